@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+对比 parse_json_loose 与旧版（正则 + json_repair）的解析耗时。
+
+输入为 logs/llm_debug/*_output.txt 中保存的 LLM 输出（去掉头部）；每份输出再派生实际遇到过的
+畸形变体：代码围栏 + 说明文字、尾随逗号、在 90% 处截断。没有保存的输出时生成一份合成抽取响应。
+
+用法：
+    python scripts/bench_json_parse.py [--dir logs/llm_debug] [--repeat 5] [--records 200]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.schema._json import iter_records, parse_json_loose
+
+
+def legacy_parse_json_loose(content: str) -> Any:
+    """单遍解析器之前的实现（保留用于对比）。"""
+    if content is None:
+        raise ValueError("空内容")
+    content = content.strip()
+    if not content:
+        raise ValueError("空内容")
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        pass
+    for pat in (r"```json\s*([\s\S]*?)\s*```", r"```\s*([\s\S]*?)\s*```", r"(\{[\s\S]*\})", r"(\[[\s\S]*\])"):
+        m = re.search(pat, content)
+        if m:
+            try:
+                return json.loads(m.group(1))
+            except (json.JSONDecodeError, IndexError):
+                continue
+    try:
+        import json_repair
+        repaired = json_repair.loads(content)
+        if repaired not in (None, "", [], {}):
+            return repaired
+    except Exception:
+        pass
+    raise ValueError("无法解析 JSON")
+
+
+def load_outputs(directory: Path) -> List[Tuple[str, str]]:
+    out = []
+    for p in sorted(directory.glob("*_output.txt")):
+        text = p.read_text(encoding="utf-8", errors="replace")
+        # _save_output 写的头部以一行 ==== 结束
+        sep = text.find("=" * 60)
+        body = text[sep + 60:].lstrip("\n") if sep >= 0 else text
+        if body.strip():
+            out.append((p.name, body))
+    return out
+
+
+def synthetic_output(records: int) -> str:
+    rows = []
+    for i in range(records):
+        rows.append({
+            "material": {"value": f"UHMWPE-{i}", "evidence": f"Sample {i} was UHMWPE cross-linked at {i % 7} Mrad."},
+            "wear_rate": {"value": 1.2 + i / 100, "evidence": f"| S{i} | {1.2 + i / 100:.2f} ± 0.1 | 0.08 |"},
+            "lubricant": {"value": "bovine serum", "evidence": "tested in 25% bovine serum at 37 °C\n(ISO 14242)"},
+            "notes": {"value": None, "evidence": None},
+        })
+    return json.dumps({"records": rows}, ensure_ascii=False, indent=1)
+
+
+def variants(body: str) -> Dict[str, str]:
+    fenced = f"以下为抽取结果：\n```json\n{body}\n```\n如有遗漏请告知。"
+    trailing = re.sub(r"(\}|\])(\s*)(\]|\})", r"\1,\2\3", body)
+    return {
+        "valid": body,
+        "fenced+prose": fenced,
+        "trailing_commas": trailing,
+        "truncated_90%": body[: int(len(body) * 0.9)],
+    }
+
+
+def bench(fn: Callable[[str], Any], text: str, repeat: int) -> Tuple[float, Any]:
+    best = float("inf")
+    result: Any = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        try:
+            result = fn(text)
+        except Exception as e:  # noqa: BLE001
+            result = e
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def _n_records(v: Any) -> str:
+    if isinstance(v, Exception):
+        return "ERR"
+    if isinstance(v, dict) and isinstance(v.get("records"), list):
+        return str(len(v["records"]))
+    return "-"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="容错 JSON 解析基准测试")
+    parser.add_argument("--dir", default="logs/llm_debug", help="保存的 LLM 输出目录")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例重复次数（取最优）")
+    parser.add_argument("--records", type=int, default=200, help="没有保存的输出时合成的记录数")
+    parser.add_argument("--limit", type=int, default=50, help="最多读取的输出份数")
+    args = parser.parse_args()
+
+    outputs = load_outputs(Path(args.dir))[: args.limit]
+    if not outputs:
+        print(f"{args.dir} 下没有 *_output.txt，使用合成响应（{args.records} 条记录）")
+        outputs = [("synthetic", synthetic_output(args.records))]
+
+    totals: Dict[str, List[float]] = {}
+    print(f"{'output':<40} {'variant':<16} {'KB':>7} {'legacy ms':>10} {'new ms':>8} {'rec old/new':>12} {'stream':>7}")
+    for name, body in outputs:
+        for kind, text in variants(body).items():
+            t_old, r_old = bench(legacy_parse_json_loose, text, args.repeat)
+            t_new, r_new = bench(parse_json_loose, text, args.repeat)
+            streamed = sum(1 for _ in iter_records([text[i:i + 4096] for i in range(0, len(text), 4096)]))
+            agg = totals.setdefault(kind, [0.0, 0.0])
+            agg[0] += t_old
+            agg[1] += t_new
+            print(f"{name[:40]:<40} {kind:<16} {len(text) / 1024:7.1f} {t_old * 1000:10.2f} {t_new * 1000:8.2f} "
+                  f"{_n_records(r_old) + '/' + _n_records(r_new):>12} {streamed:7d}")
+
+    print("\n汇总（各输出最优耗时之和）")
+    for kind, (old, new) in totals.items():
+        speedup = old / new if new > 0 else float("inf")
+        print(f"  {kind:<16} legacy {old * 1000:9.2f} ms   new {new * 1000:9.2f} ms   x{speedup:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -35,6 +35,13 @@ def main() -> int:
     parser = argparse.ArgumentParser(description="Run full schema extraction")
     parser.add_argument("--collection", required=True)
     parser.add_argument("--slug", required=True)
+    parser.add_argument("--lane", default="bulk", choices=["interactive", "normal", "bulk"],
+                        help="LLM priority lane (default: bulk)")
+    reuse = parser.add_mutually_exclusive_group()
+    reuse.add_argument("--reuse", dest="reuse", action="store_const", const=True,
+                       help="reuse re-verified sibling results for near-duplicate papers")
+    reuse.add_argument("--no-reuse", dest="reuse", action="store_const", const=False,
+                       help="always extract near-duplicate papers (default unless NEAR_DUP_REUSE=true)")
     args = parser.parse_args()
 
     collection = args.collection.strip()
@@ -59,7 +66,8 @@ def main() -> int:
             f"START collection={collection} slug={slug} papers={len(papers)}",
             flush=True,
         )
-        result = services.run_extract_job(ConsoleHandle(), slug, papers, collection)
+        result = services.run_extract_job(ConsoleHandle(), slug, papers, collection, lane=args.lane,
+                                           reuse_duplicates=args.reuse)
         print("FINAL " + json.dumps(result, ensure_ascii=False), flush=True)
         return 0 if result.get("failed", 0) == 0 else 1
 
@@ -24,7 +24,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import settings
 from src.schema import SchemaDiscovery, SchemaStore
-from src.schema.sampling import list_parsed_papers, load_paper_text
+from src.schema.sampling import list_parsed_papers, load_paper_structure, load_paper_text
 from src.extractors import ExtractionService
 
 
@@ -84,7 +84,9 @@ def _extract_one(service, paper_id, output_dir, collection):
     if not content:
         print(f"  ❌ {paper_id}: 无 full.md")
         return False
-    out = service.extract(paper_id=paper_id, content=content)
+    structure = load_paper_structure(paper_id, collection=collection, text=content)
+    out = service.extract(paper_id=paper_id, content=content, structure=structure,
+                          parsed_dir=settings.collection_parsed_dir(collection))
     output_dir.mkdir(parents=True, exist_ok=True)
     output_file = output_dir / f"{paper_id}.json"
     with open(output_file, "w", encoding="utf-8") as f:
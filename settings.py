@@ -115,6 +115,11 @@ MAX_PDF_SIZE_MB = int(os.getenv("MAX_PDF_SIZE_MB", "20"))
 PROCESSING_STALE_HOURS = int(os.getenv("PROCESSING_STALE_HOURS", "12"))
 # MinerU 上传速率上限（文件/分钟）：官方限制约 50/min，超出会 HTTP 429
 MINERU_UPLOAD_RATE_PER_MIN = int(os.getenv("MINERU_UPLOAD_RATE_PER_MIN", "50"))
+# 批内并发上传数（预签名 URL 的 PUT，复用连接池）与合计上传带宽上限（MB/s，0 不限）
+MINERU_UPLOAD_WORKERS = int(os.getenv("MINERU_UPLOAD_WORKERS", "4"))
+MINERU_UPLOAD_MAX_MBPS = float(os.getenv("MINERU_UPLOAD_MAX_MBPS", "0"))
+# 解析结果只立即解出 full.md 与结构化 JSON，图片留在 mineru_output.zip 里按需解压；true 则全部解压
+MINERU_EAGER_IMAGES = os.getenv("MINERU_EAGER_IMAGES", "false").strip().lower() in {"1", "true", "yes", "on"}
 BATCH_MAX_TOTAL_MB = int(os.getenv("BATCH_MAX_TOTAL_MB", "120"))
 UPLOAD_CONFIG = {
     "enable_formula": os.getenv("UPLOAD_ENABLE_FORMULA", "True").lower() == "true",
@@ -176,6 +181,25 @@ EXTRACTOR_ROLES = [
 EXTRACT_MERGER_ROLE = os.getenv("EXTRACT_MERGER_ROLE", "extract_merger").strip() or "extract_merger"
 EXTRACT_REVIEWER_ROLE = os.getenv("EXTRACT_REVIEWER_ROLE", "extract_reviewer").strip() or "extract_reviewer"
 EXTRACT_REVIEW_ENABLED = os.getenv("EXTRACT_REVIEW_ENABLED", "true").strip().lower() not in {"0", "false", "no", "off"}
+# reviewer 看到的正文：evidence=只发各证据附近片段及其引用的图表（定位不到时回退全文）；full=整篇。
+EXTRACT_REVIEW_CONTEXT = os.getenv("EXTRACT_REVIEW_CONTEXT", "evidence").strip().lower() or "evidence"
+EXTRACT_REVIEW_CONTEXT_TOKENS = int(os.getenv("EXTRACT_REVIEW_CONTEXT_TOKENS", "8000"))
+# merger 输入编码：compact=候选按记录对齐、去空字段/metadata、证据去重，只并排列出分歧字段；json=原样 dump。
+EXTRACT_MERGER_FORMAT = os.getenv("EXTRACT_MERGER_FORMAT", "compact").strip().lower() or "compact"
+# 合并前按规范化取值 hash 去重：各 extractor 一致（含仅少填字段的近似重复）的记录直接定稿，不送 merger。
+EXTRACT_CANDIDATE_DEDUPE = os.getenv("EXTRACT_CANDIDATE_DEDUPE", "true").strip().lower() not in {"0", "false", "no", "off"}
+# 近似重复论文（预印本/期刊版/学位论文章节）：full.md 落盘时算 MinHash 签名并按 LSH 分桶，
+# 估计 Jaccard ≥ 阈值判为近似重复；NEAR_DUP_REUSE 开启时提取复用 Jaccard ≥ 阈值的兄弟论文同一 schema 的成功结果
+# （逐条对照本篇原文重新核验 evidence，核验不过的记录丢弃，丢弃过半则照常提取）。
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_REUSE = os.getenv("NEAR_DUP_REUSE", "false").strip().lower() in {"1", "true", "yes", "on"}
+# extractor 扇出策略：fixed=每篇跑全部 EXTRACTOR_ROLES 再合并；adaptive=先跑第一个 extractor，
+# 证据核验率低、记录多、长表格或枚举越界时再补跑其余 extractor 并合并。
+EXTRACT_AGENT_POLICY = os.getenv("EXTRACT_AGENT_POLICY", "fixed").strip().lower() or "fixed"
+# adaptive 的升级阈值：核验率低于 min_verified、记录数超过 max_records、表格行数超过 max_table_rows、
+# 枚举越界超过 max_enum_violations 任一成立即升级；缺项用默认值。
+EXTRACT_ADAPTIVE_THRESHOLDS = os.getenv(
+    "EXTRACT_ADAPTIVE_THRESHOLDS", "min_verified:0.8,max_records:8,max_table_rows:30,max_enum_violations:0")
 
 
 def get_agent_config(role: str = None) -> dict:
@@ -235,11 +259,33 @@ def list_agent_endpoints() -> dict:
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
 LLM_TOP_P = float(os.getenv("LLM_TOP_P", "0.95"))
 LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "8"))
+# 优先级通道权重（加权公平排队）：interactive=网页单篇提取/schema 设计，bulk=全量提取脚本/大批量任务
+LLM_LANE_WEIGHTS = os.getenv("LLM_LANE_WEIGHTS", "interactive:8,normal:3,bulk:1")
+# 主机级（跨进程）LLM 限流：网页服务与 CLI 脚本经 STATE_DIR/llm_slots.db 的租约共享同一额度。
+# LLM_HOST_MAX_INFLIGHT=0 时沿用 LLM_MAX_INFLIGHT；LLM_HOST_RATE_PER_MIN=0 不限速；
+# 崩溃进程遗留的租约按 pid 存活或心跳超时（LLM_LEASE_TTL_S）回收。
+LLM_HOST_LIMITER = os.getenv("LLM_HOST_LIMITER", "true").strip().lower() not in {"0", "false", "no", "off"}
+LLM_HOST_MAX_INFLIGHT = int(os.getenv("LLM_HOST_MAX_INFLIGHT", "0"))
+LLM_HOST_RATE_PER_MIN = int(os.getenv("LLM_HOST_RATE_PER_MIN", "0"))
+LLM_LEASE_TTL_S = float(os.getenv("LLM_LEASE_TTL_S", "90"))
 
 # 模型最大输出 token 数。reasoning 模型(思考+正文)需要很大额度，默认拉满到 65536，
 # 避免因 max_tokens 不足导致正文为空/被截断。base.call() 仍会在截断时自动加倍重试。
 LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "65536"))
 
+# token 估算（src/llm/tokens.py）：heuristic=按字符类别加权的离线估算（按真实 prompt_tokens 校准）；
+# tiktoken[:编码名]=精确计数（需安装 tiktoken 且编码文件可用，否则回退 heuristic）。
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "heuristic").strip() or "heuristic"
+# 按 schema 宽度 × 预计记录数逐次规划 max_tokens（LLM_MAX_OUTPUT_TOKENS 为上限）；
+# 截断时仍自动加倍重试。关闭后每次调用都申请 LLM_MAX_OUTPUT_TOKENS。
+LLM_OUTPUT_PLANNING = os.getenv("LLM_OUTPUT_PLANNING", "true").strip().lower() not in {"0", "false", "no", "off"}
+LLM_OUTPUT_SAFETY = float(os.getenv("LLM_OUTPUT_SAFETY", "1.3"))                       # 预测值的放大系数
+LLM_REASONING_RESERVE_TOKENS = int(os.getenv("LLM_REASONING_RESERVE_TOKENS", "4096"))  # 给思考 token 的固定余量
+LLM_MIN_OUTPUT_TOKENS = int(os.getenv("LLM_MIN_OUTPUT_TOKENS", "2048"))
+# 结构化输出：提取/合并按 schema 生成 JSON Schema，以 response_format=json_schema 约束解码。
+# auto=先尝试，端点拒绝时降级 json_object 并记入 STATE_DIR/llm_capabilities.json；on=总是使用；off=关闭。
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "auto").strip().lower() or "auto"
+
 # ==========================
 # Schema 自动设计配置
 # ==========================
@@ -247,6 +293,7 @@ SCHEMA_MIN_FIELDS = int(os.getenv("SCHEMA_MIN_FIELDS", "20"))   # 字段数下
 SCHEMA_MAX_FIELDS = int(os.getenv("SCHEMA_MAX_FIELDS", "80"))   # 字段数上限（放宽，允许更多字段）
 SCHEMA_SAMPLE_SIZE = int(os.getenv("SCHEMA_SAMPLE_SIZE", "8"))  # 设计schema时采样论文数
 SCHEMA_EXCERPT_BUDGET = int(os.getenv("SCHEMA_EXCERPT_BUDGET", "16000"))  # 单篇摘录字符预算
+SCHEMA_EXCERPT_TOKENS = int(os.getenv("SCHEMA_EXCERPT_TOKENS", "0"))      # >0 时按 token 预算（逐篇换算为字符）
 
 # ==========================
 # 并行处理配置
@@ -262,9 +309,37 @@ if DEFAULT_WORKERS is not None:
 # ==========================
 # 单篇论文送入LLM的最大字符数；0 表示不限制（始终送全文）。
 EXTRACT_MAX_INPUT_CHARS = int(os.getenv("EXTRACT_MAX_INPUT_CHARS", "0"))
+# 同上，按估算 token 计（中英文/LaTeX 混排时比字符数更准）；0 表示不限制。
+EXTRACT_MAX_INPUT_TOKENS = int(os.getenv("EXTRACT_MAX_INPUT_TOKENS", "0"))
 
 # 提取阶段并行度：同时处理多少篇论文（每个worker独立LLM客户端）。
 EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "8"))
+# 在途论文上限（已准入、未完成）。0=按 ceil(LLM_MAX_INFLIGHT / extractor 数) + 1 自动推算，
+# 不超过 EXTRACT_CONCURRENCY。LLM 槽位按 review > merge > extract、先开始的论文优先放行。
+EXTRACT_MAX_WIP = int(os.getenv("EXTRACT_MAX_WIP", "0"))
+# 进程级共享线程池大小（src/executor.py）：papers=在途论文，agents=单篇内多路 LLM 扇出，io=下载。
+# 所有提取/设计/下载任务共用，线程总数有上限；池在首次使用时创建，修改需重启。
+EXECUTOR_POOL_SIZES = os.getenv("EXECUTOR_POOL_SIZES", "papers:32,agents:32,io:8")
+
+# 送 LLM 前的正文精简（src/schema/minimize.py）：删参考文献/致谢/附录、图片链接，
+# 化简行内 LaTeX、压缩空白与重复页眉。规则可按逗号选择，结果按原文 hash 缓存。
+EXTRACT_MINIMIZE = os.getenv("EXTRACT_MINIMIZE", "true").strip().lower() not in {"0", "false", "no", "off"}
+EXTRACT_MINIMIZE_RULES = [
+    r.strip() for r in os.getenv(
+        "EXTRACT_MINIMIZE_RULES",
+        "references,acknowledgements,appendix,images,latex,whitespace,repeated_lines",
+    ).split(",") if r.strip()
+]
+
+# 表格预解析（src/schema/tables.py）：off=关闭；hint=把表格候选值写进 extractor 提示，
+# 并按行标签回填模型留空的高置信单元格；fill=在 hint 基础上允许模型对高置信字段输出 null
+# （由系统回填，节省输出 token）。
+EXTRACT_TABLE_PREFILL = os.getenv("EXTRACT_TABLE_PREFILL", "hint").strip().lower() or "hint"
+EXTRACT_TABLE_PREFILL_MIN_CONFIDENCE = float(os.getenv("EXTRACT_TABLE_PREFILL_MIN_CONFIDENCE", "0.75"))
+
+# extractor 输出线格式（src/prompts/modes/compact.py）：cells=每字段 {value, evidence}（默认）；
+# compact=字段短代号、省略空字段；columnar=列数组 + 证据下标。解码后结果文件格式不变。
+EXTRACT_OUTPUT_FORMAT = os.getenv("EXTRACT_OUTPUT_FORMAT", "cells").strip().lower() or "cells"
 
 # ==========================
 # 日志配置
@@ -281,6 +356,8 @@ DOWNLOAD_TIMEOUT = int(os.getenv("DOWNLOAD_TIMEOUT", "180"))
 DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", "8192"))
 DOWNLOAD_RETRY_BACKOFF_BASE = float(os.getenv("DOWNLOAD_RETRY_BACKOFF_BASE", "1.8"))
 DOWNLOAD_RETRY_BACKOFF_MAX = int(os.getenv("DOWNLOAD_RETRY_BACKOFF_MAX", "8"))
+# 解析结果 zip 下载缓冲：不超过该大小（MB）时只在内存里，超过后溢出到临时文件
+DOWNLOAD_SPOOL_MB = float(os.getenv("DOWNLOAD_SPOOL_MB", "32"))
 
 # 上传重试配置
 UPLOAD_RETRY = int(os.getenv("UPLOAD_RETRY", "2"))
@@ -324,11 +401,15 @@ def reload_config() -> dict:
     """
     global DEFAULT_COLLECTION
     global MINERU_TOKEN, MINERU_API_BASE, MINERU_HEADERS
-    global MAX_PDF_SIZE_MB, MINERU_UPLOAD_RATE_PER_MIN
-    global LLM_MODEL, LLM_API_BASE, LLM_API_KEY, LLM_PROVIDER, DEFAULT_MODEL, LLM_MAX_INFLIGHT
-    global EXTRACT_CONCURRENCY, PROCESSING_STALE_HOURS
+    global MAX_PDF_SIZE_MB, MINERU_UPLOAD_RATE_PER_MIN, MINERU_UPLOAD_WORKERS, MINERU_UPLOAD_MAX_MBPS
+    global MINERU_EAGER_IMAGES, DOWNLOAD_SPOOL_MB
+    global LLM_MODEL, LLM_API_BASE, LLM_API_KEY, LLM_PROVIDER, DEFAULT_MODEL, LLM_MAX_INFLIGHT, LLM_LANE_WEIGHTS
+    global LLM_HOST_LIMITER, LLM_HOST_MAX_INFLIGHT, LLM_HOST_RATE_PER_MIN
+    global EXTRACT_CONCURRENCY, EXTRACT_MAX_WIP, PROCESSING_STALE_HOURS
     global SCHEMA_AGENT_ROLES, SCHEMA_MERGER_ROLE, SCHEMA_REVIEWER_ROLE
     global EXTRACTOR_ROLES, EXTRACT_MERGER_ROLE, EXTRACT_REVIEWER_ROLE, EXTRACT_REVIEW_ENABLED
+    global EXTRACT_AGENT_POLICY, EXTRACT_ADAPTIVE_THRESHOLDS, EXTRACT_REVIEW_CONTEXT, EXTRACT_REVIEW_CONTEXT_TOKENS
+    global EXTRACT_MERGER_FORMAT, EXTRACT_CANDIDATE_DEDUPE, NEAR_DUP_THRESHOLD, NEAR_DUP_REUSE
 
     load_dotenv(override=True)
 
@@ -346,9 +427,18 @@ def reload_config() -> dict:
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
     DEFAULT_MODEL = LLM_MODEL
     LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "8"))
+    LLM_LANE_WEIGHTS = os.getenv("LLM_LANE_WEIGHTS", "interactive:8,normal:3,bulk:1")
+    LLM_HOST_LIMITER = os.getenv("LLM_HOST_LIMITER", "true").strip().lower() not in {"0", "false", "no", "off"}
+    LLM_HOST_MAX_INFLIGHT = int(os.getenv("LLM_HOST_MAX_INFLIGHT", "0"))
+    LLM_HOST_RATE_PER_MIN = int(os.getenv("LLM_HOST_RATE_PER_MIN", "0"))
     MAX_PDF_SIZE_MB = int(os.getenv("MAX_PDF_SIZE_MB", "20"))
     MINERU_UPLOAD_RATE_PER_MIN = int(os.getenv("MINERU_UPLOAD_RATE_PER_MIN", "50"))
+    MINERU_UPLOAD_WORKERS = int(os.getenv("MINERU_UPLOAD_WORKERS", "4"))
+    MINERU_UPLOAD_MAX_MBPS = float(os.getenv("MINERU_UPLOAD_MAX_MBPS", "0"))
+    MINERU_EAGER_IMAGES = os.getenv("MINERU_EAGER_IMAGES", "false").strip().lower() in {"1", "true", "yes", "on"}
+    DOWNLOAD_SPOOL_MB = float(os.getenv("DOWNLOAD_SPOOL_MB", "32"))
     EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "8"))
+    EXTRACT_MAX_WIP = int(os.getenv("EXTRACT_MAX_WIP", "0"))
     PROCESSING_STALE_HOURS = int(os.getenv("PROCESSING_STALE_HOURS", "12"))
     SCHEMA_AGENT_ROLES = [
         r.strip() for r in os.getenv("SCHEMA_AGENT_ROLES", "schema_agent_a,schema_agent_b,schema_agent_c").split(",") if r.strip()
@@ -361,6 +451,15 @@ def reload_config() -> dict:
     EXTRACT_MERGER_ROLE = os.getenv("EXTRACT_MERGER_ROLE", "extract_merger").strip() or "extract_merger"
     EXTRACT_REVIEWER_ROLE = os.getenv("EXTRACT_REVIEWER_ROLE", "extract_reviewer").strip() or "extract_reviewer"
     EXTRACT_REVIEW_ENABLED = os.getenv("EXTRACT_REVIEW_ENABLED", "true").strip().lower() not in {"0", "false", "no", "off"}
+    EXTRACT_REVIEW_CONTEXT = os.getenv("EXTRACT_REVIEW_CONTEXT", "evidence").strip().lower() or "evidence"
+    EXTRACT_REVIEW_CONTEXT_TOKENS = int(os.getenv("EXTRACT_REVIEW_CONTEXT_TOKENS", "8000"))
+    EXTRACT_MERGER_FORMAT = os.getenv("EXTRACT_MERGER_FORMAT", "compact").strip().lower() or "compact"
+    EXTRACT_CANDIDATE_DEDUPE = os.getenv("EXTRACT_CANDIDATE_DEDUPE", "true").strip().lower() not in {"0", "false", "no", "off"}
+    NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+    NEAR_DUP_REUSE = os.getenv("NEAR_DUP_REUSE", "false").strip().lower() in {"1", "true", "yes", "on"}
+    EXTRACT_AGENT_POLICY = os.getenv("EXTRACT_AGENT_POLICY", "fixed").strip().lower() or "fixed"
+    EXTRACT_ADAPTIVE_THRESHOLDS = os.getenv(
+        "EXTRACT_ADAPTIVE_THRESHOLDS", "min_verified:0.8,max_records:8,max_table_rows:30,max_enum_violations:0")
 
     return {"mineru_api_base": MINERU_API_BASE, "llm_model": LLM_MODEL,
             "llm_api_base": LLM_API_BASE, "extract_concurrency": EXTRACT_CONCURRENCY}
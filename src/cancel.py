@@ -0,0 +1,129 @@
+"""
+协作式取消。
+
+原先只在每篇论文开始前检查 JobHandle.cancelled：取消提取任务后，所有在途的 extractor /
+merger / reviewer 调用（含重试退避）仍会跑完，占用供应商额度数分钟。这里提供 CancelToken：
+
+  - 任务持有一个 token，取消时 cancel() 触发已注册的回调；
+  - token 经 contextvars 传递（cancel_scope），ExtractionService → LLMClient.call → 限流排队 →
+    HTTP 读写都能拿到，无需逐层改签名；TaskGroup 提交的任务自动继承；
+  - sleep() 代替 time.sleep：退避/轮询等待在取消时立即醒来并抛出 Cancelled；
+  - guard(cb) 在一段阻塞操作期间注册中止回调（如关闭 socket），结束后注销。
+
+Cancelled 与 asyncio.CancelledError 一样继承 BaseException，不会被各处
+`except Exception` 的重试逻辑吞掉。
+"""
+from __future__ import annotations
+
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+
+class Cancelled(BaseException):
+    """操作因所属任务被取消而中止。"""
+
+
+class CancelToken:
+    """可跨线程共享的取消令牌。"""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+        self.reason = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "任务已取消") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:  # noqa: BLE001 - 中止回调失败不影响其它回调
+                pass
+
+    def on_cancel(self, cb: Callable[[], None]) -> Callable[[], None]:
+        """注册回调（已取消则立即执行），返回注销函数。"""
+        with self._lock:
+            if not self._event.is_set():
+                cb_id = self._next_id
+                self._next_id += 1
+                self._callbacks[cb_id] = cb
+
+                def _unregister() -> None:
+                    with self._lock:
+                        self._callbacks.pop(cb_id, None)
+                return _unregister
+        cb()
+        return lambda: None
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """最多等待 timeout 秒；期间被取消返回 True。"""
+        return self._event.wait(timeout)
+
+    @contextmanager
+    def guard(self, abort: Callable[[], None]) -> Iterator[None]:
+        """阻塞操作期间取消时调用 abort()（应使该操作尽快出错返回），由此产生的异常转为 Cancelled。"""
+        self.raise_if_cancelled()
+        unregister = self.on_cancel(abort)
+        try:
+            yield
+        except Exception:
+            if self.cancelled:
+                raise Cancelled(self.reason)
+            raise
+        finally:
+            unregister()
+
+
+_TOKEN: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("cancel_token", default=None)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _TOKEN.get()
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken]) -> Iterator[Optional[CancelToken]]:
+    """在当前上下文内使用 token（None 时沿用外层）。"""
+    if token is None:
+        yield current_token()
+        return
+    reset = _TOKEN.set(token)
+    try:
+        yield token
+    finally:
+        _TOKEN.reset(reset)
+
+
+def check() -> None:
+    """当前上下文已取消时抛 Cancelled。"""
+    token = _TOKEN.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def sleep(seconds: float) -> None:
+    """可被取消打断的 time.sleep。"""
+    token = _TOKEN.get()
+    if token is None:
+        import time
+        time.sleep(max(0.0, seconds))
+        return
+    if token.wait(max(0.0, seconds)):
+        raise Cancelled(token.reason)
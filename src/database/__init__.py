@@ -1,8 +1,9 @@
 """
 数据库/目录模块。
 
-旧的固定12表数据库已移除；保留 PaperCatalog（追踪PDF解析/提取状态）。
+旧的固定12表数据库已移除；保留 PaperCatalog（追踪PDF解析/提取状态）；NearDupIndex 记录近似重复论文签名。
 """
 from .catalog import PaperCatalog
+from .near_dup import NearDupIndex
 
-__all__ = ['PaperCatalog']
+__all__ = ['PaperCatalog', 'NearDupIndex']
@@ -0,0 +1,286 @@
+"""
+近似重复论文检测（MinHash + LSH）。
+
+同一篇论文常以预印本、期刊版、学位论文章节等不同文件名反复进入集合；上传时的 MD5 去重只能拦住
+字节完全相同的 PDF。这里在 full.md 落盘时计算 MinHash 签名，存进论文目录库（pdf_state.db），
+并用 LSH 分桶索引找近似重复：
+
+  - 文本：去参考文献后 NFKC + 小写，英文按词、中文按字切分，取 5-gram shingle；
+  - 签名：one-permutation hashing（每个 shingle 只算一次 64 位 hash，按 hash % 128 分桶取最小值，
+    空桶向后借值），纯 Python 下比 128 次置换快两个数量级；
+  - LSH：32 段 × 4 行，同段 key 相同即为候选；候选再按签名估计 Jaccard，
+    Jaccard ≥ NEAR_DUP_THRESHOLD 或较短一篇被较长一篇包含 ≥ 0.9（学位论文章节）判为近似重复。
+
+表：paper_signatures（签名、shingle 数、duplicate_of/similarity）与 lsh_buckets（段号、段 key、paper_id）。
+提取任务可选择复用 Jaccard ≥ 阈值的兄弟论文的已有结果，复用前逐条对照本篇原文重新核验 evidence
+（见 webapp/services.run_extract_job）；仅包含度高的只在分组列表中标出，不复用。
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import struct
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+NUM_BINS = 128
+BANDS = 32
+ROWS = NUM_BINS // BANDS
+SHINGLE_WORDS = 5
+CONTAINMENT_THRESHOLD = 0.9
+MIN_SHINGLES = 50          # 太短的文本（空 full.md、只有标题）不参与比较
+_EMPTY = (1 << 64) - 1
+_TOKEN_RE = re.compile("[a-z0-9]+|[\u4e00-\u9fff]")
+
+
+def near_dup_threshold() -> float:
+    try:
+        import settings
+        return float(getattr(settings, "NEAR_DUP_THRESHOLD", 0.8))
+    except Exception:
+        return 0.8
+
+
+def near_dup_reuse() -> bool:
+    try:
+        import settings
+        return bool(getattr(settings, "NEAR_DUP_REUSE", False))
+    except Exception:
+        return False
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> set:
+    words = _TOKEN_RE.findall(unicodedata.normalize("NFKC", text or "").lower())
+    out = set()
+    for i in range(max(1, len(words) - k + 1) if words else 0):
+        digest = hashlib.blake2b(" ".join(words[i:i + k]).encode("utf-8"), digest_size=8).digest()
+        out.add(int.from_bytes(digest, "little"))
+    return out
+
+
+def minhash(hashes: Iterable[int], bins: int = NUM_BINS) -> List[int]:
+    """one-permutation MinHash：按 hash % bins 分桶取 hash // bins 的最小值，空桶按环形顺延借值。"""
+    sig = [_EMPTY] * bins
+    for h in hashes:
+        b, v = h % bins, h // bins
+        if v < sig[b]:
+            sig[b] = v
+    if all(v == _EMPTY for v in sig):
+        return sig
+    for i in range(bins):
+        if sig[i] == _EMPTY:
+            j, dist = i, 0
+            while sig[j] == _EMPTY:
+                j, dist = (j + 1) % bins, dist + 1
+            # 借值带上距离，避免两个空桶分布不同的文档偶然相等
+            sig[i] = (sig[j] * 31 + dist) & ((1 << 63) - 1)
+    return sig
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def containment(jaccard: float, n_a: int, n_b: int) -> float:
+    """由 Jaccard 与两边 shingle 数估计较短一篇被包含的比例 |A∩B| / min(|A|,|B|)。"""
+    if jaccard <= 0 or min(n_a, n_b) <= 0:
+        return 0.0
+    inter = jaccard * (n_a + n_b) / (1 + jaccard)
+    return min(1.0, inter / min(n_a, n_b))
+
+
+def band_keys(sig: List[int]) -> List[str]:
+    out = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<{ROWS}Q", *sig[band * ROWS:(band + 1) * ROWS])
+        out.append(hashlib.blake2b(chunk, digest_size=8).hexdigest())
+    return out
+
+
+def signature_for_text(text: str, structure=None) -> Tuple[List[int], int]:
+    if structure is not None:
+        text = structure.without_references(text)
+    hashes = shingle_hashes(text)
+    return minhash(hashes), len(hashes)
+
+
+class NearDupIndex:
+    """签名与 LSH 分桶存放在论文目录库中；各方法每次新开连接，可跨线程/进程使用。"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        if db_path is None:
+            import settings
+            db_path = Path(settings.UPLOADS_DIR) / "pdf_state.db"
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        from src.database.catalog import configure_connection
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        configure_connection(conn)
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS paper_signatures (
+                    paper_id      TEXT PRIMARY KEY,
+                    minhash       BLOB NOT NULL,
+                    shingles      INTEGER NOT NULL,
+                    duplicate_of  TEXT,
+                    similarity    REAL,
+                    updated_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS lsh_buckets (
+                    band      INTEGER NOT NULL,
+                    bucket    TEXT NOT NULL,
+                    paper_id  TEXT NOT NULL,
+                    PRIMARY KEY (band, bucket, paper_id)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_paper ON lsh_buckets(paper_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sig_dup ON paper_signatures(duplicate_of)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _pack(sig: List[int]) -> bytes:
+        return struct.pack(f"<{len(sig)}Q", *sig)
+
+    @staticmethod
+    def _unpack(blob: bytes) -> List[int]:
+        return list(struct.unpack(f"<{len(blob) // 8}Q", blob))
+
+    def has(self, paper_id: str) -> bool:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM paper_signatures WHERE paper_id = ?", (paper_id,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def add(self, paper_id: str, sig: List[int], shingles: int) -> Optional[Dict[str, Any]]:
+        """登记签名并返回最相近的近似重复 {"paper_id", "similarity", "containment"}（无则 None）。"""
+        keys = band_keys(sig)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT DISTINCT s.paper_id, s.minhash, s.shingles FROM lsh_buckets b "
+                "JOIN paper_signatures s ON s.paper_id = b.paper_id "
+                f"WHERE b.paper_id != ? AND ({' OR '.join('(b.band = ? AND b.bucket = ?)' for _ in keys)})",
+                [paper_id] + [v for band, key in enumerate(keys) for v in (band, key)],
+            ).fetchall() if shingles >= MIN_SHINGLES else []
+            best = None
+            threshold = near_dup_threshold()
+            for row in rows:
+                j = similarity(sig, self._unpack(row["minhash"]))
+                c = containment(j, shingles, int(row["shingles"]))
+                if (j >= threshold or c >= CONTAINMENT_THRESHOLD) and (best is None or j > best["similarity"]):
+                    best = {"paper_id": row["paper_id"], "similarity": round(j, 3), "containment": round(c, 3)}
+            conn.execute(
+                "INSERT OR REPLACE INTO paper_signatures (paper_id, minhash, shingles, duplicate_of, similarity, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (paper_id, self._pack(sig), shingles,
+                 best["paper_id"] if best else None, best["similarity"] if best else None),
+            )
+            conn.execute("DELETE FROM lsh_buckets WHERE paper_id = ?", (paper_id,))
+            if shingles >= MIN_SHINGLES:
+                conn.executemany("INSERT OR IGNORE INTO lsh_buckets (band, bucket, paper_id) VALUES (?, ?, ?)",
+                                 [(band, key, paper_id) for band, key in enumerate(keys)])
+            conn.commit()
+            return best
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def index_text(self, paper_id: str, text: str, structure=None) -> Optional[Dict[str, Any]]:
+        sig, n = signature_for_text(text, structure)
+        return self.add(paper_id, sig, n)
+
+    def siblings(self, paper_id: str, min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """与 paper_id 近似重复的论文（双向：它标记的原件，以及把它标记为原件的论文）。
+
+        min_similarity 过滤估计 Jaccard：只凭包含度判定的（学位论文章节 ↔ 整篇）Jaccard 低于阈值。
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT duplicate_of AS paper_id, similarity FROM paper_signatures "
+                "WHERE paper_id = ? AND duplicate_of IS NOT NULL "
+                "UNION SELECT paper_id, similarity FROM paper_signatures WHERE duplicate_of = ?",
+                (paper_id, paper_id),
+            ).fetchall()
+            out = [dict(r) for r in rows if (r["similarity"] or 0) >= min_similarity]
+            return sorted(out, key=lambda r: -(r["similarity"] or 0))
+        finally:
+            conn.close()
+
+    def duplicate_of(self, paper_ids: Iterable[str]) -> Dict[str, str]:
+        """paper_id -> 其近似重复的原件（只含已标记的）。"""
+        ids = list(paper_ids)
+        out: Dict[str, str] = {}
+        conn = self._connect()
+        try:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT paper_id, duplicate_of FROM paper_signatures WHERE duplicate_of IS NOT NULL "
+                    f"AND paper_id IN ({', '.join('?' for _ in chunk)})", chunk,
+                ).fetchall()
+                out.update({r["paper_id"]: r["duplicate_of"] for r in rows})
+            return out
+        finally:
+            conn.close()
+
+    def groups(self) -> List[Dict[str, Any]]:
+        """按原件分组的近似重复列表；match 为 near_duplicate（Jaccard ≥ 阈值）或 containment（仅包含度高）。"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT paper_id, duplicate_of, similarity FROM paper_signatures "
+                "WHERE duplicate_of IS NOT NULL ORDER BY duplicate_of, similarity DESC"
+            ).fetchall()
+        finally:
+            conn.close()
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        threshold = near_dup_threshold()
+        for r in rows:
+            groups.setdefault(r["duplicate_of"], []).append({
+                "paper_id": r["paper_id"], "similarity": r["similarity"],
+                "match": "near_duplicate" if (r["similarity"] or 0) >= threshold else "containment",
+            })
+        return [{"paper_id": k, "duplicates": v} for k, v in groups.items()]
+
+
+def index_paper_dir(paper_dir: Path, db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """full.md 落盘后登记签名；返回发现的近似重复（无则 None）。"""
+    from src.schema.structure import load_structure
+    paper_dir = Path(paper_dir)
+    md = paper_dir / "full.md"
+    if not md.exists():
+        return None
+    text = md.read_text(encoding="utf-8", errors="ignore")
+    try:
+        structure = load_structure(paper_dir, text=text)
+    except Exception as e:  # noqa: BLE001
+        logger.debug(f"结构索引不可用，签名按全文计算: {e}")
+        structure = None
+    return NearDupIndex(db_path).index_text(paper_dir.name, text, structure)
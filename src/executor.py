@@ -0,0 +1,175 @@
+"""
+进程级共享线程池。
+
+原先 run_extract_job 每个任务建一个线程池，MultiAgentFlatMode.extract、SchemaDiscovery.discover
+每次调用再各建一个，MinerU 下载也各自建池：几千篇论文就是几千次线程池创建/销毁，线程总数没有上限。
+这里按用途划分几个固定大小、懒创建的池，所有路径从中取线程：
+
+  papers  论文级任务（run_extract_job 的在途论文）
+  agents  单篇内的多路 LLM 扇出（extractor、schema agent）
+  io      下载/上传等网络 IO
+
+嵌套只沿 papers → agents 单向进行，agents 任务内部不再向 agents 提交，避免有界池互相等待而死锁；
+若确实在某池的工作线程里向同一个池提交，任务改为在当前线程同步执行。
+
+TaskGroup 提供结构化并发：提交时携带 contextvars（llm_context 的通道/阶段/论文），退出 with 块时
+等待组内全部任务，异常退出时取消尚未开始的任务。各池的排队深度、在途数与利用率见 executor_stats()，
+经 /api/jobs 返回。
+"""
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+DEFAULT_POOL_SIZES = {"papers": 32, "agents": 32, "io": 8}
+
+
+def pool_sizes() -> Dict[str, int]:
+    """EXECUTOR_POOL_SIZES="papers:32,agents:32,io:8"；缺项/非法项用默认值。池创建后大小不再变化。"""
+    sizes = dict(DEFAULT_POOL_SIZES)
+    try:
+        import settings
+        raw = str(getattr(settings, "EXECUTOR_POOL_SIZES", "") or "")
+    except Exception:
+        raw = ""
+    for part in raw.split(","):
+        name, _, value = part.partition(":")
+        name = name.strip().lower()
+        try:
+            if name and int(value) > 0:
+                sizes[name] = min(256, int(value))
+        except ValueError:
+            continue
+    return sizes
+
+
+class SharedPool:
+    """带统计的固定大小线程池。"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._prefix = f"sped-{name}"
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self._prefix)
+        self._lock = threading.Lock()
+        self.created_at = time.monotonic()
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.inline = 0
+        self.peak_queued = 0
+        self._busy_s = 0.0
+
+    def in_worker(self) -> bool:
+        return threading.current_thread().name.startswith(self._prefix + "_")
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        if self.in_worker():
+            # 同池嵌套提交：就地执行，避免占满的有界池等待自身
+            fut: Future = Future()
+            with self._lock:
+                self.inline += 1
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:  # noqa: BLE001
+                fut.set_exception(e)
+            return fut
+        with self._lock:
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self.submitted - self.started)
+        fut = self._executor.submit(self._run, fn, args, kwargs)
+        fut.add_done_callback(self._on_done)
+        return fut
+
+    def _on_done(self, fut: Future) -> None:
+        if fut.cancelled():
+            with self._lock:
+                self.submitted -= 1
+
+    def _run(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self.started += 1
+        t0 = time.monotonic()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            elapsed = time.monotonic() - t0
+            with self._lock:
+                self.completed += 1
+                self.failed += 0 if ok else 1
+                self._busy_s += elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            uptime = max(1e-6, time.monotonic() - self.created_at)
+            running = self.started - self.completed
+            return {
+                "workers": self.workers,
+                "threads": len(getattr(self._executor, "_threads", ())),
+                "running": running,
+                "queued": self.submitted - self.started,
+                "peak_queued": self.peak_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "inline": self.inline,
+                "utilization": round(min(1.0, self._busy_s / (self.workers * uptime)), 3),
+            }
+
+
+_POOLS: Dict[str, SharedPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(name: str) -> SharedPool:
+    with _POOLS_LOCK:
+        pool = _POOLS.get(name)
+        if pool is None:
+            size = pool_sizes().get(name, DEFAULT_POOL_SIZES["io"])
+            pool = _POOLS[name] = SharedPool(name, size)
+        return pool
+
+
+def executor_stats() -> Dict[str, Any]:
+    with _POOLS_LOCK:
+        pools = dict(_POOLS)
+    return {name: pool.stats() for name, pool in sorted(pools.items())}
+
+
+class TaskGroup:
+    """在共享池上提交一组任务；with 退出时等待全部完成，异常退出时取消未开始的任务。"""
+
+    def __init__(self, pool: str = "agents"):
+        self.pool = get_pool(pool)
+        self.futures: Set[Future] = set()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        # 每个任务携带提交时的 contextvars（LLM 通道/阶段/论文准入序号）
+        fut = self.pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        self.futures.add(fut)
+        return fut
+
+    def as_completed(self, futures: Optional[List[Future]] = None) -> Iterator[Future]:
+        return as_completed(list(futures if futures is not None else self.futures))
+
+    def wait_first(self, futures: List[Future], timeout: Optional[float] = None) -> Set[Future]:
+        """等到至少一个完成（或 timeout 秒后返回空集）；已完成的移出组（长时间运行的组不无限累积 Future）。"""
+        done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+        self.futures -= done
+        return done
+
+    def __enter__(self) -> "TaskGroup":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            for fut in self.futures:
+                fut.cancel()
+        wait(list(self.futures))
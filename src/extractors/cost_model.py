@@ -0,0 +1,199 @@
+"""
+提取耗时预测（按论文字符数）与 LPT 排程。
+
+run_extract_job 原先按目录顺序准入论文，几篇超长学位论文排在最后时，其余 worker 早早空闲，
+整批被长尾拖住。这里按 schema（含模型）维护一个在线线性模型
+
+    seconds ≈ overhead + chars × sec_per_char
+
+用指数衰减的加权最小二乘拟合（新样本权重更高，适应模型/端点变化），样本不足时用默认值，
+结果写入 STATE_DIR/extract_cost.json 跨任务沿用。提取任务据此：
+
+  - 按预测耗时降序准入（LPT, longest processing time first），长任务先开跑；
+  - 用 lpt_makespan 模拟剩余工作在 W 个在途位上的完成时间，作为 ETA；
+    运行中以「实际耗时 / 预测耗时」的比值校准，吸收当次端点的快慢。
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+COST_FILENAME = "extract_cost.json"
+DEFAULT_OVERHEAD_S = 15.0          # 单篇固定开销（schema 提示词、merge/review 往返）
+DEFAULT_SEC_PER_KCHAR = 0.8        # 每千字符耗时
+MIN_SAMPLES = 3                    # 少于此数不拟合斜率，只按默认斜率校准截距
+DECAY = 0.95                       # 每个新样本对旧统计量的衰减
+CALIBRATION_ALPHA = 0.3            # 任务内实际/预测比值的 EWMA 系数
+CALIBRATION_RANGE = (0.25, 4.0)
+
+
+class _LinearFit:
+    """指数衰减的一元加权最小二乘。"""
+
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy", "count")
+
+    def __init__(self, data: Optional[Dict[str, float]] = None):
+        data = data or {}
+        self.n = float(data.get("n", 0.0))
+        self.sx = float(data.get("sx", 0.0))
+        self.sy = float(data.get("sy", 0.0))
+        self.sxx = float(data.get("sxx", 0.0))
+        self.sxy = float(data.get("sxy", 0.0))
+        self.count = int(data.get("count", 0))
+
+    def add(self, x: float, y: float) -> None:
+        self.n = self.n * DECAY + 1.0
+        self.sx = self.sx * DECAY + x
+        self.sy = self.sy * DECAY + y
+        self.sxx = self.sxx * DECAY + x * x
+        self.sxy = self.sxy * DECAY + x * y
+        self.count += 1
+
+    def coefficients(self) -> tuple:
+        """返回 (overhead 秒, 每字符秒)。"""
+        default_slope = DEFAULT_SEC_PER_KCHAR / 1000.0
+        if self.count == 0 or self.n <= 0:
+            return DEFAULT_OVERHEAD_S, default_slope
+        mx, my = self.sx / self.n, self.sy / self.n
+        var = self.sxx / self.n - mx * mx
+        slope = default_slope
+        if self.count >= MIN_SAMPLES and var > (mx * 0.05) ** 2:
+            slope = (self.sxy / self.n - mx * my) / var
+            slope = max(0.0, slope)
+        overhead = max(0.0, my - slope * mx)
+        return overhead, slope
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"n": self.n, "sx": self.sx, "sy": self.sy, "sxx": self.sxx,
+                "sxy": self.sxy, "count": self.count}
+
+
+class ExtractCostModel:
+    """按 key（schema slug / 模型）预测单篇提取耗时。线程安全。"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fits: Dict[str, _LinearFit] = {}
+        self._dirty = False
+        if path is not None and path.is_file():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                for key, v in (data or {}).items():
+                    if isinstance(v, dict):
+                        self._fits[key] = _LinearFit(v)
+            except (OSError, ValueError) as e:
+                logger.debug(f"耗时模型读取失败 {path}: {e}")
+
+    def _fit(self, key: str) -> _LinearFit:
+        fit = self._fits.get(key)
+        if fit is None or fit.count == 0:
+            # 新 schema 先借用全局统计
+            fit = self._fits.get("*") or fit or _LinearFit()
+        return fit
+
+    def predict(self, chars: int, key: str = "*") -> float:
+        with self._lock:
+            overhead, slope = self._fit(key).coefficients()
+        return overhead + max(0, int(chars or 0)) * slope
+
+    def observe(self, chars: int, seconds: float, key: str = "*") -> None:
+        if chars <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            for k in {key, "*"}:
+                self._fits.setdefault(k, _LinearFit()).add(float(chars), float(seconds))
+            self._dirty = True
+
+    def stats(self, key: str = "*") -> Dict[str, Any]:
+        with self._lock:
+            fit = self._fit(key)
+            overhead, slope = fit.coefficients()
+            return {"samples": fit.count, "overhead_s": round(overhead, 2),
+                    "sec_per_kchar": round(slope * 1000, 3)}
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty or self.path is None:
+                return
+            data = {k: v.to_dict() for k, v in self._fits.items()}
+            self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.debug(f"耗时模型写入失败 {self.path}: {e}")
+
+
+_MODEL_LOCK = threading.Lock()
+_MODEL: Optional[ExtractCostModel] = None
+
+
+def get_cost_model() -> ExtractCostModel:
+    global _MODEL
+    with _MODEL_LOCK:
+        if _MODEL is None:
+            try:
+                import settings
+                path: Optional[Path] = Path(settings.STATE_DIR) / COST_FILENAME
+            except Exception:
+                path = None
+            _MODEL = ExtractCostModel(path)
+        return _MODEL
+
+
+def lpt_order(costs: Dict[str, float]) -> List[str]:
+    """按预测耗时降序（相同耗时保持原顺序）。"""
+    order = list(costs)
+    return sorted(order, key=lambda k: -costs[k])
+
+
+def lpt_makespan(costs: Iterable[float], workers: int,
+                 busy: Optional[Iterable[float]] = None) -> float:
+    """模拟 LPT 列表调度：busy 为各在途位已占用的剩余秒数，costs 为待排任务。返回完成时间。
+
+    在途论文可多于 workers（WIP 准入允许）：最长的 workers 个各占一位，其余按从长到短
+    压到当前最空的位上，不丢弃。
+    """
+    workers = max(1, int(workers))
+    running = sorted((max(0.0, b) for b in (busy or ())), reverse=True)
+    loads = running[:workers]
+    loads += [0.0] * (workers - len(loads))
+    heapq.heapify(loads)
+    for b in running[workers:]:
+        heapq.heappush(loads, heapq.heappop(loads) + b)
+    for c in sorted(costs, reverse=True):
+        heapq.heappush(loads, heapq.heappop(loads) + max(0.0, c))
+    return max(loads) if loads else 0.0
+
+
+class MakespanTracker:
+    """提取任务内的 ETA：剩余任务按 LPT 模拟，乘以运行中校准的实际/预测比值。"""
+
+    def __init__(self, workers: int):
+        self.workers = max(1, int(workers))
+        self.ratio = 1.0
+        self._lock = threading.Lock()
+
+    def calibrate(self, predicted: float, actual: float) -> None:
+        if predicted <= 0 or actual <= 0:
+            return
+        lo, hi = CALIBRATION_RANGE
+        r = min(hi, max(lo, actual / predicted))
+        with self._lock:
+            self.ratio = (1 - CALIBRATION_ALPHA) * self.ratio + CALIBRATION_ALPHA * r
+
+    def eta(self, queued: Iterable[float], running: Iterable[tuple]) -> float:
+        """queued: 未准入论文的预测耗时；running: (预测耗时, 已运行秒) 列表。"""
+        with self._lock:
+            ratio = self.ratio
+        busy = [max(0.0, pred * ratio - elapsed) for pred, elapsed in running]
+        return lpt_makespan([c * ratio for c in queued], self.workers, busy)
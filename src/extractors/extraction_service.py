@@ -1,12 +1,14 @@
 """
 提取服务 - 高层API。基于「生成schema」的扁平提取（每字段内联 value+evidence）。
 """
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 from loguru import logger
 
+from src.cancel import CancelToken, Cancelled, cancel_scope
 from src.llm import create_llm_client, create_llm_client_for_agent, LLMClient
 from src.prompts.modes import GenericFlatMode, MultiAgentFlatMode
+from src.prompts.modes.flat_mode import configured_agent_policy
 
 
 @dataclass
@@ -20,6 +22,7 @@ class ExtractionOutput:
     model: str
     error: str = ""
     metadata: Dict[str, Any] = None
+    cancelled: bool = False
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -31,6 +34,7 @@ class ExtractionOutput:
             "model": self.model,
             "error": self.error,
             "metadata": self.metadata or {},
+            "cancelled": self.cancelled,
         }
 
 
@@ -53,11 +57,17 @@ class ExtractionService:
         reviewer_role: str = None,
         review_enabled: bool = None,
         keep_candidates: bool = False,
+        minimize: bool = None,
+        agent_policy: str = None,
     ):
         self.logger = logger.bind(module="ExtractionService")
         if schema is None:
             raise ValueError("ExtractionService 需要提供 schema")
         self.schema = schema
+        if minimize is None:
+            from src.schema.minimize import minimize_enabled
+            minimize = minimize_enabled()
+        self.minimize = bool(minimize)
         if extractor_roles is None:
             try:
                 import settings
@@ -96,6 +106,7 @@ class ExtractionService:
                 reviewer_role=reviewer_role or "extract_reviewer",
                 review_enabled=bool(review_enabled),
                 keep_candidates=keep_candidates,
+                agent_policy=agent_policy or configured_agent_policy(),
             )
             self.mode = "flat_multi_agent"
             self.llm_client = merger_client
@@ -107,10 +118,56 @@ class ExtractionService:
             f"schema={getattr(self.schema, 'slug', '?')} ({len(self.schema.fields)}字段)"
         )
 
-    def extract(self, paper_id: str, content: str, **kwargs) -> ExtractionOutput:
+    def _minimize(self, paper_id: str, content: str, kwargs: Dict[str, Any]):
+        """按配置精简正文；调用方可经 minimized= 传入已缓存的结果。
+
+        未传入时按 paper_id 走 load_paper_minimized：论文目录存在时读写其 minimized.json 侧车
+        （parsed_dir= 指定集合的解析目录，默认 DEFAULT_COLLECTION），CLI/脚本运行也能跨进程复用。
+        """
+        minimized = kwargs.pop("minimized", None)
+        parsed_dir = kwargs.pop("parsed_dir", None)
+        if minimized is None and self.minimize and content:
+            from src.schema.sampling import load_paper_minimized
+            minimized = load_paper_minimized(paper_id, parsed_dir=parsed_dir, text=content,
+                                             structure=kwargs.get("structure"))
+        return minimized
+
+    def extract(self, paper_id: str, content: str, cancel: Optional[CancelToken] = None,
+                **kwargs) -> ExtractionOutput:
+        """cancel: 取消令牌（不传时沿用当前 cancel_scope）；取消后在途 LLM 请求中止，返回 cancelled=True。"""
         self.logger.info(f"开始提取: {paper_id} ({self.mode})")
+        with cancel_scope(cancel) as token:
+            try:
+                return self._extract(paper_id, content, token, **kwargs)
+            except Cancelled:
+                return self._cancelled_output(paper_id, token)
+
+    def _cancelled_output(self, paper_id: str, token: Optional[CancelToken]) -> ExtractionOutput:
+        self.logger.info(f"提取已取消: {paper_id}")
+        return ExtractionOutput(
+            success=False, paper_id=paper_id, records=[], count=0, mode=self.mode,
+            model=self.llm_client.config.model,
+            error="已取消" + (f": {token.reason}" if token is not None and token.reason else ""),
+            cancelled=True,
+        )
+
+    def _extract(self, paper_id: str, content: str, token: Optional[CancelToken], **kwargs) -> ExtractionOutput:
         try:
+            minimized = self._minimize(paper_id, content, kwargs)
+            if minimized is not None and minimized.saved_chars > 0:
+                # 模型看精简文本；evidence 仍对照原文核验
+                kwargs["original"] = content
+                content = minimized.text
+                if kwargs.get("structure") is not None:
+                    # 输入预算收缩按精简文本的偏移进行（结构索引经偏移表映射）
+                    kwargs["content_structure"] = minimized.project_structure(kwargs["structure"])
             result = self._mode_strategy.extract(paper_id=paper_id, content=content, **kwargs)
+            if token is not None and token.cancelled:
+                # 取消后各阶段调用均被中止，部分结果不可信，不作为失败记录
+                return self._cancelled_output(paper_id, token)
+            if minimized is not None:
+                result.metadata = dict(result.metadata or {})
+                result.metadata["minimize"] = minimized.report()
             if result.success:
                 self.logger.info(f"提取完成: {paper_id}, 记录数={result.count}")
             else:
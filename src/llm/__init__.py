@@ -12,6 +12,7 @@ from .factory import (
     create_llm_client_for_worker,
 )
 from .openai_client import OpenAICompatibleClient
+from .tokens import TokenEstimator, estimate_tokens, get_estimator, plan_output_tokens
 
 __all__ = [
     "LLMClient",
@@ -22,4 +23,8 @@ __all__ = [
     "create_llm_client_for_agent",
     "create_llm_client_for_worker",
     "OpenAICompatibleClient",
+    "TokenEstimator",
+    "estimate_tokens",
+    "get_estimator",
+    "plan_output_tokens",
 ]
@@ -7,28 +7,12 @@ from typing import Dict, List, Optional, Any
 from datetime import datetime
 import json
 import time
-import threading
 from pathlib import Path
 from loguru import logger
 
-_SEM_LOCK = threading.Lock()
-_SEM_LIMIT = None
-_SEM = None
-
-
-def _llm_semaphore():
-    """Process-wide limiter for outbound LLM calls."""
-    global _SEM_LIMIT, _SEM
-    try:
-        import settings
-        limit = max(1, int(getattr(settings, "LLM_MAX_INFLIGHT", 8)))
-    except Exception:
-        limit = 8
-    with _SEM_LOCK:
-        if _SEM is None or _SEM_LIMIT != limit:
-            _SEM_LIMIT = limit
-            _SEM = threading.BoundedSemaphore(limit)
-        return _SEM
+from src.cancel import Cancelled, current_token
+from .host_slots import host_slot, note_rate_limited
+from .limiter import get_limiter
 
 
 @dataclass
@@ -50,6 +34,8 @@ class LLMResponse:
     latency_ms: int = 0
     finish_reason: str = ""
     truncated: bool = False  # 因 max_tokens 截断或正文为空（reasoning 吃光预算）
+    structured: bool = False  # 按 json_schema 约束解码（正文保证是合法 JSON）
+    cancelled: bool = False  # 所属任务被取消，调用被中止（未重试）
     raw_response: Any = None
     
     def to_json(self) -> Dict[str, Any]:
@@ -64,6 +50,8 @@ class LLMResponse:
             "latency_ms": self.latency_ms,
             "finish_reason": self.finish_reason,
             "truncated": self.truncated,
+            "structured": self.structured,
+            "cancelled": self.cancelled,
         }
 
 
@@ -84,6 +72,11 @@ class LLMConfig:
     extra_params: Dict[str, Any] = field(default_factory=dict)
 
 
+def _looks_rate_limited(error: str) -> bool:
+    msg = (error or "").lower()
+    return "429" in msg or "rate limit" in msg or "too many requests" in msg
+
+
 class LLMClient(ABC):
     """
     LLM客户端基类
@@ -152,13 +145,28 @@ class LLMClient(ABC):
         cur_max_tokens = int(kwargs.get("max_tokens", self.config.max_tokens) or self.config.max_tokens)
         token_cap = int(getattr(self.config, "max_tokens_cap", 0) or 65536)
 
-        # 重试循环
+        # 输入 token 估算：成功后用真实 prompt_tokens 校准估算器
+        prompt_est = 0
+        try:
+            from .tokens import get_estimator
+            estimator = get_estimator()
+            prompt_est = estimator.count_messages(messages, self.config.model)
+        except Exception:
+            estimator = None
+
+        # 重试循环（所属任务取消时：不再发起、退避等待立即醒来、在途请求中止）
+        token = current_token()
         last_error = ""
         for attempt in range(self.config.max_retries):
             if attempt > 0:
                 delay = self.config.retry_delay * (2 ** (attempt - 1))
                 self.logger.info(f"重试 {attempt + 1}/{self.config.max_retries}，等待 {delay:.1f}s")
-                time.sleep(delay)
+                if token is not None:
+                    token.wait(delay)
+                else:
+                    time.sleep(delay)
+            if token is not None and token.cancelled:
+                return self._cancelled_response(call_id, token.reason)
             
             try:
                 self.logger.debug(
@@ -171,14 +179,18 @@ class LLMClient(ABC):
                 call_kwargs["max_tokens"] = cur_max_tokens
 
                 start_time = time.time()
-                sem = _llm_semaphore()
-                with sem:
+                # 进程级并发上限（按通道/阶段/论文优先级放行，见 limiter.py），
+                # 再在主机级端点池上租一个槽位，多个 SPED 进程共享供应商限额（见 host_slots.py）
+                with get_limiter().slot(), host_slot(self.config.api_base):
                     response = self._do_call(messages, **call_kwargs)
                 response.latency_ms = int((time.time() - start_time) * 1000)
                 
                 if response.success:
                     self.stats["success_calls"] += 1
                     self.stats["total_tokens"] += response.usage.get("total_tokens", 0)
+                    if estimator is not None and prompt_est:
+                        estimator.observe(prompt_est, int(response.usage.get("prompt_tokens", 0) or 0),
+                                          self.config.model)
                     self._save_output(call_id, response)
                     # 报告成功
                     self._report_to_rotator(True)
@@ -186,11 +198,16 @@ class LLMClient(ABC):
                 else:
                     last_error = response.error
                     self.logger.warning(f"调用失败: {response.error}")
+                    if _looks_rate_limited(response.error):
+                        # 429：全机暂停放行该端点一小段时间，避免各进程同时重试形成风暴
+                        note_rate_limited(self.config.api_base, self.config.retry_delay * (2 ** attempt))
                     # 截断或正文为空：下次抬高 max_tokens 重试（reasoning 模型常见）
                     if getattr(response, "truncated", False) and cur_max_tokens < token_cap:
                         cur_max_tokens = min(int(cur_max_tokens * 2), token_cap)
                         self.logger.info(f"检测到截断/空正文，提升 max_tokens 至 {cur_max_tokens} 后重试")
                     
+            except Cancelled as e:
+                return self._cancelled_response(call_id, str(e))
             except Exception as e:
                 last_error = str(e)
                 self.logger.error(f"调用异常: {e}")
@@ -206,6 +223,17 @@ class LLMClient(ABC):
             provider=self.config.provider,
         )
     
+    def _cancelled_response(self, call_id: str, reason: str = "") -> LLMResponse:
+        self.stats["cancelled_calls"] = self.stats.get("cancelled_calls", 0) + 1
+        self.logger.info(f"调用已取消 [{call_id}]")
+        return LLMResponse(
+            success=False,
+            error=f"已取消: {reason}" if reason else "已取消",
+            model=self.config.model,
+            provider=self.config.provider,
+            cancelled=True,
+        )
+
     def _save_input(self, call_id: str, messages: List[LLMMessage]):
         """保存输入到文件"""
         try:
@@ -0,0 +1,104 @@
+"""
+端点能力探测缓存（目前只记录是否支持 json_schema 结构化输出）。
+
+LLM_STRUCTURED_OUTPUT=auto 时，客户端先按 json_schema 请求；端点以 400/422 拒绝 response_format
+时记为不支持并立刻降级为 json_object 重发，之后同一 (api_base, model) 不再尝试。结果写入
+STATE_DIR/llm_capabilities.json，多进程/重启后沿用，避免每个进程都浪费一次请求探测。
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+
+CAPABILITIES_FILENAME = "llm_capabilities.json"
+STRUCTURED_MODES = ("auto", "on", "off")
+
+_LOCK = threading.Lock()
+_CAPS: Optional[Dict[str, Dict[str, bool]]] = None
+
+# 端点拒绝 response_format 时错误信息里常见的关键词（各家措辞不一）
+_UNSUPPORTED_HINTS = (
+    "response_format", "json_schema", "response format", "structured output",
+    "not support", "unsupported", "unavailable", "invalid schema",
+)
+
+
+def structured_output_mode() -> str:
+    try:
+        import settings
+        mode = str(getattr(settings, "LLM_STRUCTURED_OUTPUT", "auto") or "auto").strip().lower()
+    except Exception:
+        mode = "auto"
+    return mode if mode in STRUCTURED_MODES else "auto"
+
+
+def _path() -> Optional[Path]:
+    try:
+        import settings
+        return Path(settings.STATE_DIR) / CAPABILITIES_FILENAME
+    except Exception:
+        return None
+
+
+def _load() -> Dict[str, Dict[str, bool]]:
+    global _CAPS
+    if _CAPS is None:
+        _CAPS = {}
+        path = _path()
+        if path is not None and path.is_file():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    _CAPS = {k: v for k, v in data.items() if isinstance(v, dict)}
+            except (OSError, ValueError) as e:
+                logger.debug(f"能力缓存读取失败 {path}: {e}")
+    return _CAPS
+
+
+def endpoint_key(api_base: str, model: str) -> str:
+    return f"{(api_base or '').rstrip('/')}|{model or ''}"
+
+
+def get_capability(key: str, name: str) -> Optional[bool]:
+    """已探测过返回 True/False，未知返回 None。"""
+    with _LOCK:
+        value = _load().get(key, {}).get(name)
+    return value if isinstance(value, bool) else None
+
+
+def set_capability(key: str, name: str, value: bool) -> None:
+    with _LOCK:
+        caps = _load()
+        if caps.get(key, {}).get(name) is value:
+            return
+        caps.setdefault(key, {})[name] = value
+        path = _path()
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(caps, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.debug(f"能力缓存写入失败 {path}: {e}")
+
+
+def looks_unsupported(status_code: Optional[int], message: str) -> bool:
+    """判断一次失败是否是端点不接受 json_schema response_format（而非限流/网络等）。"""
+    if status_code not in (400, 404, 415, 422):
+        return False
+    msg = (message or "").lower()
+    return any(h in msg for h in _UNSUPPORTED_HINTS)
+
+
+def reset_cache() -> None:
+    """清空进程内缓存（测试用；磁盘文件保留）。"""
+    global _CAPS
+    with _LOCK:
+        _CAPS = None
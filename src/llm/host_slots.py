@@ -0,0 +1,383 @@
+"""
+主机级 LLM 并发 / 速率限制（跨进程，SQLite 租约）。
+
+limiter.py 只管本进程；网页服务与 scripts/run_full_extract.py（或两个不同 collection 的
+CLI 任务）同时运行时，各自的 LLM_MAX_INFLIGHT 相加，真实在途数超过供应商限额，引发 429 风暴。
+这里让同一台机器上的所有 SPED 进程通过 STATE_DIR/llm_slots.db 协调：
+
+  - leases：每次 LLM 调用先在对应端点池（api_base 的主机名）租一个槽位，调用结束删除；
+    槽位数上限 LLM_HOST_MAX_INFLIGHT（0 = 沿用 LLM_MAX_INFLIGHT）；
+  - grants：近 60 秒的放行时间戳，实现 LLM_HOST_RATE_PER_MIN 的滑动窗口限速；
+  - waiters：排队中的调用及其通道，空出槽位时高权重通道（interactive）先拿，
+    等待超过 AGING_S 的调用视为最高优先级，避免批量任务被饿死；
+  - pools：端点池的冷却截止时间；任一进程遇到 429 即让全机暂停放行一小段时间。
+
+进程崩溃遗留的租约：本机上 pid 已不存在的立即回收，其它按心跳超时（LLM_LEASE_TTL_S）回收；
+持有租约的进程由后台线程定期刷新心跳。协调库不可用时降级为仅进程内限流，不阻塞调用。
+"""
+from __future__ import annotations
+
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from loguru import logger
+
+from src.cancel import sleep as cancellable_sleep
+
+SLOTS_FILENAME = "llm_slots.db"
+RATE_WINDOW_S = 60.0
+AGING_S = 10.0                     # 等待超过此秒数的调用不再让位给高权重通道
+POLL_MIN_S = 0.02
+POLL_MAX_S = 0.5
+DEFAULT_TTL_S = 90.0
+DEFAULT_COOLDOWN_S = 5.0
+_HOST = socket.gethostname()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    token       TEXT PRIMARY KEY,
+    pool        TEXT NOT NULL,
+    slot        INTEGER NOT NULL,
+    pid         INTEGER NOT NULL,
+    host        TEXT NOT NULL,
+    lane        TEXT,
+    stage       TEXT,
+    paper       TEXT,
+    acquired_at REAL NOT NULL,
+    heartbeat   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leases_pool ON leases(pool);
+CREATE TABLE IF NOT EXISTS waiters (
+    token     TEXT PRIMARY KEY,
+    pool      TEXT NOT NULL,
+    pid       INTEGER NOT NULL,
+    host      TEXT NOT NULL,
+    lane      TEXT,
+    weight    REAL NOT NULL,
+    since     REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_waiters_pool ON waiters(pool);
+CREATE TABLE IF NOT EXISTS grants (
+    pool TEXT NOT NULL,
+    ts   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_grants_pool_ts ON grants(pool, ts);
+CREATE TABLE IF NOT EXISTS pools (
+    pool           TEXT PRIMARY KEY,
+    max_inflight   INTEGER,
+    rate_per_min   INTEGER,
+    cooldown_until REAL DEFAULT 0
+);
+"""
+
+
+def pool_for(api_base: str) -> str:
+    """端点池：按 api_base 的主机名划分（同一供应商共享限额）。"""
+    host = urlparse(api_base or "").netloc or (api_base or "")
+    return host.lower() or "default"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class HostSlots:
+    """SQLite 租约表上的跨进程槽位。acquire 返回 token，release(token) 归还。"""
+
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL_S):
+        self.path = Path(path)
+        self.ttl = max(5.0, float(ttl))
+        self._local = threading.local()
+        self._held: Dict[str, float] = {}
+        self._held_lock = threading.Lock()
+        self._beat: Optional[threading.Thread] = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            from src.database.catalog import configure_connection
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            configure_connection(conn)
+            self._local.conn = conn
+        return conn
+
+    # ---- 过期回收 ----
+    def _reap(self, conn: sqlite3.Connection, now: float) -> int:
+        cutoff = now - self.ttl
+        removed = 0
+        for table in ("leases", "waiters"):
+            removed += conn.execute(f"DELETE FROM {table} WHERE heartbeat < ?", (cutoff,)).rowcount
+            rows = conn.execute(f"SELECT token, pid FROM {table} WHERE host = ? AND pid != ?",
+                                (_HOST, os.getpid())).fetchall()
+            dead = [(r["token"],) for r in rows if not _pid_alive(int(r["pid"]))]
+            if dead:
+                conn.executemany(f"DELETE FROM {table} WHERE token = ?", dead)
+                removed += len(dead)
+        conn.execute("DELETE FROM grants WHERE ts < ?", (now - RATE_WINDOW_S,))
+        return removed
+
+    # ---- 申请 / 归还 ----
+    def _try_grant(self, conn: sqlite3.Connection, token: str, pool: str, limit: int, rate: int,
+                   weight: float, since: float, info: Dict[str, str]) -> Optional[float]:
+        """在一个 IMMEDIATE 事务内尝试放行；成功返回 None，否则返回建议等待秒数。"""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._reap(conn, now)
+            conn.execute("UPDATE waiters SET heartbeat = ? WHERE token = ?", (now, token))
+            conn.execute(
+                "INSERT INTO pools(pool, max_inflight, rate_per_min) VALUES(?, ?, ?) "
+                "ON CONFLICT(pool) DO UPDATE SET max_inflight = excluded.max_inflight, "
+                "rate_per_min = excluded.rate_per_min", (pool, limit, rate))
+            cooldown = conn.execute("SELECT cooldown_until FROM pools WHERE pool = ?", (pool,)).fetchone()
+            if cooldown and (cooldown[0] or 0) > now:
+                conn.execute("COMMIT")
+                return float(cooldown[0]) - now
+            used = [r[0] for r in conn.execute("SELECT slot FROM leases WHERE pool = ?", (pool,))]
+            if len(used) >= limit:
+                conn.execute("COMMIT")
+                return -1.0
+            if rate > 0:
+                recent = conn.execute("SELECT COUNT(*), MIN(ts) FROM grants WHERE pool = ? AND ts >= ?",
+                                      (pool, now - RATE_WINDOW_S)).fetchone()
+                if recent[0] >= rate:
+                    conn.execute("COMMIT")
+                    return max(POLL_MIN_S, float(recent[1]) + RATE_WINDOW_S - now)
+            # 跨进程优先级：有更高有效权重的存活等待者时让位（等待过久者有效权重视为无穷大）
+            mine = float("inf") if now - since >= AGING_S else weight
+            if mine != float("inf"):
+                better = conn.execute(
+                    "SELECT 1 FROM waiters WHERE pool = ? AND token != ? AND "
+                    "(weight > ? OR ? - since >= ?) LIMIT 1",
+                    (pool, token, mine, now, AGING_S)).fetchone()
+                if better:
+                    conn.execute("COMMIT")
+                    return -1.0
+            taken = set(used)
+            slot = next(i for i in range(len(used) + 1) if i not in taken)
+            conn.execute("DELETE FROM waiters WHERE token = ?", (token,))
+            conn.execute(
+                "INSERT INTO leases(token, pool, slot, pid, host, lane, stage, paper, acquired_at, heartbeat) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (token, pool, slot, os.getpid(), _HOST, info.get("lane", ""), info.get("stage", ""),
+                 info.get("paper", ""), now, now))
+            conn.execute("INSERT INTO grants(pool, ts) VALUES(?, ?)", (pool, now))
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self, pool: str, limit: int, rate_per_min: int = 0, weight: float = 1.0,
+                info: Optional[Dict[str, str]] = None) -> str:
+        info = info or {}
+        limit = max(1, int(limit))
+        token = uuid.uuid4().hex
+        conn = self._conn()
+        since = time.time()
+        conn.execute(
+            "INSERT INTO waiters(token, pool, pid, host, lane, weight, since, heartbeat) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+            (token, pool, os.getpid(), _HOST, info.get("lane", ""), float(weight), since, since))
+        delay = POLL_MIN_S
+        try:
+            while True:
+                hint = self._try_grant(conn, token, pool, limit, int(rate_per_min or 0), weight, since, info)
+                if hint is None:
+                    break
+                wait = hint if hint > 0 else delay
+                cancellable_sleep(min(POLL_MAX_S * 4, wait) * random.uniform(0.8, 1.2))
+                delay = min(POLL_MAX_S, delay * 1.5)
+        except BaseException:
+            conn.execute("DELETE FROM waiters WHERE token = ?", (token,))
+            raise
+        with self._held_lock:
+            self._held[token] = time.time()
+        self._ensure_heartbeat()
+        return token
+
+    def release(self, token: str) -> None:
+        with self._held_lock:
+            self._held.pop(token, None)
+        self._conn().execute("DELETE FROM leases WHERE token = ?", (token,))
+
+    def note_rate_limited(self, pool: str, seconds: float = DEFAULT_COOLDOWN_S) -> None:
+        """端点返回 429：让全机在 seconds 内暂停放行该池的新调用。"""
+        until = time.time() + max(0.0, seconds)
+        self._conn().execute(
+            "INSERT INTO pools(pool, cooldown_until) VALUES(?, ?) ON CONFLICT(pool) DO UPDATE SET "
+            "cooldown_until = MAX(COALESCE(cooldown_until, 0), excluded.cooldown_until)", (pool, until))
+
+    # ---- 心跳 ----
+    def _ensure_heartbeat(self) -> None:
+        if self._beat is not None and self._beat.is_alive():
+            return
+        with self._held_lock:
+            if self._beat is not None and self._beat.is_alive():
+                return
+            self._beat = threading.Thread(target=self._heartbeat_loop, name="llm-slots-heartbeat", daemon=True)
+            self._beat.start()
+
+    def heartbeat(self) -> int:
+        with self._held_lock:
+            tokens = [(t,) for t in self._held]
+        if not tokens:
+            return 0
+        now = time.time()
+        conn = self._conn()
+        conn.executemany("UPDATE leases SET heartbeat = ? WHERE token = ?", [(now, t) for (t,) in tokens])
+        return len(tokens)
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(self.ttl / 3)
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                logger.debug(f"LLM 槽位心跳失败: {e}")
+
+    # ---- 状态 ----
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            reaped = self._reap(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        me = (os.getpid(), _HOST)
+
+        def _rows(sql: str) -> List[Dict[str, Any]]:
+            return [dict(r) for r in conn.execute(sql)]
+
+        leases = []
+        for r in _rows("SELECT * FROM leases ORDER BY pool, slot"):
+            leases.append({
+                "pool": r["pool"], "slot": r["slot"], "pid": r["pid"], "host": r["host"],
+                "lane": r["lane"], "stage": r["stage"], "paper": r["paper"],
+                "held_s": round(now - r["acquired_at"], 1),
+                "heartbeat_age_s": round(now - r["heartbeat"], 1),
+                "self": (r["pid"], r["host"]) == me,
+            })
+        waiters = [{"pool": r["pool"], "pid": r["pid"], "host": r["host"], "lane": r["lane"],
+                    "waiting_s": round(now - r["since"], 1), "self": (r["pid"], r["host"]) == me}
+                   for r in _rows("SELECT * FROM waiters ORDER BY since")]
+        pools = {}
+        for r in _rows("SELECT * FROM pools ORDER BY pool"):
+            recent = conn.execute("SELECT COUNT(*) FROM grants WHERE pool = ?", (r["pool"],)).fetchone()[0]
+            pools[r["pool"]] = {
+                "max_inflight": r["max_inflight"], "rate_per_min": r["rate_per_min"],
+                "inflight": sum(1 for x in leases if x["pool"] == r["pool"]),
+                "waiting": sum(1 for x in waiters if x["pool"] == r["pool"]),
+                "grants_last_min": recent,
+                "cooldown_s": round(max(0.0, (r["cooldown_until"] or 0) - now), 1),
+            }
+        return {"db": str(self.path), "ttl_s": self.ttl, "reaped": reaped,
+                "pools": pools, "leases": leases, "waiters": waiters}
+
+
+# ---------------------------------------------------------------------------
+# 进程级入口
+# ---------------------------------------------------------------------------
+_HOST_LOCK = threading.Lock()
+_HOST_SLOTS: Optional[HostSlots] = None
+_HOST_FAILED = False
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def host_limits() -> Dict[str, Any]:
+    enabled = bool(_setting("LLM_HOST_LIMITER", True))
+    try:
+        limit = int(_setting("LLM_HOST_MAX_INFLIGHT", 0) or 0) or int(_setting("LLM_MAX_INFLIGHT", 8))
+        rate = max(0, int(_setting("LLM_HOST_RATE_PER_MIN", 0) or 0))
+    except (TypeError, ValueError):
+        limit, rate = 8, 0
+    return {"enabled": enabled, "max_inflight": max(1, limit), "rate_per_min": rate}
+
+
+def get_host_slots() -> Optional[HostSlots]:
+    """LLM_HOST_LIMITER 关闭或协调库不可用时返回 None。"""
+    global _HOST_SLOTS, _HOST_FAILED
+    if not host_limits()["enabled"] or _HOST_FAILED:
+        return None
+    with _HOST_LOCK:
+        if _HOST_SLOTS is None:
+            try:
+                path = Path(_setting("STATE_DIR", Path("data/state"))) / SLOTS_FILENAME
+                _HOST_SLOTS = HostSlots(path, ttl=float(_setting("LLM_LEASE_TTL_S", DEFAULT_TTL_S)))
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"主机级 LLM 限流不可用，仅按进程内限流: {e}")
+                _HOST_FAILED = True
+                return None
+        return _HOST_SLOTS
+
+
+@contextmanager
+def host_slot(api_base: str):
+    """在主机级端点池上持有一个 LLM 槽位；协调失败时直接放行（不因限流库故障阻塞提取）。"""
+    slots = get_host_slots()
+    token = None
+    if slots is not None:
+        from .limiter import current_context, lane_weights
+        ctx = current_context()
+        limits = host_limits()
+        try:
+            token = slots.acquire(pool_for(api_base), limits["max_inflight"], limits["rate_per_min"],
+                                  weight=lane_weights().get(ctx["lane"], 1.0),
+                                  info={"lane": ctx["lane"], "stage": ctx["stage"], "paper": ctx["paper"]})
+        except sqlite3.Error as e:
+            logger.warning(f"主机级 LLM 槽位申请失败，本次直接放行: {e}")
+    try:
+        yield
+    finally:
+        if token is not None:
+            try:
+                slots.release(token)
+            except sqlite3.Error as e:
+                logger.debug(f"LLM 槽位归还失败（将按心跳超时回收）: {e}")
+
+
+def note_rate_limited(api_base: str, seconds: float = DEFAULT_COOLDOWN_S) -> None:
+    slots = get_host_slots()
+    if slots is None:
+        return
+    try:
+        slots.note_rate_limited(pool_for(api_base), seconds)
+    except sqlite3.Error as e:
+        logger.debug(f"记录限速冷却失败: {e}")
+
+
+def host_slots_status() -> Dict[str, Any]:
+    slots = get_host_slots()
+    out: Dict[str, Any] = {"limits": host_limits(), "host": _HOST, "pid": os.getpid()}
+    if slots is not None:
+        out.update(slots.status())
+    return out
@@ -0,0 +1,308 @@
+"""
+进程内 LLM 调用限流器（按阶段/论文优先级调度）。
+
+原先所有调用 FIFO 竞争一个 BoundedSemaphore(LLM_MAX_INFLIGHT)：8 篇论文各自 2 路 extractor，
+再加 merger、reviewer，大量论文停在半路，单篇延迟被拉长。这里在同样的并发上限前加一个
+优先队列，空出槽位时按以下顺序放行：
+
+  1. 阶段越靠后越优先：review > merge > extract > 其它（schema 设计等）；
+  2. 同阶段内，越早开始处理的论文越优先（让在途论文先完成、结果稳定流出）；
+  3. 其余按到达顺序。
+
+阶段与论文通过 contextvars 传递（llm_context），调用点无需改签名；跨线程提交任务时
+需用 contextvars.copy_context().run 携带上下文。
+
+在此之上按任务划分优先级通道（lane）：interactive（网页上单篇提取、schema 设计）、normal、
+bulk（全量提取脚本、大批量任务）。各通道排各自的队，空出槽位时按加权公平排队（WFQ）选通道：
+每放行一次，该通道的虚拟完成时间推进 1/权重，取虚拟完成时间最小者。权重默认 8:3:1
+（LLM_LANE_WEIGHTS），交互请求只需等当前在途调用之一结束，bulk 在满载时仍保有约 1/12 的份额，
+不会饿死。通道内部仍按上面的阶段/论文顺序。
+"""
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.cancel import Cancelled, current_token
+
+STAGE_RANKS = {"review": 0, "merge": 1, "extract": 2}
+DEFAULT_RANK = 3
+
+LANES = ("interactive", "normal", "bulk")
+DEFAULT_LANE = "normal"
+DEFAULT_LANE_WEIGHTS = {"interactive": 8.0, "normal": 3.0, "bulk": 1.0}
+# 按批量大小自动选通道：≤ INTERACTIVE_MAX_PAPERS 篇视为交互，≥ BULK_MIN_PAPERS 篇视为批量
+INTERACTIVE_MAX_PAPERS = 2
+BULK_MIN_PAPERS = 50
+
+_STAGE: contextvars.ContextVar[str] = contextvars.ContextVar("llm_stage", default="")
+_LANE: contextvars.ContextVar[str] = contextvars.ContextVar("llm_lane", default=DEFAULT_LANE)
+_PAPER: contextvars.ContextVar[Optional[Tuple[int, str]]] = contextvars.ContextVar("llm_paper", default=None)
+_PAPER_SEQ = itertools.count()
+
+
+def next_paper_seq() -> int:
+    """论文准入序号（越小越早开始处理）。"""
+    return next(_PAPER_SEQ)
+
+
+def normalize_lane(lane: Optional[str]) -> str:
+    lane = (lane or "").strip().lower()
+    return lane if lane in LANES else DEFAULT_LANE
+
+
+def lane_for_batch(n_papers: int, requested: Optional[str] = None) -> str:
+    """任务的优先级通道：显式指定优先，否则按批量大小推断。"""
+    if requested and requested.strip().lower() in LANES:
+        return requested.strip().lower()
+    if n_papers <= INTERACTIVE_MAX_PAPERS:
+        return "interactive"
+    if n_papers >= BULK_MIN_PAPERS:
+        return "bulk"
+    return DEFAULT_LANE
+
+
+def lane_weights() -> Dict[str, float]:
+    """LLM_LANE_WEIGHTS="interactive:8,normal:3,bulk:1"；缺项/非法项用默认值。"""
+    weights = dict(DEFAULT_LANE_WEIGHTS)
+    try:
+        import settings
+        raw = str(getattr(settings, "LLM_LANE_WEIGHTS", "") or "")
+    except Exception:
+        raw = ""
+    for part in raw.split(","):
+        name, _, value = part.partition(":")
+        name = name.strip().lower()
+        try:
+            if name in weights and float(value) > 0:
+                weights[name] = float(value)
+        except ValueError:
+            continue
+    return weights
+
+
+@contextmanager
+def llm_context(stage: Optional[str] = None, paper: Optional[str] = None, seq: Optional[int] = None,
+                lane: Optional[str] = None):
+    """在当前上下文中标注后续 LLM 调用所属的阶段 / 论文 / 优先级通道。未给的项沿用外层。"""
+    tokens: List[Tuple[contextvars.ContextVar, contextvars.Token]] = []
+    if lane is not None:
+        tokens.append((_LANE, _LANE.set(normalize_lane(lane))))
+    if stage is not None:
+        tokens.append((_STAGE, _STAGE.set(stage)))
+    if paper is not None:
+        tokens.append((_PAPER, _PAPER.set((next_paper_seq() if seq is None else seq, paper))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_context() -> Dict[str, Any]:
+    paper = _PAPER.get()
+    return {"stage": _STAGE.get(), "paper": paper[1] if paper else "",
+            "paper_seq": paper[0] if paper else None, "lane": _LANE.get()}
+
+
+class _Waiter:
+    __slots__ = ("key", "event", "stage", "lane", "since", "granted", "abandoned")
+
+    def __init__(self, key: Tuple, stage: str, lane: str):
+        self.key = key
+        self.stage = stage
+        self.lane = lane
+        self.event = threading.Event()
+        self.since = time.monotonic()
+        self.granted = False
+        self.abandoned = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+class PriorityLimiter:
+    """并发上限 + 按通道加权公平的优先队列。slot() 为上下文管理器，按当前 llm_context 排队。"""
+
+    def __init__(self, limit: int, weights: Optional[Dict[str, float]] = None):
+        self.limit = max(1, int(limit))
+        self.weights: Dict[str, float] = dict(weights or DEFAULT_LANE_WEIGHTS)
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[_Waiter]] = {lane: [] for lane in LANES}
+        self._finish: Dict[str, float] = {lane: 0.0 for lane in LANES}   # 各通道虚拟完成时间
+        self._vtime = 0.0
+        self._arrivals = itertools.count()
+        self.inflight = 0
+        self._inflight_by_stage: Dict[str, int] = {}
+        self._inflight_by_lane: Dict[str, int] = {}
+        self.granted = 0
+        self._granted_by_lane: Dict[str, int] = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_by_lane: Dict[str, float] = {}
+
+    def set_limit(self, limit: int) -> None:
+        with self._lock:
+            self.limit = max(1, int(limit))
+            self._dispatch()
+
+    def set_weights(self, weights: Dict[str, float]) -> None:
+        with self._lock:
+            self.weights = {lane: max(1e-3, float(weights.get(lane, DEFAULT_LANE_WEIGHTS[lane]))) for lane in LANES}
+
+    def _waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _next_lane(self) -> Optional[str]:
+        """WFQ：取虚拟完成时间最小的非空通道（相同时权重大者优先）。"""
+        best, best_tag = None, None
+        for lane in LANES:
+            if not self._queues[lane]:
+                continue
+            tag = self._finish[lane] + 1.0 / self.weights.get(lane, 1.0)
+            if best_tag is None or tag < best_tag:
+                best, best_tag = lane, tag
+        if best is not None:
+            self._vtime = max(self._vtime, self._finish[best])
+            self._finish[best] = best_tag
+        return best
+
+    def _dispatch(self) -> None:
+        while self.inflight < self.limit:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            w = heapq.heappop(self._queues[lane])
+            w.granted = True
+            self._grant(w.stage, lane, time.monotonic() - w.since)
+            w.event.set()
+
+    def _grant(self, stage: str, lane: str, waited: float) -> None:
+        self.inflight += 1
+        self._inflight_by_stage[stage] = self._inflight_by_stage.get(stage, 0) + 1
+        self._inflight_by_lane[lane] = self._inflight_by_lane.get(lane, 0) + 1
+        self.granted += 1
+        self._granted_by_lane[lane] = self._granted_by_lane.get(lane, 0) + 1
+        self._wait_total += waited
+        self._wait_by_lane[lane] = self._wait_by_lane.get(lane, 0.0) + waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def acquire(self, stage: str = "", paper_seq: Optional[int] = None, lane: str = DEFAULT_LANE) -> None:
+        rank = STAGE_RANKS.get(stage, DEFAULT_RANK)
+        lane = normalize_lane(lane)
+        with self._lock:
+            if self.inflight < self.limit and not self._waiting():
+                # 空闲时直接放行；通道虚拟时间照常推进，保证之后竞争时份额正确
+                self._vtime = max(self._vtime, self._finish[lane])
+                self._finish[lane] = self._vtime + 1.0 / self.weights.get(lane, 1.0)
+                self._grant(stage, lane, 0.0)
+                return
+            w = _Waiter((rank, paper_seq if paper_seq is not None else float("inf"), next(self._arrivals)),
+                        stage, lane)
+            if not self._queues[lane]:
+                # 通道由空转为积压：从当前虚拟时间起算，空闲期间不累积额度
+                self._finish[lane] = max(self._finish[lane], self._vtime)
+            heapq.heappush(self._queues[lane], w)
+        token = current_token()
+        if token is None:
+            w.event.wait()
+            return
+        unregister = token.on_cancel(lambda: self._abandon(w))
+        try:
+            w.event.wait()
+        finally:
+            unregister()
+        if w.abandoned:
+            raise Cancelled(token.reason)
+
+    def _abandon(self, w: _Waiter) -> None:
+        """排队中的调用所属任务被取消：移出队列并唤醒（已放行的不受影响，由调用方照常 release）。"""
+        with self._lock:
+            if w.granted:
+                return
+            queue = self._queues[w.lane]
+            if w in queue:
+                queue.remove(w)
+                heapq.heapify(queue)
+            w.abandoned = True
+        w.event.set()
+
+    @staticmethod
+    def _dec(counts: Dict[str, int], key: str) -> None:
+        left = counts.get(key, 0) - 1
+        if left > 0:
+            counts[key] = left
+        else:
+            counts.pop(key, None)
+
+    def release(self, stage: str = "", lane: str = DEFAULT_LANE) -> None:
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+            self._dec(self._inflight_by_stage, stage)
+            self._dec(self._inflight_by_lane, normalize_lane(lane))
+            self._dispatch()
+
+    @contextmanager
+    def slot(self):
+        ctx = current_context()
+        self.acquire(ctx["stage"], ctx["paper_seq"], ctx["lane"])
+        try:
+            yield
+        finally:
+            self.release(ctx["stage"], ctx["lane"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting: Dict[str, int] = {}
+            for q in self._queues.values():
+                for w in q:
+                    waiting[w.stage or "other"] = waiting.get(w.stage or "other", 0) + 1
+            return {
+                "limit": self.limit,
+                "inflight": self.inflight,
+                "inflight_by_stage": {k or "other": v for k, v in self._inflight_by_stage.items()},
+                "inflight_by_lane": dict(self._inflight_by_lane),
+                "waiting": self._waiting(),
+                "waiting_by_stage": waiting,
+                "waiting_by_lane": {lane: len(q) for lane, q in self._queues.items() if q},
+                "granted": self.granted,
+                "granted_by_lane": dict(self._granted_by_lane),
+                "avg_wait_ms": int(self._wait_total / self.granted * 1000) if self.granted else 0,
+                "avg_wait_ms_by_lane": {lane: int(self._wait_by_lane.get(lane, 0.0) / n * 1000)
+                                        for lane, n in self._granted_by_lane.items() if n},
+                "max_wait_ms": int(self._wait_max * 1000),
+                "weights": dict(self.weights),
+            }
+
+
+_LIMITER_LOCK = threading.Lock()
+_LIMITER: Optional[PriorityLimiter] = None
+
+
+def get_limiter() -> PriorityLimiter:
+    """进程级限流器；LLM_MAX_INFLIGHT / LLM_LANE_WEIGHTS 变化（设置页热更新）时原地调整，不丢排队者。"""
+    global _LIMITER
+    try:
+        import settings
+        limit = max(1, int(getattr(settings, "LLM_MAX_INFLIGHT", 8)))
+    except Exception:
+        limit = 8
+    weights = lane_weights()
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = PriorityLimiter(limit, weights)
+        else:
+            if _LIMITER.limit != limit:
+                _LIMITER.set_limit(limit)
+            if _LIMITER.weights != weights:
+                _LIMITER.set_weights(weights)
+        return _LIMITER
+
+
+def limiter_stats() -> Dict[str, Any]:
+    return get_limiter().stats()
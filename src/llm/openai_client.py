@@ -2,9 +2,22 @@
 OpenAI兼容客户端 - 支持OpenAI/SiliconFlow/DeepSeek等兼容API
 """
 from typing import Dict, List, Any, Optional
+import socket
+
+import httpcore
 import httpx
+from loguru import logger
 
+from src.cancel import current_token
+from src.cancel import sleep as cancellable_sleep
 from .base import LLMClient, LLMConfig, LLMMessage, LLMResponse
+from .capabilities import (
+    endpoint_key,
+    get_capability,
+    looks_unsupported,
+    set_capability,
+    structured_output_mode,
+)
 
 try:
     from openai import OpenAI
@@ -12,6 +25,115 @@ except ImportError:
     OpenAI = None
 
 
+class _CancellableStream(httpcore.NetworkStream):
+    """阻塞读写期间登记中止回调：任务取消时 shutdown socket，使正在等待响应的请求立即出错。"""
+
+    def __init__(self, inner: httpcore.NetworkStream):
+        self._inner = inner
+
+    def _abort(self) -> None:
+        sock = self._inner.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        token = current_token()
+        if token is None:
+            return self._inner.read(max_bytes, timeout)
+        with token.guard(self._abort):
+            data = self._inner.read(max_bytes, timeout)
+        # shutdown 后 recv 返回 b""，不能让 httpcore 当作对端断开
+        token.raise_if_cancelled()
+        return data
+
+    def write(self, buffer: bytes, timeout: Optional[float] = None) -> None:
+        token = current_token()
+        if token is None:
+            return self._inner.write(buffer, timeout)
+        with token.guard(self._abort):
+            return self._inner.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._inner.close()
+
+    def start_tls(self, *args: Any, **kwargs: Any) -> httpcore.NetworkStream:
+        return _CancellableStream(self._inner.start_tls(*args, **kwargs))
+
+    def get_extra_info(self, info: str) -> Any:
+        return self._inner.get_extra_info(info)
+
+
+class _CancellableBackend(httpcore.NetworkBackend):
+    def __init__(self, inner: httpcore.NetworkBackend):
+        self._inner = inner
+
+    def connect_tcp(self, *args: Any, **kwargs: Any) -> httpcore.NetworkStream:
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        return _CancellableStream(self._inner.connect_tcp(*args, **kwargs))
+
+    def connect_unix_socket(self, *args: Any, **kwargs: Any) -> httpcore.NetworkStream:
+        return _CancellableStream(self._inner.connect_unix_socket(*args, **kwargs))
+
+    def sleep(self, seconds: float) -> None:
+        cancellable_sleep(seconds)
+
+
+def _pool_of(transport: httpx.HTTPTransport) -> Optional[httpcore.ConnectionPool]:
+    # httpx 未公开连接池；依赖的属性名随 requirements.txt 中固定的 httpx/httpcore 版本范围
+    pool = getattr(transport, "_pool", None)
+    if isinstance(pool, httpcore.ConnectionPool) and hasattr(pool, "_network_backend"):
+        return pool
+    return None
+
+
+def is_cancellable(transport: httpx.BaseTransport) -> bool:
+    """传输层是否已装上可取消的网络后端。"""
+    pool = _pool_of(transport) if isinstance(transport, httpx.HTTPTransport) else None
+    return pool is not None and isinstance(pool._network_backend, _CancellableBackend)
+
+
+def _install_backend(transport: httpx.BaseTransport) -> bool:
+    pool = _pool_of(transport) if isinstance(transport, httpx.HTTPTransport) else None
+    if pool is None or pool._network_backend is None:
+        return False
+    if not isinstance(pool._network_backend, _CancellableBackend):
+        pool._network_backend = _CancellableBackend(pool._network_backend)
+    return True
+
+
+def _warn_not_cancellable() -> None:
+    logger.warning(
+        f"无法为 httpx {httpx.__version__} / httpcore {httpcore.__version__} 安装可取消的网络后端，"
+        "任务取消将不能中止进行中的 LLM 请求"
+    )
+
+
+def cancellable_transport(**kwargs: Any) -> httpx.HTTPTransport:
+    """httpx 传输层：请求在当前 cancel_scope 的 token 被取消时中止（连接池照常复用）。
+
+    httpx/httpcore 内部结构变化导致无法替换网络后端时记警告：请求照常进行，但取消只能在请求之间生效。
+    """
+    transport = httpx.HTTPTransport(**kwargs)
+    if not _install_backend(transport):
+        _warn_not_cancellable()
+    return transport
+
+
+def cancellable_client(**kwargs: Any) -> httpx.Client:
+    """httpx.Client：保留默认传输层与按 HTTP(S)_PROXY/ALL_PROXY 环境变量挂载的代理传输层，
+    并给它们都装上可取消的网络后端（显式传 transport 会让 httpx 忽略代理环境变量）。"""
+    client = httpx.Client(**kwargs)
+    transports = [client._transport, *(t for t in client._mounts.values() if t is not None)]
+    if not all([_install_backend(t) for t in transports]):
+        _warn_not_cancellable()
+    return client
+
+
 class OpenAICompatibleClient(LLMClient):
     """
     OpenAI兼容客户端
@@ -51,7 +173,8 @@ class OpenAICompatibleClient(LLMClient):
                 "Accept": "application/json",
             }
         
-        http_client = httpx.Client(
+        # 传输层支持协作式取消：任务取消时正在等待的请求立即中止，释放供应商并发额度
+        http_client = cancellable_client(
             timeout=timeout_config,
             **http_client_kwargs
         )
@@ -80,9 +203,14 @@ class OpenAICompatibleClient(LLMClient):
             # 添加超时
             request_kwargs["timeout"] = self.config.timeout
             
-            # 强制JSON输出模式（默认开启）
+            # 强制JSON输出模式（默认开启）；调用方给了 response_schema 且端点支持时用 json_schema 约束解码
+            structured = False
             if kwargs.get("json_mode", True):
                 request_kwargs["response_format"] = {"type": "json_object"}
+                response_schema = kwargs.get("response_schema")
+                if response_schema and self._use_structured_output():
+                    request_kwargs["response_format"] = {"type": "json_schema", "json_schema": response_schema}
+                    structured = True
             
             # 供应商特定参数
             extra_body = self._build_extra_body()
@@ -95,7 +223,15 @@ class OpenAICompatibleClient(LLMClient):
             )
             
             # 调用API
-            response = self.client.chat.completions.create(**request_kwargs)
+            try:
+                response = self.client.chat.completions.create(**request_kwargs)
+            except Exception as e:
+                if not structured or not self._structured_rejected(e):
+                    raise
+                # 端点不接受 json_schema：记入能力缓存，本次立即降级为 json_object 重发
+                request_kwargs["response_format"] = {"type": "json_object"}
+                structured = False
+                response = self.client.chat.completions.create(**request_kwargs)
             
             # 解析响应
             choice = response.choices[0]
@@ -133,6 +269,7 @@ class OpenAICompatibleClient(LLMClient):
                 provider=self.config.provider,
                 usage=usage,
                 finish_reason=finish_reason,
+                structured=structured,
                 raw_response=response,
             )
             
@@ -151,6 +288,29 @@ class OpenAICompatibleClient(LLMClient):
                 provider=self.config.provider,
             )
     
+    def _use_structured_output(self) -> bool:
+        """LLM_STRUCTURED_OUTPUT：on 总是使用；off 从不使用；auto 除非已探测到端点不支持。"""
+        mode = structured_output_mode()
+        if mode == "off":
+            return False
+        if mode == "on":
+            return True
+        key = endpoint_key(self.config.api_base, self.config.model)
+        return get_capability(key, "json_schema") is not False
+
+    def _structured_rejected(self, error: Exception) -> bool:
+        """auto 模式下 json_schema 请求被端点拒绝时记为不支持（on 模式不降级，原样报错）。"""
+        if structured_output_mode() != "auto":
+            return False
+        status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        if not looks_unsupported(status, str(error)):
+            return False
+        set_capability(endpoint_key(self.config.api_base, self.config.model), "json_schema", False)
+        self.logger.warning(
+            f"端点不支持 json_schema 输出，降级为 json_object: model={self.config.model}, error={str(error)[:200]}"
+        )
+        return True
+
     def _build_extra_body(self) -> Dict[str, Any]:
         """构建供应商特定的extra_body"""
         extra = {}
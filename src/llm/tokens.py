@@ -0,0 +1,314 @@
+"""
+离线 token 估算与输出预算规划。
+
+输入/输出上限原先按字符（EXTRACT_MAX_INPUT_CHARS、SCHEMA_EXCERPT_BUDGET）或一刀切的
+LLM_MAX_OUTPUT_TOKENS 设定，中英文/LaTeX 混排时字符数与 token 数差距很大。这里提供：
+
+  - TokenEstimator：可插拔分词器（LLM_TOKENIZER=heuristic | tiktoken[:编码名] | 已注册名），
+    默认是按字符类别加权的启发式估算；每次调用返回的 prompt_tokens 会按模型做 EWMA 校准。
+  - plan_output_tokens：按 schema 宽度 × 预计记录数预测输出 token，得出单次调用的 max_tokens；
+    实际 completion_tokens / 记录数 按 key（通常是 schema slug）学习，后续调用越来越准。
+
+截断时 LLMClient.call 仍会加倍 max_tokens 重试，规划只是让首次尝试更贴近实际需要。
+"""
+from __future__ import annotations
+
+import math
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from loguru import logger
+
+# 启发式权重（相对 cl100k/DeepSeek 一类 BPE 分词器的经验值）
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+_WORD_RE = re.compile(r"[A-Za-z]+")
+_DIGITS_RE = re.compile(r"[0-9]+")
+_PUNCT_RE = re.compile(r"[!-/:-@\[-`{-~]")
+_NEWLINE_RE = re.compile(r"\n")
+_ASCII_RE = re.compile(r"[\x00-\x7f]")
+
+CJK_WEIGHT = 0.7          # 每个中日韩字符
+WORD_BASE = 0.6           # 每个英文词的起步
+WORD_PER_CHAR = 0.12      # 英文词每个字母
+DIGIT_RUN_BASE = 0.3      # 每段数字
+DIGIT_PER_CHAR = 1 / 3    # 数字按约 3 位一组切分
+PUNCT_WEIGHT = 0.8        # ASCII 标点/LaTeX 符号（\ { } ^ _ 多为独立 token）
+NEWLINE_WEIGHT = 0.5
+OTHER_WEIGHT = 1.0        # 希腊字母、°、± 等其它非 ASCII 字符
+
+SCALE_MIN, SCALE_MAX = 0.5, 2.0
+SCALE_ALPHA = 0.2         # 校准 EWMA 平滑系数
+MESSAGE_OVERHEAD = 4      # 每条 chat 消息的角色/分隔 token
+
+
+def heuristic_count(text: str) -> float:
+    """按字符类别加权估算 token 数（未校准的浮点值）。"""
+    if not text:
+        return 0.0
+    cjk = len(_CJK_RE.findall(text))
+    words = _WORD_RE.findall(text)
+    letters = sum(len(w) for w in words)
+    digit_runs = _DIGITS_RE.findall(text)
+    digits = sum(len(d) for d in digit_runs)
+    punct = len(_PUNCT_RE.findall(text))
+    newlines = len(_NEWLINE_RE.findall(text))
+    ascii_chars = len(_ASCII_RE.findall(text))
+    other = max(0, len(text) - ascii_chars - cjk)
+    return (
+        cjk * CJK_WEIGHT
+        + len(words) * WORD_BASE + letters * WORD_PER_CHAR
+        + len(digit_runs) * DIGIT_RUN_BASE + digits * DIGIT_PER_CHAR
+        + punct * PUNCT_WEIGHT
+        + newlines * NEWLINE_WEIGHT
+        + other * OTHER_WEIGHT
+    )
+
+
+_REGISTRY: Dict[str, Callable[[str], int]] = {}
+
+
+def register_tokenizer(name: str, fn: Callable[[str], int]) -> None:
+    """注册自定义分词计数函数，之后可用 LLM_TOKENIZER=<name> 选用。"""
+    _REGISTRY[name.strip().lower()] = fn
+    with _LOCK:
+        _ESTIMATORS.clear()
+
+
+def _tiktoken_counter(encoding: str) -> Optional[Callable[[str], int]]:
+    try:
+        import tiktoken  # 可选依赖
+        enc = tiktoken.get_encoding(encoding or "cl100k_base")
+    except Exception as e:  # noqa: BLE001  未安装或编码文件不可得（离线）
+        logger.warning(f"tiktoken 不可用（{e}），回退启发式 token 估算")
+        return None
+    return lambda s: len(enc.encode(s, disallowed_special=()))
+
+
+class TokenEstimator:
+    """token 计数器：精确分词器可用时直接计数，否则启发式估算 × 按模型校准的系数。"""
+
+    def __init__(self, name: str = "heuristic", counter: Optional[Callable[[str], int]] = None):
+        self.name = name
+        self._counter = counter
+        self._scales: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        return self._counter is not None
+
+    def scale(self, model: str = "") -> float:
+        return self._scales.get(model or "", self._scales.get("", 1.0))
+
+    def count(self, text: str, model: str = "") -> int:
+        if not text:
+            return 0
+        if self._counter is not None:
+            return int(self._counter(text))
+        return int(math.ceil(heuristic_count(text) * self.scale(model)))
+
+    def count_messages(self, messages: Iterable[Any], model: str = "") -> int:
+        """chat 消息总 token：各条 content 之和 + 每条固定开销。兼容 LLMMessage 与 dict。"""
+        total = 0
+        for m in messages:
+            content = m.get("content", "") if isinstance(m, dict) else getattr(m, "content", "")
+            total += self.count(content or "", model) + MESSAGE_OVERHEAD
+        return total
+
+    def observe(self, estimated: int, actual: int, model: str = "") -> None:
+        """用接口返回的真实 prompt_tokens 校准启发式系数（精确分词器无需校准）。"""
+        if self._counter is not None or estimated <= 0 or actual <= 0:
+            return
+        with self._lock:
+            raw = estimated / self.scale(model)      # 去掉当前系数后的启发式原值
+            target = actual / raw
+            # 按模型与全局各自学习；未见过的模型先用全局系数
+            for key in ({model, ""} if model else {""}):
+                cur = self._scales.get(key, self.scale(""))
+                new = (1 - SCALE_ALPHA) * cur + SCALE_ALPHA * target
+                self._scales[key] = min(SCALE_MAX, max(SCALE_MIN, new))
+
+    def chars_for_tokens(self, text: str, tokens: int, model: str = "") -> int:
+        """按该文本自身的字符/token 比，把 token 预算换算成字符预算。"""
+        if tokens <= 0:
+            return 0
+        n = self.count(text, model)
+        if n <= tokens:
+            return len(text)
+        return max(1, int(len(text) * tokens / n))
+
+    def trim_to_tokens(self, text: str, max_tokens: int, model: str = "") -> str:
+        """截到不超过 max_tokens（尽量落在行边界）；未超限原样返回。"""
+        if max_tokens <= 0 or self.count(text, model) <= max_tokens:
+            return text
+        cut = self.chars_for_tokens(text, max_tokens, model)
+        for _ in range(4):
+            piece = text[:cut]
+            nl = piece.rfind("\n")
+            if nl > cut * 0.9:
+                piece = piece[:nl]
+            n = self.count(piece, model)
+            if n <= max_tokens:
+                return piece
+            cut = max(1, int(cut * max_tokens / n * 0.98))
+        return text[:cut]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tokenizer": self.name, "exact": self.exact, "scales": dict(self._scales)}
+
+
+_LOCK = threading.Lock()
+_ESTIMATORS: Dict[str, TokenEstimator] = {}
+
+
+def _configured_tokenizer() -> str:
+    try:
+        import settings
+        return str(getattr(settings, "LLM_TOKENIZER", "heuristic") or "heuristic").strip().lower()
+    except Exception:
+        return "heuristic"
+
+
+def get_estimator(spec: Optional[str] = None) -> TokenEstimator:
+    """按配置取进程内共享的估算器（校准系数在同一进程的所有调用间累积）。"""
+    spec = (spec or _configured_tokenizer()).strip().lower()
+    with _LOCK:
+        est = _ESTIMATORS.get(spec)
+        if est is not None:
+            return est
+        counter: Optional[Callable[[str], int]] = None
+        if spec in _REGISTRY:
+            counter = _REGISTRY[spec]
+        elif spec.startswith("tiktoken"):
+            counter = _tiktoken_counter(spec.partition(":")[2])
+        elif spec != "heuristic":
+            logger.warning(f"未知 LLM_TOKENIZER={spec}，使用启发式估算")
+        est = TokenEstimator(spec if counter is not None else "heuristic", counter)
+        _ESTIMATORS[spec] = est
+        return est
+
+
+def estimate_tokens(text: str, model: str = "") -> int:
+    return get_estimator().count(text, model)
+
+
+# ==========================
+# 输出预算规划
+# ==========================
+CELL_OVERHEAD_TOKENS = 14      # "name": {"value": null, "evidence": null}, 的结构 token
+FILLED_CELL_TOKENS = 40        # 有值单元格的 value + evidence 引文
+COMPACT_CELL_TOKENS = 6        # "f12":[ , ], 代号与括号
+COLUMNAR_CELL_TOKENS = 4       # [ , 下标], 单元格括号与证据下标
+QUOTE_SHARE = 0.6              # columnar 下证据引文去重后的剩余比例
+RESPONSE_OVERHEAD_TOKENS = 64  # {"records": [...], ...} 外壳与附带字段
+DEFAULT_FILL_RATIO = 0.5
+DEFAULT_EXPECTED_RECORDS = 3
+LEARN_ALPHA = 0.3
+
+
+@dataclass
+class OutputPlan:
+    max_tokens: int
+    predicted: int
+    expected_records: int
+    per_record: float
+    learned: bool = False
+    reserve: int = 0
+    inputs: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_tokens": self.max_tokens,
+            "predicted": self.predicted,
+            "expected_records": self.expected_records,
+            "per_record": round(self.per_record, 1),
+            "learned": self.learned,
+            "reserve": self.reserve,
+            **self.inputs,
+        }
+
+
+def planning_settings() -> Dict[str, Any]:
+    """LLM_OUTPUT_PLANNING 等规划参数；settings 不可用时取默认值。"""
+    try:
+        import settings
+        return {
+            "enabled": bool(getattr(settings, "LLM_OUTPUT_PLANNING", True)),
+            "safety": float(getattr(settings, "LLM_OUTPUT_SAFETY", 1.3)),
+            "reserve": int(getattr(settings, "LLM_REASONING_RESERVE_TOKENS", 4096)),
+            "min_tokens": int(getattr(settings, "LLM_MIN_OUTPUT_TOKENS", 2048)),
+            "max_tokens": int(getattr(settings, "LLM_MAX_OUTPUT_TOKENS", 65536)),
+        }
+    except Exception:
+        return {"enabled": True, "safety": 1.3, "reserve": 4096, "min_tokens": 2048, "max_tokens": 65536}
+
+
+_PER_RECORD: Dict[str, float] = {}
+_PER_RECORD_LOCK = threading.Lock()
+
+
+def observe_output(key: str, completion_tokens: int, records: int) -> None:
+    """记录一次实际输出：completion_tokens / 记录数 的 EWMA（按 key，一般为 "schema slug:输出格式"）。"""
+    if not key or completion_tokens <= 0 or records <= 0:
+        return
+    per = (completion_tokens - RESPONSE_OVERHEAD_TOKENS) / records
+    if per <= 0:
+        return
+    with _PER_RECORD_LOCK:
+        old = _PER_RECORD.get(key)
+        _PER_RECORD[key] = per if old is None else (1 - LEARN_ALPHA) * old + LEARN_ALPHA * per
+
+
+def learned_per_record(key: str) -> Optional[float]:
+    return _PER_RECORD.get(key) if key else None
+
+
+def output_stats() -> Dict[str, float]:
+    """已学习的每记录输出 token（key -> EWMA），如 {"joint_wear:compact": 310.5}。"""
+    with _PER_RECORD_LOCK:
+        return {k: round(v, 1) for k, v in _PER_RECORD.items()}
+
+
+def schema_record_tokens(field_names: Iterable[str], fill_ratio: float = DEFAULT_FILL_RATIO,
+                         estimator: Optional[TokenEstimator] = None, fmt: str = "cells") -> float:
+    """一条记录的预计输出 token。cells：每字段名 + 结构开销，按填充率加值与证据；
+    compact：空字段省略、字段名换短代号；columnar：再去掉每行的键，证据引文去重。"""
+    est = estimator or get_estimator()
+    names = list(field_names)
+    if fmt == "compact":
+        return len(names) * fill_ratio * (COMPACT_CELL_TOKENS + FILLED_CELL_TOKENS)
+    if fmt == "columnar":
+        return len(names) * fill_ratio * (COLUMNAR_CELL_TOKENS + FILLED_CELL_TOKENS * QUOTE_SHARE)
+    total = 0.0
+    for name in names:
+        total += est.count(f'"{name}"') + CELL_OVERHEAD_TOKENS + fill_ratio * FILLED_CELL_TOKENS
+    return total
+
+
+def clamp_max_tokens(predicted: float, cfg: Optional[Dict[str, Any]] = None) -> int:
+    cfg = cfg or planning_settings()
+    want = int(math.ceil(predicted * cfg["safety"])) + cfg["reserve"]
+    return max(min(cfg["min_tokens"], cfg["max_tokens"]), min(want, cfg["max_tokens"]))
+
+
+def plan_output_tokens(field_names: Iterable[str], expected_records: int = DEFAULT_EXPECTED_RECORDS,
+                       key: str = "", fill_ratio: float = DEFAULT_FILL_RATIO,
+                       fmt: str = "cells") -> OutputPlan:
+    """按 schema 宽度 × 预计记录数规划 max_tokens；key 有学习值时以学习值为准。
+    不同输出格式的每记录 token 差异很大，key 应包含格式（见 GenericFlatMode._plan_output）。"""
+    cfg = planning_settings()
+    records = max(1, int(expected_records or DEFAULT_EXPECTED_RECORDS))
+    learned = learned_per_record(key)
+    per_record = learned if learned is not None else schema_record_tokens(field_names, fill_ratio, fmt=fmt)
+    predicted = int(math.ceil(RESPONSE_OVERHEAD_TOKENS + records * per_record))
+    return OutputPlan(
+        max_tokens=clamp_max_tokens(predicted, cfg),
+        predicted=predicted,
+        expected_records=records,
+        per_record=per_record,
+        learned=learned is not None,
+        reserve=cfg["reserve"],
+        inputs={"format": fmt},
+    )
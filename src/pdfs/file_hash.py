@@ -0,0 +1,145 @@
+"""
+PDF 文件 MD5 的缓存与并行计算。
+
+scan_new_pdfs 每次扫描都把目录里所有 PDF 以 8 KB 小块重新算一遍 MD5，_register_pdfs 对选中的文件
+再算一遍；几千个 20 MB 的 PDF 重扫一次就要几分钟磁盘 IO。这里：
+
+  - 缓存表 file_hashes 以 (逻辑路径, 大小, mtime_ns, inode) 为键，文件未变则直接取缓存；
+  - 未命中的文件在共享 io 线程池里并行计算（hashlib 对大块数据释放 GIL，线程即可并行），1 MB 读块；
+  - 缓存查询/写入按批量 SQL 进行，不再逐文件 SELECT/INSERT；
+  - 上传时边读边算的 MD5（transfer.ThrottledFile）经 remember() 写回缓存，
+    所以 _register_pdfs 只取缓存（compute=False），未命中的文件留到上传时一次读完。
+
+缓存表与 pdf_files 同在 pdf_state.db。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import settings
+
+READ_BUFFER = 1 << 20
+_SQL_CHUNK = 500
+
+
+def file_md5(path: Path, buffer: int = READ_BUFFER) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb", buffering=0) as f:
+        view = memoryview(bytearray(buffer))
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            md5.update(view[:n])
+    return md5.hexdigest()
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    from src.database.catalog import configure_connection
+    conn = sqlite3.connect(db_path, timeout=30)
+    configure_connection(conn)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            path        TEXT PRIMARY KEY,
+            size        INTEGER NOT NULL,
+            mtime_ns    INTEGER NOT NULL,
+            inode       INTEGER NOT NULL,
+            md5         TEXT NOT NULL,
+            updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    return conn
+
+
+def _chunks(items: List, size: int = _SQL_CHUNK) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def hash_files(paths: Iterable[Path], db_path: Optional[Path] = None,
+               stats: Optional[Dict[str, int]] = None, compute: bool = True) -> Dict[Path, str]:
+    """批量取 PDF 的 MD5：缓存命中直接返回，未命中的并行计算后批量写回缓存。
+
+    返回 {路径: md5}；读不到的文件不出现在结果中。stats 传入时累加 hits/misses。
+    compute=False 时只查缓存，未命中的不读文件、不出现在结果中。
+    """
+    if db_path is None:
+        db_path = Path(settings.UPLOADS_DIR) / "pdf_state.db"
+    keyed: Dict[str, Tuple[Path, int, int, int]] = {}
+    for p in paths:
+        p = Path(p)
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        keyed[settings.logical_pdf_name(p)] = (p, st.st_size, st.st_mtime_ns, st.st_ino)
+    if not keyed:
+        return {}
+
+    out: Dict[Path, str] = {}
+    conn = _connect(Path(db_path))
+    try:
+        names = list(keyed)
+        for chunk in _chunks(names):
+            rows = conn.execute(
+                f"SELECT path, size, mtime_ns, inode, md5 FROM file_hashes "
+                f"WHERE path IN ({', '.join('?' for _ in chunk)})", chunk,
+            ).fetchall()
+            for name, size, mtime_ns, inode, md5 in rows:
+                p, s, m, i = keyed[name]
+                if (size, mtime_ns, inode) == (s, m, i):
+                    out[p] = md5
+        misses = [name for name in names if keyed[name][0] not in out]
+        if stats is not None:
+            stats["hits"] = stats.get("hits", 0) + len(names) - len(misses)
+            stats["misses"] = stats.get("misses", 0) + len(misses)
+        if not misses or not compute:
+            return out
+
+        from src.executor import TaskGroup
+        fresh: List[Tuple[str, int, int, int, str]] = []
+        with TaskGroup("io") as tg:
+            futs = {tg.submit(file_md5, keyed[name][0]): name for name in misses}
+            for fut in tg.as_completed(list(futs)):
+                name = futs[fut]
+                try:
+                    md5 = fut.result()
+                except OSError:
+                    continue
+                p, s, m, i = keyed[name]
+                out[p] = md5
+                fresh.append((name, s, m, i, md5))
+        conn.executemany(
+            "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, md5, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)", fresh,
+        )
+        conn.commit()
+        return out
+    finally:
+        conn.close()
+
+
+
+def remember(entries: Iterable[Tuple[Path, os.stat_result, str]], db_path: Optional[Path] = None) -> None:
+    """把别处已算出的 MD5（如上传时边读边算）连同读取时的 stat 批量写入缓存。"""
+    if db_path is None:
+        db_path = Path(settings.UPLOADS_DIR) / "pdf_state.db"
+    rows = [(settings.logical_pdf_name(Path(p)), st.st_size, st.st_mtime_ns, st.st_ino, md5)
+            for p, st, md5 in entries]
+    if not rows:
+        return
+    conn = _connect(Path(db_path))
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, md5, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)", rows,
+        )
+        conn.commit()
+    finally:
+        conn.close()
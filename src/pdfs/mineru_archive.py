@@ -0,0 +1,188 @@
+"""
+MinerU 解析结果 ZIP 的流式下载与按需解压。
+
+原先 _download_and_extract 先把 mineru_output.zip 整个写盘、全部解压（含所有图片）、再删掉 zip：
+磁盘 IO 翻倍，parsed 目录里堆满提取阶段从不读取的图片。这里：
+
+  - download_to_spool：下载进 SpooledTemporaryFile（不超过 DOWNLOAD_SPOOL_MB 时只在内存里），
+    连接中断/读短时按已收字节发 Range 请求续传（服务端回 206 则追加，回 200 则从头重下）；
+  - extract_selected：安全检查全部条目后，只立即解出 full.md 与结构化 JSON（*_content_list.json 等），
+    图片、原始 PDF 等其余条目留在论文目录下的 mineru_output.zip 里；
+  - extract_member：界面请求某张图片时才从归档里解出（解出后直接复用）。
+
+MINERU_EAGER_IMAGES=true 时恢复全部解压（不保留归档）。
+"""
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import IO, Any, Dict, Optional
+
+import requests
+
+from src.cancel import check as check_cancelled
+from src.cancel import sleep as cancellable_sleep
+
+ARCHIVE_NAME = "mineru_output.zip"
+EAGER_SUFFIXES = {".md", ".json"}
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+_extract_lock = threading.Lock()
+
+
+def _setting(name: str, default):
+    try:
+        import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def _expected_total(resp, offset: int) -> Optional[int]:
+    """本次响应结束时文件应有的总字节数；无法判断（如压缩传输、缺长度头）时为 None。"""
+    if resp.headers.get("Content-Encoding"):
+        return None
+    if resp.status_code == 206:
+        m = _CONTENT_RANGE_RE.match(resp.headers.get("Content-Range", ""))
+        if m and m.group(3) != "*":
+            return int(m.group(3))
+    length = resp.headers.get("Content-Length")
+    return offset + int(length) if length and length.isdigit() else None
+
+
+def _range_start(resp) -> Optional[int]:
+    m = _CONTENT_RANGE_RE.match(resp.headers.get("Content-Range", ""))
+    return int(m.group(1)) if m else None
+
+
+def download_to_spool(url: str, session: Any = None, retry: Optional[int] = None,
+                      stats: Optional[Dict[str, int]] = None) -> Optional[IO[bytes]]:
+    """下载 url 到 SpooledTemporaryFile 并定位到开头；重试用尽返回 None。
+
+    有新字节到手的中断不计入重试次数（大文件逐段续传）；stats 传入时累加 resumed/restarted/bytes。
+    """
+    get = (session or requests).get
+    retry = int(retry if retry is not None else _setting("DOWNLOAD_RETRY", 2))
+    timeout = _setting("DOWNLOAD_TIMEOUT", 180)
+    chunk_size = int(_setting("DOWNLOAD_CHUNK_SIZE", 8192))
+    spool_bytes = int(float(_setting("DOWNLOAD_SPOOL_MB", 32)) * 1024 * 1024)
+    backoff_base = _setting("DOWNLOAD_RETRY_BACKOFF_BASE", 1.8)
+    backoff_max = _setting("DOWNLOAD_RETRY_BACKOFF_MAX", 8)
+    stats = stats if stats is not None else {}
+
+    buf = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    failures = 0
+    try:
+        while failures < max(1, retry):
+            have = buf.tell()
+            gained = False
+            try:
+                resp = get(url, timeout=timeout, stream=True,
+                           headers={"Range": f"bytes={have}-"} if have else None)
+                try:
+                    if have and resp.status_code == 206 and _range_start(resp) == have:
+                        stats["resumed"] = stats.get("resumed", 0) + 1
+                    elif resp.status_code == 200:
+                        if have:
+                            # 服务端不支持 Range：从头重下
+                            buf.seek(0)
+                            buf.truncate()
+                            have = 0
+                            stats["restarted"] = stats.get("restarted", 0) + 1
+                    else:
+                        raise requests.HTTPError(f"HTTP {resp.status_code}")
+                    total = _expected_total(resp, have)
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        check_cancelled()    # 任务取消时在块边界中止下载
+                        if chunk:
+                            buf.write(chunk)
+                            gained = True
+                            stats["bytes"] = stats.get("bytes", 0) + len(chunk)
+                finally:
+                    resp.close()
+                if total is None or buf.tell() >= total:
+                    buf.seek(0)
+                    return buf
+            except Exception:
+                pass
+            if gained:
+                continue
+            failures += 1
+            if failures < retry:
+                cancellable_sleep(min(backoff_max, backoff_base ** failures))
+    except BaseException:
+        buf.close()
+        raise
+    buf.close()
+    return None
+
+
+def is_eager(name: str) -> bool:
+    return PurePosixPath(name).suffix.lower() in EAGER_SUFFIXES
+
+
+def _safe_target(root: Path, name: str) -> Path:
+    """归档条目解压后的路径；绝对路径或 .. 目录穿越（zip-slip）时抛 ValueError。"""
+    target = (root / name).resolve()
+    if root not in target.parents:
+        raise ValueError(f"不安全的压缩包条目: {name}")
+    return target
+
+
+def extract_selected(fileobj: IO[bytes], paper_dir: Path, eager_all: Optional[bool] = None) -> Dict[str, int]:
+    """只解出 full.md 与 JSON，其余条目保留在 paper_dir/mineru_output.zip 里待按需解压。
+
+    任一条目不安全时抛 ValueError（不解出任何文件）。返回 {"extracted", "archived"} 条目数。
+    """
+    if eager_all is None:
+        eager_all = bool(_setting("MINERU_EAGER_IMAGES", False))
+    paper_dir = Path(paper_dir).resolve()
+    paper_dir.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(fileobj) as zf:
+        infos = [i for i in zf.infolist() if not i.is_dir()]
+        for info in infos:
+            _safe_target(paper_dir, info.filename)
+        eager = [i for i in infos if eager_all or is_eager(i.filename)]
+        for info in eager:
+            check_cancelled()
+            zf.extract(info, paper_dir)
+    archived = len(infos) - len(eager)
+    archive = paper_dir / ARCHIVE_NAME
+    if archived:
+        tmp = archive.with_name(archive.name + ".tmp")
+        fileobj.seek(0)
+        with open(tmp, "wb") as out:
+            while True:
+                block = fileobj.read(1 << 20)
+                if not block:
+                    break
+                out.write(block)
+        os.replace(tmp, archive)
+    elif archive.exists():
+        archive.unlink()     # 重新解析后不再需要旧归档
+    return {"extracted": len(eager), "archived": archived}
+
+
+def extract_member(paper_dir: Path, name: str) -> Path:
+    """返回论文目录下 name 对应的文件，尚未解出时从归档中解出；不存在时抛 FileNotFoundError。"""
+    paper_dir = Path(paper_dir).resolve()
+    name = name.replace("\\", "/").lstrip("/")
+    target = _safe_target(paper_dir, name)
+    if target.is_file():
+        return target
+    archive = paper_dir / ARCHIVE_NAME
+    if not archive.is_file():
+        raise FileNotFoundError(name)
+    with _extract_lock:
+        if target.is_file():
+            return target
+        with zipfile.ZipFile(archive) as zf:
+            try:
+                info = zf.getinfo(name)
+            except KeyError:
+                raise FileNotFoundError(name) from None
+            zf.extract(info, paper_dir)
+    return target
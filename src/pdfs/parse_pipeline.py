@@ -0,0 +1,306 @@
+"""
+解析流水线：上传后的轮询与下载交叠进行。
+
+原先 _run_parse_job_locked 先把所有批次轮询到终态（或 max_wait_min 超时），再逐批 download_batch_parallel：
+先解析完的论文要等最慢的批次。这里每轮并发查询所有未终态批次，某个文件一旦 done 就提交下载
+（下载 → 安全解压 → 校验 full.md → 建结构索引/签名 → 记账，与 _download_and_extract 相同），
+轮询继续进行；首篇论文的可用时间由最慢批次缩短到最快文件。
+
+轮询间隔按剩余工作自适应：本轮有新完成/失败的文件时减半（不低于 min_interval），无进展时放大 1.5 倍
+（不超过 2 × poll_interval）；只剩下载在进行时等下载完成即醒。
+
+解析 → 提取一体化任务（run_ingest_job）里，每篇 full.md 校验通过即经 on_parsed 放进 PaperFeed，
+提取阶段从中准入；PaperFeed 积压达到上限时 backpressure 为真，流水线暂停开启新的下载。
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from src.cancel import check as check_cancelled
+from src.cancel import current_token
+from src.executor import TaskGroup
+
+Key = Tuple[str, str]   # (batch_id, data_id)
+
+
+@dataclass
+class ParseProgress:
+    total: int = 0
+    done: int = 0                 # MinerU 端已完成
+    failed: int = 0               # MinerU 端解析失败
+    processing: int = 0
+    downloaded: int = 0           # 本次下载落盘成功（含此前已下载的）
+    download_failed: int = 0
+    polls: int = 0
+    first_parsed_s: Optional[float] = None
+    timed_out: bool = False
+    failed_files: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total, "done": self.done, "failed": self.failed, "processing": self.processing,
+            "downloaded": self.downloaded, "download_failed": self.download_failed, "polls": self.polls,
+            "first_parsed_s": self.first_parsed_s, "timed_out": self.timed_out,
+        }
+
+
+class PaperFeed:
+    """解析阶段 → 提取阶段的有界交接队列（线程安全）。
+
+    expected 为预计送达的论文数（用于提取阶段的进度总数）；maxsize 为允许积压的论文数，
+    积压满时 saturated() 为真，解析流水线据此暂停新的下载（背压）。
+    """
+
+    def __init__(self, maxsize: int, expected: int = 0):
+        self.maxsize = max(1, int(maxsize))
+        self.expected = int(expected)
+        self.delivered = 0
+        self.closed = False
+        self._unbounded = False
+        self._items: "deque[str]" = deque()
+        self._cond = threading.Condition()
+
+    def put(self, paper_id: str) -> None:
+        with self._cond:
+            self._items.append(paper_id)
+            self.delivered += 1
+            self._cond.notify_all()
+
+    def get_nowait(self) -> Optional[str]:
+        with self._cond:
+            return self._items.popleft() if self._items else None
+
+    def wait(self, timeout: float) -> None:
+        """等到有论文可取、队列关闭或超时。"""
+        with self._cond:
+            if not self._items and not self.closed:
+                self._cond.wait(timeout)
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def saturated(self) -> bool:
+        with self._cond:
+            return not self._unbounded and len(self._items) >= self.maxsize
+
+    def unblock(self) -> None:
+        """下游已退出（异常）：解除背压，上游照常跑完解析。"""
+        with self._cond:
+            self._unbounded = True
+
+    @property
+    def drained(self) -> bool:
+        with self._cond:
+            return self.closed and not self._items
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+
+class ParsePipeline:
+    """对一组已上传批次做「并发轮询 + 逐文件即时下载」。
+
+    log / on_progress 为回调（任务日志、进度），cancelled 返回任务是否已取消；取消令牌经 contextvars
+    传到轮询与下载线程，等待期间取消立即醒来。on_parsed(paper_id) 在每篇落盘校验通过后调用；
+    backpressure() 为真时暂不开启新的下载（已完成的文件留在队列里，MinerU 端结果不会丢）。
+    """
+
+    def __init__(self, proc, output_dir: Path, poll_interval: float = 30, max_wait_min: float = 240,
+                 download_workers: int = 4, log: Callable[[str], None] = print,
+                 on_progress: Optional[Callable[[ParseProgress], None]] = None,
+                 cancelled: Callable[[], bool] = lambda: False,
+                 on_parsed: Optional[Callable[[str], None]] = None,
+                 backpressure: Optional[Callable[[], bool]] = None):
+        self.proc = proc
+        self.output_dir = Path(output_dir)
+        self.poll_interval = max(0.1, float(poll_interval))
+        self.min_interval = max(0.1, self.poll_interval / 6)
+        self.max_interval = self.poll_interval * 2
+        self.max_wait_s = max_wait_min * 60
+        self.download_workers = max(1, int(download_workers))
+        self.log = log
+        self.on_progress = on_progress
+        self.cancelled = cancelled
+        self.on_parsed = on_parsed
+        self.backpressure = backpressure
+        self._wake = threading.Event()
+
+    # ------------------------------------------------------------------
+    def _already_downloaded(self, batch_ids: List[str]) -> Set[Key]:
+        """已有 completed 下载记录且目录仍有效的文件：不再重复下载。"""
+        conn = sqlite3.connect(self.proc.db_path, timeout=30)
+        try:
+            rows = conn.execute(
+                f"SELECT batch_id, data_id, output_path FROM download_records WHERE download_status = 'completed' "
+                f"AND batch_id IN ({', '.join('?' for _ in batch_ids)})", batch_ids,
+            ).fetchall()
+        finally:
+            conn.close()
+        return {(b, d) for b, d, out in rows
+                if out and Path(out).exists() and self.proc._validate_parsed_dir(out)[0]}
+
+    def _mark_parse_failed(self, names: List[str]) -> None:
+        if not names:
+            return
+        conn = sqlite3.connect(self.proc.db_path, timeout=30)
+        try:
+            conn.executemany(
+                "UPDATE pdf_files SET status='failed', updated_at=CURRENT_TIMESTAMP WHERE filename=?",
+                [(n,) for n in names],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _finish_batches(self, totals: Dict[str, int], ok: Dict[str, int]) -> None:
+        conn = sqlite3.connect(self.proc.db_path, timeout=30)
+        try:
+            rows = []
+            for bid, total in totals.items():
+                n = ok.get(bid, 0)
+                rows.append(("completed" if total and n == total else "partial" if n else "uploaded", bid))
+            conn.executemany("UPDATE batches SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE batch_id = ?", rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _held(self) -> bool:
+        return self.backpressure is not None and bool(self.backpressure())
+
+    def _wait(self, seconds: float) -> None:
+        """等待 seconds 秒；有下载完成或任务取消时提前醒来。"""
+        self._wake.wait(max(0.0, seconds))
+        self._wake.clear()
+        check_cancelled()
+
+    # ------------------------------------------------------------------
+    def run(self, batch_ids: List[str]) -> ParseProgress:
+        prog = ParseProgress()
+        if not batch_ids:
+            return prog
+        t0 = time.monotonic()
+        deadline = t0 + self.max_wait_s
+        seen: Set[Key] = self._already_downloaded(batch_ids)
+        ok_by_batch: Dict[str, int] = {}
+        for bid, _ in seen:
+            ok_by_batch[bid] = ok_by_batch.get(bid, 0) + 1
+        prog.downloaded = len(seen)
+        failed_seen: Set[Key] = set()
+        done_keys: Set[Key] = set()
+        totals: Dict[str, int] = {}
+        terminal: Set[str] = set()
+        queue: List[Dict[str, Any]] = []
+        inflight: Dict[Any, Dict[str, Any]] = {}
+        interval = self.poll_interval
+        next_poll = t0
+        token = current_token()
+        unregister = token.on_cancel(self._wake.set) if token is not None else (lambda: None)
+
+        def _on_done(item: Dict[str, Any], result: Dict[str, Any]) -> None:
+            if result.get("success"):
+                prog.downloaded += 1
+                ok_by_batch[item["batch_id"]] = ok_by_batch.get(item["batch_id"], 0) + 1
+                if prog.first_parsed_s is None:
+                    prog.first_parsed_s = round(time.monotonic() - t0, 1)
+                    self.log(f"⚡ 首篇解析结果已落盘（{prog.first_parsed_s:.0f}s）: {item['filename']}")
+                if self.on_parsed is not None and result.get("output_path"):
+                    self.on_parsed(Path(result["output_path"]).name)
+            else:
+                prog.download_failed += 1
+                self.log(f"  ❌ 下载失败 {item['filename']}: {result.get('error', '未知错误')}")
+
+        try:
+            with TaskGroup("io") as group:
+                def _pump() -> None:
+                    # 收割已完成的下载，再按并发上限补充
+                    for fut in [f for f in inflight if f.done()]:
+                        item = inflight.pop(fut)
+                        group.futures.discard(fut)
+                        try:
+                            _on_done(item, fut.result())
+                        except Exception as e:  # noqa: BLE001
+                            _on_done(item, {"success": False, "error": str(e)})
+                    while queue and len(inflight) < self.download_workers and not self._held():
+                        item = queue.pop(0)
+                        fut = group.submit(self.proc._download_single_file, item)
+                        fut.add_done_callback(lambda _f: self._wake.set())
+                        inflight[fut] = item
+
+                while True:
+                    if self.cancelled():
+                        check_cancelled()
+                        break
+                    pending = [b for b in batch_ids if b not in terminal]
+                    polled = progressed = False
+                    now = time.monotonic()
+                    if pending and next_poll <= now < deadline:
+                        polled = True
+                        prog.polls += 1
+                        polls = {group.submit(self.proc.check_batch_status, bid, verbose=False): bid
+                                 for bid in pending}
+                        newly_failed: List[str] = []
+                        for fut in group.as_completed(list(polls)):
+                            group.futures.discard(fut)
+                            bid = polls[fut]
+                            st = fut.result()
+                            if not st:
+                                continue   # 查询失败按未完成处理，下一轮再查
+                            totals[bid] = st["total"]
+                            if st["total"] and st["done"] + st["failed"] >= st["total"]:
+                                terminal.add(bid)
+                            for it in st.get("results", []):
+                                key = (bid, it.get("data_id", "unknown"))
+                                state = it.get("state")
+                                if state == "done":
+                                    done_keys.add(key)
+                                if state == "done" and it.get("full_zip_url") and key not in seen:
+                                    seen.add(key)
+                                    progressed = True
+                                    queue.append({"batch_id": bid, "data_id": key[1],
+                                                  "filename": it.get("file_name", "unknown.pdf"),
+                                                  "zip_url": it["full_zip_url"], "output_dir": self.output_dir})
+                                elif state == "failed" and key not in failed_seen:
+                                    failed_seen.add(key)
+                                    progressed = True
+                                    if it.get("file_name"):
+                                        newly_failed.append(it["file_name"])
+                        self._mark_parse_failed(newly_failed)
+                        prog.failed_files.extend(newly_failed)
+                        prog.total = sum(totals.values())
+                        prog.failed = len(failed_seen)
+                        prog.done = len(done_keys)
+                        prog.processing = max(0, prog.total - prog.done - prog.failed)
+                    _pump()
+                    if self.on_progress is not None:
+                        self.on_progress(prog)
+
+                    pending = [b for b in batch_ids if b not in terminal]
+                    if pending and time.monotonic() >= deadline:
+                        prog.timed_out = True
+                        pending = []
+                    if not pending and not queue and not inflight:
+                        break
+                    if polled:
+                        interval = (max(self.min_interval, interval / 2) if progressed
+                                    else min(self.max_interval, interval * 1.5))
+                        next_poll = time.monotonic() + interval
+                    # 下载完成会提前唤醒（收割并补充下载），但不提前轮询
+                    wait_s = (min(next_poll, deadline) - time.monotonic()) if pending else self.poll_interval
+                    if queue and not inflight:
+                        wait_s = min(wait_s, 1.0)   # 背压中：下游腾出位置后尽快续传
+                    self._wait(wait_s)
+            if self.on_progress is not None:
+                self.on_progress(prog)
+        finally:
+            unregister()
+            self._finish_batches(totals, ok_by_batch)
+        return prog
@@ -10,17 +10,22 @@ PDF处理模块 - 统一的PDF上传、查询、下载接口
 """
 import sys
 import hashlib
+import random
 import sqlite3
+import threading
+import time
 import requests
 import zipfile
-import time
 from pathlib import Path
 from typing import List, Dict, Optional, Any, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+from src.cancel import sleep as cancellable_sleep
+from src.executor import TaskGroup
+from src.pdfs.mineru_archive import download_to_spool, extract_selected
+from src.pdfs.transfer import ThrottledFile, TokenBucket, pooled_session
 from settings import (
     MINERU_WEB_BASE,
     UPLOADS_DIR,
@@ -33,11 +38,7 @@ from settings import (
     UPLOAD_RETRY,
     UPLOAD_RETRY_BACKOFF_BASE,
     UPLOAD_RETRY_BACKOFF_MAX,
-    DOWNLOAD_RETRY,
     DOWNLOAD_TIMEOUT,
-    DOWNLOAD_CHUNK_SIZE,
-    DOWNLOAD_RETRY_BACKOFF_BASE,
-    DOWNLOAD_RETRY_BACKOFF_MAX
 )
 import settings
 
@@ -63,6 +64,11 @@ class PDFProcessor:
         self.api_base = _st.MINERU_API_BASE
         self.headers = dict(_st.MINERU_HEADERS)
         self.upload_rate_per_min = getattr(_st, "MINERU_UPLOAD_RATE_PER_MIN", 50)
+        # 批内并发上传：连接池 + 所有上传共用的带宽令牌桶（MINERU_UPLOAD_MAX_MBPS，0 不限）
+        self.upload_workers = max(1, int(getattr(_st, "MINERU_UPLOAD_WORKERS", 4)))
+        self.upload_bucket = TokenBucket.from_mbps(getattr(_st, "MINERU_UPLOAD_MAX_MBPS", 0))
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
         self._init_db()
         # 统一论文目录（与本状态库共库），串联解析/提取/入库状态
         from src.database.catalog import PaperCatalog
@@ -135,13 +141,18 @@ class PDFProcessor:
         conn.close()
         migrate_state_db(self.db_path)
     
+    @property
+    def session(self) -> requests.Session:
+        """上传共用的连接池会话（池大小 = 上传并发数），懒创建。"""
+        with self._session_lock:
+            if self._session is None:
+                self._session = pooled_session(self.upload_workers)
+            return self._session
+
     def _get_file_hash(self, filepath: Path) -> str:
         """计算文件MD5哈希"""
-        md5 = hashlib.md5()
-        with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b''):
-                md5.update(chunk)
-        return md5.hexdigest()
+        from src.pdfs.file_hash import file_md5
+        return file_md5(filepath)
     
     def scan_new_pdfs(self, pdf_dir: Path = None) -> List[Path]:
         """
@@ -168,36 +179,77 @@ class PDFProcessor:
         if not all_pdfs:
             return []
         
+        # MD5 走缓存（大小/mtime/inode 未变不重算），未命中的并行计算；已登记的 hash 批量查询
+        from src.pdfs.file_hash import hash_files
+        cache_stats: Dict[str, int] = {}
+        hashes = hash_files(all_pdfs, self.db_path, stats=cache_stats)
         new_pdfs = []
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=30)
         cur = conn.cursor()
         
+        known: Dict[str, Tuple[str, str]] = {}
+        distinct = sorted(set(hashes.values()))
+        for i in range(0, len(distinct), 500):
+            chunk = distinct[i:i + 500]
+            for filename, file_hash, status in cur.execute(
+                f"SELECT filename, file_hash, status FROM pdf_files "
+                f"WHERE file_hash IN ({', '.join('?' for _ in chunk)})", chunk,
+            ):
+                known.setdefault(file_hash, (filename, status))
+        
+        # 同名记录也按已登记处理：网页端登记时 hash 缓存未命中会先记空串，
+        # 若随后上传失败/被取消，这里补齐 hash，避免按文件名重复 INSERT
+        by_name: Dict[str, Tuple[str, str]] = {}
+        names = sorted({settings.logical_pdf_name(pdf) for pdf in all_pdfs if pdf in hashes})
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            for filename, file_hash, status in cur.execute(
+                f"SELECT filename, file_hash, status FROM pdf_files "
+                f"WHERE filename IN ({', '.join('?' for _ in chunk)})", chunk,
+            ):
+                by_name[filename] = (file_hash, status)
+        backfill: List[Tuple[str, str]] = []
+        for pdf, file_hash in hashes.items():
+            name = settings.logical_pdf_name(pdf)
+            registered = by_name.get(name)
+            if registered and not registered[0]:
+                backfill.append((file_hash, name))
+                known.setdefault(file_hash, (name, registered[1]))
+        
+        rows = []
         for pdf in all_pdfs:
-            file_hash = self._get_file_hash(pdf)
-            
-            # 检查是否已存在
-            cur.execute(
-                "SELECT filename, status, batch_id FROM pdf_files WHERE file_hash = ?",
-                (file_hash,)
-            )
-            existing = cur.fetchone()
-            
+            file_hash = hashes.get(pdf)
+            if file_hash is None:
+                continue
+            name = settings.logical_pdf_name(pdf)
+            registered = by_name.get(name)
+            if registered:
+                print(f"  ⏭️  跳过（已登记）: {pdf.name} (status={registered[1]})")
+                continue
+            existing = known.get(file_hash)
             if existing:
                 print(f"  ⏭️  跳过（已处理）: {pdf.name} -> {existing[0]} (status={existing[1]})")
             else:
-                # 添加新记录
+                # 添加新记录；同一次扫描里内容相同的文件只登记第一个
                 file_size = pdf.stat().st_size
-                cur.execute("""
-                    INSERT INTO pdf_files (filename, file_hash, file_size, status)
-                    VALUES (?, ?, ?, 'pending')
-                """, (settings.logical_pdf_name(pdf), file_hash, file_size))
+                rows.append((name, file_hash, file_size))
+                known[file_hash] = (name, "pending")
                 new_pdfs.append(pdf)
-                print(f"  ✅ 新PDF: {settings.logical_pdf_name(pdf)} ({file_size/1024/1024:.2f} MB)")
-        
+                print(f"  ✅ 新PDF: {name} ({file_size/1024/1024:.2f} MB)")
+        
+        cur.executemany("""
+            UPDATE pdf_files SET file_hash = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE filename = ? AND (file_hash IS NULL OR file_hash = '')
+        """, backfill)
+        cur.executemany("""
+            INSERT OR IGNORE INTO pdf_files (filename, file_hash, file_size, status)
+            VALUES (?, ?, ?, 'pending')
+        """, rows)
         conn.commit()
         conn.close()
         
-        print(f"\n📊 统计: 新增 {len(new_pdfs)}/{len(all_pdfs)} 个PDF")
+        print(f"\n📊 统计: 新增 {len(new_pdfs)}/{len(all_pdfs)} 个PDF"
+              f"（hash 缓存命中 {cache_stats.get('hits', 0)}，新算 {cache_stats.get('misses', 0)}）")
         return new_pdfs
 
     def build_upload_batches(self, pdfs: List[Path], max_files: int = None) -> List[List[Path]]:
@@ -304,7 +356,7 @@ class PDFProcessor:
             max_rate_waits = 10
             while attempt < max(1, UPLOAD_RETRY):
                 try:
-                    response = requests.post(
+                    response = self.session.post(
                         f"{self.api_base}/file-urls/batch",
                         headers=self.headers,
                         json={
@@ -329,7 +381,7 @@ class PDFProcessor:
                         ra = response.headers.get("Retry-After")
                         wait = int(ra) if (ra and ra.isdigit()) else 65
                         print(f"⚠️ 命中速率限制(429)，等待 {wait} 秒后重试...({rate_waits}/{max_rate_waits})")
-                        time.sleep(wait)
+                        cancellable_sleep(wait)
                         continue
                     else:
                         print(f"⚠️ 申请上传URL失败：HTTP {response.status_code}")
@@ -342,7 +394,7 @@ class PDFProcessor:
                 if attempt < max(1, UPLOAD_RETRY):
                     delay = min(UPLOAD_RETRY_BACKOFF_MAX, UPLOAD_RETRY_BACKOFF_BASE ** attempt)
                     print(f"  ⏳ 等待 {delay} 秒后重试...")
-                    time.sleep(delay)
+                    cancellable_sleep(delay)
 
             if not result:
                 print("❌ 申请上传URL失败：超过最大重试次数")
@@ -353,55 +405,71 @@ class PDFProcessor:
             
             print(f"📦 获得批次ID: {batch_id}")
             
-            # 上传文件
-            success_count = 0
-            for pdf, upload_url, file_data in zip(pdfs, file_urls, files_data):
-                print(f"  上传: {pdf.name} ... ", end='', flush=True)
-                
-                uploaded = False
-                for attempt in range(max(1, UPLOAD_RETRY)):
-                    try:
-                        with open(pdf, 'rb') as f:
-                            res = requests.put(upload_url, data=f, timeout=DOWNLOAD_TIMEOUT)
+            # 并发上传：本批最多同时 upload_workers 个（共享 io 池），合计带宽受令牌桶约束；
+            # 状态更新收集起来，最后与批次记录在同一事务里写入。上传流顺带算出 MD5，
+            # 补齐/核对 pdf_files.file_hash 并写入 hash 缓存，文件只从磁盘读一遍
+            uploaded: List[Tuple[Optional[str], str, str, str]] = []
+            streamed: List[Tuple[Path, Any, str]] = []
+            sent_bytes = 0
+            completed = False
+            t0 = time.monotonic()
+            try:
+                queue = iter(zip(pdfs, file_urls, files_data))
+                with TaskGroup("io") as group:
+                    futures: Dict[Any, Tuple[Path, Dict[str, Any]]] = {}
 
-                        if res.status_code in [200, 201]:
-                            success_count += 1
-                            uploaded = True
-                            print("✅")
+                    def _fill() -> None:
+                        while len(futures) < self.upload_workers:
+                            nxt = next(queue, None)
+                            if nxt is None:
+                                return
+                            pdf, upload_url, file_data = nxt
+                            futures[group.submit(self._upload_one, pdf, upload_url)] = (pdf, file_data)
 
-                            # 更新数据库状态
-                            conn = sqlite3.connect(self.db_path)
-                            conn.execute("""
+                    _fill()
+                    while futures:
+                        for future in group.wait_first(list(futures)):
+                            pdf, file_data = futures.pop(future)
+                            error, md5, stat = future.result()
+                            if error is None:
+                                uploaded.append((md5, batch_id, file_data["data_id"], file_data["record_name"]))
+                                sent_bytes += stat.st_size if stat is not None else 0
+                                if md5:
+                                    streamed.append((pdf, stat, md5))
+                                print(f"  ✅ 上传: {pdf.name}")
+                            else:
+                                print(f"  ❌ 上传失败: {pdf.name} ({error})")
+                        _fill()
+                completed = True
+            finally:
+                # 取消时也记下已传完的文件；批次记录仅在正常结束或已有文件上传成功时写入
+                access_url = f"{MINERU_WEB_BASE}/{batch_id}"
+                if completed or uploaded:
+                    conn = sqlite3.connect(self.db_path, timeout=30)
+                    try:
+                        with conn:
+                            self._verify_streamed_hashes(conn, uploaded)
+                            conn.executemany("""
                                 UPDATE pdf_files
-                                SET batch_id = ?, data_id = ?, status = 'uploaded', 
-                                    updated_at = CURRENT_TIMESTAMP
+                                SET file_hash = COALESCE(?, file_hash), batch_id = ?, data_id = ?,
+                                    status = 'uploaded', updated_at = CURRENT_TIMESTAMP
                                 WHERE filename = ?
-                            """, (batch_id, file_data["data_id"], file_data["record_name"]))
-                            conn.commit()
-                            conn.close()
-                            break
-
-                        print(f"⚠️ HTTP {res.status_code}")
-                    except Exception as e:
-                        print(f"⚠️ {str(e)[:50]}")
-
-                    if attempt < max(1, UPLOAD_RETRY) - 1:
-                        delay = min(UPLOAD_RETRY_BACKOFF_MAX, UPLOAD_RETRY_BACKOFF_BASE ** (attempt + 1))
-                        time.sleep(delay)
-
-                if not uploaded:
-                    print("❌ 上传失败")
-            
-            # 保存批次信息
-            access_url = f"{MINERU_WEB_BASE}/{batch_id}"
-            conn = sqlite3.connect(self.db_path)
-            conn.execute("""
-                INSERT OR REPLACE INTO batches 
-                (batch_id, batch_index, file_count, access_url, status)
-                VALUES (?, ?, ?, ?, 'uploaded')
-            """, (batch_id, batch_index, len(pdfs), access_url))
-            conn.commit()
-            conn.close()
+                            """, uploaded)
+                            conn.execute("""
+                                INSERT OR REPLACE INTO batches
+                                (batch_id, batch_index, file_count, access_url, status)
+                                VALUES (?, ?, ?, ?, 'uploaded')
+                            """, (batch_id, batch_index, len(pdfs), access_url))
+                    finally:
+                        conn.close()
+                    from src.pdfs.file_hash import remember
+                    remember(streamed, self.db_path)
+            success_count = len(uploaded)
+            elapsed = time.monotonic() - t0
+            # 用上传时打开文件的 stat 计量，不再逐个 stat（文件中途被移走时不至于让已提交的批次走失败分支）
+            total_mb = sent_bytes / 1024 / 1024
+            print(f"  ⏱️ 上传耗时 {elapsed:.1f}s（{total_mb:.1f} MB，{total_mb / max(elapsed, 1e-3):.2f} MB/s，"
+                  f"并发 {self.upload_workers}）")
             
             print(f"\n✅ 批次上传完成: {success_count}/{len(pdfs)} 成功")
             print(f"🔗 访问地址: {access_url}")
@@ -414,17 +482,56 @@ class PDFProcessor:
             traceback.print_exc()
             return None
     
-    def check_batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+    def _upload_one(self, pdf: Path, upload_url: str) -> Tuple[Optional[str], Optional[str], Any]:
+        """PUT 单个文件到预签名 URL（抖动退避重试），边传边算 MD5。
+
+        Returns:
+            (错误, md5, 打开时的 stat)：成功时错误为 None；md5 仅在请求体整份读完时给出。
+        """
+        error = "未知错误"
+        for attempt in range(max(1, UPLOAD_RETRY)):
+            try:
+                with ThrottledFile(pdf, self.upload_bucket, hash_md5=True) as body:
+                    res = self.session.put(upload_url, data=body, timeout=DOWNLOAD_TIMEOUT)
+                if res.status_code in (200, 201):
+                    return None, body.md5_hexdigest(), body.stat
+                error = f"HTTP {res.status_code}"
+            except Exception as e:
+                error = str(e)[:80]
+            if attempt < max(1, UPLOAD_RETRY) - 1:
+                # 抖动退避：并发上传同时失败时错开重试时刻
+                delay = min(UPLOAD_RETRY_BACKOFF_MAX, UPLOAD_RETRY_BACKOFF_BASE ** (attempt + 1))
+                cancellable_sleep(delay * random.uniform(0.5, 1.5))
+        return error, None, None
+
+    @staticmethod
+    def _verify_streamed_hashes(conn: sqlite3.Connection,
+                                uploaded: List[Tuple[Optional[str], str, str, str]]) -> None:
+        """核对上传流算出的 MD5 与登记时的 hash；不一致说明文件在登记后被替换，以上传内容为准。"""
+        by_name = {name: md5 for md5, _, _, name in uploaded if md5}
+        names = list(by_name)
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            for name, old in conn.execute(
+                f"SELECT filename, file_hash FROM pdf_files WHERE filename IN ({', '.join('?' for _ in chunk)})",
+                chunk,
+            ):
+                if old and old != by_name[name]:
+                    print(f"  ⚠️ {name} 内容自登记后已变化（hash {old[:8]} → {by_name[name][:8]}），按上传内容更新")
+
+    def check_batch_status(self, batch_id: str, verbose: bool = True) -> Optional[Dict[str, Any]]:
         """
         查询批次处理状态
         
         Args:
             batch_id: 批次ID
+            verbose: 是否打印批次统计（流水线并发轮询时关闭，避免多批输出交错）
         
         Returns:
             状态信息字典
         """
-        print(f"\n🔍 查询批次: {batch_id}")
+        if verbose:
+            print(f"\n🔍 查询批次: {batch_id}")
         
         url = f"{self.api_base}/extract-results/batch/{batch_id}"
         
@@ -450,20 +557,21 @@ class PDFProcessor:
             processing = sum(1 for item in extract_results if item.get("state") in ["processing", "waiting"])
             failed = sum(1 for item in extract_results if item.get("state") == "failed")
             
-            print(f"📊 批次状态:")
-            print(f"  总文件数: {total}")
-            print(f"  ✅ 已完成: {done}")
-            print(f"  ⏳ 处理中: {processing}")
-            print(f"  ❌ 失败: {failed}")
-            
-            if done == total and total > 0:
-                print(f"  🎉 批次已全部完成！")
-            elif total > 0:
-                progress = done / total * 100
-                print(f"  📈 进度: {progress:.1f}%")
+            if verbose:
+                print(f"📊 批次状态:")
+                print(f"  总文件数: {total}")
+                print(f"  ✅ 已完成: {done}")
+                print(f"  ⏳ 处理中: {processing}")
+                print(f"  ❌ 失败: {failed}")
+                
+                if done == total and total > 0:
+                    print(f"  🎉 批次已全部完成！")
+                elif total > 0:
+                    progress = done / total * 100
+                    print(f"  📈 进度: {progress:.1f}%")
             
             # 更新数据库状态
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=30)
             status = 'completed' if done == total else 'processing'
             conn.execute("""
                 UPDATE batches
@@ -616,54 +724,6 @@ class PDFProcessor:
             "total": len(extract_results)
         }
     
-    def _download_file(self, url: str, save_path: Path, retry: int = None) -> bool:
-        """下载文件（带重试）"""
-        if retry is None:
-            retry = DOWNLOAD_RETRY
-        
-        for attempt in range(retry):
-            try:
-                response = requests.get(url, timeout=DOWNLOAD_TIMEOUT, stream=True)
-                if response.status_code == 200:
-                    with open(save_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                            if chunk:
-                                f.write(chunk)
-                    return True
-                else:
-                    if attempt < retry - 1:
-                        delay = min(
-                            DOWNLOAD_RETRY_BACKOFF_MAX,
-                            DOWNLOAD_RETRY_BACKOFF_BASE ** (attempt + 1)
-                        )
-                        time.sleep(delay)
-            except Exception:
-                if attempt < retry - 1:
-                    delay = min(
-                        DOWNLOAD_RETRY_BACKOFF_MAX,
-                        DOWNLOAD_RETRY_BACKOFF_BASE ** (attempt + 1)
-                    )
-                    time.sleep(delay)
-        
-        return False
-    
-    def _unzip_file(self, zip_path: Path, extract_to: Path) -> bool:
-        """安全解压ZIP文件（拒绝绝对路径与 .. 目录穿越）"""
-        extract_to = Path(extract_to).resolve()
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                for member in zip_ref.namelist():
-                    # 防御 zip-slip：解析后的目标必须仍在 extract_to 之内
-                    target = (extract_to / member).resolve()
-                    if not str(target).startswith(str(extract_to)):
-                        print(f"  ⚠️ 跳过不安全的压缩包条目: {member}")
-                        return False
-                zip_ref.extractall(extract_to)
-            return True
-        except Exception as e:
-            print(f"  解压错误: {e}")
-            return False
-
     # ------------------------------------------------------------------
     # MinerU 下载健壮性辅助
     # ------------------------------------------------------------------
@@ -793,28 +853,29 @@ class PDFProcessor:
         zip_url: str, output_dir: Path
     ) -> Dict[str, Any]:
         """
-        完整处理单个文件：定位目录 -> 下载 -> 安全解压 -> 校验 full.md -> 记账。
+        完整处理单个文件：定位目录 -> 流式下载 -> 选择性解压 -> 校验 full.md -> 记账。
+
+        zip 下载进内存/临时文件（可 Range 续传），只解出 full.md 与结构化 JSON；
+        图片等留在 mineru_output.zip 里，界面请求时再按需解出（见 src/pdfs/mineru_archive.py）。
 
         返回 {"success": bool, "output_path"/"error": ...}
         """
         paper_dir = self._resolve_paper_dir(output_dir, filename, batch_id, data_id)
         paper_dir.mkdir(parents=True, exist_ok=True)
-        zip_path = paper_dir / "mineru_output.zip"
 
-        if not self._download_file(zip_url, zip_path):
+        spool = download_to_spool(zip_url)
+        if spool is None:
             self._record_download_failure(batch_id, data_id, filename, paper_dir, "下载失败")
             return {"success": False, "error": "下载失败"}
 
-        if not self._unzip_file(zip_path, paper_dir):
+        try:
+            with spool:
+                extract_selected(spool, paper_dir)
+        except (ValueError, zipfile.BadZipFile, OSError) as e:
+            print(f"  解压错误: {e}")
             self._record_download_failure(batch_id, data_id, filename, paper_dir, "解压失败")
             return {"success": False, "error": "解压失败"}
 
-        # 删除ZIP节省空间
-        try:
-            zip_path.unlink()
-        except OSError:
-            pass
-
         # 校验 MinerU 解析结果（常见 bug：zip 内缺少/为空的 full.md）
         ok, char_count = self._validate_parsed_dir(paper_dir)
         if not ok:
@@ -823,6 +884,22 @@ class PDFProcessor:
             )
             return {"success": False, "error": "解析结果缺少有效的 full.md"}
 
+        # 落盘时一次性建结构索引（structure.json），下游采样/提取直接复用；失败不影响下载结果
+        try:
+            from src.schema.structure import write_structure
+            write_structure(paper_dir)
+        except Exception as e:  # noqa: BLE001
+            print(f"  ⚠️ 结构索引生成失败（将在首次使用时重建）: {e}")
+
+        # 近似重复签名（MinHash + LSH），提取时可复用兄弟论文的结果；失败不影响下载结果
+        try:
+            from src.database.near_dup import index_paper_dir
+            dup = index_paper_dir(paper_dir, self.db_path)
+            if dup:
+                print(f"  ♻️ 与 {dup['paper_id']} 近似重复（Jaccard≈{dup['similarity']}）")
+        except Exception as e:  # noqa: BLE001
+            print(f"  ⚠️ 近似重复签名失败（将在提取时补算）: {e}")
+
         self._record_download_success(batch_id, data_id, filename, paper_dir, char_count)
         return {"success": True, "output_path": str(paper_dir)}
 
@@ -981,25 +1058,34 @@ class PDFProcessor:
         success_count = already_done
         failed_count = 0
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(self._download_single_file, item): item 
-                for item in to_download
-            }
-            
-            for future in as_completed(futures):
-                item = futures[future]
-                try:
-                    result = future.result()
-                    if result["success"]:
-                        success_count += 1
-                        print(f"  ✅ {item['filename']}")
-                    else:
+        # 在进程级共享 io 池上下载；本批最多同时 max_workers 个，完成一个再补一个
+        queue = iter(to_download)
+        with TaskGroup("io") as group:
+            futures: Dict[Any, Dict[str, Any]] = {}
+
+            def _fill() -> None:
+                while len(futures) < max(1, max_workers):
+                    nxt = next(queue, None)
+                    if nxt is None:
+                        return
+                    futures[group.submit(self._download_single_file, nxt)] = nxt
+
+            _fill()
+            while futures:
+                for future in group.wait_first(list(futures)):
+                    item = futures.pop(future)
+                    try:
+                        result = future.result()
+                        if result["success"]:
+                            success_count += 1
+                            print(f"  ✅ {item['filename']}")
+                        else:
+                            failed_count += 1
+                            print(f"  ❌ {item['filename']}: {result.get('error', '未知错误')}")
+                    except Exception as e:
                         failed_count += 1
-                        print(f"  ❌ {item['filename']}: {result.get('error', '未知错误')}")
-                except Exception as e:
-                    failed_count += 1
-                    print(f"  ❌ {item['filename']}: {e}")
+                        print(f"  ❌ {item['filename']}: {e}")
+                _fill()
         
         # 更新批次状态
         conn = sqlite3.connect(self.db_path)
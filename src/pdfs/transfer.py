@@ -0,0 +1,111 @@
+"""
+MinerU 上传的连接池与带宽控制。
+
+原先 upload_batch 逐个文件 requests.put（每次新建连接），一批 50 个 20 MB 的 PDF 只能串行上传。
+这里提供：
+
+  - pooled_session：连接池大小与并发数一致的 requests.Session，预签名 URL 的 PUT 复用 TCP/TLS 连接；
+  - TokenBucket：按字节计的令牌桶，所有并发上传共用，合计带宽不超过 MINERU_UPLOAD_MAX_MBPS；
+  - ThrottledFile：以文件对象形式交给 requests（保留 Content-Length），每读一块先取令牌，
+    并在块边界响应任务取消；可顺带对读出的字节算 MD5，上传即完成 hash，不必为登记再读一遍文件。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.cancel import check as check_cancelled
+from src.cancel import sleep as cancellable_sleep
+
+
+def pooled_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max(1, pool_size), pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class TokenBucket:
+    """字节令牌桶；rate<=0 表示不限速。容量为一秒的量，允许短时突发。"""
+
+    def __init__(self, rate_bytes_per_s: float, burst: Optional[float] = None):
+        self.rate = float(rate_bytes_per_s)
+        self.capacity = float(burst if burst is not None else max(self.rate, 1.0))
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_mbps(cls, mbps: float) -> "TokenBucket":
+        return cls(float(mbps) * 1024 * 1024 if mbps and mbps > 0 else 0)
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def consume(self, n: int) -> None:
+        """取 n 个字节的令牌，不够时等待（可被任务取消打断）。n 超过容量时按容量分段取。"""
+        if self.unlimited or n <= 0:
+            return
+        while n > 0:
+            want = min(n, self.capacity)
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= want:
+                    self._tokens -= want
+                    n -= want
+                    continue
+                wait = (want - self._tokens) / self.rate
+            cancellable_sleep(wait)
+
+
+class ThrottledFile:
+    """只读文件包装：read 时按令牌桶限速并检查取消；实现 __len__ 让 requests 设置 Content-Length。
+
+    hash_md5=True 时对读出的字节累积 MD5，整份读完后由 md5_hexdigest() 取得（未读完为 None）。
+    """
+
+    def __init__(self, path: Path, bucket: Optional[TokenBucket] = None, hash_md5: bool = False):
+        self._f = open(path, "rb")
+        self.stat = os.fstat(self._f.fileno())
+        self._size = self.stat.st_size
+        self._bucket = bucket
+        self._md5 = hashlib.md5() if hash_md5 else None
+        self.sent = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def read(self, n: int = -1) -> bytes:
+        check_cancelled()
+        data = self._f.read(n)
+        if data and self._bucket is not None:
+            self._bucket.consume(len(data))
+        if data and self._md5 is not None:
+            self._md5.update(data)
+        self.sent += len(data)
+        return data
+
+    def md5_hexdigest(self) -> Optional[str]:
+        if self._md5 is None or self.sent != self._size:
+            return None
+        return self._md5.hexdigest()
+
+    def close(self) -> None:
+        self._f.close()
+
+    def __enter__(self) -> "ThrottledFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
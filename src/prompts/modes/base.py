@@ -84,7 +84,7 @@ class ExtractionMode(ABC):
         调用LLM并解析JSON
         
         Returns:
-            {"success": bool, "data": dict, "error": str}
+            {"success": bool, "data": dict, "error": str, "usage": dict}
         """
         from src.llm import LLMMessage
         
@@ -97,14 +97,14 @@ class ExtractionMode(ABC):
         
         if not response.success:
             self.logger.warning(f"[{call_id}] LLM调用失败: {response.error}")
-            return {"success": False, "data": {}, "error": response.error}
+            return {"success": False, "data": {}, "error": response.error, "usage": response.usage}
         
         # 记录响应长度
         self.logger.debug(f"[{call_id}] LLM响应: {len(response.content)} 字符")
         
-        # 解析JSON
+        # 解析JSON：json_schema 约束解码的响应一次 json.loads 即可，否则走宽松解析
         try:
-            data = self._parse_json(response.content)
+            data = self._parse_structured(response) if response.structured else self._parse_json(response.content)
             # 记录解析结果摘要
             record_count = data.get("record_count", len(data.get("records", [])))
             records_len = len(data.get("records", []))
@@ -114,40 +114,24 @@ class ExtractionMode(ABC):
                 f"records数组长度={records_len}, "
                 f"application={paper_info.get('application', '未提供')}"
             )
-            return {"success": True, "data": data, "error": ""}
+            return {"success": True, "data": data, "error": "", "usage": response.usage}
         except Exception as e:
             # 记录解析失败的详细信息
             self.logger.warning(
                 f"[{call_id}] JSON解析失败: {e}\n"
                 f"响应内容前500字符: {response.content[:500]}"
             )
-            return {"success": False, "data": {}, "error": f"JSON解析失败: {e}"}
+            return {"success": False, "data": {}, "error": f"JSON解析失败: {e}", "usage": response.usage}
     
-    def _parse_json(self, content: str) -> Dict[str, Any]:
-        """解析LLM返回的JSON"""
+    def _parse_structured(self, response) -> Dict[str, Any]:
         import json
-        import re
-        
-        # 尝试直接解析
         try:
-            return json.loads(content)
+            return json.loads(response.content)
         except json.JSONDecodeError:
-            pass
-        
-        # 尝试提取代码块
-        patterns = [
-            r'```json\s*([\s\S]*?)\s*```',
-            r'```\s*([\s\S]*?)\s*```',
-            r'\{[\s\S]*\}',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, content)
-            if match:
-                try:
-                    json_str = match.group(1) if '```' in pattern else match.group(0)
-                    return json.loads(json_str)
-                except (json.JSONDecodeError, IndexError):
-                    continue
-        
-        raise ValueError(f"无法解析JSON: {content[:200]}...")
+            self.logger.warning("结构化输出不是合法 JSON，回退宽松解析")
+            return self._parse_json(response.content)
+
+    def _parse_json(self, content: str) -> Dict[str, Any]:
+        """解析LLM返回的JSON（单遍容错解析：代码块/尾逗号/截断，见 src/schema/_json.py）"""
+        from src.schema._json import parse_json_loose
+        return parse_json_loose(content)
@@ -0,0 +1,230 @@
+"""
+紧凑提取输出格式（EXTRACT_OUTPUT_FORMAT）。
+
+默认 cells 格式每条记录重复全部字段名，空字段也输出 {"value":null,"evidence":null}，
+宽 schema 下输出 token（最慢最贵的部分）随字段数线性膨胀。这里提供两种可选线格式：
+
+  compact  ：字段用短代号，空字段省略，单元格写成 [value, evidence]
+             {"quotes":["原文片段",...], "records":[{"f1":["UHMWPE","..."], "f4":[5.2, 0]}]}
+  columnar ：列数组 + 证据引用，同一段原文只写一次
+             {"cols":["f1","f4"], "quotes":["原文片段",...], "rows":[[["UHMWPE",0],[5.2,1]], ...]}
+
+evidence 可以是原文字符串，也可以是 quotes 数组下标。decode_records 把两种格式还原成
+cells 形状（全部字段齐全、空字段为 null），下游的表格回填 / evidence 核验 / 合并审阅均不变。
+模型无视格式直接返回 cells 时原样通过。
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+FORMATS = ("cells", "compact", "columnar")
+DEFAULT_FORMAT = "cells"
+
+
+def configured_format() -> str:
+    try:
+        import settings
+        fmt = str(getattr(settings, "EXTRACT_OUTPUT_FORMAT", DEFAULT_FORMAT) or DEFAULT_FORMAT).strip().lower()
+    except Exception:
+        fmt = DEFAULT_FORMAT
+    return fmt if fmt in FORMATS else DEFAULT_FORMAT
+
+
+def field_codes(schema) -> Dict[str, str]:
+    """字段名 -> 短代号（f1, f2, ...，按 schema 字段顺序，稳定可复现）。"""
+    return {f.name: f"f{i}" for i, f in enumerate(schema.fields, 1)}
+
+
+def format_instructions(fmt: str) -> str:
+    """写进 user prompt「提取输出格式」一节的线格式说明。"""
+    if fmt == "compact":
+        return (
+            '输出 JSON：{"quotes":[原文片段,...],"records":[{代号:[value,evidence],...},...]}。\n'
+            "- 字段用字段表中的代号（如 f1），value 为 null 的字段直接省略，不要输出。\n"
+            "- 每个单元格写成 [value, evidence]；evidence 可直接写原文片段，"
+            "同一片段被多处引用时放进 quotes 数组并写其下标（整数）。\n"
+            "- list 型字段的 value 是数组：写成 [[值1,值2,...], evidence]。"
+        )
+    if fmt == "columnar":
+        return (
+            '输出 JSON：{"cols":[代号,...],"quotes":[原文片段,...],"rows":[[单元格,...],...]}。\n'
+            "- cols 只列出至少一条记录有值的字段代号；rows 每行是一条记录，单元格顺序与 cols 一致。\n"
+            "- 单元格写成 [value, 证据下标]，证据下标指向 quotes 数组中的原文片段；该记录无此值时写 null。\n"
+            "- list 型字段的 value 是数组：写成 [[值1,值2,...], 证据下标]。"
+        )
+    return ""
+
+
+def _evidence(ref: Any, quotes: List[Any]) -> Optional[str]:
+    if isinstance(ref, bool):
+        return None
+    if isinstance(ref, int):
+        if 0 <= ref < len(quotes) and isinstance(quotes[ref], str):
+            return quotes[ref]
+        return None
+    if isinstance(ref, str) and ref.strip():
+        return ref
+    return None
+
+
+def _cell(raw: Any, quotes: List[Any], ftype: str = "string") -> Dict[str, Any]:
+    """[value, evidence] / {"value","evidence"} / 标量 -> cells 单元格。
+
+    list 型字段的值本身是数组，只认 [[...], evidence]；两项的 ["UHMWPE", "PEEK"] 是值而不是 [值, 证据]。
+    """
+    if isinstance(raw, dict) and ("value" in raw or "evidence" in raw):
+        ev = raw.get("evidence")
+        return {"value": raw.get("value"), "evidence": _evidence(ev, quotes) if ev is not None else None}
+    if ftype == "list" and isinstance(raw, list) and not (
+            len(raw) == 2 and (raw[0] is None or isinstance(raw[0], list))):
+        return {"value": raw, "evidence": None}
+    if isinstance(raw, list) and len(raw) == 2 and not isinstance(raw[1], (list, dict)):
+        value, ev = raw
+        return {"value": value, "evidence": _evidence(ev, quotes) if value is not None else None}
+    return {"value": raw, "evidence": None}
+
+
+def _expand(rec: Dict[str, Any], by_code: Dict[str, str], names: List[str],
+            quotes: List[Any], types: Dict[str, str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {name: {"value": None, "evidence": None} for name in names}
+    for key, raw in rec.items():
+        name = by_code.get(str(key).strip().lower(), str(key))
+        out[name] = _cell(raw, quotes, types.get(name, "string"))
+    return out
+
+
+def decode_records(data: Any, schema) -> List[Dict[str, Any]]:
+    """把 compact / columnar / cells 任一格式的响应解码为 cells 形状的 records。"""
+    if not isinstance(data, dict):
+        return []
+    codes = field_codes(schema)
+    by_code = {code: name for name, code in codes.items()}
+    names = list(codes)
+    types = {f.name: f.type for f in schema.fields}
+    quotes = data.get("quotes") if isinstance(data.get("quotes"), list) else []
+
+    if isinstance(data.get("rows"), list) and isinstance(data.get("cols"), list):
+        cols = [str(c) for c in data["cols"]]
+        out = []
+        for row in data["rows"]:
+            if not isinstance(row, list):
+                continue
+            rec = {c: v for c, v in zip(cols, row) if v is not None}
+            out.append(_expand(rec, by_code, names, quotes, types))
+        return out
+
+    records = data.get("records", [])
+    if not isinstance(records, list):
+        return []
+    out = []
+    for rec in records:
+        if not isinstance(rec, dict):
+            continue
+        cells_shaped = all(isinstance(v, dict) for v in rec.values()) and not any(
+            str(k).strip().lower() in by_code for k in rec)
+        out.append(rec if cells_shaped else _expand(rec, by_code, names, quotes, types))
+    return out
+
+
+# ----------------------------------------------------------------------
+# merger 候选紧凑编码（EXTRACT_MERGER_FORMAT）
+# ----------------------------------------------------------------------
+MERGER_FORMATS = ("compact", "json")
+
+
+def configured_merger_format() -> str:
+    try:
+        import settings
+        fmt = str(getattr(settings, "EXTRACT_MERGER_FORMAT", "compact") or "compact").strip().lower()
+    except Exception:
+        fmt = "compact"
+    return fmt if fmt in MERGER_FORMATS else "compact"
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    if isinstance(a, str) and isinstance(b, str):
+        return " ".join(a.split()).lower() == " ".join(b.split()).lower()
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool) and not isinstance(b, bool):
+        return abs(float(a) - float(b)) <= 1e-9 * max(1.0, abs(float(a)))
+    return a == b
+
+
+def _filled(rec: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {k: c for k, c in rec.items() if isinstance(c, dict) and c.get("value") is not None}
+
+
+def _align(candidates: List[Dict[str, Any]]) -> List[Dict[str, Dict[str, Any]]]:
+    """把各候选的记录按「一致字段数」贪心对齐成组：组内每个 extractor 至多一条记录。"""
+    groups: List[Dict[str, Dict[str, Any]]] = []
+    for cand in candidates:
+        label = cand["label"]
+        for rec in cand["records"]:
+            cells = _filled(rec)
+            best, best_score = None, 0
+            for g in groups:
+                if label in g:
+                    continue
+                score = sum(
+                    1 for other in g.values() for k, c in cells.items()
+                    if k in other and _same_value(other[k]["value"], c["value"])
+                )
+                if score > best_score:
+                    best, best_score = g, score
+            if best is None:
+                best = {}
+                groups.append(best)
+            best[label] = cells
+    return groups
+
+
+def encode_candidates(candidate_outputs: List[Dict[str, Any]], schema) -> Dict[str, Any]:
+    """多个 extractor 的候选 -> merger 用的紧凑编码。
+
+    去掉 metadata 与空字段；字段改用代号；证据原文去重进 quotes；各候选记录对齐成组后，
+    一致的单元格只写一次（same），只有分歧的字段按 extractor 并排列出（diff）。
+    """
+    codes = field_codes(schema)
+    quotes: List[str] = []
+    quote_idx: Dict[str, int] = {}
+
+    def _q(evidence: Any) -> Optional[int]:
+        if not isinstance(evidence, str) or not evidence.strip():
+            return None
+        if evidence not in quote_idx:
+            quote_idx[evidence] = len(quotes)
+            quotes.append(evidence)
+        return quote_idx[evidence]
+
+    labels = [chr(ord("A") + i) for i in range(len(candidate_outputs))]
+    candidates = [{"label": lab, "records": [r for r in (c.get("records") or []) if isinstance(r, dict)]}
+                  for lab, c in zip(labels, candidate_outputs)]
+    groups = []
+    for g in _align(candidates):
+        same: Dict[str, Any] = {}
+        diff: Dict[str, Any] = {}
+        for name in list(codes) + sorted({k for cells in g.values() for k in cells} - set(codes)):
+            present = [(lab, cells[name]) for lab, cells in g.items() if name in cells]
+            if not present:
+                continue
+            code = codes.get(name, name)
+            first = present[0][1]
+            if all(_same_value(c["value"], first["value"]) for _, c in present):
+                same[code] = [first["value"], _q(first.get("evidence"))]
+            else:
+                diff[code] = {lab: [c["value"], _q(c.get("evidence"))] for lab, c in present}
+        group: Dict[str, Any] = {"by": "".join(g), "same": same}
+        if diff:
+            group["diff"] = diff
+        groups.append(group)
+    return {
+        "extractors": {lab: c.get("role", lab) for lab, c in zip(labels, candidate_outputs)},
+        "quotes": quotes,
+        "groups": groups,
+    }
+
+
+def decode_merged(data: Any, schema, quotes: List[str]) -> List[Dict[str, Any]]:
+    """merger 的紧凑输出 -> cells 形状 records；evidence 下标指向 encode_candidates 的 quotes。"""
+    if isinstance(data, dict) and not (isinstance(data.get("quotes"), list) and data["quotes"]):
+        data = dict(data, quotes=quotes)
+    return decode_records(data, schema)
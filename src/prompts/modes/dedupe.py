@@ -0,0 +1,182 @@
+"""
+合并前的候选记录去重（EXTRACT_CANDIDATE_DEDUPE）。
+
+多个 extractor 经常给出相同或几乎相同的记录，原先仍逐条逐格交给 merger。这里先做两遍去重：
+
+  精确：记录按字段的规范化取值（NFKC、空白折叠、大小写、数值按 6 位有效数字；忽略 evidence）
+        求 sha1，同一 extractor 内重复的记录只留一条；所有 extractor 都给出的同一记录直接定稿。
+  近似：两条记录在共同字段上取值一致、差别只在一方留空的字段时视为同一条（仅在匹配唯一时合并，
+        取字段并集），同样在 extractor 内折叠、跨全部 extractor 定稿。
+
+定稿记录不再送 merger；全部定稿时跳过 merger。合并单元格时优先保留核验通过的 evidence。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def canonical_value(value: Any) -> Any:
+    """比较用的规范化取值；数值字符串按数值处理。"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return format(float(value), ".6g")
+    if isinstance(value, str):
+        s = " ".join(unicodedata.normalize("NFKC", value).split()).lower().rstrip(" .;,")
+        try:
+            return format(float(s), ".6g")
+        except ValueError:
+            return s
+    if isinstance(value, (list, tuple)):
+        return sorted((canonical_value(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(value, dict):
+        return {str(k): canonical_value(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    return str(value)
+
+
+def canonical_cells(rec: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: canonical_value(cell["value"]) for name, cell in rec.items()
+            if isinstance(cell, dict) and cell.get("value") is not None}
+
+
+def record_hash(rec: Dict[str, Any]) -> str:
+    raw = json.dumps(sorted(canonical_cells(rec).items()), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _near(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """共同字段取值一致，且一方字段是另一方的子集（差别只在留空的字段）。"""
+    shared = a.keys() & b.keys()
+    if not shared or any(a[k] != b[k] for k in shared):
+        return False
+    return a.keys() <= b.keys() or b.keys() <= a.keys()
+
+
+def _combine(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """字段并集；同一字段优先取 evidence 核验通过的单元格。"""
+    out: Dict[str, Any] = {}
+    for rec in records:
+        for name, cell in rec.items():
+            if not isinstance(cell, dict):
+                continue
+            cur = out.get(name)
+            if cur is None or cur.get("value") is None or (
+                    cell.get("value") is not None and cell.get("evidence_verified") and not cur.get("evidence_verified")):
+                out[name] = cell
+    return out
+
+
+@dataclass
+class DedupeResult:
+    candidates: List[Dict[str, Any]]             # 去重后仍需 merger 仲裁的候选（records 已剔除定稿记录）
+    settled: List[Dict[str, Any]] = field(default_factory=list)   # 所有 extractor 一致、直接定稿的记录
+    records_in: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(c.get("records") or []) for c in self.candidates)
+
+    def report(self) -> Dict[str, Any]:
+        removed = self.records_in - self.pending - len(self.settled)
+        return {
+            "records_in": self.records_in,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "settled": len(self.settled),
+            "sent_to_merger": self.pending,
+            "rate": round(removed / self.records_in, 3) if self.records_in else 0.0,
+            "merge_skipped": self.pending == 0,
+        }
+
+
+def _collapse(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int, int]:
+    """同一 extractor 内：精确重复只留一条，近似重复（匹配唯一）并为一条。"""
+    seen: Dict[str, int] = {}
+    out: List[Dict[str, Any]] = []
+    exact = 0
+    for rec in records:
+        if not isinstance(rec, dict):
+            continue
+        h = record_hash(rec)
+        if h in seen:
+            out[seen[h]] = _combine([out[seen[h]], rec])
+            exact += 1
+            continue
+        seen[h] = len(out)
+        out.append(rec)
+    near = 0
+    i = 0
+    while i < len(out):
+        ci = canonical_cells(out[i])
+        matches = [j for j in range(len(out)) if j != i and _near(ci, canonical_cells(out[j]))]
+        if len(matches) == 1:
+            j = matches[0]
+            out[min(i, j)] = _combine([out[min(i, j)], out[max(i, j)]])
+            del out[max(i, j)]
+            near += 1
+            i = 0
+            continue
+        i += 1
+    return out, exact, near
+
+
+def dedupe_candidates(candidate_outputs: List[Dict[str, Any]]) -> DedupeResult:
+    """候选 -> (仍需仲裁的候选, 定稿记录)；candidate_outputs 本身不被修改。"""
+    result = DedupeResult(candidates=[])
+    pools: List[List[Dict[str, Any]]] = []
+    for cand in candidate_outputs:
+        records = list(cand.get("records") or [])
+        result.records_in += len(records)
+        collapsed, exact, near = _collapse(records)
+        result.exact_duplicates += exact
+        result.near_duplicates += near
+        pools.append(collapsed)
+
+    if len(pools) >= 2:
+        # 跨 extractor：以第一个候选为锚，每个其它候选中都有精确/唯一近似匹配的记录定稿
+        for rec in list(pools[0]):
+            key, cells = record_hash(rec), canonical_cells(rec)
+            picks: List[Tuple[int, int]] = []
+            fuzzy = False
+            for p, pool in enumerate(pools[1:], 1):
+                hit = next((j for j, other in enumerate(pool) if record_hash(other) == key), None)
+                if hit is None:
+                    near = [j for j, other in enumerate(pool) if _near(cells, canonical_cells(other))]
+                    if len(near) != 1:
+                        break
+                    hit, fuzzy = near[0], True
+                picks.append((p, hit))
+            else:
+                group = [rec] + [pools[p][j] for p, j in picks]
+                result.settled.append(_combine(group))
+                if fuzzy:
+                    result.near_duplicates += len(picks)
+                else:
+                    result.exact_duplicates += len(picks)
+                pools[0].remove(rec)
+                for p, j in sorted(picks, key=lambda x: -x[1]):
+                    del pools[p][j]
+
+    result.candidates = [dict(cand, records=pool, count=len(pool))
+                         for cand, pool in zip(candidate_outputs, pools)]
+    return result
+
+
+def dedupe_enabled() -> bool:
+    try:
+        import settings
+        return bool(getattr(settings, "EXTRACT_CANDIDATE_DEDUPE", True))
+    except Exception:
+        return True
+
+
+def merge_settled(settled: List[Dict[str, Any]], merged: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """定稿记录 + merger 输出；merger 复述了定稿记录时按规范化 hash 去掉重复。"""
+    keys = {record_hash(r) for r in settled}
+    return list(settled) + [r for r in (merged or []) if isinstance(r, dict) and record_hash(r) not in keys]
@@ -15,12 +15,51 @@ import re
 import unicodedata
 from typing import Any, Dict, List, Optional
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.executor import TaskGroup
+from src.llm.limiter import llm_context
 
 from .base import ExtractionMode, ExtractionResult
+from .compact import (configured_format, configured_merger_format, decode_merged, decode_records,
+                      encode_candidates, field_codes, format_instructions)
+from .dedupe import dedupe_candidates, dedupe_enabled, merge_settled
 
 EVIDENCE_MAX_CHARS = 240
 EVIDENCE_MATCH_WINDOW = 16
+MAX_EXPECTED_RECORDS = 40
+
+AGENT_POLICIES = ("fixed", "adaptive")
+DEFAULT_ADAPTIVE_THRESHOLDS = {"min_verified": 0.8, "max_records": 8, "max_table_rows": 30, "max_enum_violations": 0}
+
+
+def configured_agent_policy() -> str:
+    """EXTRACT_AGENT_POLICY：fixed=全部 extractor 扇出（默认）；adaptive=先跑一个，按信号升级。"""
+    try:
+        import settings
+        policy = str(getattr(settings, "EXTRACT_AGENT_POLICY", "fixed") or "fixed").lower()
+    except Exception:
+        policy = "fixed"
+    return policy if policy in AGENT_POLICIES else "fixed"
+
+
+def adaptive_thresholds() -> Dict[str, float]:
+    """EXTRACT_ADAPTIVE_THRESHOLDS="min_verified:0.8,max_records:8,..."；缺项/非法项用默认值。"""
+    out = dict(DEFAULT_ADAPTIVE_THRESHOLDS)
+    try:
+        import settings
+        raw = str(getattr(settings, "EXTRACT_ADAPTIVE_THRESHOLDS", "") or "")
+    except Exception:
+        raw = ""
+    for part in raw.split(","):
+        name, _, value = part.partition(":")
+        name = name.strip().lower()
+        if name not in out:
+            continue
+        try:
+            out[name] = float(value)
+        except ValueError:
+            continue
+    return out
 
 
 def _normalize_text(s: str) -> str:
@@ -51,12 +90,46 @@ def _evidence_in_source(evidence: str, norm_source: str) -> bool:
     return False
 
 
+def reverify_records(records: List[Any], source: str) -> (List[Dict[str, Any]], int, int):
+    """对照 source 重新核验已有 records（如复用近似重复论文的结果）。
+
+    任一非空字段缺 evidence 或 evidence 不在 source 中的记录整条丢弃；
+    返回 (保留的记录, 丢弃的记录数, 核验通过的单元格数)。
+    """
+    norm_source = _normalize_text(source)
+    kept: List[Dict[str, Any]] = []
+    dropped = cells = 0
+    for rec in records or []:
+        if not isinstance(rec, dict):
+            continue
+        new_rec: Dict[str, Any] = {}
+        ok = True
+        for fname, cell in rec.items():
+            value, evidence = GenericFlatMode._normalize_cell(cell)
+            if value is None:
+                new_rec[fname] = {"value": None, "evidence": None}
+            elif evidence and _evidence_in_source(evidence, norm_source):
+                new_rec[fname] = {"value": value, "evidence": evidence, "evidence_verified": True}
+            else:
+                ok = False
+                break
+        if ok and any(c["value"] is not None for c in new_rec.values()):
+            kept.append(new_rec)
+            cells += sum(1 for c in new_rec.values() if c["value"] is not None)
+        else:
+            dropped += 1
+    return kept, dropped, cells
+
+
 class GenericFlatMode(ExtractionMode):
     """基于生成 schema 的扁平 + evidence 提取。"""
 
-    def __init__(self, llm_client, schema, prompt_assembler=None):
+    def __init__(self, llm_client, schema, prompt_assembler=None, output_format: str = None):
         super().__init__(llm_client, prompt_assembler)
         self.schema = schema
+        # 线格式：cells（默认，每字段 {value, evidence}）| compact | columnar，见 compact.py
+        self.output_format = output_format or configured_format()
+        self._response_schemas: Dict[str, Dict[str, Any]] = {}
 
     @property
     def mode_name(self) -> str:
@@ -70,12 +143,13 @@ class GenericFlatMode(ExtractionMode):
     # ---- prompt ----
     def _build_system_prompt(self) -> str:
         from src.schema import prompts as P
-        return P.EXTRACTOR_SYSTEM
+        return P.EXTRACTOR_SYSTEM if self.output_format == "cells" else P.EXTRACTOR_SYSTEM_COMPACT
 
-    def _build_schema_block(self) -> str:
+    def _build_schema_block(self, with_codes: bool = False) -> str:
+        codes = field_codes(self.schema) if with_codes else {}
         lines = []
         for f in self.schema.fields:
-            parts = [f"- {f.name} ({f.type}"]
+            parts = [f"- {codes[f.name]} = {f.name} ({f.type}" if codes else f"- {f.name} ({f.type}"]
             if f.unit:
                 parts[0] += f", 单位:{f.unit}"
             if f.enum_values:
@@ -87,48 +161,185 @@ class GenericFlatMode(ExtractionMode):
             lines.append(f"{parts[0]}: {desc}{hint}{fig}")
         return "\n".join(lines)
 
-    def _build_user_prompt(self, paper_id: str, content: str) -> str:
+    def _build_user_prompt(self, paper_id: str, content: str, prefill_block: str = "") -> str:
         record_def = self.schema.record_definition or "论文中一组可独立成行的结构化数据"
+        prefill_section = f"{prefill_block}\n\n" if prefill_block else ""
+        compact = self.output_format != "cells"
+        if compact:
+            output_format = format_instructions(self.output_format)
+            closing = "请按 schema 抽取所有记录，严格按【提取输出格式】输出 JSON（字段用代号，空字段省略）。"
+        else:
+            output_format = self.schema.extraction_format or '输出 JSON：{"records":[{字段名:{"value":...,"evidence":...}}]}。'
+            closing = "请按 schema 抽取所有记录，输出 JSON（含 records，每字段 value+evidence）。"
         return (
             f"【领域】{self.schema.domain}\n"
             f"【一条记录代表】{record_def}\n\n"
-            f"【提取输出格式】\n{self.schema.extraction_format or '输出 JSON：{\"records\":[{字段名:{\"value\":...,\"evidence\":...}}]}。'}\n\n"
-            f"【字段表 schema】\n{self._build_schema_block()}\n\n"
+            f"【提取输出格式】\n{output_format}\n\n"
+            f"【字段表 schema】\n{self._build_schema_block(with_codes=compact)}\n\n"
             f"【论文全文 (paper_id={paper_id})】\n{content}\n\n"
-            f"请按 schema 抽取所有记录，输出 JSON（含 records，每字段 value+evidence）。"
+            f"{prefill_section}"
+            f"{closing}"
         )
 
-    # ---- 提取 ----
-    def extract(self, paper_id: str, content: str, chunks: List[str] = None, **kwargs) -> ExtractionResult:
+    # ---- 表格预解析 ----
+    @staticmethod
+    def _table_prefill_policy() -> (str, float):
+        try:
+            import settings
+            policy = str(getattr(settings, "EXTRACT_TABLE_PREFILL", "hint") or "hint").lower()
+            min_conf = float(getattr(settings, "EXTRACT_TABLE_PREFILL_MIN_CONFIDENCE", 0.75))
+        except Exception:
+            policy, min_conf = "hint", 0.75
+        return (policy if policy in ("off", "hint", "fill") else "hint"), min_conf
+
+    def _table_prefill(self, content: str, kwargs: Dict[str, Any]):
+        """表格候选：调用方（多路提取）已算好时直接复用，否则按原文现场解析。"""
+        if "table_prefill" in kwargs:
+            return kwargs["table_prefill"]
+        policy, min_conf = self._table_prefill_policy()
+        if policy == "off":
+            return None
+        from src.schema.tables import build_table_prefill
+        try:
+            return build_table_prefill(kwargs.get("original") or content, self.schema,
+                                       structure=kwargs.get("structure"), min_confidence=min_conf,
+                                       evidence_max_chars=EVIDENCE_MAX_CHARS)
+        except Exception as e:  # noqa: BLE001
+            self.logger.warning(f"表格预解析失败，跳过: {e}")
+            return None
+
+    # ---- 输入/输出预算 ----
+    @staticmethod
+    def _input_limits() -> (int, int):
         try:
             import settings
             max_chars = int(getattr(settings, "EXTRACT_MAX_INPUT_CHARS", 0) or 0)
+            max_tokens = int(getattr(settings, "EXTRACT_MAX_INPUT_TOKENS", 0) or 0)
         except Exception:
-            max_chars = 0
-        truncated_input = False
+            max_chars = max_tokens = 0
+        return max_chars, max_tokens
+
+    def _fit_input(self, paper_id: str, content: str, kwargs: Dict[str, Any]) -> (str, Dict[str, Any]):
+        """按字符/ token 上限收缩正文：有结构索引时先去参考文献，仍超限再尾部截断。
+
+        content 为精简文本时用映射到精简文本上的结构索引（content_structure）；
+        索引与 content 对不上时按 content 现场重建，不静默退回盲截断。
+        """
+        from src.llm.tokens import get_estimator
+        max_chars, max_tokens = self._input_limits()
+        estimator = get_estimator()
+        model = getattr(getattr(self.llm_client, "config", None), "model", "")
+        info = {"input_truncated": False, "references_dropped": False, "input_tokens_est": None}
+        tokens = estimator.count(content, model) if max_tokens else 0
+        over = (max_chars and len(content) > max_chars) or (max_tokens and tokens > max_tokens)
+        structure = kwargs.get("content_structure") or kwargs.get("structure")
+        if over and structure is not None and structure.char_count != len(content):
+            from src.schema.structure import build_structure
+            structure = build_structure(content)
+        if over and structure is not None:
+            trimmed = structure.without_references(content)
+            info["references_dropped"] = len(trimmed) < len(content)
+            content = trimmed
         if max_chars and len(content) > max_chars:
             content = content[:max_chars]
-            truncated_input = True
+            info["input_truncated"] = True
             self.logger.warning(f"[{paper_id}] 输入超长，截断至 {max_chars} 字符")
+        if max_tokens:
+            trimmed = estimator.trim_to_tokens(content, max_tokens, model)
+            if len(trimmed) < len(content):
+                content = trimmed
+                info["input_truncated"] = True
+                self.logger.warning(f"[{paper_id}] 输入超出 token 预算，截断至约 {max_tokens} tokens")
+        info["input_tokens_est"] = estimator.count(content, model)
+        return content, info
 
-        result = self._call_llm(
-            system_prompt=self._build_system_prompt(),
-            user_prompt=self._build_user_prompt(paper_id, content),
-            call_id=f"flat_extract_{paper_id}",
+    @staticmethod
+    def _expected_records(prefill, structure) -> int:
+        """预计记录数：表格预解析的行数优先，其次结构索引中最大表格的行数。"""
+        from src.llm.tokens import DEFAULT_EXPECTED_RECORDS
+        if prefill is not None and prefill.rows:
+            return min(max(1, len({(r.table, r.label) for r in prefill.rows})), MAX_EXPECTED_RECORDS)
+        tables = getattr(structure, "tables", None) or []
+        if tables:
+            return min(max(DEFAULT_EXPECTED_RECORDS, max(t.rows for t in tables)), MAX_EXPECTED_RECORDS)
+        return DEFAULT_EXPECTED_RECORDS
+
+    def _plan_output(self, prefill, structure):
+        """按 schema 宽度 × 预计记录数规划本次调用的 max_tokens；关闭规划时返回 None。"""
+        from src.llm.tokens import plan_output_tokens, planning_settings
+        if not planning_settings()["enabled"]:
+            return None
+        return plan_output_tokens(
+            [f.name for f in self.schema.fields],
+            expected_records=self._expected_records(prefill, structure),
+            key=self._output_key(),
+            fmt=self.output_format,
         )
-        if not result["success"]:
-            return ExtractionResult(success=False, error=result["error"])
 
-        data = result["data"]
+    def _response_schema(self, fmt: str = None) -> Dict[str, Any]:
+        """json_schema 结构化输出参数（LLM_STRUCTURED_OUTPUT=off 时为空，不传给客户端）。"""
+        from src.llm.capabilities import structured_output_mode
+        if structured_output_mode() == "off":
+            return {}
+        fmt = fmt or self.output_format
+        if fmt not in self._response_schemas:
+            from src.schema.response_schema import build_response_schema
+            self._response_schemas[fmt] = build_response_schema(self.schema, fmt)
+        return {"response_schema": self._response_schemas[fmt]}
+
+    def _output_key(self) -> str:
+        """每记录输出 token 的学习键：同一 schema 不同线格式分开统计。"""
+        return f"{self.schema.slug}:{self.output_format}"
+
+    def _decode_records(self, data: Any) -> List[Any]:
+        """解析后的响应 -> cells 形状 records（compact/columnar 在此展开字段代号与证据引用）。"""
+        if self.output_format != "cells":
+            return decode_records(data, self.schema)
         records = data.get("records", []) if isinstance(data, dict) else []
-        if not isinstance(records, list):
-            records = []
+        return records if isinstance(records, list) else []
 
-        cleaned, stats = self._postprocess(records, content)
+    # ---- 提取 ----
+    def extract(self, paper_id: str, content: str, chunks: List[str] = None, **kwargs) -> ExtractionResult:
+        content, input_info = self._fit_input(paper_id, content, kwargs)
+
+        prefill = self._table_prefill(content, kwargs)
+        prefill_block = ""
+        if prefill is not None:
+            from src.schema.tables import render_prefill_block
+            prefill_block = render_prefill_block(prefill, omit_high=self._table_prefill_policy()[0] == "fill")
+
+        plan = self._plan_output(prefill, kwargs.get("structure"))
+        call_kwargs = {"max_tokens": plan.max_tokens} if plan is not None else {}
+        call_kwargs.update(self._response_schema())
+        with llm_context(stage="extract"):
+            result = self._call_llm(
+                system_prompt=self._build_system_prompt(),
+                user_prompt=self._build_user_prompt(paper_id, content, prefill_block=prefill_block),
+                call_id=f"flat_extract_{paper_id}",
+                **call_kwargs,
+            )
+        if not result["success"]:
+            return ExtractionResult(success=False, error=result["error"])
+
+        records = self._decode_records(result["data"])
+        usage = result.get("usage") or {}
+        if plan is not None:
+            from src.llm.tokens import observe_output
+            observe_output(self._output_key(), int(usage.get("completion_tokens", 0) or 0), len(records))
+        filled = 0
+        if prefill is not None:
+            from src.schema.tables import apply_prefill
+            filled = apply_prefill(records, prefill)
+
+        cleaned, stats = self._postprocess(records, content, original=kwargs.get("original"))
         meta = {
             "schema_slug": self.schema.slug,
             "field_count": len(self.schema.fields),
-            "input_truncated": truncated_input,
+            **input_info,
+            "output_format": self.output_format,
+            "output_plan": plan.to_dict() if plan is not None else None,
+            "usage": usage,
+            "table_prefill": dict(prefill.stats(), filled_cells=filled) if prefill is not None else None,
             "evidence_verified": stats["verified"],
             "evidence_unverified": stats["unverified"],
             "evidence_total": stats["total"],
@@ -140,9 +351,13 @@ class GenericFlatMode(ExtractionMode):
             metadata=meta,
         )
 
-    def _postprocess(self, records: List[Any], source: str) -> (List[Dict], Dict[str, int]):
+    def _postprocess(self, records: List[Any], source: str,
+                     original: Optional[str] = None) -> (List[Dict], Dict[str, int]):
+        """清洗记录并核验 evidence；source 为送入模型的（可能已精简的）正文，
+        original 为精简前原文，两者任一命中即视为核验通过。"""
         field_names = {f.normalized_key(): f.name for f in self.schema.fields}
         norm_source = _normalize_text(source)
+        norm_original = _normalize_text(original) if original and original is not source else ""
         verified = unverified = total = 0
         out: List[Dict] = []
 
@@ -164,7 +379,8 @@ class GenericFlatMode(ExtractionMode):
                 if evidence:
                     evidence = evidence[:EVIDENCE_MAX_CHARS]
                     total += 1
-                    ok = _evidence_in_source(evidence, norm_source)
+                    ok = _evidence_in_source(evidence, norm_source) or (
+                        bool(norm_original) and _evidence_in_source(evidence, norm_original))
                     if ok:
                         verified += 1
                     else:
@@ -211,9 +427,13 @@ class MultiAgentFlatMode(GenericFlatMode):
         reviewer_role: str = "extract_reviewer",
         review_enabled: bool = True,
         keep_candidates: bool = False,
+        output_format: str = None,
+        agent_policy: str = None,
+        merger_format: str = None,
+        candidate_dedupe: bool = None,
     ):
         # GenericFlatMode needs one llm_client for base initialization; use merger as the owner client.
-        super().__init__(merger_client, schema)
+        super().__init__(merger_client, schema, output_format=output_format)
         self.extractor_clients = extractor_clients
         self.merger_client = merger_client
         self.merger_role = merger_role
@@ -223,11 +443,27 @@ class MultiAgentFlatMode(GenericFlatMode):
         # 溯源开关：在 metadata 中保留每个 extractor 的候选 records，
         # 供消融实验/置信度特征（agent 一致性）使用；默认关闭避免结果文件膨胀。
         self.keep_candidates = keep_candidates
+        # 直接构造时保持全部扇出（fixed）；ExtractionService 按 EXTRACT_AGENT_POLICY 传入
+        self.agent_policy = agent_policy if agent_policy in AGENT_POLICIES else "fixed"
+        # merger 输入：compact=按记录对齐、只并排列出分歧字段；json=原样 dump 全部候选
+        self.merger_format = merger_format or configured_merger_format()
+        self.candidate_dedupe = dedupe_enabled() if candidate_dedupe is None else bool(candidate_dedupe)
 
     @property
     def mode_name(self) -> str:
         return "flat_multi_agent"
 
+    @staticmethod
+    def _plan_for_records(records: Any, client: Any, factor: float = 1.0) -> Dict[str, int]:
+        """合并/审阅的输出与输入记录同量级：按记录 JSON 的 token 数规划 max_tokens。"""
+        from src.llm.tokens import RESPONSE_OVERHEAD_TOKENS, clamp_max_tokens, get_estimator, planning_settings
+        cfg = planning_settings()
+        if not cfg["enabled"]:
+            return {}
+        model = getattr(getattr(client, "config", None), "model", "")
+        n = get_estimator().count(json.dumps(records, ensure_ascii=False), model)
+        return {"max_tokens": clamp_max_tokens(n * factor + RESPONSE_OVERHEAD_TOKENS, cfg)}
+
     def _build_merger_user_prompt(self, candidate_outputs: List[Dict[str, Any]]) -> str:
         from src.schema import prompts as P
         record_def = self.schema.record_definition or "论文中一组可独立成行的结构化数据"
@@ -238,12 +474,36 @@ class MultiAgentFlatMode(GenericFlatMode):
             candidate_outputs=json.dumps(candidate_outputs, ensure_ascii=False),
         )
 
-    def _review_records(self, paper_id: str, content: str, records: List[Dict[str, Any]]) -> ExtractionResult:
+    def _build_merger_compact_prompt(self, encoded: Dict[str, Any]) -> str:
+        from src.schema import prompts as P
+        record_def = self.schema.record_definition or "论文中一组可独立成行的结构化数据"
+        return P.EXTRACT_MERGER_USER_COMPACT.format(
+            domain=self.schema.domain,
+            record_definition=record_def,
+            schema_block=self._build_schema_block(with_codes=True),
+            candidate_outputs=json.dumps(encoded, ensure_ascii=False, separators=(",", ":")),
+        )
+
+    def _review_context(self, content: str, records: List[Dict[str, Any]], original: Optional[str],
+                        structure) -> Any:
+        """reviewer 看到的正文：默认只取各 evidence 附近的片段及其引用的图表（见 review_context.py）。"""
+        from src.llm.tokens import get_estimator
+        from .review_context import ReviewContext, build_review_context, review_context_settings
+        mode, budget = review_context_settings()
+        model = self.reviewer_client.config.model
+        if mode == "full":
+            n = get_estimator().count(content, model)
+            return ReviewContext(text=content, mode="full", full_tokens=n, context_tokens=n, fallback="disabled")
+        return build_review_context(original or content, records, structure=structure, max_tokens=budget,
+                                    model=model, full_text=content)
+
+    def _review_records(self, paper_id: str, content: str, records: List[Dict[str, Any]],
+                        original: Optional[str] = None, structure=None) -> ExtractionResult:
         from src.llm import LLMMessage
         from src.schema import prompts as P
 
         if not self.reviewer_client or not self.review_enabled:
-            cleaned, stats = self._postprocess(records, content)
+            cleaned, stats = self._postprocess(records, content, original=original)
             return ExtractionResult(
                 success=True,
                 records=cleaned,
@@ -257,25 +517,33 @@ class MultiAgentFlatMode(GenericFlatMode):
             )
 
         record_def = self.schema.record_definition or "论文中一组可独立成行的结构化数据"
+        ctx = self._review_context(content, records, original, structure)
+        context_report = ctx.report()
         user = P.EXTRACT_REVIEWER_USER.format(
             domain=self.schema.domain,
             record_definition=record_def,
             schema_block=self._build_schema_block(),
-            content=content,
+            content_title="论文全文" if ctx.mode == "full" else "论文原文摘录（各证据附近片段及其引用的图表，片段间以 …… 分隔）",
+            content=ctx.text,
             records=json.dumps(records, ensure_ascii=False),
         )
-        resp = self.reviewer_client.call(
-            [LLMMessage(role="system", content=P.EXTRACT_REVIEWER_SYSTEM), LLMMessage(role="user", content=user)],
-            call_id=f"flat_review_{paper_id}",
-        )
+        with llm_context(stage="review"):
+            resp = self.reviewer_client.call(
+                [LLMMessage(role="system", content=P.EXTRACT_REVIEWER_SYSTEM if ctx.mode == "full"
+                             else P.EXTRACT_REVIEWER_SYSTEM_EXCERPTS),
+                 LLMMessage(role="user", content=user)],
+                call_id=f"flat_review_{paper_id}",
+                **self._plan_for_records(records, self.reviewer_client, factor=1.1),
+            )
         if not resp.success:
-            cleaned, stats = self._postprocess(records, content)
+            cleaned, stats = self._postprocess(records, content, original=original)
             return ExtractionResult(
                 success=True,
                 records=cleaned,
                 count=len(cleaned),
                 metadata={
                     "review_used": False,
+                    "review_context": context_report,
                     "review_error": resp.error,
                     "evidence_verified": stats["verified"],
                     "evidence_unverified": stats["unverified"],
@@ -285,13 +553,14 @@ class MultiAgentFlatMode(GenericFlatMode):
         try:
             data = self._parse_json(resp.content)
         except Exception as e:
-            cleaned, stats = self._postprocess(records, content)
+            cleaned, stats = self._postprocess(records, content, original=original)
             return ExtractionResult(
                 success=True,
                 records=cleaned,
                 count=len(cleaned),
                 metadata={
                     "review_used": False,
+                    "review_context": context_report,
                     "review_error": f"审阅 JSON 解析失败: {e}",
                     "evidence_verified": stats["verified"],
                     "evidence_unverified": stats["unverified"],
@@ -301,13 +570,14 @@ class MultiAgentFlatMode(GenericFlatMode):
         reviewed_records = data.get("records", []) if isinstance(data, dict) else []
         if not isinstance(reviewed_records, list):
             reviewed_records = []
-        cleaned, stats = self._postprocess(reviewed_records, content)
+        cleaned, stats = self._postprocess(reviewed_records, content, original=original)
         return ExtractionResult(
             success=True,
             records=cleaned,
             count=len(cleaned),
             metadata={
                 "review_used": True,
+                "review_context": context_report,
                 "reviewer_role": self.reviewer_role,
                 "reviewer_model": self.reviewer_client.config.model,
                 "review": data.get("review", {}) if isinstance(data, dict) else {},
@@ -322,49 +592,80 @@ class MultiAgentFlatMode(GenericFlatMode):
         paper_id: str,
         content: str,
         candidate_outputs: List[Dict[str, Any]],
+        original: Optional[str] = None,
+        structure=None,
+        settled: Optional[List[Dict[str, Any]]] = None,
     ) -> ExtractionResult:
+        """settled：去重阶段已定稿的记录，不送 merger，与合并结果一起审阅。"""
         from src.llm import LLMMessage
         from src.schema import prompts as P
 
-        messages = [
-            LLMMessage(role="system", content=P.EXTRACT_MERGER_SYSTEM),
-            LLMMessage(role="user", content=self._build_merger_user_prompt(candidate_outputs)),
-        ]
-        resp = self.merger_client.call(messages, call_id=f"flat_merge_{paper_id}")
+        from src.llm.tokens import get_estimator
+
+        model = self.merger_client.config.model
+        prompt_meta: Dict[str, Any] = {"format": self.merger_format}
+        largest = max((c.get("records") or [] for c in candidate_outputs), key=len, default=[])
+        if self.merger_format == "compact":
+            encoded = encode_candidates(candidate_outputs, self.schema)
+            user = self._build_merger_compact_prompt(encoded)
+            messages = [LLMMessage(role="system", content=P.EXTRACT_MERGER_SYSTEM_COMPACT),
+                        LLMMessage(role="user", content=user)]
+            prompt_meta.update(prompt_tokens=get_estimator().count(user, model), groups=len(encoded["groups"]),
+                               disputed_fields=sum(len(g.get("diff", {})) for g in encoded["groups"]))
+            call_kwargs = {**self._plan_for_records(encoded["groups"], self.merger_client, factor=1.0),
+                           **self._response_schema("compact")}
+        else:
+            encoded = None
+            user = self._build_merger_user_prompt(candidate_outputs)
+            messages = [LLMMessage(role="system", content=P.EXTRACT_MERGER_SYSTEM),
+                        LLMMessage(role="user", content=user)]
+            prompt_meta["prompt_tokens"] = get_estimator().count(user, model)
+            call_kwargs = {**self._plan_for_records(largest, self.merger_client, factor=1.2),
+                           **self._response_schema("cells")}
+        with llm_context(stage="merge"):
+            resp = self.merger_client.call(messages, call_id=f"flat_merge_{paper_id}", **call_kwargs)
+        prompt_meta["latency_ms"] = resp.latency_ms
         if not resp.success:
-            return ExtractionResult(success=False, error=f"合并失败: {resp.error}")
+            return ExtractionResult(success=False, error=f"合并失败: {resp.error}",
+                                    metadata={"merge_prompt": prompt_meta})
         try:
-            data = self._parse_json(resp.content)
+            data = self._parse_structured(resp) if resp.structured else self._parse_json(resp.content)
         except Exception as e:
-            return ExtractionResult(success=False, error=f"合并 JSON 解析失败: {e}")
-        records = data.get("records", []) if isinstance(data, dict) else []
-        if not isinstance(records, list):
-            records = []
-        reviewed = self._review_records(paper_id, content, records)
+            return ExtractionResult(success=False, error=f"合并 JSON 解析失败: {e}",
+                                    metadata={"merge_prompt": prompt_meta})
+        if encoded is not None:
+            # 代号/证据下标映射回字段名与原文片段
+            records = decode_merged(data, self.schema, encoded["quotes"])
+        else:
+            records = data.get("records", []) if isinstance(data, dict) else []
+            if not isinstance(records, list):
+                records = []
+        if settled:
+            records = merge_settled(settled, records)
+        reviewed = self._review_records(paper_id, content, records, original=original, structure=structure)
         reviewed.metadata.update({
             "schema_slug": self.schema.slug,
             "field_count": len(self.schema.fields),
             "merger_role": self.merger_role,
-            "merger_model": self.merger_client.config.model,
+            "merger_model": model,
+            "merge_prompt": prompt_meta,
         })
         return reviewed
 
-    def extract(self, paper_id: str, content: str, chunks: List[str] = None, **kwargs) -> ExtractionResult:
+    def _run_extractors(self, paper_id: str, content: str, chunks: Optional[List[str]],
+                        clients: List[tuple], kwargs: Dict[str, Any]) -> (List[Dict[str, Any]], Dict[str, str]):
         candidate_outputs: List[Dict[str, Any]] = []
         errors: Dict[str, str] = {}
 
         def _run_one(role: str, client: Any):
-            mode = GenericFlatMode(client, self.schema)
+            mode = GenericFlatMode(client, self.schema, output_format=self.output_format)
             result = mode.extract(paper_id=paper_id, content=content, chunks=chunks, **kwargs)
             return role, client, result
 
-        workers = max(1, min(len(self.extractor_clients), 8))
-        with ThreadPoolExecutor(max_workers=workers) as ex:
-            futures = {
-                ex.submit(_run_one, role, client): role
-                for role, client in self.extractor_clients.items()
-            }
-            for fut in as_completed(futures):
+        # 多路 extractor 走进程级共享池（TaskGroup 携带论文准入序号等上下文，供限流器排优先级）
+        with TaskGroup("agents") as group:
+            futures = {group.submit(_run_one, role, client): role for role, client in clients}
+            for fut in group.as_completed():
                 role = futures[fut]
                 try:
                     role, client, result = fut.result()
@@ -381,6 +682,70 @@ class MultiAgentFlatMode(GenericFlatMode):
                     })
                 else:
                     errors[role] = result.error
+        return candidate_outputs, errors
+
+    def _escalation_reasons(self, candidate: Optional[Dict[str, Any]], content: str,
+                            kwargs: Dict[str, Any]) -> List[str]:
+        """单个 extractor 的结果是否需要第二意见：核验率低、记录多、长表格、枚举越界。"""
+        if candidate is None:
+            return ["extractor_failed"]
+        th = adaptive_thresholds()
+        records = candidate.get("records") or []
+        meta = candidate.get("metadata") or {}
+        reasons: List[str] = []
+        if not records:
+            reasons.append("no_records")
+        total = int(meta.get("evidence_total") or 0)
+        if total and int(meta.get("evidence_verified") or 0) / total < th["min_verified"]:
+            reasons.append("low_evidence")
+        if len(records) > th["max_records"]:
+            reasons.append("many_records")
+
+        prefill = kwargs.get("table_prefill")
+        if prefill is not None:
+            frames = prefill.frames
+        else:
+            from src.schema.tables import parse_tables
+            try:
+                frames = parse_tables(kwargs.get("original") or content, structure=kwargs.get("structure"))
+            except Exception:  # noqa: BLE001
+                frames = []
+        if max((len(f.rows) for f in frames), default=0) > th["max_table_rows"]:
+            reasons.append("long_table")
+
+        enums = {f.name: {str(v).strip().lower() for v in f.enum_values}
+                 for f in self.schema.fields if f.type == "enum" and f.enum_values}
+        violations = 0
+        for rec in records:
+            for name, allowed in enums.items():
+                value = (rec.get(name) or {}).get("value")
+                values = value if isinstance(value, list) else [value]
+                violations += sum(1 for v in values if v is not None and str(v).strip().lower() not in allowed)
+        if violations > th["max_enum_violations"]:
+            reasons.append("enum_violation")
+        return reasons
+
+    def extract(self, paper_id: str, content: str, chunks: List[str] = None, **kwargs) -> ExtractionResult:
+        # 表格只解析一次，各 extractor 共用同一份候选
+        kwargs["table_prefill"] = self._table_prefill(content, kwargs)
+
+        clients = list(self.extractor_clients.items())
+        adaptive = self.agent_policy == "adaptive" and len(clients) > 1
+        candidate_outputs, errors = self._run_extractors(
+            paper_id, content, chunks, clients[:1] if adaptive else clients, kwargs)
+        policy_meta: Dict[str, Any] = {"policy": "adaptive" if adaptive else "fixed",
+                                       "escalated": False, "reasons": []}
+        if adaptive:
+            reasons = self._escalation_reasons(candidate_outputs[0] if candidate_outputs else None, content, kwargs)
+            if reasons:
+                more, more_errors = self._run_extractors(paper_id, content, chunks, clients[1:], kwargs)
+                candidate_outputs += more
+                errors.update(more_errors)
+            policy_meta.update(escalated=bool(reasons), reasons=reasons)
+        ran = len(clients) if not adaptive or policy_meta["escalated"] else 1
+        # 省下的调用：未运行的 extractor，以及未升级时免去的 merger
+        policy_meta.update(extractors_run=ran,
+                           calls_saved=(len(clients) - ran) + (1 if adaptive and not policy_meta["escalated"] else 0))
 
         if not candidate_outputs:
             return ExtractionResult(
@@ -389,24 +754,32 @@ class MultiAgentFlatMode(GenericFlatMode):
                 metadata={
                     "extractor_roles": list(self.extractor_clients.keys()),
                     "agent_errors": errors,
+                    "agent_policy": policy_meta,
                 },
             )
 
         role_order = {role: i for i, role in enumerate(self.extractor_clients.keys())}
         candidate_outputs.sort(key=lambda x: role_order.get(x["role"], len(role_order)))
 
-        if len(candidate_outputs) == 1:
-            only = candidate_outputs[0]
-            reviewed = self._review_records(paper_id, content, only.get("records", []))
+        # 合并前去重：各 extractor 一致的记录直接定稿，只把有分歧的记录交给 merger
+        dedupe = dedupe_candidates(candidate_outputs) if len(candidate_outputs) > 1 and self.candidate_dedupe else None
+        if len(candidate_outputs) == 1 or (dedupe is not None and dedupe.pending == 0):
+            records = dedupe.settled if dedupe is not None else candidate_outputs[0].get("records", [])
+            reviewed = self._review_records(paper_id, content, records,
+                                            original=kwargs.get("original"), structure=kwargs.get("structure"))
             reviewed.metadata.update({
                 "schema_slug": self.schema.slug,
                 "field_count": len(self.schema.fields),
                 "multi_agent": True,
                 "merge_used": False,
                 "extractor_roles": list(self.extractor_clients.keys()),
-                "successful_agents": [only["role"]],
+                "successful_agents": [x["role"] for x in candidate_outputs],
                 "agent_errors": errors,
+                "agent_policy": policy_meta,
             })
+            if dedupe is not None:
+                reviewed.metadata["dedupe"] = dedupe.report()
+                reviewed.metadata["candidate_counts"] = {x["role"]: x["count"] for x in candidate_outputs}
             if self.keep_candidates:
                 reviewed.metadata["candidates"] = [
                     {"role": x["role"], "model": x["model"], "records": x["records"]}
@@ -414,7 +787,9 @@ class MultiAgentFlatMode(GenericFlatMode):
                 ]
             return reviewed
 
-        merged = self._merge_records(paper_id, content, candidate_outputs)
+        merged = self._merge_records(paper_id, content, dedupe.candidates if dedupe is not None else candidate_outputs,
+                                     original=kwargs.get("original"), structure=kwargs.get("structure"),
+                                     settled=dedupe.settled if dedupe is not None else None)
         merged.metadata.update({
             "multi_agent": True,
             "merge_used": True,
@@ -422,7 +797,10 @@ class MultiAgentFlatMode(GenericFlatMode):
             "successful_agents": [x["role"] for x in candidate_outputs],
             "agent_errors": errors,
             "candidate_counts": {x["role"]: x["count"] for x in candidate_outputs},
+            "agent_policy": policy_meta,
         })
+        if dedupe is not None:
+            merged.metadata["dedupe"] = dedupe.report()
         if self.keep_candidates:
             merged.metadata["candidates"] = [
                 {"role": x["role"], "model": x["model"], "records": x["records"]}
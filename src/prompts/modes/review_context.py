@@ -0,0 +1,232 @@
+"""
+extract_reviewer 的证据局部上下文（EXTRACT_REVIEW_CONTEXT）。
+
+审阅阶段原先把整篇正文连同全部 records 发给 reviewer，输入 token 约等于再做一次提取。
+审阅只需核对每个值与其证据是否相符，这里按 evidence 在原文中的位置只截取：
+
+  - 每条 evidence 前后 window 个字符（扩到整行）；
+  - evidence 落在表格内时带上整张表格；
+  - 片段里引用的 Table N / Fig. N 的标题（表格标题再带上对应表格）。
+
+片段按原文顺序合并，以 …… 分隔，总量不超过 token 预算（超出时逐级缩小窗口、去掉附带的表格/标题）。
+有 evidence 在原文中定位不到，或摘录并不比全文短时，退回全文。
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+CONTEXT_MODES = ("evidence", "full")
+DEFAULT_CONTEXT_TOKENS = 8000
+DEFAULT_WINDOW_CHARS = 400
+MATCH_WINDOW = 16
+SEPARATOR = "\n……\n"
+
+_LATEX_CMD_RE = re.compile(r"\\[a-zA-Z]+")
+_KEEP_RE = re.compile("[a-z0-9\u4e00-\u9fff]")
+_REF_RE = re.compile(r"\b(fig(?:ure)?s?\.?|tables?|图|表)\s*(\d+)", re.IGNORECASE)
+_CAPTION_NUM_RE = re.compile(r"^\s*(?:!\[[^\]]*\]\([^)]*\)\s*)?(?:fig(?:ure)?\.?|table|图|表)\s*[\.:]?\s*(\d+)",
+                             re.IGNORECASE)
+
+
+def review_context_settings() -> Tuple[str, int]:
+    """(模式, token 预算)：EXTRACT_REVIEW_CONTEXT=evidence|full，EXTRACT_REVIEW_CONTEXT_TOKENS。"""
+    try:
+        import settings
+        mode = str(getattr(settings, "EXTRACT_REVIEW_CONTEXT", "evidence") or "evidence").strip().lower()
+        budget = int(getattr(settings, "EXTRACT_REVIEW_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS))
+    except Exception:
+        mode, budget = "evidence", DEFAULT_CONTEXT_TOKENS
+    return (mode if mode in CONTEXT_MODES else "evidence"), max(500, budget)
+
+
+def _normalized_index(text: str) -> Tuple[str, List[int]]:
+    """与 flat_mode 的 evidence 核验同样的归一（NFKC、去 LaTeX 命令、仅字母数字与中文），
+    并记录每个归一字符在原文中的下标，用于把命中位置映射回原文。"""
+    skip = [False] * len(text)
+    for m in _LATEX_CMD_RE.finditer(text):
+        for i in range(m.start(), m.end()):
+            skip[i] = True
+    chars: List[str] = []
+    pos: List[int] = []
+    for i, ch in enumerate(text):
+        if skip[i]:
+            continue
+        for c in unicodedata.normalize("NFKC", ch).lower():
+            if _KEEP_RE.match(c):
+                chars.append(c)
+                pos.append(i)
+    return "".join(chars), pos
+
+
+def locate(evidence: str, norm: str, pos: List[int]) -> Optional[Tuple[int, int]]:
+    """evidence 在原文中的区间 [start, end)；完整命中优先，否则取首尾命中的 MATCH_WINDOW 片段。"""
+    n, _ = _normalized_index(evidence or "")
+    if not n:
+        return None
+    i = norm.find(n)
+    if i >= 0:
+        return pos[i], pos[i + len(n) - 1] + 1
+    w = MATCH_WINDOW
+    if len(n) <= w:
+        return None
+    first = last = None
+    for k in range(0, len(n) - w + 1):
+        j = norm.find(n[k:k + w])
+        if j >= 0:
+            first = j
+            break
+    if first is None:
+        return None
+    for k in range(len(n) - w, -1, -1):
+        j = norm.find(n[k:k + w], first)
+        if j >= 0:
+            last = j + w
+            break
+    last = last if last is not None else first + w
+    return pos[first], pos[last - 1] + 1
+
+
+@dataclass
+class ReviewContext:
+    text: str
+    mode: str                   # evidence | full
+    full_tokens: int
+    context_tokens: int
+    windows: int = 0
+    located: int = 0
+    unlocated: int = 0
+    fallback: str = ""
+
+    def report(self) -> Dict[str, Any]:
+        saved = 1 - self.context_tokens / self.full_tokens if self.full_tokens else 0.0
+        return {
+            "mode": self.mode,
+            "full_tokens": self.full_tokens,
+            "context_tokens": self.context_tokens,
+            "saved_ratio": round(max(0.0, saved), 3),
+            "windows": self.windows,
+            "evidence_located": self.located,
+            "evidence_unlocated": self.unlocated,
+            "fallback": self.fallback or None,
+        }
+
+
+def _line_span(text: str, s: int, e: int) -> Tuple[int, int]:
+    s = text.rfind("\n", 0, max(0, s)) + 1
+    nl = text.find("\n", min(len(text), e))
+    return s, (len(text) if nl < 0 else nl)
+
+
+def _merge(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    out: List[Tuple[int, int]] = []
+    for s, e in sorted(spans):
+        if out and s <= out[-1][1] + 1:
+            out[-1] = (out[-1][0], max(out[-1][1], e))
+        else:
+            out.append((s, e))
+    return out
+
+
+def _render(text: str, spans: List[Tuple[int, int]]) -> str:
+    return SEPARATOR.join(text[s:e].strip("\n") for s, e in _merge(spans))
+
+
+def _evidences(records: List[Dict[str, Any]]) -> List[str]:
+    out: List[str] = []
+    for rec in records or []:
+        if not isinstance(rec, dict):
+            continue
+        for cell in rec.values():
+            if isinstance(cell, dict) and isinstance(cell.get("evidence"), str) and cell["evidence"].strip():
+                out.append(cell["evidence"])
+    return out
+
+
+def _cited(text: str, spans: List[Tuple[int, int]], structure) -> List[Tuple[int, int]]:
+    """片段里引用的图/表标题；表格标题再带上紧邻的表格块。"""
+    captions = getattr(structure, "captions", None) or []
+    tables = getattr(structure, "tables", None) or []
+    refs = set()
+    for s, e in spans:
+        for m in _REF_RE.finditer(text[s:e]):
+            kind = "table" if m.group(1).lower().startswith(("tab", "表")) else "figure"
+            refs.add((kind, m.group(2)))
+    out: List[Tuple[int, int]] = []
+    for cap in captions:
+        m = _CAPTION_NUM_RE.match(cap.text)
+        if not m or (cap.kind, m.group(1)) not in refs:
+            continue
+        out.append(_line_span(text, cap.start, cap.end))
+        if cap.kind == "table" and tables:
+            near = min(tables, key=lambda t: min(abs(t.start - cap.end), abs(cap.start - t.end)))
+            if min(abs(near.start - cap.end), abs(cap.start - near.end)) < 2000:
+                out.append((near.start, near.end))
+    return out
+
+
+def build_review_context(text: str, records: List[Dict[str, Any]], structure=None,
+                         max_tokens: int = DEFAULT_CONTEXT_TOKENS, window: int = DEFAULT_WINDOW_CHARS,
+                         model: str = "", full_text: Optional[str] = None) -> ReviewContext:
+    """为 reviewer 构建证据局部上下文。
+
+    text 为 evidence 所引用的原文（与 structure 偏移一致）；full_text 为原本会整篇发送的正文
+    （可能是精简后的文本，缺省同 text），用于回退与「之前」的 token 计数。
+    """
+    from src.llm.tokens import get_estimator
+    est = get_estimator()
+    full_text = text if full_text is None else full_text
+    full_tokens = est.count(full_text, model)
+
+    def _full(reason: str, located: int = 0, unlocated: int = 0) -> ReviewContext:
+        return ReviewContext(text=full_text, mode="full", full_tokens=full_tokens, context_tokens=full_tokens,
+                             located=located, unlocated=unlocated, fallback=reason)
+
+    evidences = _evidences(records)
+    if not evidences:
+        return _full("no_evidence")
+    if structure is not None and getattr(structure, "char_count", -1) != len(text):
+        structure = None
+    if structure is None:
+        from src.schema.structure import build_structure
+        try:
+            structure = build_structure(text)
+        except Exception:  # noqa: BLE001
+            structure = None
+
+    norm, pos = _normalized_index(text)
+    hits: List[Tuple[int, int]] = []
+    unlocated = 0
+    for ev in dict.fromkeys(evidences):
+        span = locate(ev, norm, pos)
+        if span is None:
+            unlocated += 1
+        else:
+            hits.append(span)
+    if unlocated:
+        # 定位不到的证据无法给出局部上下文：整篇交给 reviewer 判断
+        return _full("unlocated_evidence", len(hits), unlocated)
+
+    tables = getattr(structure, "tables", None) or []
+    in_table = [(t.start, t.end) for t in tables if any(t.start <= s < t.end for s, _ in hits)]
+    for w, with_tables, with_captions in ((window, True, True), (window // 2, True, True),
+                                          (window // 4, True, False), (0, False, False)):
+        spans = [_line_span(text, max(0, s - w), min(len(text), e + w)) for s, e in hits]
+        extras = list(in_table) if with_tables else []
+        if with_captions:
+            extras += _cited(text, spans, structure)
+        ctx = _render(text, spans + extras)
+        n = est.count(ctx, model)
+        if n <= max_tokens:
+            break
+    else:
+        # 证据本身已超预算（记录极多）：按预算截断，靠后的证据行不再附带上下文
+        ctx = est.trim_to_tokens(ctx, max_tokens, model)
+        n = est.count(ctx, model)
+    if n >= full_tokens:
+        return _full("not_smaller", len(hits))
+    return ReviewContext(text=ctx, mode="evidence", full_tokens=full_tokens, context_tokens=n,
+                         windows=len(_merge(spans + extras)), located=len(hits),
+                         fallback="" if n <= max_tokens and w == window else f"window={w}")
@@ -1,9 +1,179 @@
-"""共享的宽松 JSON 解析（兼容 LLM 偶尔包裹的代码块/前后缀）。"""
+"""共享的宽松 JSON 解析（兼容 LLM 偶尔包裹的代码块/前后缀、尾逗号与截断）。
+
+合法 JSON 直接走 C 实现的 json.loads；失败时用单遍的容错解析器：从最外层 { / [ 开始
+按 token 前进（字符串用 json.decoder 的 C 版 scanstring，数字/字面量用锚定正则），
+每个容器先整体尝试 C 版 raw_decode，只有出错的那一支才逐 token 处理，
+不再对几百 KB 的输出反复做 `\\{[\\s\\S]*\\}` 这类全文正则。容忍：
+
+  - 代码块围栏与前后说明文字（取第一个能解析的最外层值）；
+  - 尾逗号/多余逗号、字符串内未转义的换行、Python 风格 True/False/None；
+  - 截断：输出在任意位置中断时，丢弃最后一个不完整的标量，闭合所有未闭合的容器。
+
+仍无法解析（如缺引号的键）时才回退 json_repair。RecordStream / iter_records 可在
+文本逐段到达时增量吐出 records 数组中已完整的元素。
+"""
 from __future__ import annotations
 
 import json
 import re
-from typing import Any
+from json.decoder import scanstring
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+_WS_RE = re.compile(r"[ \t\n\r]*")
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_START_RE = re.compile(r"[\[{]")
+_LITERALS = (
+    ("true", True), ("false", False), ("null", None),
+    ("True", True), ("False", False), ("None", None),
+)
+MAX_START_ATTEMPTS = 4
+_DECODER = json.JSONDecoder(strict=False)
+
+
+class _Truncated(Exception):
+    """输入在一个标量中间结束。"""
+
+
+class _Syntax(Exception):
+    """无法容错的语法错误。"""
+
+
+class TolerantParser:
+    """单遍容错解析器。parse(start) -> (值, 结束位置)；truncated 表示输入在值内部结束。"""
+
+    def __init__(self, text: str):
+        self.s = text
+        self.n = len(text)
+        self.truncated = False
+
+    def _ws(self, i: int) -> int:
+        return _WS_RE.match(self.s, i).end()
+
+    def parse(self, i: int = 0) -> Tuple[Any, int]:
+        i = self._ws(i)
+        if i >= self.n:
+            raise _Syntax("空内容")
+        try:
+            return self._value(i)
+        except _Truncated:
+            raise _Syntax("内容在首个值内截断")
+
+    def _value(self, i: int) -> Tuple[Any, int]:
+        s = self.s
+        c = s[i]
+        if c == "{" or c == "[":
+            # 容器先整体交给 C 解码器；只有它内部确有问题时才逐 token 容错解析
+            try:
+                return _DECODER.raw_decode(s, i)
+            except json.JSONDecodeError:
+                pass
+            return self._object(i + 1) if c == "{" else self._array(i + 1)
+        if c == '"':
+            try:
+                return scanstring(s, i + 1, False)
+            except json.JSONDecodeError:
+                self.truncated = True
+                raise _Truncated()
+        m = _NUMBER_RE.match(s, i)
+        if m and m.end() > i:
+            end = m.end()
+            if end >= self.n:          # 数字紧贴结尾，可能被截断（0.12 -> 0.1）
+                self.truncated = True
+                raise _Truncated()
+            text = m.group()
+            return (float(text) if any(ch in text for ch in ".eE") else int(text)), end
+        for lit, val in _LITERALS:
+            if s.startswith(lit, i):
+                return val, i + len(lit)
+            if self.n - i < len(lit) and lit.startswith(s[i:]):   # 只在字面量抵达输入末尾时视为截断
+                self.truncated = True
+                raise _Truncated()
+        raise _Syntax(f"位置 {i} 处无法识别的字符 {c!r}")
+
+    def _object(self, i: int) -> Tuple[dict, int]:
+        s, n = self.s, self.n
+        obj: dict = {}
+        while True:
+            i = self._ws(i)
+            if i >= n:
+                self.truncated = True
+                return obj, n
+            c = s[i]
+            if c == "}":
+                return obj, i + 1
+            if c == ",":
+                i += 1
+                continue
+            if c != '"':
+                raise _Syntax(f"位置 {i} 处期望键名，得到 {c!r}")
+            try:
+                key, i = scanstring(s, i + 1, False)
+            except json.JSONDecodeError:
+                self.truncated = True
+                return obj, n
+            i = self._ws(i)
+            if i >= n:
+                self.truncated = True
+                return obj, n
+            if s[i] != ":":
+                raise _Syntax(f"位置 {i} 处期望冒号")
+            i = self._ws(i + 1)
+            if i >= n:
+                self.truncated = True
+                return obj, n
+            try:
+                obj[key], i = self._value(i)
+            except _Truncated:
+                return obj, n
+
+    def _array(self, i: int) -> Tuple[list, int]:
+        s, n = self.s, self.n
+        arr: list = []
+        while True:
+            i = self._ws(i)
+            if i >= n:
+                self.truncated = True
+                return arr, n
+            c = s[i]
+            if c == "]":
+                return arr, i + 1
+            if c == ",":
+                i += 1
+                continue
+            try:
+                v, i = self._value(i)
+            except _Truncated:
+                return arr, n
+            arr.append(v)
+
+
+def _candidate_starts(content: str) -> Iterator[int]:
+    """最外层值的候选起点：有代码块围栏时从围栏内开始找，否则从头找第一个 { / [。"""
+    pos = 0
+    fence = content.find("```")
+    if fence >= 0:
+        nl = content.find("\n", fence)
+        pos = nl + 1 if nl >= 0 else fence + 3
+    for _ in range(MAX_START_ATTEMPTS):
+        m = _START_RE.search(content, pos)
+        if not m:
+            return
+        yield m.start()
+        pos = m.start() + 1
+
+
+def parse_json_tolerant(content: str) -> Tuple[Any, bool]:
+    """容错解析，返回 (值, 是否截断)。找不到可解析的最外层值时抛 ValueError。"""
+    last = "未找到 JSON 起始符"
+    for start in _candidate_starts(content):
+        parser = TolerantParser(content)
+        try:
+            value, _ = parser.parse(start)
+        except _Syntax as e:
+            last = str(e)
+            continue
+        return value, parser.truncated
+    raise ValueError(last)
 
 
 def parse_json_loose(content: str) -> Any:
@@ -19,22 +189,14 @@ def parse_json_loose(content: str) -> Any:
     except json.JSONDecodeError:
         pass
 
-    patterns = [
-        r"```json\s*([\s\S]*?)\s*```",
-        r"```\s*([\s\S]*?)\s*```",
-        r"(\{[\s\S]*\})",
-        r"(\[[\s\S]*\])",
-    ]
-    for pat in patterns:
-        m = re.search(pat, content)
-        if m:
-            snippet = m.group(1)
-            try:
-                return json.loads(snippet)
-            except (json.JSONDecodeError, IndexError):
-                continue
+    try:
+        value, _ = parse_json_tolerant(content)
+        if value not in (None, "", [], {}):
+            return value
+    except ValueError:
+        pass
 
-    # 最后兜底：用 json_repair 修复模型偶发的非法 JSON（如括号不匹配、尾逗号）
+    # 最后兜底：用 json_repair 修复容错解析器也处理不了的非法 JSON（如缺引号的键）
     try:
         import json_repair
         repaired = json_repair.loads(content)
@@ -44,3 +206,98 @@ def parse_json_loose(content: str) -> Any:
         pass
 
     raise ValueError(f"无法解析 JSON: {content[:200]}...")
+
+
+# ---------------------------------------------------------------------------
+# 增量解析 records 元素
+# ---------------------------------------------------------------------------
+_OUTSIDE_RE = re.compile(r'["{}\[\]]')
+_INSIDE_RE = re.compile(r'["\\]')
+
+
+class RecordStream:
+    """逐段 feed 文本，返回新完整的数组元素（默认 "records"/"rows" 数组，或顶层裸数组）。
+
+    只做括号深度与字符串状态的跳跃扫描（正则直接跳到下一个结构字符），元素闭合时
+    才对该元素切片做一次解析；截断在中途的最后一个元素不会吐出。
+    """
+
+    def __init__(self, keys: Tuple[str, ...] = ("records", "rows")):
+        self._key_re = re.compile(r'"(?:%s)"\s*:\s*$' % "|".join(re.escape(k) for k in keys))
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.array_depth: Optional[int] = None   # 目标数组打开后的深度
+        self.elem_start: Optional[int] = None
+        self.count = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        self.buf += chunk
+        out: List[Any] = []
+        buf = self.buf
+        i = self.pos
+        n = len(buf)
+        while i < n:
+            if self.in_string:
+                m = _INSIDE_RE.search(buf, i)
+                if not m:
+                    i = n
+                    break
+                j = m.start()
+                if buf[j] == "\\":
+                    if j + 1 >= n:          # 转义符落在片段末尾，等下一段
+                        i = j
+                        break
+                    i = j + 2
+                    continue
+                self.in_string = False
+                i = j + 1
+                continue
+            m = _OUTSIDE_RE.search(buf, i)
+            if not m:
+                i = n
+                break
+            j = m.start()
+            c = buf[j]
+            if c == '"':
+                self.in_string = True
+            elif c in "{[":
+                if self.array_depth is not None and self.depth == self.array_depth and self.elem_start is None:
+                    self.elem_start = j
+                self.depth += 1
+                if c == "[" and self.array_depth is None and (
+                        self.depth == 1 or self._key_re.search(buf, max(0, j - 64), j)):
+                    self.array_depth = self.depth
+            else:
+                self.depth -= 1
+                if self.array_depth is not None:
+                    if self.depth == self.array_depth and self.elem_start is not None:
+                        out.append(self._element(buf[self.elem_start:j + 1]))
+                        self.elem_start = None
+                    elif self.depth < self.array_depth:
+                        self.array_depth = None
+            i = j + 1
+        self.pos = i
+        return [x for x in out if x is not None]
+
+    def _element(self, text: str) -> Any:
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                value, _ = parse_json_tolerant(text)
+            except ValueError:
+                return None
+        self.count += 1
+        return value
+
+
+def iter_records(chunks: Iterable[str] | str,
+                 keys: Tuple[str, ...] = ("records", "rows")) -> Iterator[Any]:
+    """对完整文本或文本片段序列，逐个产出 records 数组中已完整的元素。"""
+    stream = RecordStream(keys)
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
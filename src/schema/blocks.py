@@ -0,0 +1,124 @@
+"""
+MinerU 结构化块（content_list.json）加载。
+
+MinerU 的 zip 除 full.md 外还带 `<name>_content_list.json`：按阅读顺序排列的块列表，
+每块有 type（text/image/table/equation/...）、text、text_level（标题层级）、page_idx、
+bbox 以及图/表标题。这里把它惰性读成紧凑的 Block 元组，供 structure.py 构建精确的
+结构索引（标题/表格/图注/参考文献不再靠正则猜）。缺文件或格式异常时返回 None，
+调用方回退 full.md 启发式。
+
+读取结果按 (路径, size, mtime) 进程内缓存，批量处理上千篇论文时同一文件只解析一次。
+"""
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+CONTENT_LIST_GLOBS = ("*_content_list.json", "content_list.json")
+
+# MinerU 不同版本的块类型名不完全一致，统一到少数几类
+_TYPE_ALIASES = {
+    "text": "text",
+    "title": "text",
+    "list": "text",
+    "image": "image",
+    "figure": "image",
+    "table": "table",
+    "equation": "equation",
+    "interline_equation": "equation",
+    "ref_text": "ref",
+    "reference": "ref",
+}
+
+
+class Block(NamedTuple):
+    type: str                      # text | image | table | equation | ref | 其它原样保留
+    text: str                      # 正文 / 公式 / 表格 HTML（table 为 table_body）
+    page: int = -1                 # 0 起页码
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    level: int = 0                 # 标题层级（text_level），0 为正文
+    caption: str = ""              # 图/表标题（多段以空格拼接）
+
+
+def find_content_list(paper_dir: Path) -> Optional[Path]:
+    """在解析目录中找 MinerU 的 content_list.json，找不到返回 None。"""
+    paper_dir = Path(paper_dir)
+    for pattern in CONTENT_LIST_GLOBS:
+        for p in sorted(paper_dir.glob(pattern)):
+            if p.is_file():
+                return p
+    return None
+
+
+def _join(v) -> str:
+    if isinstance(v, list):
+        return " ".join(str(x).strip() for x in v if x)
+    return str(v).strip() if v else ""
+
+
+def _bbox(v) -> Optional[Tuple[float, float, float, float]]:
+    if isinstance(v, (list, tuple)) and len(v) == 4:
+        try:
+            return tuple(float(x) for x in v)  # type: ignore[return-value]
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def parse_blocks(items) -> List[Block]:
+    """把 content_list 的 dict 列表转成 Block 列表；无法识别的条目跳过。"""
+    out: List[Block] = []
+    if not isinstance(items, list):
+        return out
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        raw_type = str(it.get("type") or "text")
+        btype = _TYPE_ALIASES.get(raw_type, raw_type)
+        if btype == "table":
+            text = str(it.get("table_body") or it.get("html") or "")
+            caption = _join(it.get("table_caption"))
+        elif btype == "image":
+            text = ""
+            caption = _join(it.get("image_caption") or it.get("img_caption"))
+        else:
+            text = str(it.get("text") or "")
+            caption = ""
+        try:
+            level = int(it.get("text_level") or 0)
+        except (TypeError, ValueError):
+            level = 0
+        try:
+            page = int(it.get("page_idx", -1))
+        except (TypeError, ValueError):
+            page = -1
+        out.append(Block(btype, text, page, _bbox(it.get("bbox")), level, caption))
+    return out
+
+
+@lru_cache(maxsize=256)
+def _load_cached(path: str, size: int, mtime_ns: int) -> Optional[Tuple[Block, ...]]:
+    try:
+        with open(path, "rb") as f:
+            items = json.loads(f.read())
+    except (OSError, ValueError) as e:
+        logger.debug(f"content_list 读取失败 {path}: {e}")
+        return None
+    blocks = parse_blocks(items)
+    return tuple(blocks) if blocks else None
+
+
+def load_blocks(paper_dir: Path) -> Optional[Tuple[Block, ...]]:
+    """读取解析目录的结构化块；没有 content_list 或解析失败返回 None。"""
+    path = find_content_list(paper_dir)
+    if path is None:
+        return None
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return _load_cached(str(path), st.st_size, st.st_mtime_ns)
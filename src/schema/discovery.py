@@ -14,11 +14,11 @@ from __future__ import annotations
 
 import datetime
 import json as _json
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Dict, List, Optional, Tuple
 
 from loguru import logger
 
+from ..executor import TaskGroup
 from ..llm.base import LLMClient, LLMMessage
 from ..llm.factory import create_llm_client_for_agent
 from ._json import parse_json_loose
@@ -310,13 +310,13 @@ class SchemaDiscovery:
 
         drafts: List[GeneratedSchema] = []
         trace_drafts: List[Dict[str, Any]] = []
-        workers = max(1, min(len(self.schema_agent_roles), 8))
-        with ThreadPoolExecutor(max_workers=workers) as ex:
+        # 各 schema agent 在共享 agents 池上并行（TaskGroup 携带调用方的 llm_context 优先级通道）
+        with TaskGroup("agents") as group:
             futures = {
-                ex.submit(self._draft_schema_with_agent, role, paper_context): role
+                group.submit(self._draft_schema_with_agent, role, paper_context): role
                 for role in self.schema_agent_roles
             }
-            for fut in as_completed(futures):
+            for fut in group.as_completed():
                 role = futures[fut]
                 try:
                     draft = fut.result()
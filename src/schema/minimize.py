@@ -0,0 +1,433 @@
+"""
+论文正文精简（送 LLM 前的确定性预处理）。
+
+MinerU 的 full.md 原样送给每个 extractor 与 reviewer，其中参考文献、致谢/资助声明、
+附录、图片链接、LaTeX 排版噪声、逐页重复的页眉页脚都在消耗输入 token。这里按规则
+做一次确定性精简：
+
+  references        删除参考文献区间（结构索引给出）
+  acknowledgements  删除致谢 / 资助 / 利益冲突 / 作者贡献 / 数据可用性声明小节
+  appendix          删除附录小节
+  images            删除图片 markdown（图注行保留）
+  latex             行内公式 $...$ 化简为纯文本（\\mathrm{N} → N，^{\\circ} → °，1 0 0 → 100）
+  whitespace        去行尾空白、压缩连续空格与 3 行以上空行
+  repeated_lines    删除重复 ≥3 次的短行（页眉/页脚/期刊名），保留首次出现
+
+所有规则都作用在原文上、产出不重叠的「区间替换」，据此维护精简文本 → 原文的偏移映射，
+evidence 核验与定位仍可回到原文。结果按 (原文 sha1, 规则指纹) 缓存：进程内 LRU，
+给了 cache_dir 时另写 minimized.json 侧车。
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from ..llm.tokens import estimate_tokens
+from .structure import PaperStructure, build_structure, content_hash, is_table_line
+
+MINIMIZED_FILENAME = "minimized.json"
+MINIMIZE_VERSION = 1
+
+ALL_RULES = ("references", "acknowledgements", "appendix", "images", "latex", "whitespace", "repeated_lines")
+
+_ACK_RE = re.compile(
+    r"^(?:\d+(?:\.\d+)*\.?\s*)?(?:acknowledge?ments?|funding|declaration\s+of\s+competing|competing\s+interests?|"
+    r"conflicts?\s+of\s+interest|author\s+contributions?|credit\s+authorship|data\s+availability|"
+    r"致谢|基金|资助|利益冲突|作者贡献)",
+    re.IGNORECASE,
+)
+_APPENDIX_RE = re.compile(r"^(?:\d+(?:\.\d+)*\.?\s*)?(?:appendix|appendices|附录)", re.IGNORECASE)
+
+_IMAGE_LINE_RE = re.compile(r"^[ \t]*!\[[^\]\n]*\]\([^)\n]*\)[ \t]*\n?", re.MULTILINE)
+_IMAGE_INLINE_RE = re.compile(r"!\[[^\]\n]*\]\([^)\n]*\)|<img\b[^>\n]*>", re.IGNORECASE)
+_INLINE_MATH_RE = re.compile(r"(?<![$\\])\$(?!\$)([^$\n]{1,200}?)(?<!\\)\$(?!\$)")
+_TRAILING_WS_RE = re.compile(r"[ \t]+(?=\n)")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_MULTI_SPACE_RE = re.compile(r"(?<=\S) {2,}(?=\S)")
+
+_LATEX_SYMBOLS = {
+    "times": "×", "pm": "±", "mp": "∓", "cdot": "·", "sim": "~", "approx": "≈",
+    "leq": "≤", "le": "≤", "geq": "≥", "ge": "≥", "neq": "≠", "ne": "≠",
+    "circ": "°", "degree": "°", "infty": "∞", "prime": "′", "to": "→", "rightarrow": "→",
+    "AA": "Å", "angstrom": "Å", "%": "%",
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "Delta": "Δ", "epsilon": "ε",
+    "varepsilon": "ε", "eta": "η", "theta": "θ", "lambda": "λ", "mu": "μ", "nu": "ν",
+    "pi": "π", "rho": "ρ", "sigma": "σ", "tau": "τ", "phi": "φ", "varphi": "φ",
+    "omega": "ω", "Omega": "Ω",
+}
+_LATEX_DROP = {
+    "mathrm", "mathbf", "mathit", "mathsf", "mathtt", "text", "textbf", "textit", "textrm",
+    "operatorname", "boldsymbol", "rm", "bf", "it", "left", "right", "displaystyle",
+    ",", ";", ":", "!", "quad", "qquad",
+}
+_LATEX_CMD_RE = re.compile(r"\\([A-Za-z]+|[,;:!%])")
+
+
+def approx_tokens(text: str) -> int:
+    """估算 token（src/llm/tokens.py 的共享估算器，含按调用校准的系数）。"""
+    if not text:
+        return 0
+    return estimate_tokens(text)
+
+
+def simplify_latex(expr: str) -> Optional[str]:
+    """把行内公式化简为纯文本；含无法识别的命令时返回 None（保留原样）。"""
+    s = re.sub(r"\^\s*\{\s*\\circ\s*\}|\^\s*\\circ", "°", expr)
+    unknown = False
+
+    def _sub(m: "re.Match[str]") -> str:
+        nonlocal unknown
+        name = m.group(1)
+        if name in _LATEX_SYMBOLS:
+            return _LATEX_SYMBOLS[name]
+        if name in _LATEX_DROP:
+            return " " if name in (",", ";", ":", "quad", "qquad") else ""
+        unknown = True
+        return m.group(0)
+
+    s = _LATEX_CMD_RE.sub(_sub, s)
+    if unknown or "\\" in s:
+        return None
+    s = s.replace("{", "").replace("}", "").replace("~", " ")
+    s = re.sub(r"(?<=\d)\s+(?=[\d.,])|(?<=[\d.])\s+(?=\d)", "", s)
+    s = re.sub(r"\s*°\s*", "°", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+@dataclass
+class MinimizedText:
+    """精简结果 + 精简文本到原文的偏移映射。"""
+    text: str
+    content_hash: str
+    original_chars: int
+    rules: Tuple[str, ...] = ALL_RULES
+    # 段表：(精简起点, 原文起点, 精简长度, 原文长度)；两长度相等的是原样拷贝段，否则为替换段
+    segments: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    removed: Dict[str, int] = field(default_factory=dict)  # 每条规则净删除字符数
+    original_tokens: int = 0
+    minimized_tokens: int = 0
+    _starts: Optional[List[int]] = field(default=None, repr=False, compare=False)
+    _o_starts: Optional[List[int]] = field(default=None, repr=False, compare=False)
+
+    @property
+    def saved_chars(self) -> int:
+        return self.original_chars - len(self.text)
+
+    def _seg(self, pos: int) -> Optional[Tuple[int, int, int, int]]:
+        if not self.segments:
+            return None
+        if self._starts is None:
+            self._starts = [s[0] for s in self.segments]
+        i = bisect.bisect_right(self._starts, pos) - 1
+        return self.segments[max(i, 0)]
+
+    def to_original(self, pos: int) -> int:
+        """精简文本中的下标 → 原文下标（落在替换段内时取被替换区间起点）。"""
+        if pos >= len(self.text):
+            return self.original_chars
+        seg = self._seg(pos)
+        if seg is None:
+            return pos
+        m_start, o_start, m_len, o_len = seg
+        if m_len == o_len:
+            return o_start + (pos - m_start)
+        return o_start
+
+    def original_span(self, start: int, end: int) -> Tuple[int, int]:
+        """精简文本区间 [start, end) → 原文区间（替换段按整个被替换区间展开）。"""
+        a = self.to_original(start)
+        if end <= start:
+            return a, a
+        seg = self._seg(end - 1)
+        if seg is None:
+            return a, end
+        m_start, o_start, m_len, o_len = seg
+        if m_len == o_len:
+            return a, o_start + (end - m_start)
+        return a, o_start + o_len
+
+    def to_minimized(self, pos: int) -> int:
+        """原文下标 → 精简文本下标（落在被删除/替换区间内时取其在精简文本中的起点）。"""
+        if not self.segments:
+            return min(pos, len(self.text))
+        if self._o_starts is None:
+            self._o_starts = [s[1] for s in self.segments]
+        i = bisect.bisect_right(self._o_starts, pos) - 1
+        if i < 0:
+            return 0
+        m_start, o_start, m_len, o_len = self.segments[i]
+        if pos < o_start + o_len:
+            return m_start + (pos - o_start) if m_len == o_len else m_start
+        return m_start + m_len       # 被整段删除的区间：落到下一段起点
+
+    def project_structure(self, structure: PaperStructure) -> PaperStructure:
+        """把原文的结构索引映射到精简文本上（标题/表格/图注/参考文献区间按偏移表换算）。
+
+        被删除的元素（如参考文献区间、附录里的表格）在精简文本中长度为 0，直接丢弃。
+        """
+        if structure.char_count != self.original_chars:
+            return build_structure(self.text)
+
+        def span(start: int, end: int) -> Tuple[int, int]:
+            return self.to_minimized(start), self.to_minimized(end)
+
+        headings, tables, captions = [], [], []
+        for h in structure.headings:
+            a, b = span(h.start, h.end)
+            if b > a:
+                headings.append(replace(h, start=a, end=b))
+        for t in structure.tables:
+            a, b = span(t.start, t.end)
+            if b > a:
+                tables.append(replace(t, start=a, end=b))
+        for c in structure.captions:
+            a, b = span(c.start, c.end)
+            if b > a:
+                captions.append(replace(c, start=a, end=b))
+        references = None
+        if structure.references:
+            a, b = span(*structure.references)
+            references = (a, b) if b > a else None
+        return replace(
+            structure,
+            content_hash=content_hash(self.text),
+            char_count=len(self.text),
+            line_count=self.text.count("\n") + 1,
+            headings=headings, tables=tables, captions=captions, references=references,
+            body_char_count=len(self.text) - ((references[1] - references[0]) if references else 0),
+            table_char_count=sum(t.end - t.start for t in tables),
+            md_size=0, md_mtime_ns=0,
+        )
+
+    def report(self) -> Dict[str, object]:
+        """单篇精简统计（写入提取 metadata）。"""
+        return {
+            "original_chars": self.original_chars,
+            "minimized_chars": len(self.text),
+            "saved_chars": self.saved_chars,
+            "saved_ratio": round(self.saved_chars / self.original_chars, 4) if self.original_chars else 0.0,
+            "original_tokens_est": self.original_tokens,
+            "minimized_tokens_est": self.minimized_tokens,
+            "saved_tokens_est": self.original_tokens - self.minimized_tokens,
+            "removed": dict(self.removed),
+        }
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "version": MINIMIZE_VERSION,
+            "content_hash": self.content_hash,
+            "rules": list(self.rules),
+            "original_chars": self.original_chars,
+            "original_tokens": self.original_tokens,
+            "minimized_tokens": self.minimized_tokens,
+            "removed": self.removed,
+            "segments": [list(s) for s in self.segments],
+            "text": self.text,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, object]) -> "MinimizedText":
+        return cls(
+            text=str(d.get("text", "")),
+            content_hash=str(d.get("content_hash", "")),
+            original_chars=int(d.get("original_chars", 0) or 0),
+            rules=tuple(d.get("rules") or ()),
+            segments=[tuple(int(x) for x in s) for s in d.get("segments") or []],
+            removed={str(k): int(v) for k, v in (d.get("removed") or {}).items()},
+            original_tokens=int(d.get("original_tokens", 0) or 0),
+            minimized_tokens=int(d.get("minimized_tokens", 0) or 0),
+        )
+
+
+# ----------------------------------------------------------------------
+# 规则：各自在原文上产出 (start, end, replacement, rule)
+# ----------------------------------------------------------------------
+def _section_edits(structure: PaperStructure, pattern: "re.Pattern[str]", rule: str):
+    for h, s, e in structure.sections():
+        if pattern.match(h.text.strip()):
+            yield s, e, "", rule
+
+
+def _repeated_line_edits(text: str):
+    counts: Dict[str, int] = {}
+    lines = []
+    pos = 0
+    for raw in text.split("\n"):
+        key = raw.strip()
+        lines.append((pos, pos + len(raw), key))
+        pos += len(raw) + 1
+        if 8 <= len(key) <= 100 and not key.startswith(("#", "|", "!", "<", "$")) and not is_table_line(key):
+            counts[key] = counts.get(key, 0) + 1
+    seen = set()
+    for s, e, key in lines:
+        if counts.get(key, 0) >= 3:
+            if key in seen:
+                yield s, min(e + 1, len(text)), "", "repeated_lines"
+            seen.add(key)
+
+
+def _collect_edits(text: str, structure: PaperStructure, rules: Sequence[str]):
+    edits = []
+    if "references" in rules and structure.references:
+        s, e = structure.references
+        edits.append((s, e, "", "references"))
+    if "acknowledgements" in rules:
+        edits.extend(_section_edits(structure, _ACK_RE, "acknowledgements"))
+    if "appendix" in rules:
+        edits.extend(_section_edits(structure, _APPENDIX_RE, "appendix"))
+    if "images" in rules:
+        edits.extend((m.start(), m.end(), "", "images") for m in _IMAGE_LINE_RE.finditer(text))
+        edits.extend((m.start(), m.end(), "", "images") for m in _IMAGE_INLINE_RE.finditer(text))
+    if "repeated_lines" in rules:
+        edits.extend(_repeated_line_edits(text))
+    if "latex" in rules:
+        for m in _INLINE_MATH_RE.finditer(text):
+            plain = simplify_latex(m.group(1))
+            if plain is not None:
+                edits.append((m.start(), m.end(), plain, "latex"))
+    if "whitespace" in rules:
+        edits.extend((m.start(), m.end(), "", "whitespace") for m in _TRAILING_WS_RE.finditer(text))
+        edits.extend((m.start(), m.end(), "\n\n", "whitespace") for m in _BLANK_LINES_RE.finditer(text))
+        edits.extend((m.start(), m.end(), " ", "whitespace") for m in _MULTI_SPACE_RE.finditer(text))
+    # 起点升序、同起点长者优先；与已接受区间重叠的编辑丢弃（大块删除吞掉其内部的小编辑）
+    edits.sort(key=lambda x: (x[0], -x[1]))
+    accepted = []
+    last_end = 0
+    for s, e, rep, rule in edits:
+        if s < last_end or e <= s:
+            continue
+        accepted.append((s, e, rep, rule))
+        last_end = e
+    return accepted
+
+
+def minimize_text(text: str, structure: Optional[PaperStructure] = None,
+                  rules: Optional[Sequence[str]] = None) -> MinimizedText:
+    """对一篇论文正文做确定性精简（不走缓存）。"""
+    text = text or ""
+    rules = tuple(r for r in (rules if rules is not None else ALL_RULES) if r in ALL_RULES)
+    if structure is None or structure.char_count != len(text):
+        structure = build_structure(text)
+
+    out: List[str] = []
+    segments: List[Tuple[int, int, int, int]] = []
+    removed: Dict[str, int] = {}
+    pos = mpos = 0
+    for s, e, rep, rule in _collect_edits(text, structure, rules):
+        if s > pos:
+            out.append(text[pos:s])
+            segments.append((mpos, pos, s - pos, s - pos))
+            mpos += s - pos
+        if rep:
+            out.append(rep)
+            # 替换段长度恰与原区间相同会被误认作原样段：此时按原样段映射也成立（逐字符一一对应）
+            segments.append((mpos, s, len(rep), e - s))
+            mpos += len(rep)
+        removed[rule] = removed.get(rule, 0) + (e - s) - len(rep)
+        pos = e
+    if pos < len(text):
+        out.append(text[pos:])
+        segments.append((mpos, pos, len(text) - pos, len(text) - pos))
+    minimized = "".join(out)
+    return MinimizedText(
+        text=minimized,
+        content_hash=content_hash(text),
+        original_chars=len(text),
+        rules=rules,
+        segments=segments,
+        removed=removed,
+        original_tokens=approx_tokens(text),
+        minimized_tokens=approx_tokens(minimized),
+    )
+
+
+# ----------------------------------------------------------------------
+# 缓存
+# ----------------------------------------------------------------------
+_CACHE_MAX = 64
+_cache: "OrderedDict[Tuple[str, Tuple[str, ...]], MinimizedText]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def configured_rules() -> Tuple[str, ...]:
+    """settings.EXTRACT_MINIMIZE_RULES（逗号分隔），未配置时为全部规则。"""
+    try:
+        import settings
+        rules = getattr(settings, "EXTRACT_MINIMIZE_RULES", None)
+    except Exception:
+        rules = None
+    if not rules:
+        return ALL_RULES
+    return tuple(r for r in rules if r in ALL_RULES)
+
+
+def minimize_enabled() -> bool:
+    try:
+        import settings
+        return bool(getattr(settings, "EXTRACT_MINIMIZE", True))
+    except Exception:
+        return True
+
+
+def _read_sidecar(path: Path, digest: str, rules: Tuple[str, ...]) -> Optional[MinimizedText]:
+    if not path.exists():
+        return None
+    try:
+        d = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if d.get("version") != MINIMIZE_VERSION or d.get("content_hash") != digest \
+            or tuple(d.get("rules") or ()) != rules:
+        return None
+    try:
+        return MinimizedText.from_dict(d)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_sidecar(path: Path, m: MinimizedText) -> None:
+    tmp = path.with_suffix(path.suffix + f".tmp.{os.getpid()}")
+    try:
+        tmp.write_text(json.dumps(m.to_dict(), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.debug(f"写入精简缓存失败 {path}: {e}")
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def minimize_content(text: str, structure: Optional[PaperStructure] = None,
+                     rules: Optional[Sequence[str]] = None,
+                     cache_dir: Optional[Path] = None) -> MinimizedText:
+    """带缓存的精简入口：按 (原文 sha1, 规则) 命中进程内 LRU / cache_dir 下的侧车文件。"""
+    rules = tuple(rules) if rules is not None else configured_rules()
+    digest = structure.content_hash if structure is not None and structure.char_count == len(text or "") \
+        else content_hash(text)
+    key = (digest, rules)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    m = _read_sidecar(Path(cache_dir) / MINIMIZED_FILENAME, digest, rules) if cache_dir else None
+    if m is None:
+        m = minimize_text(text, structure=structure, rules=rules)
+        if cache_dir:
+            _write_sidecar(Path(cache_dir) / MINIMIZED_FILENAME, m)
+    with _cache_lock:
+        _cache[key] = m
+        while len(_cache) > _CACHE_MAX:
+            _cache.popitem(last=False)
+    return m
@@ -114,6 +114,17 @@ EXTRACTOR_SYSTEM = """你是严谨的科研数据抽取专家。请依据给定
 5. 一篇论文常含多条记录(不同材料/不同实验条件各一条)，用 records 数组表达；同一条记录内字段对应同一材料/同一组条件。
 6. 只返回 JSON：{"records":[ {字段:{"value":...,"evidence":...}}, ... ]}。"""
 
+# 紧凑线格式（EXTRACT_OUTPUT_FORMAT=compact|columnar）：字段用代号、空字段省略，具体格式见 user prompt
+EXTRACTOR_SYSTEM_COMPACT = """你是严谨的科研数据抽取专家。请依据给定字段表(schema)，从论文全文中抽取结构化数据，输出**扁平记录**。
+硬性要求：
+1. 字段用字段表中的代号（如 f1）表示；无法确定的字段直接省略，禁止臆造。
+2. value 必须忠于原文；每个有值的字段都要给出 evidence（原文依据）。
+3. evidence 必须是论文原文中的**原句/原短语**(可截断，不得改写)，用于核验该 value。
+   - 若该值来自图/表，请把**图注或表格原文**作为 evidence（如 "Fig. 3 ...", "Table 2 ..."）。
+4. number 字段只放数值(可含小数/科学计数)，单位见 schema 的 unit；enum 取自 enum_values；list 用数组。
+5. 一篇论文常含多条记录(不同材料/不同实验条件各一条)；同一条记录内字段对应同一材料/同一组条件。
+6. 严格按 user 消息中的【提取输出格式】返回 JSON，不要输出其它内容。"""
+
 
 # ---------------------------------------------------------------------------
 # 多路提取合并者（extract_merger）：合并多个 extractor 的候选记录
@@ -144,6 +155,36 @@ EXTRACT_MERGER_USER = """【领域】{domain}
 
 请合并为最终 records（JSON）。"""
 
+# 紧凑候选编码（EXTRACT_MERGER_FORMAT=compact）：候选按记录对齐分组，只并排列出有分歧的字段
+EXTRACT_MERGER_SYSTEM_COMPACT = """你是科研结构化抽取结果的仲裁与合并专家。
+我会给你同一篇论文、同一份 schema 下多个 extractor（以 A、B… 表示）的候选抽取结果，已按记录对齐为若干组。
+请合并为一份最终 records。
+
+候选格式：
+- quotes：去重后的原文片段表，单元格里的整数 evidence 是它的下标。
+- groups：每组是各 extractor 对同一条记录的抽取；by 列出参与该组的 extractor。
+  - same：组内一致（或仅一方给出）的字段，{代号:[value, evidence下标]}；
+  - diff：有分歧的字段，{代号:{extractor:[value, evidence下标]}}。
+- 未出现的字段表示所有候选都为空。
+
+硬性要求：
+1. 只能使用候选中已有的 value/evidence，不得引入新事实；evidence 写 quotes 下标，不要改写原文。
+2. diff 冲突时，优先选择 evidence 更具体、类型更符合 schema、与同组其它字段彼此匹配的值；无法确认时省略该字段。
+3. 对齐有误（同一条记录被拆成多组，或一组混入不同对象/条件）时，按 record_definition 重新组织记录。
+4. 删除明显重复记录；保留确实不同对象/不同条件/不同结果的多条记录。
+5. 只返回 JSON：{"records":[{代号:[value, evidence下标], ...}, ...]}，空字段省略，不要输出 quotes。"""
+
+EXTRACT_MERGER_USER_COMPACT = """【领域】{domain}
+【一条记录代表】{record_definition}
+
+【字段表 schema】
+{schema_block}
+
+【多个 extractor 的候选结果（紧凑编码）】
+{candidate_outputs}
+
+请合并为最终 records（JSON）。"""
+
 
 # ---------------------------------------------------------------------------
 # 提取审阅者（extract_reviewer）：审阅最终 records 与 evidence
@@ -161,13 +202,28 @@ EXTRACT_REVIEWER_SYSTEM = """你是科研结构化抽取审阅专家。
 6. 只返回 JSON：
 {"records":[...],"review":{"passed":true/false,"issues":[...],"notes":"..."}}"""
 
+# evidence 模式（EXTRACT_REVIEW_CONTEXT=evidence）：reviewer 只看到各 evidence 附近的原文摘录
+EXTRACT_REVIEWER_SYSTEM_EXCERPTS = """你是科研结构化抽取审阅专家。
+我会给你论文原文摘录（各 evidence 附近的片段及其引用的图表，片段之间以「……」分隔，不是全文）、
+schema、以及已经合并的 records。请审阅 value 与 evidence 是否匹配原文，并输出审阅后的 records 和审阅摘要。
+
+硬性要求：
+1. value 必须被 evidence 支持；evidence 本身与 value 矛盾或不支持时，把该字段改为 {"value":null,"evidence":null}。
+2. 摘录之外的原文你看不到：某个值或其上下文没有出现在摘录里，不是置 null 或删除记录的理由，保持原样即可。
+3. evidence 必须是论文原文片段，不要改写；可以保留原 evidence 或缩短。
+4. 字段类型、单位、enum 必须符合 schema；不符合且无法修正时置 null。
+5. 只处理 records 之间明显的重复（同一对象、同一条件、同样取值）；不要依据摘录推断记录错位或缺失。
+6. 不得引入论文中没有的新事实。
+7. 只返回 JSON：
+{"records":[...],"review":{"passed":true/false,"issues":[...],"notes":"..."}}"""
+
 EXTRACT_REVIEWER_USER = """【领域】{domain}
 【一条记录代表】{record_definition}
 
 【字段表 schema】
 {schema_block}
 
-【论文全文】
+【{content_title}】
 {content}
 
 【待审阅 records】
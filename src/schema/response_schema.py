@@ -0,0 +1,110 @@
+"""
+由 GeneratedSchema 生成提取响应的 JSON Schema（用于 response_format=json_schema）。
+
+支持结构化输出的端点按该 schema 约束解码，返回必为合法 JSON，解析只需一次 json.loads，
+不再走 parse_json_loose 的正则/json_repair 兜底。字段类型映射：
+
+  string -> string | null          number -> number | null      boolean -> boolean | null
+  enum   -> enum_values + null     list   -> [string|number] | null
+
+单位与字段说明写进 description。cells 格式使用 strict 模式（所有字段必填、不允许额外键）；
+compact / columnar 需要省略空字段或定长数组，strict 无法表达，降为非 strict 的形状约束。
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List
+
+# OpenAI strict 模式单个对象的属性数上限；超出时退回非 strict
+STRICT_MAX_PROPERTIES = 100
+
+_NULLABLE_EVIDENCE = {"type": ["string", "null"]}
+
+
+def _value_schema(f) -> Dict[str, Any]:
+    if f.type == "number":
+        out: Dict[str, Any] = {"type": ["number", "null"]}
+    elif f.type == "boolean":
+        out = {"type": ["boolean", "null"]}
+    elif f.type == "list":
+        out = {"type": ["array", "null"], "items": {"type": ["string", "number"]}}
+    elif f.type == "enum" and f.enum_values:
+        out = {"type": ["string", "null"], "enum": [str(v) for v in f.enum_values] + [None]}
+    else:
+        out = {"type": ["string", "null"]}
+    desc = f.description or ""
+    if f.unit:
+        desc = f"{desc}（单位: {f.unit}）" if desc else f"单位: {f.unit}"
+    if desc:
+        out["description"] = desc[:300]
+    return out
+
+
+def _schema_name(schema) -> str:
+    name = re.sub(r"[^A-Za-z0-9_-]+", "_", schema.slug or "records").strip("_")
+    return f"extract_{name}"[:64] or "extract_records"
+
+
+def _cells_schema(schema, strict: bool) -> Dict[str, Any]:
+    props = {}
+    for f in schema.fields:
+        props[f.name] = {
+            "type": "object",
+            "properties": {"value": _value_schema(f), "evidence": dict(_NULLABLE_EVIDENCE)},
+            "required": ["value", "evidence"],
+            "additionalProperties": False,
+        }
+    record: Dict[str, Any] = {"type": "object", "properties": props, "additionalProperties": False}
+    if strict:
+        record["required"] = list(props)
+    return {
+        "type": "object",
+        "properties": {"records": {"type": "array", "items": record}},
+        "required": ["records"],
+        "additionalProperties": False,
+    }
+
+
+def _compact_schema(schema) -> Dict[str, Any]:
+    from src.prompts.modes.compact import field_codes
+    codes = field_codes(schema)
+    props = {}
+    for f in schema.fields:
+        # [value, evidence]；定长元组的逐项约束各家支持不一，只约束形状
+        props[codes[f.name]] = {"type": "array", "minItems": 2, "maxItems": 2, "description": f.name}
+    return {
+        "type": "object",
+        "properties": {
+            "quotes": {"type": "array", "items": {"type": "string"}},
+            "records": {"type": "array", "items": {"type": "object", "properties": props,
+                                                   "additionalProperties": False}},
+        },
+        "required": ["records"],
+    }
+
+
+def _columnar_schema(schema) -> Dict[str, Any]:
+    from src.prompts.modes.compact import field_codes
+    codes: List[str] = list(field_codes(schema).values())
+    cell = {"type": ["array", "null"], "minItems": 2, "maxItems": 2}
+    return {
+        "type": "object",
+        "properties": {
+            "cols": {"type": "array", "items": {"type": "string", "enum": codes}},
+            "quotes": {"type": "array", "items": {"type": "string"}},
+            "rows": {"type": "array", "items": {"type": "array", "items": cell}},
+        },
+        "required": ["cols", "rows"],
+    }
+
+
+def build_response_schema(schema, fmt: str = "cells") -> Dict[str, Any]:
+    """返回 OpenAI 兼容的 json_schema 参数：{"name", "strict", "schema"}。"""
+    if fmt == "compact":
+        body, strict = _compact_schema(schema), False
+    elif fmt == "columnar":
+        body, strict = _columnar_schema(schema), False
+    else:
+        strict = len(schema.fields) <= STRICT_MAX_PROPERTIES
+        body = _cells_schema(schema, strict)
+    return {"name": _schema_name(schema), "strict": strict, "schema": body}
@@ -11,6 +11,8 @@ import re
 from pathlib import Path
 from typing import List, Optional
 
+from .structure import CAPTION_RE, PaperStructure, is_table_line, load_structure
+
 
 # 命中这些关键词的小节标题更可能含有可提取字段
 _SECTION_KEYWORDS = [
@@ -21,15 +23,44 @@ _SECTION_KEYWORDS = [
 ]
 
 
-def _is_table_line(line: str) -> bool:
-    return line.count("|") >= 2 or "\t" in line
+_is_table_line = is_table_line
+
+
+def _usable(structure: Optional[PaperStructure], text: str) -> bool:
+    """结构索引与当前文本一致（长度相同）才按偏移取片段，否则回退逐行扫描。"""
+    return structure is not None and structure.char_count == len(text)
 
 
-def build_excerpt(text: str, budget: int = 12000) -> str:
+def _indexed_middle(text: str, structure: PaperStructure, lo: int, hi: int, remaining: int) -> List[str]:
+    """按结构索引在 [lo, hi) 中取表格块与命中关键词的小节（每块最多 25 行）。"""
+    spans = [(t.start, t.end) for t in structure.tables if lo <= t.start < hi]
+    for h, s, e in structure.sections():
+        if lo <= s < hi and any(k in h.text.lower() for k in _SECTION_KEYWORDS):
+            spans.append((s, e))
+    parts: List[str] = []
+    used = 0
+    last_end = lo
+    for s, e in sorted(spans):
+        if used >= remaining:
+            break
+        s = max(s, last_end)
+        e = min(e, hi)
+        if e <= s:
+            continue
+        block = "\n".join(text[s:e].split("\n")[:25])[:remaining - used]
+        parts.append(block)
+        used += len(block)
+        last_end = s + len(block)
+    return parts
+
+
+def build_excerpt(text: str, budget: int = 12000,
+                  structure: Optional[PaperStructure] = None) -> str:
     """
     构造分节感知摘录，控制在 budget 字符内。
 
     策略：head 段 + 命中关键词的小节/表格块 + tail 段，去重拼接。
+    传入 structure（结构索引）时直接按偏移取块，不再逐行扫描。
     """
     if text is None:
         return ""
@@ -44,7 +75,9 @@ def build_excerpt(text: str, budget: int = 12000) -> str:
     remaining = budget - len(head) - len(tail)
     middle_parts: List[str] = []
 
-    if remaining > 500:
+    if remaining > 500 and _usable(structure, text):
+        middle_parts = _indexed_middle(text, structure, head_chars, len(text) - tail_chars, remaining)
+    elif remaining > 500:
         lines = text[head_chars:-tail_chars].split("\n")
         i = 0
         used = 0
@@ -86,14 +119,25 @@ def build_schema_context_for_papers(paper_ids: List[str], budget_per_paper: int
 
     优先保留每篇论文的摘要/引言/实验或方法相关部分；若 MinerU 的标题结构不稳定，
     回退到 build_excerpt 的分节感知摘录。每篇论文单独限长，避免某篇长文挤掉其它样本。
+    配置了 SCHEMA_EXCERPT_TOKENS 时按每篇自身的字符/token 比换算字符预算。
     """
+    try:
+        import settings
+        token_budget = int(getattr(settings, "SCHEMA_EXCERPT_TOKENS", 0) or 0)
+    except Exception:
+        token_budget = 0
     parts: List[str] = []
     for pid in paper_ids:
         text = load_paper_text(pid, parsed_dir=parsed_dir, collection=collection) or ""
         if not text:
             continue
-        excerpt = _abstract_intro_methods_excerpt(text, budget_per_paper)
-        figures = collect_figures(text, max_items=24, max_chars=1600)
+        budget = budget_per_paper
+        if token_budget > 0:
+            from ..llm.tokens import get_estimator
+            budget = get_estimator().chars_for_tokens(text, token_budget)
+        structure = load_paper_structure(pid, parsed_dir=parsed_dir, collection=collection, text=text)
+        excerpt = _abstract_intro_methods_excerpt(text, budget, structure=structure)
+        figures = collect_figures(text, max_items=24, max_chars=1600, structure=structure)
         parts.append(
             f"===== PAPER {pid} =====\n"
             f"【正文摘录：摘要 / 引言 / 实验或方法优先】\n{excerpt}\n\n"
@@ -102,20 +146,37 @@ def build_schema_context_for_papers(paper_ids: List[str], budget_per_paper: int
     return "\n\n".join(parts)
 
 
-def _abstract_intro_methods_excerpt(text: str, budget: int) -> str:
-    """抽摘要、引言、实验/方法优先；不足或失败时回退 build_excerpt。"""
-    if len(text) <= budget:
-        return text
-
-    lines = text.splitlines()
-    section_patterns = [
+_WANTED_SECTIONS = [
+    re.compile(p, re.I) for p in (
         r"abstract|摘要",
         r"introduction|引言|绪论",
         r"experiment|experimental|materials?\s+and\s+methods?|methodology|methods?|实验|材料与方法|方法",
-    ]
-    wanted = [re.compile(p, re.I) for p in section_patterns]
+    )
+]
+
+
+def _abstract_intro_methods_excerpt(text: str, budget: int,
+                                    structure: Optional[PaperStructure] = None) -> str:
+    """抽摘要、引言、实验/方法优先；不足或失败时回退 build_excerpt。"""
+    if len(text) <= budget:
+        return text
 
+    wanted = _WANTED_SECTIONS
     blocks: List[str] = []
+    if _usable(structure, text):
+        last_end = 0
+        for h, s, e in structure.sections():
+            if s < last_end or not any(p.search(h.text) for p in wanted):
+                continue
+            e = min(e, s + budget // 2)
+            blocks.append(text[s:e].rstrip("\n"))
+            last_end = e
+        joined = "\n\n...\n\n".join(blocks)
+        if len(joined) >= max(1000, budget // 4):
+            return joined[:budget]
+        return build_excerpt(text, budget=budget, structure=structure)
+
+    lines = text.splitlines()
     n = len(lines)
     i = 0
     while i < n:
@@ -147,21 +208,27 @@ def _abstract_intro_methods_excerpt(text: str, budget: int) -> str:
     return build_excerpt(text, budget=budget)
 
 
-def collect_figures(text: str, max_items: int = 40, max_chars: int = 2500) -> str:
+def collect_figures(text: str, max_items: int = 40, max_chars: int = 2500,
+                    structure: Optional[PaperStructure] = None) -> str:
     """
     抽取图/表标题行（Fig./Figure/Table/图/表 开头的说明），供 schema 设计参考。
     这些图注常含「只在图里出现」的可结构化信息（形貌、相、峰位等）。
     """
     if not text:
         return ""
-    pat = re.compile(r"^\s*(?:!\[[^\]]*\]\([^)]*\)\s*)?((?:fig(?:ure)?\.?|table|图|表)\s*[\.:]?\s*\d+[^\n]{0,180})",
-                     re.IGNORECASE)
+    if _usable(structure, text):
+        captions = [c.text for c in structure.captions]
+    else:
+        captions = []
+        for line in text.split("\n"):
+            m = CAPTION_RE.match(line)
+            if m:
+                captions.append(m.group(1))
     out = []
     seen = set()
-    for line in text.split("\n"):
-        m = pat.match(line)
-        if m:
-            cap = m.group(1).strip()
+    for cap in captions:
+        if cap:
+            cap = cap.strip()
             key = cap[:40].lower()
             if key in seen:
                 continue
@@ -196,6 +263,40 @@ def load_paper_text(paper_id: str, parsed_dir: Optional[Path] = None,
         return None
 
 
+def load_paper_structure(paper_id: str, parsed_dir: Optional[Path] = None,
+                         collection: str = "", text: Optional[str] = None) -> Optional[PaperStructure]:
+    """读取某篇论文的结构索引（structure.json），缺失或过期时就地重建。"""
+    if parsed_dir is None:
+        import settings
+        collection = collection or getattr(settings, "DEFAULT_COLLECTION", "")
+        parsed_dir = settings.collection_parsed_dir(collection)
+    paper_dir = Path(parsed_dir) / paper_id
+    if not (paper_dir / "full.md").exists():
+        return None
+    try:
+        return load_structure(paper_dir, text=text)
+    except Exception:
+        return None
+
+
+def load_paper_minimized(paper_id: str, parsed_dir: Optional[Path] = None,
+                         collection: str = "", text: Optional[str] = None,
+                         structure: Optional[PaperStructure] = None):
+    """读取某篇论文的精简正文（minimized.json 侧车按原文 hash + 规则缓存）。"""
+    from .minimize import minimize_content
+    if parsed_dir is None:
+        import settings
+        collection = collection or getattr(settings, "DEFAULT_COLLECTION", "")
+        parsed_dir = settings.collection_parsed_dir(collection)
+    paper_dir = Path(parsed_dir) / paper_id
+    if text is None:
+        text = load_paper_text(paper_id, parsed_dir=parsed_dir)
+    if not text:
+        return None
+    return minimize_content(text, structure=structure,
+                            cache_dir=paper_dir if paper_dir.is_dir() else None)
+
+
 def list_parsed_papers(parsed_dir: Optional[Path] = None,
                        collection: str = "") -> List[str]:
     """列出有 full.md 的已解析论文 id。"""
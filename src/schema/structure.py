@@ -0,0 +1,455 @@
+"""
+论文结构索引（parsed/<paper_id>/structure.json 侧车文件）。
+
+full.md 在下载落盘时只解析一次：标题层级与偏移、表格块、图/表标题、参考文献区间、
+字符数，写入与 full.md 同目录的 structure.json。下游（采样 / 摘录 / 提取）直接读索引，
+不再每次逐行正则重扫全文。
+
+有 MinerU content_list.json 时优先按结构化块构建（标题层级、表格、图注、参考文献均来自
+MinerU 的版面分析，并带页码），再把块定位回 full.md 的字符偏移；块对不上 full.md 时
+回退 markdown 启发式。
+
+失效规则：索引记录 full.md 的 content_hash（sha1）与 size/mtime。size/mtime 未变直接
+命中；变了则重算 hash，一致则只刷新 stat，不一致（full.md 被替换）或索引版本升级时重建。
+所有偏移都是 full.md 文本（str）中的字符下标，左闭右开。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+STRUCTURE_FILENAME = "structure.json"
+STRUCTURE_VERSION = 2
+
+# 与 sampling.collect_figures 历史行为一致的图/表标题正则（允许前置图片链接）
+CAPTION_RE = re.compile(
+    r"^\s*(?:!\[[^\]]*\]\([^)]*\)\s*)?((?:fig(?:ure)?\.?|table|图|表)\s*[\.:]?\s*\d+[^\n]{0,180})",
+    re.IGNORECASE,
+)
+# MinerU 常不给小节加 #：短行的「2.1 Materials」视为隐式标题
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(?:\.\d+){0,3})\.?\s+(\S.*)$")
+_NAMED_SECTION_RE = re.compile(
+    r"^(?:abstract|introduction|conclusions?|references?|bibliography|acknowledge?ments?|appendix|"
+    r"摘要|引言|绪论|结论|参考文献|致谢|附录)\s*[:：]?$",
+    re.IGNORECASE,
+)
+REFERENCES_RE = re.compile(r"^(?:\d+(?:\.\d+)*\.?\s*)?(?:references?|bibliography|literature\s+cited|参考文献)\s*[:：]?$",
+                           re.IGNORECASE)
+_HTML_TABLE_OPEN = "<table"
+_HTML_TABLE_CLOSE = "</table>"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def is_table_line(line: str) -> bool:
+    return line.count("|") >= 2 or "\t" in line
+
+
+@dataclass
+class Heading:
+    level: int
+    text: str
+    start: int          # 标题行起点
+    end: int            # 标题行终点（不含换行）
+    implicit: bool = False  # 无 # 号、按编号/常见节名推断的标题
+    page: int = -1
+
+
+@dataclass
+class TableBlock:
+    start: int
+    end: int
+    kind: str = "markdown"  # markdown | html
+    rows: int = 0
+    page: int = -1
+
+
+@dataclass
+class Caption:
+    kind: str           # figure | table
+    text: str
+    start: int
+    end: int
+    page: int = -1
+
+
+@dataclass
+class PaperStructure:
+    """一篇已解析论文的结构索引。"""
+    content_hash: str
+    char_count: int
+    line_count: int = 0
+    headings: List[Heading] = field(default_factory=list)
+    tables: List[TableBlock] = field(default_factory=list)
+    captions: List[Caption] = field(default_factory=list)
+    references: Optional[Tuple[int, int]] = None
+    body_char_count: int = 0     # 去掉参考文献区间后的字符数
+    table_char_count: int = 0
+    source: str = "markdown"  # markdown | content_list
+    page_count: int = 0
+    version: int = STRUCTURE_VERSION
+    md_size: int = 0
+    md_mtime_ns: int = 0
+
+    # ---- 查询 ----
+    def section_end(self, idx: int) -> int:
+        """第 idx 个标题所辖小节的终点：下一个同级或更高级标题起点，否则全文末尾。"""
+        level = self.headings[idx].level
+        for h in self.headings[idx + 1:]:
+            if h.level <= level:
+                return h.start
+        return self.char_count
+
+    def sections(self) -> Iterator[Tuple[Heading, int, int]]:
+        """逐个产出 (标题, 小节起点=标题行起点, 小节终点)。"""
+        for i, h in enumerate(self.headings):
+            yield h, h.start, self.section_end(i)
+
+    def find_sections(self, pattern: "re.Pattern[str]") -> List[Tuple[Heading, int, int]]:
+        return [(h, s, e) for h, s, e in self.sections() if pattern.search(h.text)]
+
+    def in_references(self, pos: int) -> bool:
+        return bool(self.references) and self.references[0] <= pos < self.references[1]
+
+    def without_references(self, text: str) -> str:
+        """返回去掉参考文献区间后的正文（索引与 text 不匹配时原样返回）。"""
+        if not self.references or len(text) != self.char_count:
+            return text
+        s, e = self.references
+        return text[:s] + text[e:]
+
+    # ---- 序列化 ----
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["references"] = list(self.references) if self.references else None
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "PaperStructure":
+        refs = d.get("references")
+        return cls(
+            content_hash=str(d.get("content_hash", "")),
+            char_count=int(d.get("char_count", 0) or 0),
+            line_count=int(d.get("line_count", 0) or 0),
+            headings=[Heading(**h) for h in d.get("headings") or []],
+            tables=[TableBlock(**t) for t in d.get("tables") or []],
+            captions=[Caption(**c) for c in d.get("captions") or []],
+            references=(int(refs[0]), int(refs[1])) if refs else None,
+            body_char_count=int(d.get("body_char_count", 0) or 0),
+            table_char_count=int(d.get("table_char_count", 0) or 0),
+            source=str(d.get("source", "markdown")),
+            page_count=int(d.get("page_count", 0) or 0),
+            version=int(d.get("version", 0) or 0),
+            md_size=int(d.get("md_size", 0) or 0),
+            md_mtime_ns=int(d.get("md_mtime_ns", 0) or 0),
+        )
+
+
+# ----------------------------------------------------------------------
+# 构建
+# ----------------------------------------------------------------------
+def _heading_of(line: str) -> Optional[Tuple[int, str, bool]]:
+    """判断一行是否为标题，返回 (level, 标题文本, implicit)。"""
+    stripped = line.strip()
+    if not stripped:
+        return None
+    if stripped.startswith("#"):
+        level = len(stripped) - len(stripped.lstrip("#"))
+        text = stripped.lstrip("#").strip()
+        return (max(1, min(level, 6)), text, False) if text else None
+    if len(stripped) >= 120 or is_table_line(stripped):
+        return None
+    if _NAMED_SECTION_RE.match(stripped):
+        return 1, stripped, True
+    m = _NUMBERED_HEADING_RE.match(stripped)
+    if m and len(stripped) < 80 and not stripped.endswith((".", "。", ";", "；", ",")):
+        title = m.group(2)
+        # 要求标题以字母/中文开头，排除「1 mm thick ...」这类数值正文
+        if title[:1].isupper() or "一" <= title[:1] <= "鿿":
+            return m.group(1).count(".") + 1, stripped, True
+    return None
+
+
+def _find_references(headings: List[Heading], char_count: int) -> Optional[Tuple[int, int]]:
+    for i, h in enumerate(headings):
+        if REFERENCES_RE.match(h.text.strip()):
+            end = char_count
+            for nxt in headings[i + 1:]:
+                # 参考文献后常见的附录/致谢/作者简介用显式标题分隔
+                if not nxt.implicit:
+                    end = nxt.start
+                    break
+            return h.start, end
+    return None
+
+
+def build_structure(text: str) -> PaperStructure:
+    """单次扫描 full.md，构建结构索引。"""
+    text = text or ""
+    headings: List[Heading] = []
+    tables: List[TableBlock] = []
+    captions: List[Caption] = []
+
+    pos = 0
+    line_count = 0
+    table_start = table_end = -1
+    table_rows = 0
+    for raw in text.split("\n"):
+        line_count += 1
+        start, end = pos, pos + len(raw)
+        pos = end + 1
+
+        # HTML 表格在循环后单独扫描；这里只收集 markdown 表格块
+        if is_table_line(raw) and _HTML_TABLE_OPEN not in raw.lower():
+            if table_start < 0:
+                table_start, table_rows = start, 0
+            table_end = end
+            if not re.fullmatch(r"[\s|:\-+]*", raw):
+                table_rows += 1
+            continue
+        if table_start >= 0:
+            tables.append(TableBlock(start=table_start, end=table_end, kind="markdown", rows=table_rows))
+            table_start = -1
+
+        m = CAPTION_RE.match(raw)
+        if m:
+            kind = "table" if m.group(1).lower().startswith(("table", "表")) else "figure"
+            captions.append(Caption(kind=kind, text=m.group(1).strip(), start=start + m.start(1), end=end))
+            continue
+        head = _heading_of(raw)
+        if head:
+            level, title, implicit = head
+            headings.append(Heading(level=level, text=title, start=start, end=end, implicit=implicit))
+    if table_start >= 0:
+        tables.append(TableBlock(start=table_start, end=table_end, kind="markdown", rows=table_rows))
+
+    low = text.lower()
+    i = low.find(_HTML_TABLE_OPEN)
+    while i >= 0:
+        j = low.find(_HTML_TABLE_CLOSE, i)
+        end = j + len(_HTML_TABLE_CLOSE) if j >= 0 else len(text)
+        tables.append(TableBlock(start=i, end=end, kind="html", rows=low.count("<tr", i, end)))
+        i = low.find(_HTML_TABLE_OPEN, end)
+    tables.sort(key=lambda t: t.start)
+
+    char_count = len(text)
+    refs = _find_references(headings, char_count)
+    return PaperStructure(
+        content_hash=content_hash(text),
+        char_count=char_count,
+        line_count=line_count,
+        headings=headings,
+        tables=tables,
+        captions=captions,
+        references=refs,
+        body_char_count=char_count - (refs[1] - refs[0] if refs else 0),
+        table_char_count=sum(t.end - t.start for t in tables),
+    )
+
+
+def _line_bounds(text: str, pos: int) -> Tuple[int, int]:
+    start = text.rfind("\n", 0, pos) + 1
+    end = text.find("\n", pos)
+    return start, (len(text) if end < 0 else end)
+
+
+def _needle(s: str) -> str:
+    """块文本在 full.md 中的定位锚：首行前 60 字符（避免跨行换行差异）。"""
+    s = (s or "").strip()
+    return s.split("\n", 1)[0][:60].strip()
+
+
+def build_structure_from_blocks(text: str, blocks) -> Optional[PaperStructure]:
+    """
+    按 MinerU 结构化块构建索引，块按阅读顺序用游标在 full.md 中顺序定位。
+
+    定位不到的块直接跳过（不推进游标）；标题定位率过低说明 full.md 与块不匹配，
+    返回 None 交给 markdown 启发式。
+    """
+    text = text or ""
+    low = text.lower()
+    headings: List[Heading] = []
+    tables: List[TableBlock] = []
+    captions: List[Caption] = []
+    ref_start = ref_end = -1
+    cursor = 0
+    wanted_headings = found_headings = 0
+    pages = 0
+
+    def _locate(needle: str, lower: bool = False) -> int:
+        if not needle:
+            return -1
+        return (low if lower else text).find(needle.lower() if lower else needle, cursor)
+
+    for b in blocks:
+        pages = max(pages, b.page + 1)
+        if b.type == "table":
+            i = _locate("<table", lower=True)
+            if b.caption:
+                ci = _locate(_needle(b.caption))
+                if ci >= 0 and (i < 0 or ci < i):
+                    s, e = _line_bounds(text, ci)
+                    captions.append(Caption(kind="table", text=b.caption, start=ci, end=e, page=b.page))
+                    cursor = e
+                    i = _locate("<table", lower=True)
+            if i >= 0:
+                j = low.find(_HTML_TABLE_CLOSE, i)
+                end = j + len(_HTML_TABLE_CLOSE) if j >= 0 else len(text)
+                tables.append(TableBlock(start=i, end=end, kind="html",
+                                         rows=low.count("<tr", i, end), page=b.page))
+                cursor = end
+            continue
+        if b.type == "image":
+            if b.caption:
+                ci = _locate(_needle(b.caption))
+                if ci >= 0:
+                    _, e = _line_bounds(text, ci)
+                    kind = "table" if b.caption.lower().startswith(("table", "表")) else "figure"
+                    captions.append(Caption(kind=kind, text=b.caption, start=ci, end=e, page=b.page))
+                    cursor = e
+            continue
+        needle = _needle(b.text)
+        if b.level > 0:
+            wanted_headings += 1
+        i = _locate(needle)
+        if i < 0:
+            continue
+        s, e = _line_bounds(text, i)
+        if b.level > 0:
+            found_headings += 1
+            headings.append(Heading(level=min(b.level, 6), text=b.text.strip(), start=s, end=e, page=b.page))
+        elif b.type == "ref":
+            ref_start = s if ref_start < 0 else ref_start
+        else:
+            m = CAPTION_RE.match(text[s:e])
+            if m:
+                kind = "table" if m.group(1).lower().startswith(("table", "表")) else "figure"
+                captions.append(Caption(kind=kind, text=m.group(1).strip(), start=s + m.start(1), end=e, page=b.page))
+        # 文本块可能跨多行：游标推进到块全文末尾（找不到则推进到首行末尾）
+        full = b.text.strip()
+        cursor = i + len(full) if len(full) > len(needle) and text.startswith(full, i) else e
+        if b.type == "ref":
+            ref_end = cursor
+
+    if wanted_headings and found_headings < wanted_headings * 0.6:
+        return None
+
+    char_count = len(text)
+    refs = _find_references(headings, char_count)
+    if ref_start >= 0:
+        # MinerU 标了 ref_text：区间从参考文献标题（若有）或首条文献开始，到末条文献结束
+        start = refs[0] if refs and refs[0] <= ref_start else ref_start
+        refs = (start, ref_end)
+    return PaperStructure(
+        content_hash=content_hash(text),
+        char_count=char_count,
+        line_count=text.count("\n") + 1,
+        headings=headings,
+        tables=tables,
+        captions=captions,
+        references=refs,
+        body_char_count=char_count - (refs[1] - refs[0] if refs else 0),
+        table_char_count=sum(t.end - t.start for t in tables),
+        source="content_list",
+        page_count=pages,
+    )
+
+
+def build_structure_for_dir(paper_dir: Path, text: str) -> PaperStructure:
+    """优先用 content_list.json 构建，缺失或对不上 full.md 时回退 markdown 启发式。"""
+    from .blocks import load_blocks
+    blocks = load_blocks(paper_dir)
+    if blocks:
+        structure = build_structure_from_blocks(text, blocks)
+        if structure is not None:
+            return structure
+        logger.debug(f"content_list 与 full.md 对不上，回退 markdown 结构: {paper_dir}")
+    return build_structure(text)
+
+
+# ----------------------------------------------------------------------
+# 侧车文件读写
+# ----------------------------------------------------------------------
+def structure_path(paper_dir: Path) -> Path:
+    return Path(paper_dir) / STRUCTURE_FILENAME
+
+
+def _stamp(structure: PaperStructure, md_path: Path) -> None:
+    try:
+        st = md_path.stat()
+        structure.md_size, structure.md_mtime_ns = st.st_size, st.st_mtime_ns
+    except OSError:
+        pass
+
+
+def _save(structure: PaperStructure, path: Path) -> None:
+    tmp = path.with_suffix(path.suffix + f".tmp.{os.getpid()}")
+    try:
+        tmp.write_text(json.dumps(structure.to_dict(), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"写入结构索引失败 {path}: {e}")
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def write_structure(paper_dir: Path, text: Optional[str] = None) -> Optional[PaperStructure]:
+    """为解析目录（重）建 structure.json。full.md 缺失时返回 None。"""
+    md_path = Path(paper_dir) / "full.md"
+    if text is None:
+        try:
+            text = md_path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+    structure = build_structure_for_dir(Path(paper_dir), text)
+    _stamp(structure, md_path)
+    _save(structure, structure_path(paper_dir))
+    return structure
+
+
+def load_structure(paper_dir: Path, text: Optional[str] = None,
+                   rebuild: bool = True) -> Optional[PaperStructure]:
+    """读取结构索引；缺失/过期时按需重建（rebuild=False 时返回 None）。
+
+    text 可传入调用方已读好的 full.md 内容，省去重复读盘。
+    """
+    paper_dir = Path(paper_dir)
+    md_path = paper_dir / "full.md"
+    path = structure_path(paper_dir)
+    cached: Optional[PaperStructure] = None
+    if path.exists():
+        try:
+            cached = PaperStructure.from_dict(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError) as e:
+            logger.debug(f"结构索引损坏，将重建 {path}: {e}")
+            cached = None
+    if cached is not None and cached.version == STRUCTURE_VERSION:
+        try:
+            st = md_path.stat()
+        except OSError:
+            st = None
+        if st and st.st_size == cached.md_size and st.st_mtime_ns == cached.md_mtime_ns:
+            return cached
+        if text is None:
+            try:
+                text = md_path.read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                return None
+        if content_hash(text) == cached.content_hash:
+            _stamp(cached, md_path)
+            _save(cached, path)
+            return cached
+    if not rebuild:
+        return None
+    return write_structure(paper_dir, text=text)
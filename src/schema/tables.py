@@ -0,0 +1,578 @@
+"""
+表格确定性预解析：markdown / HTML 表格 → 带类型的 TableFrame → 列头映射到 schema 字段。
+
+磨损率、摩擦系数、硬度等数值字段大多来自表格，LLM 却要逐格重读、连同 evidence 重新输出。
+这里先把表格解析成结构化帧（单元格识别数值 / ± 误差 / 范围 / 文本），再按列头名称、
+单位、字段描述与提示的相似度把列映射到 schema 字段，产出：
+
+  - 给 extractor 的「表格预解析候选」提示块（render_prefill_block）；
+  - 高置信映射的逐行候选值，提取后按行标签回填记录中为 null 的单元格（apply_prefill），
+    evidence 取原文中该行的确切片段，可 100% 核验。
+
+解析只依赖标准库；HTML 表格由 MinerU 生成、结构规整，用正则切行/格并展开 rowspan/colspan。
+"""
+from __future__ import annotations
+
+import html
+import re
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .models import normalize_field_name
+from .structure import PaperStructure, build_structure
+
+_NUM = r"[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?"
+_CELL_NUM_RE = re.compile(
+    rf"^\s*(?P<cmp>[<>≤≥~≈])?\s*(?P<num>{_NUM})"
+    rf"(?:\s*[×x]\s*10\s*\^?\s*\{{?\s*(?P<exp>[-+]?\d+)\s*\}}?)?"
+    rf"\s*(?:(?:±|\+/-|\+-)\s*(?P<err>{_NUM}))?"
+    rf"\s*(?P<unit>[^\d\s].{{0,15}})?\s*$"
+)
+_CELL_RANGE_RE = re.compile(rf"^\s*(?P<lo>{_NUM})\s*(?:-|–|~|to)\s*(?P<hi>{_NUM})\s*(?P<unit>[^\d\s].{{0,15}})?\s*$")
+_HEADER_UNIT_RE = re.compile(r"^(?P<name>.*?)\s*[\(\[（]\s*(?P<unit>[^()\[\]（）]{1,30})\s*[\)\]）]\s*$")
+_TR_RE = re.compile(r"<tr\b[^>]*>(.*?)</tr\s*>", re.IGNORECASE | re.DOTALL)
+_TD_RE = re.compile(r"<(t[dh])\b([^>]*)>(.*?)</t[dh]\s*>", re.IGNORECASE | re.DOTALL)
+_SPAN_RE = re.compile(r"(rowspan|colspan)\s*=\s*[\"']?(\d+)", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_MD_SEP_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(?:\|\s*:?-{2,}:?\s*)*\|?\s*$")
+
+_STOPWORDS = {"of", "the", "and", "a", "an", "in", "on", "at", "for", "to", "with", "by", "or", "value", "values"}
+# 表头常见缩写 → 展开词，提升与字段描述的匹配
+_ABBREVIATIONS = {
+    "cof": "coefficient friction",
+    "μ": "friction coefficient",
+    "hv": "vickers hardness",
+    "hb": "brinell hardness",
+    "ra": "surface roughness",
+    "uts": "ultimate tensile strength",
+    "ys": "yield strength",
+    "e": "elastic modulus",
+    "wr": "wear rate",
+    "k": "specific wear rate",
+}
+
+
+def _clean(s: str) -> str:
+    s = html.unescape(_TAG_RE.sub(" ", s or ""))
+    s = s.replace("−", "-").replace(" ", " ").replace("\xa0", " ")
+    return re.sub(r"\s+", " ", s).strip()
+
+
+@dataclass
+class Cell:
+    raw: str
+    kind: str = "text"              # number | range | text | empty
+    value: Optional[float] = None
+    error: Optional[float] = None    # ± 误差
+    high: Optional[float] = None     # 范围上界（kind=range）
+    unit: Optional[str] = None
+    start: int = -1                 # 该格在原文中的区间（找不到时为 -1）
+    end: int = -1
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.kind in ("number", "range")
+
+
+def parse_cell(raw: str) -> Cell:
+    """识别单元格类型：5.2 / 5.2 ± 0.3 / 1.2×10^-6 / 10-20 / 文本。"""
+    text = _clean(raw)
+    if not text or text in ("-", "–", "—", "/", "N/A", "n/a", "NA"):
+        return Cell(raw=text, kind="empty")
+    compact = re.sub(r"\$|\\mathrm|\\times|\\pm|[{}]", lambda m: {"\\times": "×", "\\pm": "±"}.get(m.group(0), ""), text)
+    if "$" in text:
+        # MinerU 的 LaTeX 数字常被逐字符空格分开（$1 . 2 \times 1 0 ^ { - 6 }$）
+        compact = re.sub(r"\s+", "", compact)
+    else:
+        compact = re.sub(r"(?<=\d) (?=[\d.])", "", compact)
+    m = _CELL_RANGE_RE.match(compact)
+    if m:
+        return Cell(raw=text, kind="range", value=float(m.group("lo")), high=float(m.group("hi")),
+                    unit=(m.group("unit") or "").strip() or None)
+    m = _CELL_NUM_RE.match(compact)
+    if m:
+        try:
+            value = float(m.group("num"))
+            if m.group("exp"):
+                value *= 10 ** int(m.group("exp"))
+            err = float(m.group("err")) if m.group("err") else None
+        except ValueError:
+            return Cell(raw=text)
+        unit = (m.group("unit") or "").strip() or None
+        if unit and re.search(r"[A-Za-z]{4,}\s+[A-Za-z]{3,}", unit):
+            return Cell(raw=text)  # 「5 samples tested」之类的句子不当数值
+        return Cell(raw=text, kind="number", value=value, error=err, unit=unit)
+    return Cell(raw=text)
+
+
+@dataclass
+class TableFrame:
+    """一张解析后的表格。"""
+    index: int
+    kind: str                        # markdown | html
+    start: int
+    end: int
+    caption: str = ""
+    headers: List[str] = field(default_factory=list)
+    header_units: List[Optional[str]] = field(default_factory=list)
+    rows: List[List[Cell]] = field(default_factory=list)
+    row_spans: List[Tuple[int, int]] = field(default_factory=list)  # 每行在原文中的区间
+
+    @property
+    def width(self) -> int:
+        return len(self.headers)
+
+    def column(self, j: int) -> List[Cell]:
+        return [r[j] for r in self.rows if j < len(r)]
+
+    def numeric_ratio(self, j: int) -> float:
+        cells = [c for c in self.column(j) if c.kind != "empty"]
+        return sum(c.is_numeric for c in cells) / len(cells) if cells else 0.0
+
+    def label_column(self) -> Optional[int]:
+        """行标签列：第一个以文本为主的列（材料 / 样品 / 条件名）。"""
+        for j in range(self.width):
+            cells = [c for c in self.column(j) if c.kind != "empty"]
+            if cells and self.numeric_ratio(j) < 0.5:
+                return j
+        return None
+
+
+def _split_header(h: str) -> Tuple[str, Optional[str]]:
+    h = _clean(h)
+    m = _HEADER_UNIT_RE.match(h)
+    if m and m.group("name").strip():
+        return m.group("name").strip(), m.group("unit").strip()
+    if "," in h:
+        name, _, tail = h.rpartition(",")
+        if name.strip() and len(tail.strip()) <= 12 and re.search(r"[/%°a-zA-Zμ]", tail):
+            return name.strip(), tail.strip()
+    return h, None
+
+
+def _merge_headers(header_rows: List[List[str]], width: int) -> List[str]:
+    out = []
+    for j in range(width):
+        parts: List[str] = []
+        for r in header_rows:
+            t = _clean(r[j]) if j < len(r) else ""
+            if t and t not in parts:
+                parts.append(t)
+        out.append(" ".join(parts))
+    return out
+
+
+def parse_markdown_table(text: str, start: int, end: int, index: int = 0) -> Optional[TableFrame]:
+    """解析 [start, end) 内的 markdown 管道表格，单元格偏移对应原文。"""
+    lines: List[Tuple[int, str]] = []
+    pos = start
+    for raw in text[start:end].split("\n"):
+        lines.append((pos, raw))
+        pos += len(raw) + 1
+    rows: List[List[Tuple[str, int, int]]] = []
+    spans: List[Tuple[int, int]] = []
+    header_idx = None
+    for off, raw in lines:
+        if not raw.strip():
+            continue
+        if _MD_SEP_RE.match(raw):
+            header_idx = len(rows)
+            continue
+        # 逐格记录偏移；首尾的 | 不产生空格
+        cells = []
+        p = 0
+        parts = raw.split("|") if "|" in raw else raw.split("\t")
+        for k, part in enumerate(parts):
+            if (k == 0 or k == len(parts) - 1) and not part.strip() and len(parts) > 1:
+                p += len(part) + 1
+                continue
+            lead = len(part) - len(part.lstrip())
+            cells.append((part.strip(), off + p + lead, off + p + lead + len(part.strip())))
+            p += len(part) + 1
+        rows.append(cells)
+        spans.append((off, off + len(raw)))
+    if len(rows) < 2:
+        return None
+    n_header = header_idx if header_idx else 1
+    width = max(len(r) for r in rows)
+    headers = _merge_headers([[c[0] for c in r] for r in rows[:n_header]], width)
+    frame = TableFrame(index=index, kind="markdown", start=start, end=end)
+    for h in headers:
+        name, unit = _split_header(h)
+        frame.headers.append(name)
+        frame.header_units.append(unit)
+    for r, span in zip(rows[n_header:], spans[n_header:]):
+        row = []
+        for raw, s, e in r:
+            c = parse_cell(raw)
+            c.start, c.end = s, e
+            row.append(c)
+        row += [Cell(raw="", kind="empty") for _ in range(width - len(row))]
+        frame.rows.append(row)
+        frame.row_spans.append(span)
+    return frame if frame.rows else None
+
+
+def parse_html_table(text: str, start: int, end: int, index: int = 0) -> Optional[TableFrame]:
+    """解析 [start, end) 内的 HTML 表格，展开 rowspan/colspan。"""
+    chunk = text[start:end]
+    grid: List[List[Optional[Tuple[str, int, int, bool]]]] = []
+    spans: List[Tuple[int, int]] = []
+    carry: Dict[int, Tuple[Tuple[str, int, int, bool], int]] = {}  # 列 -> (格, 剩余行数)
+    for tr in _TR_RE.finditer(chunk):
+        row: List[Optional[Tuple[str, int, int, bool]]] = []
+        col = 0
+
+        def _fill_carry():
+            nonlocal col
+            while col in carry:
+                cell, left = carry[col]
+                row.append(cell)
+                if left <= 1:
+                    del carry[col]
+                else:
+                    carry[col] = (cell, left - 1)
+                col += 1
+
+        for td in _TD_RE.finditer(tr.group(1)):
+            _fill_carry()
+            attrs = dict((k.lower(), int(v)) for k, v in _SPAN_RE.findall(td.group(2)))
+            s = start + tr.start(1) + td.start(3)
+            cell = (td.group(3), s, s + len(td.group(3)), td.group(1).lower() == "th")
+            for _ in range(max(1, attrs.get("colspan", 1))):
+                row.append(cell)
+                if attrs.get("rowspan", 1) > 1:
+                    carry[col] = (cell, attrs["rowspan"] - 1)
+                col += 1
+        _fill_carry()
+        if row:
+            grid.append(row)
+            spans.append((start + tr.start(), start + tr.end()))
+    if len(grid) < 2:
+        return None
+    width = max(len(r) for r in grid)
+    # 表头：全 th 的行；没有 th 时取首行，首行含合并格且次行非数值时连同次行
+    n_header = 0
+    while n_header < len(grid) - 1 and all(c is None or c[3] for c in grid[n_header]):
+        n_header += 1
+    if n_header == 0:
+        n_header = 1
+        first, second = grid[0], grid[1]
+        merged = len({id(c) for c in first}) < len(first)
+        if merged and len(grid) > 2 and not any(parse_cell(c[0]).is_numeric for c in second if c):
+            n_header = 2
+    headers = _merge_headers([[c[0] if c else "" for c in r] for r in grid[:n_header]], width)
+    frame = TableFrame(index=index, kind="html", start=start, end=end)
+    for h in headers:
+        name, unit = _split_header(h)
+        frame.headers.append(name)
+        frame.header_units.append(unit)
+    for r, span in zip(grid[n_header:], spans[n_header:]):
+        row = []
+        for c in r:
+            if c is None:
+                row.append(Cell(raw="", kind="empty"))
+                continue
+            cell = parse_cell(c[0])
+            cell.start, cell.end = c[1], c[2]
+            row.append(cell)
+        row += [Cell(raw="", kind="empty") for _ in range(width - len(row))]
+        frame.rows.append(row)
+        frame.row_spans.append(span)
+    return frame if frame.rows else None
+
+
+def parse_tables(text: str, structure: Optional[PaperStructure] = None) -> List[TableFrame]:
+    """解析全文所有表格；表格位置取自结构索引（不匹配时现场构建）。"""
+    if structure is None or structure.char_count != len(text or ""):
+        structure = build_structure(text or "")
+    frames: List[TableFrame] = []
+    for t in structure.tables:
+        parser = parse_html_table if t.kind == "html" else parse_markdown_table
+        frame = parser(text, t.start, t.end, index=len(frames) + 1)
+        if frame is None:
+            continue
+        # 表题：表格前最近的 table 类标题（相距 600 字符以内）
+        best = None
+        for c in structure.captions:
+            if c.kind == "table" and c.end <= t.start and t.start - c.end <= 600:
+                best = c
+        if best is not None:
+            frame.caption = best.text
+        frames.append(frame)
+    return frames
+
+
+# ----------------------------------------------------------------------
+# 列 → 字段映射
+# ----------------------------------------------------------------------
+def _tokens(s: str) -> set:
+    s = (s or "").lower().replace("_", " ")
+    out = set()
+    for t in re.findall(r"[a-z]+|[一-鿿]+|μ", s):
+        if t in _STOPWORDS:
+            continue
+        if len(t) > 3 and t.endswith("s"):
+            t = t[:-1]
+        out.add(t)
+    return out
+
+
+def _norm_unit(u: Optional[str]) -> str:
+    if not u:
+        return ""
+    u = u.lower().replace(" ", "").replace("·", "").replace("^", "").replace("−", "-")
+    return u.replace("mm3", "mm³").replace("m3", "m³").replace("²", "2")
+
+
+@dataclass
+class ColumnMatch:
+    column: int
+    field: str
+    score: float
+
+
+def _score(header: str, header_unit: Optional[str], f) -> float:
+    h = _tokens(header)
+    for t in list(h) + [header.strip().lower()]:
+        if t in _ABBREVIATIONS:
+            h.discard(t)
+            h |= _tokens(_ABBREVIATIONS[t])
+    if not h:
+        return 0.0
+    name_tokens = _tokens(f.name)
+    desc_tokens = _tokens(f"{f.description} {f.extraction_hint}")
+    jaccard = len(h & name_tokens) / max(1, len(h | name_tokens))
+    cover = len(h & (name_tokens | desc_tokens)) / len(h)
+    seq = SequenceMatcher(None, normalize_field_name(header), f.normalized_key()).ratio()
+    score = max(seq, 0.5 * jaccard + 0.5 * cover)
+    hu, fu = _norm_unit(header_unit), _norm_unit(f.unit)
+    if hu and fu:
+        score = min(1.0, score + 0.15) if hu == fu else score * 0.5
+    return round(score, 3)
+
+
+def map_columns(frame: TableFrame, fields: Iterable[Any], min_score: float = 0.45) -> List[ColumnMatch]:
+    """按名称/单位/描述相似度把列映射到字段；一列至多一个字段，一个字段至多一列。"""
+    fields = list(fields)
+    label = frame.label_column()
+    cands: List[ColumnMatch] = []
+    for j, header in enumerate(frame.headers):
+        numeric = frame.numeric_ratio(j) >= 0.6
+        for f in fields:
+            if f.type == "number" and not numeric:
+                continue
+            if f.type in ("boolean", "list"):
+                continue
+            if f.type != "number" and numeric and j != label:
+                continue
+            s = _score(header, frame.header_units[j] if j < len(frame.header_units) else None, f)
+            if s >= min_score:
+                cands.append(ColumnMatch(column=j, field=f.name, score=s))
+    cands.sort(key=lambda m: -m.score)
+    used_cols, used_fields, out = set(), set(), []
+    for m in cands:
+        if m.column in used_cols or m.field in used_fields:
+            continue
+        used_cols.add(m.column)
+        used_fields.add(m.field)
+        out.append(m)
+    return sorted(out, key=lambda m: m.column)
+
+
+# ----------------------------------------------------------------------
+# 预填候选
+# ----------------------------------------------------------------------
+@dataclass
+class PrefillRow:
+    table: int
+    label: str
+    cells: Dict[str, Dict[str, Any]]   # 字段 -> {"value", "evidence", "confidence"}
+
+
+@dataclass
+class TablePrefill:
+    frames: List[TableFrame] = field(default_factory=list)
+    matches: Dict[int, List[ColumnMatch]] = field(default_factory=dict)   # 表序号 -> 列映射
+    rows: List[PrefillRow] = field(default_factory=list)
+    min_confidence: float = 0.75
+
+    @property
+    def mapped_columns(self) -> int:
+        return sum(len(v) for v in self.matches.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tables": len(self.frames),
+            "mapped_columns": self.mapped_columns,
+            "candidate_cells": sum(len(r.cells) for r in self.rows),
+            "high_confidence_cells": sum(
+                1 for r in self.rows for c in r.cells.values() if c["confidence"] >= self.min_confidence
+            ),
+        }
+
+
+def _evidence(text: str, label_cell: Optional[Cell], cell: Cell, row_span: Tuple[int, int],
+              max_chars: int) -> str:
+    """原文确切片段：行首（含行标签）到值所在格结束；过长时只取值所在格及其前一段。"""
+    if cell is label_cell:
+        return text[cell.start:cell.end].strip()
+    s = label_cell.start if label_cell is not None and 0 <= label_cell.start < cell.start else row_span[0]
+    e = cell.end if cell.end > 0 else row_span[1]
+    if e - s > max_chars:
+        s = max(row_span[0], e - max_chars)
+    return text[s:e].strip()
+
+
+def _cell_value(cell: Cell, ftype: str) -> Any:
+    if ftype != "number":
+        return cell.raw
+    if cell.kind == "range":
+        return cell.raw
+    v = cell.value
+    return int(v) if v is not None and float(v).is_integer() and "." not in cell.raw else v
+
+
+def build_table_prefill(text: str, schema, structure: Optional[PaperStructure] = None,
+                        min_confidence: float = 0.75, evidence_max_chars: int = 240) -> TablePrefill:
+    """解析全文表格并生成逐行预填候选。"""
+    prefill = TablePrefill(min_confidence=min_confidence)
+    ftypes = {f.name: f.type for f in schema.fields}
+    for frame in parse_tables(text, structure=structure):
+        matches = map_columns(frame, schema.fields)
+        if not matches:
+            continue
+        prefill.frames.append(frame)
+        prefill.matches[frame.index] = matches
+        label_col = frame.label_column()
+        for row, span in zip(frame.rows, frame.row_spans):
+            label_cell = row[label_col] if label_col is not None and label_col < len(row) else None
+            cells: Dict[str, Dict[str, Any]] = {}
+            for m in matches:
+                if m.column >= len(row):
+                    continue
+                cell = row[m.column]
+                if cell.kind == "empty" or cell.start < 0:
+                    continue
+                cells[m.field] = {
+                    "value": _cell_value(cell, ftypes.get(m.field, "string")),
+                    "evidence": _evidence(text, label_cell, cell, span, evidence_max_chars),
+                    "confidence": m.score,
+                }
+            # 只有行标签本身命中字段的行没有增量信息
+            if any(m.column != label_col and m.field in cells for m in matches):
+                label = label_cell.raw if label_cell is not None else ""
+                prefill.rows.append(PrefillRow(table=frame.index, label=label, cells=cells))
+    return prefill
+
+
+def render_prefill_block(prefill: TablePrefill, max_chars: int = 6000, omit_high: bool = False) -> str:
+    """渲染给 extractor 的候选提示块；★ 为高置信映射。"""
+    if not prefill.rows:
+        return ""
+    lines = ["【表格预解析候选】（系统从原文表格确定性解析，★=高置信列映射；值与 evidence 可直接采用）"]
+    if omit_high:
+        lines.append("★ 字段在对应记录中可输出 null，系统会按行标签自动回填该值与 evidence。")
+    for frame in prefill.frames:
+        matches = prefill.matches.get(frame.index) or []
+        mapping = "; ".join(
+            f"{frame.headers[m.column]!s}→{m.field}{' ★' if m.score >= prefill.min_confidence else ''}"
+            for m in matches
+        )
+        lines.append(f"T{frame.index} {frame.caption or '(无表题)'}\n  列映射: {mapping}")
+        for r in (x for x in prefill.rows if x.table == frame.index):
+            vals = "; ".join(f"{k}={c['value']}" for k, c in r.cells.items())
+            lines.append(f"  - {r.label or '(无行标签)'}: {vals}")
+    out = "\n".join(lines)
+    if len(out) > max_chars:
+        out = out[:max_chars].rsplit("\n", 1)[0] + "\n  ...（候选过多已截断）"
+    return out
+
+
+def _cell_is_empty(cell: Any) -> bool:
+    if cell is None:
+        return True
+    if isinstance(cell, dict):
+        v = cell.get("value")
+        return v is None or (isinstance(v, str) and v.strip().lower() in ("", "null", "n/a", "none"))
+    return False
+
+
+def _norm_label(s: str) -> str:
+    return re.sub(r"[^a-z0-9一-鿿]+", "", (s or "").lower())
+
+
+_LABEL_TOKEN_RE = re.compile(r"[a-z0-9]+|[一-鿿]")
+MIN_LABEL_CHARS = 3          # 更短的行标签（PE、Ti）极易误配，不据此回填
+MAX_LABEL_VALUE_TOKENS = 6   # 只在短字符串值（材料名、样品编号等标识字段）里找行标签
+
+
+def _label_tokens(s: str) -> Tuple[str, ...]:
+    return tuple(_LABEL_TOKEN_RE.findall((s or "").lower()))
+
+
+def _has_token_run(tokens: Tuple[str, ...], run: Tuple[str, ...]) -> bool:
+    n = len(run)
+    return any(tokens[i:i + n] == run for i in range(len(tokens) - n + 1))
+
+
+def apply_prefill(records: List[Any], prefill: TablePrefill) -> int:
+    """按行标签把高置信候选回填到记录中 value 为 null 的字段，返回回填的单元格数。
+
+    行与记录的对齐：优先找某个字符串值归一化后与行标签完全相同的记录，其次找短字符串值
+    （标识字段）中以完整词出现行标签的记录——「PE」不匹配「PEEK」「UHMWPE」；
+    行标签归一化后不足 3 字符时不回填。无行标签、表格仅一行且只有一条记录时直接对齐。
+    不新增记录、不覆盖模型已给出的值。
+    """
+    if not prefill.rows or not records:
+        return 0
+    high_rows = []
+    for r in prefill.rows:
+        cells = {k: c for k, c in r.cells.items() if c["confidence"] >= prefill.min_confidence}
+        if cells:
+            high_rows.append((r, cells))
+    if not high_rows:
+        return 0
+
+    dict_records = [rec for rec in records if isinstance(rec, dict)]
+    rec_keys = [{normalize_field_name(k): k for k in rec} for rec in dict_records]
+    rec_exact, rec_tokens = [], []
+    for rec in dict_records:
+        exact, tokens = set(), []
+        for cell in rec.values():
+            v = cell.get("value") if isinstance(cell, dict) else cell
+            if not isinstance(v, str):
+                continue
+            exact.add(_norm_label(v))
+            toks = _label_tokens(v)
+            if toks and len(toks) <= MAX_LABEL_VALUE_TOKENS:
+                tokens.append(toks)
+        rec_exact.append(exact)
+        rec_tokens.append(tokens)
+
+    per_table = {}
+    for r, _ in high_rows:
+        per_table[r.table] = per_table.get(r.table, 0) + 1
+
+    filled = 0
+    for r, cells in high_rows:
+        label = _norm_label(r.label)
+        targets = []
+        if len(label) >= MIN_LABEL_CHARS:
+            targets = [i for i, exact in enumerate(rec_exact) if label in exact]
+            if not targets:
+                run = _label_tokens(r.label)
+                targets = [i for i, values in enumerate(rec_tokens)
+                           if any(_has_token_run(t, run) for t in values)]
+        elif not label and per_table[r.table] == 1 and len(dict_records) == 1:
+            targets = [0]
+        if len(targets) != 1:
+            continue  # 对不齐或有歧义时不动
+        rec, keys = dict_records[targets[0]], rec_keys[targets[0]]
+        for fname, c in cells.items():
+            key = keys.get(normalize_field_name(fname), fname)
+            if _cell_is_empty(rec.get(key)):
+                rec[key] = {"value": c["value"], "evidence": c["evidence"]}
+                filled += 1
+    return filled
@@ -1,6 +1,6 @@
 import time
 
-from webapp.jobs import JobManager
+from webapp.jobs import Job, JobHandle, JobManager, StageHandle
 
 
 def test_submit_reuses_active_job_by_fingerprint():
@@ -19,3 +19,16 @@ def test_submit_reuses_active_job_by_fingerprint():
     time.sleep(0.15)
     third = jm.submit("x", "same", slow, fingerprint="same-work")
     assert third.id != first.id
+
+
+def test_stage_handles_roll_up_into_parent_job():
+    job = Job("ingest", "t")
+    h = JobHandle(job)
+    StageHandle(h, "parse", "解析").set_progress(3, 3)
+    extract = StageHandle(h, "extract", "提取")
+    extract.set_progress(1, 3)
+    extract.set_meta(ok=1)
+    extract.log("hi")
+    assert (job.done, job.total) == (4, 6)
+    assert job.meta["stages"]["extract"] == {"done": 1, "total": 3, "ok": 1}
+    assert job.logs[-1].endswith("[提取] hi")
@@ -0,0 +1,345 @@
+"""
+PDF 上传/解析链路（src/pdfs）的确定性单元测试（不访问真实 MinerU）。
+运行: python -m pytest tests/test_pdfs.py -q
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def test_file_hash_cache_skips_unchanged_pdfs(tmp_path):
+    import hashlib
+    import os
+    from src.pdfs.file_hash import hash_files
+
+    a, b = tmp_path / "a.pdf", tmp_path / "b.pdf"
+    a.write_bytes(b"%PDF-a" * 300000)
+    b.write_bytes(b"%PDF-b")
+    db = tmp_path / "pdf_state.db"
+    stats = {}
+    first = hash_files([a, b, tmp_path / "missing.pdf"], db, stats=stats)
+    assert first == {a: hashlib.md5(a.read_bytes()).hexdigest(), b: hashlib.md5(b"%PDF-b").hexdigest()}
+    assert stats == {"hits": 0, "misses": 2}
+
+    stats = {}
+    assert hash_files([a, b], db, stats=stats) == first and stats == {"hits": 2, "misses": 0}
+    # 内容变化（大小 / mtime 变化）只重算该文件
+    b.write_bytes(b"%PDF-b2")
+    os.utime(b, ns=(b.stat().st_atime_ns, b.stat().st_mtime_ns + 10**9))
+    stats = {}
+    again = hash_files([a, b], db, stats=stats)
+    assert stats == {"hits": 1, "misses": 1} and again[b] == hashlib.md5(b"%PDF-b2").hexdigest()
+
+
+def test_upload_token_bucket_caps_aggregate_bandwidth(tmp_path):
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from src.pdfs.transfer import ThrottledFile, TokenBucket, pooled_session
+
+    got = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_PUT(self):
+            got[self.path] = self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        files = []
+        for i in range(3):
+            f = tmp_path / f"{i}.pdf"
+            f.write_bytes(bytes([i]) * 60_000)
+            files.append(f)
+        bucket = TokenBucket(200_000, burst=20_000)     # 三个文件共 180 KB，合计 200 KB/s
+        session = pooled_session(3)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def put(f):
+            with ThrottledFile(f, bucket) as body:
+                assert session.put(f"{base}/{f.name}", data=body, timeout=10).status_code == 200
+
+        t0 = time.monotonic()
+        threads = [threading.Thread(target=put, args=(f,)) for f in files]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - t0
+        assert {k: len(v) for k, v in got.items()} == {f"/{i}.pdf": 60_000 for i in range(3)}
+        assert 0.7 <= elapsed < 3.0
+        assert TokenBucket.from_mbps(0).unlimited
+    finally:
+        server.shutdown()
+
+
+def test_upload_streams_file_once_and_records_hash(tmp_path):
+    import hashlib
+    import sqlite3
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import settings
+    from src.pdfs.file_hash import hash_files
+    from src.pdfs.pdf_processor import PDFProcessor
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            files = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["files"]
+            port = self.server.server_address[1]
+            body = json.dumps({"code": 0, "data": {"batch_id": "B1", "file_urls": [
+                f"http://127.0.0.1:{port}/put/{i}" for i in range(len(files))]}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_PUT(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        pdfs = []
+        for i in range(2):
+            f = tmp_path / f"p{i}.pdf"
+            f.write_bytes(bytes([i + 1]) * 50_000)
+            pdfs.append(f)
+        db = tmp_path / "pdf_state.db"
+        proc = PDFProcessor(db)
+        proc.api_base = f"http://127.0.0.1:{server.server_address[1]}"
+        conn = sqlite3.connect(db)
+        # 登记时缓存未命中：hash 先记空串（_register_pdfs 不再为此读文件）；p1 记了过期 hash
+        conn.executemany("INSERT INTO pdf_files (filename, file_hash, file_size) VALUES (?, ?, ?)",
+                         [(settings.logical_pdf_name(pdfs[0]), "", 50_000),
+                          (settings.logical_pdf_name(pdfs[1]), "stale", 50_000)])
+        conn.commit()
+        assert proc.upload_batch(pdfs) == "B1"
+        rows = dict(conn.execute("SELECT filename, file_hash FROM pdf_files WHERE status = 'uploaded'"))
+        conn.close()
+        expected = {settings.logical_pdf_name(f): hashlib.md5(f.read_bytes()).hexdigest() for f in pdfs}
+        assert rows == expected
+        stats = {}
+        cached = hash_files(pdfs, db, stats=stats, compute=False)
+        assert stats == {"hits": 2, "misses": 0} and set(cached.values()) == set(expected.values())
+        # 文件在上传完成后被移走：批次已提交，仍按成功返回
+        gone = tmp_path / "gone.pdf"
+        gone.write_bytes(b"g" * 1000)
+        real_upload = proc._upload_one
+
+        def upload_then_remove(pdf, url):
+            out = real_upload(pdf, url)
+            pdf.unlink()
+            return out
+
+        proc._upload_one = upload_then_remove
+        assert proc.upload_batch([gone]) == "B1" and not gone.exists()
+    finally:
+        server.shutdown()
+
+
+def test_scan_backfills_hash_of_rows_left_by_failed_upload(tmp_path):
+    import hashlib
+    import sqlite3
+    import settings
+    from src.pdfs.pdf_processor import PDFProcessor
+
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    left, fresh, dup = pdf_dir / "left.pdf", pdf_dir / "fresh.pdf", pdf_dir / "dup.pdf"
+    left.write_bytes(b"L" * 4096)
+    fresh.write_bytes(b"F" * 4096)
+    dup.write_bytes(b"L" * 4096)
+    db = tmp_path / "pdf_state.db"
+    proc = PDFProcessor(db)
+    conn = sqlite3.connect(db)
+    # 网页端登记时缓存未命中记了空串，随后上传失败：行停在 pending
+    conn.execute("INSERT INTO pdf_files (filename, file_hash, file_size) VALUES (?, '', 4096)",
+                 (settings.logical_pdf_name(left),))
+    conn.commit()
+    new = proc.scan_new_pdfs(pdf_dir)
+    assert new == [fresh]
+    rows = dict(conn.execute("SELECT filename, file_hash FROM pdf_files"))
+    conn.close()
+    assert rows == {settings.logical_pdf_name(left): hashlib.md5(left.read_bytes()).hexdigest(),
+                    settings.logical_pdf_name(fresh): hashlib.md5(fresh.read_bytes()).hexdigest()}
+    assert proc.scan_new_pdfs(pdf_dir) == []
+
+
+def test_parse_pipeline_downloads_each_file_as_soon_as_done(tmp_path):
+    import sqlite3
+    from src.pdfs.parse_pipeline import ParsePipeline
+    from src.pdfs.pdf_processor import PDFProcessor
+
+    proc = PDFProcessor(tmp_path / "pdf_state.db")
+    conn = sqlite3.connect(proc.db_path)
+    conn.executemany("INSERT INTO batches (batch_id, file_count) VALUES (?, ?)", [("fast", 1), ("slow", 2)])
+    conn.executemany("INSERT INTO pdf_files (filename, file_hash) VALUES (?, '')", [("c/s2.pdf",)])
+    conn.commit()
+    conn.close()
+
+    polls = {"fast": 0, "slow": 0}
+    events = []
+
+    def item(data_id, state):
+        return {"data_id": data_id, "file_name": f"c/{data_id}.pdf", "state": state,
+                "full_zip_url": f"http://x/{data_id}.zip" if state == "done" else ""}
+
+    def check_batch_status(bid, verbose=True):
+        polls[bid] += 1
+        n = polls[bid]
+        if bid == "fast":
+            results = [item("f1", "done")]
+        else:
+            results = [item("s1", "done" if n >= 3 else "processing"),
+                       item("s2", "failed" if n >= 2 else "processing")]
+        events.append(("poll", bid, n))
+        done = sum(r["state"] == "done" for r in results)
+        failed = sum(r["state"] == "failed" for r in results)
+        return {"batch_id": bid, "total": len(results), "done": done, "failed": failed,
+                "processing": len(results) - done - failed, "results": results}
+
+    def download(it):
+        events.append(("download", it["data_id"]))
+        return {"success": True}
+
+    proc.check_batch_status = check_batch_status
+    proc._download_single_file = download
+    pipeline = ParsePipeline(proc, tmp_path / "parsed", poll_interval=0.1, max_wait_min=1, log=lambda m: None)
+    prog = pipeline.run(["fast", "slow"])
+
+    # fast 批次的文件在 slow 批次第一次轮询之后、完成之前就已下载；终态批次不再轮询
+    assert events.index(("download", "f1")) < events.index(("poll", "slow", 3))
+    assert polls["fast"] == 1 and polls["slow"] == 3
+    assert prog.downloaded == 2 and prog.failed == 1 and prog.done == 2 and not prog.timed_out
+    assert prog.first_parsed_s is not None
+    conn = sqlite3.connect(proc.db_path)
+    assert dict(conn.execute("SELECT batch_id, status FROM batches")) == {"fast": "completed", "slow": "partial"}
+    assert conn.execute("SELECT status FROM pdf_files WHERE filename = 'c/s2.pdf'").fetchone()[0] == "failed"
+    conn.close()
+
+
+def test_ingest_feed_applies_backpressure_between_parse_and_extract(tmp_path):
+    import threading
+    import time
+    from src.pdfs.parse_pipeline import PaperFeed, ParsePipeline
+    from src.pdfs.pdf_processor import PDFProcessor
+
+    proc = PDFProcessor(tmp_path / "pdf_state.db")
+    downloads = []
+    started = threading.Event()
+    proc.check_batch_status = lambda bid, verbose=True: {
+        "batch_id": bid, "total": 3, "done": 3, "failed": 0, "processing": 0,
+        "results": [{"data_id": f"d{i}", "file_name": f"p{i}.pdf", "state": "done",
+                     "full_zip_url": f"http://x/{i}.zip"} for i in range(3)]}
+
+    def download(it):
+        downloads.append(it["data_id"])
+        started.set()
+        return {"success": True, "output_path": str(tmp_path / "parsed" / f"paper{it['data_id'][1:]}")}
+
+    proc._download_single_file = download
+    feed = PaperFeed(maxsize=1, expected=3)
+    pipeline = ParsePipeline(proc, tmp_path / "parsed", poll_interval=0.1, max_wait_min=1, download_workers=1,
+                             log=lambda m: None, on_parsed=feed.put, backpressure=feed.saturated)
+    runner = threading.Thread(target=pipeline.run, args=(["B"],))
+    runner.start()
+    assert started.wait(10)
+    deadline = time.monotonic() + 10
+    while len(feed) < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(feed) == 1
+    # 下游未取走第一篇：积压已满，再等几个轮询周期也不开启新的下载
+    time.sleep(0.3)
+    assert downloads == ["d0"] and len(feed) == 1
+    taken = []
+    deadline = time.monotonic() + 10
+    while len(taken) < 3 and time.monotonic() < deadline:
+        feed.wait(2.0)
+        pid = feed.get_nowait()
+        if pid:
+            taken.append(pid)
+    runner.join(10)
+    assert taken == ["paper0", "paper1", "paper2"] and feed.delivered == 3
+
+
+def test_mineru_zip_streams_with_range_resume_and_extracts_images_lazily(tmp_path):
+    import io
+    import zipfile
+    import pytest
+    from src.pdfs.mineru_archive import ARCHIVE_NAME, download_to_spool, extract_member, extract_selected
+
+    raw = io.BytesIO()
+    with zipfile.ZipFile(raw, "w") as zf:
+        zf.writestr("full.md", "# Title\n\n![](images/a.jpg)\nText.\n")
+        zf.writestr("paper_content_list.json", "[]")
+        zf.writestr("images/a.jpg", b"\xff\xd8jpeg" * 100)
+    payload = raw.getvalue()
+    requests_seen = []
+
+    class Resp:
+        def __init__(self, status, body, headers, fail_after=None):
+            self.status_code, self.body, self.headers, self.fail_after = status, body, headers, fail_after
+
+        def iter_content(self, chunk_size):
+            for i in range(0, len(self.body), 64):
+                if self.fail_after is not None and i >= self.fail_after:
+                    raise ConnectionError("reset")
+                yield self.body[i:i + 64]
+
+        def close(self):
+            pass
+
+    class Session:
+        def get(self, url, timeout=None, stream=False, headers=None):
+            rng = (headers or {}).get("Range")
+            requests_seen.append(rng)
+            if rng is None:   # 首次请求读到一半断开
+                return Resp(200, payload, {"Content-Length": str(len(payload))}, fail_after=128)
+            start = int(rng.split("=")[1].rstrip("-"))
+            return Resp(206, payload[start:], {
+                "Content-Range": f"bytes {start}-{len(payload) - 1}/{len(payload)}",
+                "Content-Length": str(len(payload) - start)})
+
+    stats = {}
+    spool = download_to_spool("http://x/r.zip", session=Session(), retry=1, stats=stats)
+    assert spool is not None and requests_seen == [None, "bytes=128-"] and stats["resumed"] == 1
+    paper = tmp_path / "paper"
+    with spool:
+        assert spool.read() == payload
+        assert extract_selected(spool, paper, eager_all=False) == {"extracted": 2, "archived": 1}
+    assert (paper / "full.md").exists() and (paper / "paper_content_list.json").exists()
+    assert not (paper / "images").exists() and (paper / ARCHIVE_NAME).exists()
+    # 界面请求时才解出图片
+    img = extract_member(paper, "images/a.jpg")
+    assert img.read_bytes() == b"\xff\xd8jpeg" * 100
+    with pytest.raises(FileNotFoundError):
+        extract_member(paper, "images/missing.jpg")
+    with pytest.raises(ValueError):
+        extract_member(paper, "../outside.txt")
+
+    bad = io.BytesIO()
+    with zipfile.ZipFile(bad, "w") as zf:
+        zf.writestr("full.md", "x")
+        zf.writestr("../evil.md", "x")
+    with pytest.raises(ValueError):
+        extract_selected(bad, tmp_path / "bad", eager_all=False)
+    assert not (tmp_path / "bad" / "full.md").exists() and not (tmp_path / "evil.md").exists()
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -9,9 +9,12 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.llm.base import LLMClient, LLMConfig, LLMResponse
+from src.llm.tokens import TokenEstimator, learned_per_record, observe_output
 from src.schema.models import GeneratedSchema, SchemaField, validate_schema
 from src.schema.discovery import SchemaDiscovery
-from src.schema.sampling import build_excerpt
+from src.schema.sampling import build_excerpt, collect_figures
+from src.schema.structure import build_structure, load_structure
+from src.schema.minimize import minimize_text
 from src.prompts.modes.flat_mode import GenericFlatMode, MultiAgentFlatMode
 
 
@@ -23,12 +26,14 @@ class FakeLLM(LLMClient):
         super().__init__(cfg)
         self.responses = responses
         self.calls = []
+        self.call_kwargs = []
 
     def _do_call(self, messages, **kwargs):
         return LLMResponse(success=True, content="{}")
 
     def call(self, messages, call_id="unknown", **kwargs):
         self.calls.append(call_id)
+        self.call_kwargs.append(kwargs)
         for prefix, payload in self.responses.items():
             if call_id.startswith(prefix):
                 content = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
@@ -44,6 +49,116 @@ def test_build_excerpt_budget():
     assert build_excerpt(short, 5000) == short
 
 
+_PAPER_MD = (
+    "# Wear of UHMWPE\n\n## Abstract\nWe test liners.\n\n"
+    "## 2 Methods\nPin-on-disc.\n\nTable 1. Wear rates\n| a | b |\n|---|---|\n| 1 | 2 |\n\n"
+    "![](img.jpg) Fig. 2 SEM of worn surface\n\n"
+    "## References\n[1] Foo et al.\n[2] Bar et al.\n"
+)
+
+
+def test_build_structure_index():
+    st = build_structure(_PAPER_MD)
+    assert [h.text for h in st.headings][:3] == ["Wear of UHMWPE", "Abstract", "2 Methods"]
+    assert len(st.tables) == 1 and st.tables[0].rows == 2
+    assert [c.kind for c in st.captions] == ["table", "figure"]
+    s, e = st.references
+    assert _PAPER_MD[s:].startswith("## References") and e == len(_PAPER_MD)
+    assert "Foo" not in st.without_references(_PAPER_MD)
+    assert collect_figures(_PAPER_MD, structure=st) == collect_figures(_PAPER_MD)
+
+
+def test_structure_sidecar_invalidated_by_content(tmp_path):
+    (tmp_path / "full.md").write_text(_PAPER_MD, encoding="utf-8")
+    first = load_structure(tmp_path)
+    assert (tmp_path / "structure.json").exists()
+    assert load_structure(tmp_path).content_hash == first.content_hash
+    (tmp_path / "full.md").write_text("# Other\nbody\n", encoding="utf-8")
+    second = load_structure(tmp_path)
+    assert second.content_hash != first.content_hash and second.references is None
+
+
+def test_structure_prefers_content_list(tmp_path):
+    md = (
+        "# Wear of UHMWPE\n\nWe test liners.\n\n"
+        "Table 1 Wear rates\n\n<table><tr><td>a</td></tr><tr><td>1</td></tr></table>\n\n"
+        "# References\n\n[1] Foo et al.\n\n[2] Bar et al.\n\n# Appendix A\n\nextra\n"
+    )
+    blocks = [
+        {"type": "text", "text": "Wear of UHMWPE", "text_level": 1, "page_idx": 0},
+        {"type": "text", "text": "We test liners.", "page_idx": 0},
+        {"type": "table", "table_caption": ["Table 1 Wear rates"],
+         "table_body": "<table><tr><td>a</td></tr><tr><td>1</td></tr></table>", "page_idx": 1},
+        {"type": "text", "text": "References", "text_level": 1, "page_idx": 2},
+        {"type": "ref_text", "text": "[1] Foo et al.", "page_idx": 2},
+        {"type": "ref_text", "text": "[2] Bar et al.", "page_idx": 2},
+        {"type": "text", "text": "Appendix A", "text_level": 1, "page_idx": 3},
+    ]
+    (tmp_path / "full.md").write_text(md, encoding="utf-8")
+    (tmp_path / "x_content_list.json").write_text(json.dumps(blocks), encoding="utf-8")
+    st = load_structure(tmp_path)
+    assert st.source == "content_list" and st.page_count == 4
+    assert [h.text for h in st.headings] == ["Wear of UHMWPE", "References", "Appendix A"]
+    assert st.tables[0].kind == "html" and st.tables[0].rows == 2 and st.tables[0].page == 1
+    assert st.captions[0].kind == "table"
+    s, e = st.references
+    assert md[s:e].startswith("# References") and md[s:e].rstrip().endswith("Bar et al.")
+
+
+def test_minimize_keeps_offset_map():
+    md = (
+        "# Wear\n\nLoad $1 0 0 \\mathrm { ~ N }$ at $3 7 ^ { \\circ } \\mathrm { C }$.\n\n\n\n"
+        "![](images/a.jpg)\nFig. 1 SEM image\n\n# Acknowledgements\nThanks.\n\n# References\n[1] A\n"
+    )
+    m = minimize_text(md)
+    assert "100 N" in m.text and "37°C" in m.text
+    assert "images/a.jpg" not in m.text and "Thanks" not in m.text and "[1] A" not in m.text
+    i = m.text.index("Fig. 1")
+    a, b = m.original_span(i, i + 6)
+    assert md[a:b] == "Fig. 1"
+    j = m.text.index("100 N")
+    a, b = m.original_span(j, j + 5)
+    assert md[a:b].startswith("$1 0 0")
+    assert m.report()["saved_chars"] == len(md) - len(m.text) > 0
+
+
+def test_service_minimize_persists_sidecar_in_paper_dir(tmp_path):
+    from src.extractors.extraction_service import ExtractionService
+    from src.schema.minimize import MINIMIZED_FILENAME
+
+    md = "# Wear\n\n" + "UHMWPE wear rate was 5.2 mm3/Nm.  \n\n\n\n" * 5
+    (tmp_path / "p1").mkdir()
+    (tmp_path / "p1" / "full.md").write_text(md, encoding="utf-8")
+    svc = ExtractionService.__new__(ExtractionService)
+    svc.minimize = True
+    kwargs = {"parsed_dir": tmp_path}
+    m = svc._minimize("p1", md, kwargs)
+    # CLI/脚本直接调用 extract 时也写论文目录下的侧车，parsed_dir 不下传给提取模式
+    assert m.saved_chars > 0 and (tmp_path / "p1" / MINIMIZED_FILENAME).exists()
+    assert "parsed_dir" not in kwargs
+
+
+def test_fit_input_drops_references_from_minimized_text_via_projected_structure(monkeypatch):
+    md = ("# Wear\n\n" + "UHMWPE wear rate was 5.2 mm3/Nm.  \n" * 20
+          + "\n\n\n\n# References\n" + "[1] Foo et al. Wear 2001.\n" * 30)
+    st = build_structure(md)
+    m = minimize_text(md, structure=st, rules=("whitespace",))
+    assert m.saved_chars > 0 and len(m.text) != st.char_count
+    projected = m.project_structure(st)
+    s, e = projected.references
+    assert m.text[s:e].startswith("# References") and projected.char_count == len(m.text)
+
+    schema = GeneratedSchema(domain="d", description="x", fields=[SchemaField(name="wear_rate", type="number")])
+    mode = GenericFlatMode(FakeLLM({}), schema)
+    limit = len(m.text) - 10
+    monkeypatch.setattr(GenericFlatMode, "_input_limits", staticmethod(lambda: (limit, 0)))
+    for kwargs in ({"structure": st, "content_structure": projected}, {"structure": st}):
+        out, info = mode._fit_input("p", m.text, kwargs)
+        # 按结构去掉参考文献即可满足上限，不再盲截断
+        assert info["references_dropped"] and not info["input_truncated"]
+        assert "[1] Foo" not in out and out.rstrip().endswith("5.2 mm3/Nm.")
+
+
 def test_validate_schema_field_count():
     schema = GeneratedSchema(domain="d", description="x", fields=[
         SchemaField(name="a"), SchemaField(name="b"),
@@ -206,6 +321,417 @@ def test_flat_extract_scalar_cells():
     assert res.records[0]["material"]["value"] == "Ti6Al4V"
 
 
+def test_flat_extract_table_prefill_backfills_nulls():
+    source = (
+        "Table 2 Wear of liners\n\n"
+        "| Material | Wear rate (mm3/Nm) | COF |\n|---|---|---|\n"
+        "| UHMWPE | 5.2 ± 0.3 | 0.08 |\n| HXLPE | $1 . 2 \\times 1 0 ^ { - 6 }$ | 0.07 |\n"
+    )
+    schema = GeneratedSchema(domain="d", description="x", fields=[
+        SchemaField(name="material", type="string"),
+        SchemaField(name="wear_rate", type="number", unit="mm3/Nm", description="specific wear rate"),
+        SchemaField(name="friction_coefficient", type="number", description="coefficient of friction"),
+    ])
+    llm_out = {"records": [
+        {"material": {"value": "UHMWPE", "evidence": "UHMWPE"}, "wear_rate": {"value": None, "evidence": None}},
+        {"material": {"value": "HXLPE", "evidence": "HXLPE"}, "wear_rate": {"value": 9.9, "evidence": "HXLPE"}},
+    ]}
+    mode = GenericFlatMode(FakeLLM({"flat_extract": llm_out}), schema)
+    res = mode.extract("p1", source)
+    a, b = res.records
+    assert a["wear_rate"]["value"] == 5.2 and a["wear_rate"]["evidence_verified"] is True
+    assert a["friction_coefficient"]["value"] == 0.08
+    assert b["wear_rate"]["value"] == 9.9          # 模型已给出的值不覆盖
+    assert b["friction_coefficient"]["value"] == 0.07
+    assert res.metadata["table_prefill"]["filled_cells"] == 3
+
+
+
+def test_table_prefill_does_not_match_substring_labels():
+    from src.schema.tables import PrefillRow, TablePrefill, apply_prefill
+
+    def row(label, wear):
+        return PrefillRow(table=0, label=label, cells={
+            "wear_rate": {"value": wear, "evidence": f"{label} | {wear}", "confidence": 0.9}})
+
+    prefill = TablePrefill(rows=[row("PE", 5.0), row("Ti", 7.0), row("CoCrMo", 2.0), row("PEEK", 3.1)])
+    records = [
+        {"material": {"value": "UHMWPE"}, "wear_rate": {"value": None}},
+        {"material": {"value": "PEEK-CF30"}, "note": {"value": "tested against a titanium counterface"},
+         "wear_rate": {"value": None}},
+        {"material": {"value": "Titanium"}, "wear_rate": {"value": None}},
+        {"material": {"value": "CoCrMo alloy head"}, "wear_rate": {"value": None}},
+    ]
+    assert apply_prefill(records, prefill) == 2
+    uhmwpe, peek, ti, cocr = records
+    # PE / Ti 太短，不回填；PE 也不会落到 UHMWPE 或 PEEK
+    assert uhmwpe["wear_rate"]["value"] is None and ti["wear_rate"]["value"] is None
+    # PEEK 作为完整词出现在标识字段里
+    assert peek["wear_rate"] == {"value": 3.1, "evidence": "PEEK | 3.1"}
+    assert cocr["wear_rate"]["value"] == 2.0
+    # 只出现在长文本里的词不用于对齐
+    free = [{"material": {"value": "UHMWPE"}, "note": {"value": "compared with PEEK liners of the same design"},
+             "wear_rate": {"value": None}}]
+    assert apply_prefill(free, TablePrefill(rows=[row("PEEK", 3.1)])) == 0
+
+def test_token_estimator_and_output_plan():
+    est = TokenEstimator()
+    en = "The wear rate of UHMWPE was measured under 1 MPa. " * 40
+    zh = "超高分子量聚乙烯的磨损率在一兆帕下测得。" * 40
+    assert 0 < est.count(en) < len(en) / 2          # 英文约 4 字符 1 token
+    assert est.count(zh) > len(zh) / 2              # 中文接近 1 字 1 token
+    trimmed = est.trim_to_tokens(en + zh, 200)
+    assert est.count(trimmed) <= 200 and (en + zh).startswith(trimmed)
+    est.observe(100, 150, model="m")
+    assert est.scale("m") > 1.0                    # 按真实 prompt_tokens 上调
+
+    source = (
+        "Table 2 Wear of liners\n\n"
+        "| Material | Wear rate (mm3/Nm) |\n|---|---|\n"
+        "| UHMWPE | 5.2 |\n| HXLPE | 1.2 |\n"
+    )
+    schema = GeneratedSchema(domain="d", description="x", slug="plan_test", fields=[
+        SchemaField(name="material", type="string"),
+        SchemaField(name="wear_rate", type="number", unit="mm3/Nm"),
+    ])
+    fake = FakeLLM({"flat_extract": {"records": []}})
+    res = GenericFlatMode(fake, schema).extract("p1", source)
+    plan = res.metadata["output_plan"]
+    assert plan["expected_records"] == 2 and not plan["learned"]
+    assert fake.call_kwargs[0]["max_tokens"] == plan["max_tokens"] < 65536
+    observe_output("plan_test", 64 + 2 * 120, 2)
+    assert learned_per_record("plan_test") == 120
+    from src.llm.tokens import output_stats
+    assert output_stats()["plan_test"] == 120
+
+
+def test_flat_extract_compact_and_columnar_formats():
+    source = "The UHMWPE liner showed a wear rate of 5.2 mm3/Nm under 1 MPa contact pressure."
+    schema = GeneratedSchema(domain="d", description="x", fields=[
+        SchemaField(name="material", type="string"),
+        SchemaField(name="wear_rate", type="number", unit="mm3/Nm"),
+        SchemaField(name="missing_field", type="string"),
+    ])
+    compact_out = {"quotes": ["wear rate of 5.2 mm3/Nm"],
+                   "records": [{"f1": ["UHMWPE", "The UHMWPE liner showed"], "f2": [5.2, 0]}]}
+    columnar_out = {"cols": ["f1", "f2"], "quotes": ["The UHMWPE liner showed", "wear rate of 5.2 mm3/Nm"],
+                    "rows": [[["UHMWPE", 0], [5.2, 1]], [["HXLPE", None], None]]}
+    for fmt, out, n in (("compact", compact_out, 1), ("columnar", columnar_out, 2)):
+        fake = FakeLLM({"flat_extract": out})
+        mode = GenericFlatMode(fake, schema, output_format=fmt)
+        assert "f2 = wear_rate" in mode._build_user_prompt("p1", source)
+        res = mode.extract("p1", source)
+        assert res.count == n and res.metadata["output_format"] == fmt
+        rec = res.records[0]
+        assert rec["material"] == {"value": "UHMWPE", "evidence": "The UHMWPE liner showed",
+                                   "evidence_verified": True}
+        assert rec["wear_rate"]["value"] == 5.2 and rec["wear_rate"]["evidence_verified"] is True
+        assert rec["missing_field"] == {"value": None, "evidence": None}
+    assert res.records[1]["material"] == {"value": "HXLPE", "evidence": None}
+    assert res.records[1]["wear_rate"]["value"] is None
+
+
+
+def test_compact_decode_keeps_two_item_list_values():
+    from src.prompts.modes.compact import decode_records
+    schema = GeneratedSchema(domain="d", description="x", fields=[
+        SchemaField(name="materials", type="list"),
+        SchemaField(name="material", type="string"),
+    ])
+    quotes = ["UHMWPE and PEEK liners"]
+    rec = decode_records({"quotes": quotes, "records": [{"f1": ["UHMWPE", "PEEK"], "f2": ["UHMWPE", 0]}]},
+                         schema)[0]
+    # 两项的 list 值不被误读为 [value, evidence]
+    assert rec["materials"] == {"value": ["UHMWPE", "PEEK"], "evidence": None}
+    assert rec["material"] == {"value": "UHMWPE", "evidence": "UHMWPE and PEEK liners"}
+    rec = decode_records({"quotes": quotes, "records": [{"f1": [["UHMWPE", "PEEK"], 0]}]}, schema)[0]
+    assert rec["materials"] == {"value": ["UHMWPE", "PEEK"], "evidence": "UHMWPE and PEEK liners"}
+    rec = decode_records({"cols": ["f1"], "quotes": quotes, "rows": [[["UHMWPE", "PEEK"]]]}, schema)[0]
+    assert rec["materials"]["value"] == ["UHMWPE", "PEEK"]
+
+def test_structured_output_schema_and_fallback(monkeypatch, tmp_path):
+    import settings
+    from types import SimpleNamespace
+    from src.llm import capabilities
+    from src.llm.base import LLMMessage
+    from src.llm.openai_client import OpenAICompatibleClient
+    from src.schema.response_schema import build_response_schema
+
+    schema = GeneratedSchema(domain="d", description="x", fields=[
+        SchemaField(name="material", type="string"),
+        SchemaField(name="wear_rate", type="number", unit="mm3/Nm"),
+        SchemaField(name="lubricant", type="enum", enum_values=["water", "serum"]),
+    ])
+    rs = build_response_schema(schema)
+    rec = rs["schema"]["properties"]["records"]["items"]
+    assert rs["strict"] and rec["required"] == ["material", "wear_rate", "lubricant"]
+    assert rec["properties"]["wear_rate"]["properties"]["value"]["type"] == ["number", "null"]
+    assert rec["properties"]["lubricant"]["properties"]["value"]["enum"] == ["water", "serum", None]
+
+    class Rejected(Exception):
+        status_code = 400
+
+    sent = []
+
+    def create(**kw):
+        sent.append(kw["response_format"]["type"])
+        if kw["response_format"]["type"] == "json_schema":
+            raise Rejected("response_format type json_schema is not supported")
+        msg = SimpleNamespace(content='{"records": []}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg, finish_reason="stop")],
+                               usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15))
+
+    monkeypatch.setattr(settings, "STATE_DIR", tmp_path)
+    monkeypatch.setattr(settings, "LLM_STRUCTURED_OUTPUT", "auto", raising=False)
+    capabilities.reset_cache()
+    client = OpenAICompatibleClient(LLMConfig(model="m", provider="openai", api_key="x", api_base="http://x"))
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    msgs = [LLMMessage(role="user", content="hi")]
+    first = client._do_call(msgs, response_schema=rs)
+    second = client._do_call(msgs, response_schema=rs)
+    assert first.success and not first.structured
+    assert sent == ["json_schema", "json_object", "json_object"]   # 探测一次后不再尝试
+    assert second.success
+    assert (tmp_path / "llm_capabilities.json").is_file()
+    capabilities.reset_cache()
+
+
+def test_tolerant_json_parser_and_record_stream():
+    from src.schema._json import iter_records, parse_json_loose, parse_json_tolerant
+
+    fenced = '说明 {见下}\n```json\n{"records": [{"a": 1,}, {"b": "x\ny",},],}\n```\n完毕'
+    assert parse_json_loose(fenced) == {"records": [{"a": 1}, {"b": "x\ny"}]}
+    value, truncated = parse_json_tolerant('{"records": [{"a": 1}, {"b": 2, "c": 0.1')
+    assert truncated and value == {"records": [{"a": 1}, {"b": 2}]}   # 紧贴结尾的数字可能不完整，丢弃
+    value, truncated = parse_json_tolerant('{"records": [null, false, true, nu')
+    assert truncated and value == {"records": [None, False, True]}    # 只有抵达结尾的字面量算截断
+    text = '{"records": [{"e": "x]}\\"q"}, {"f": [1, 2]}, {"g": '
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+    assert list(iter_records(chunks)) == [{"e": 'x]}"q'}, {"f": [1, 2]}]
+
+
+def test_priority_limiter_prefers_later_stages_and_earlier_papers():
+    import threading
+    import time
+    from src.llm.limiter import PriorityLimiter, llm_context
+
+    lim = PriorityLimiter(1)
+    order = []
+    lim.acquire("extract", 0)                    # 占住唯一槽位
+
+    def _call(stage, paper, seq):
+        with llm_context(stage=stage, paper=paper, seq=seq):
+            with lim.slot():
+                order.append((stage, paper))
+
+    threads = []
+    for stage, paper, seq in (("extract", "p3", 3), ("extract", "p1", 1), ("merge", "p2", 2), ("review", "p3", 3)):
+        t = threading.Thread(target=_call, args=(stage, paper, seq))
+        t.start()
+        threads.append(t)
+        while lim.stats()["waiting"] < len(threads):
+            time.sleep(0.001)
+    assert lim.stats()["waiting_by_stage"] == {"extract": 2, "merge": 1, "review": 1}
+    lim.release("extract")
+    for t in threads:
+        t.join(2)
+    assert order == [("review", "p3"), ("merge", "p2"), ("extract", "p1"), ("extract", "p3")]
+    assert lim.stats()["inflight"] == 0 and lim.stats()["granted"] == 5
+
+
+def test_priority_limiter_lanes_weighted_fair():
+    import threading
+    import time
+    from src.llm.limiter import PriorityLimiter, lane_for_batch, llm_context
+
+    assert lane_for_batch(1) == "interactive" and lane_for_batch(200) == "bulk"
+    assert lane_for_batch(200, "interactive") == "interactive" and lane_for_batch(10) == "normal"
+
+    lim = PriorityLimiter(1, {"interactive": 8, "normal": 3, "bulk": 1})
+    order = []
+    lim.acquire("extract", 0, "bulk")            # 批量任务占住槽位
+
+    def _call(lane):
+        with llm_context(lane=lane, stage="extract"):
+            with lim.slot():
+                order.append(lane[0])
+
+    threads = []
+    for lane in ["bulk"] * 3 + ["interactive"] * 24:
+        t = threading.Thread(target=_call, args=(lane,))
+        t.start()
+        threads.append(t)
+        while lim.stats()["waiting"] < len(threads):
+            time.sleep(0.001)
+    lim.release("extract", "bulk")
+    for t in threads:
+        t.join(2)
+    seq = "".join(order)
+    assert seq.startswith("i" * 8)               # 交互请求越过已排队的批量请求
+    assert seq.index("b") < seq.rindex("i")      # 批量请求不被饿死
+    assert seq[seq.index("b") + 1:].startswith("i" * 8 + "b")   # 满载时份额 8:1
+    assert lim.stats()["granted_by_lane"] == {"bulk": 4, "interactive": 24}
+
+
+def test_host_slots_leases_across_processes(tmp_path):
+    import os
+    import threading
+    import time
+    from src.llm import host_slots
+    from src.llm.host_slots import HostSlots, pool_for
+
+    assert pool_for("https://api.deepseek.com/v1") == "api.deepseek.com"
+    slots = HostSlots(tmp_path / "slots.db", ttl=5)
+    other = HostSlots(tmp_path / "slots.db", ttl=5)     # 同一个库的另一个“进程”
+    token = slots.acquire("p", limit=1, info={"lane": "bulk", "stage": "extract", "paper": "a"})
+    got = []
+    t = threading.Thread(target=lambda: got.append(other.acquire("p", limit=1)))
+    t.start()
+    time.sleep(0.1)
+    assert not got and other.status()["pools"]["p"]["waiting"] == 1
+    slots.release(token)
+    t.join(2)
+    assert got and other.status()["leases"][0]["slot"] == 0
+    other.release(got[0])
+
+    # 崩溃进程遗留的租约：本机 pid 不存在 / 心跳超时
+    conn = slots._conn()
+    now = time.time()
+    for tok, pid, host, beat in (("dead", 2 ** 22 + 17, host_slots._HOST, now),
+                                 ("stale", os.getpid(), "elsewhere", now - 60)):
+        conn.execute("INSERT INTO leases(token, pool, slot, pid, host, acquired_at, heartbeat) "
+                     "VALUES(?, 'p', 0, ?, ?, ?, ?)", (tok, pid, host, now, beat))
+    status = slots.status()
+    assert status["reaped"] == 2 and status["leases"] == []
+
+    # 速率上限与 429 冷却
+    for _ in range(2):
+        slots.release(slots.acquire("r", limit=5, rate_per_min=2))
+    hint = slots._try_grant(conn, "x", "r", 5, 2, 1.0, time.time(), {})
+    assert hint is not None and hint > 50
+    slots.note_rate_limited("c", 30)
+    assert slots._try_grant(conn, "y", "c", 5, 0, 1.0, time.time(), {}) > 25
+
+
+def test_shared_executor_task_group():
+    import threading
+    from src.executor import TaskGroup, executor_stats, get_pool
+    from src.llm.limiter import current_context, llm_context
+
+    def _inner():
+        # 同池嵌套提交就地执行，不会等待自身
+        with TaskGroup("test") as g:
+            f = g.submit(lambda: threading.current_thread().name)
+        return f.result()
+
+    with llm_context(lane="bulk", stage="extract"):
+        with TaskGroup("test") as group:
+            futs = [group.submit(lambda: current_context()["lane"]) for _ in range(5)]
+            nested = group.submit(_inner)
+            done = set()
+            while len(done) < 6:
+                done |= group.wait_first([f for f in futs + [nested] if f not in done])
+    assert [f.result() for f in futs] == ["bulk"] * 5
+    assert nested.result().startswith("sped-test_")
+    stats = executor_stats()["test"]
+    assert stats["workers"] == get_pool("test").workers
+    assert stats["completed"] == 6 and stats["inline"] == 1 and stats["queued"] == 0
+    assert not group.futures
+
+
+def test_cancel_token_aborts_waits_and_inflight_http():
+    import socket
+    import threading
+    import time
+    import httpx
+    from src.cancel import CancelToken, Cancelled, cancel_scope, sleep
+    from src.llm.limiter import PriorityLimiter
+    from src.llm.openai_client import cancellable_transport, is_cancellable
+
+    # 依赖 httpx 内部连接池结构：版本变化导致后端没换上时这里直接失败，而不是静默失去取消能力
+    assert is_cancellable(cancellable_transport())
+    assert not is_cancellable(httpx.HTTPTransport())
+
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+    t0 = time.monotonic()
+    try:
+        with cancel_scope(token):
+            sleep(30)
+        raise AssertionError("sleep 未被取消")
+    except Cancelled:
+        assert time.monotonic() - t0 < 5
+
+    # 排队中的限流等待被取消后退出队列，不占槽位
+    limiter = PriorityLimiter(1)
+    limiter.acquire("extract", 0, "normal")
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+    try:
+        with cancel_scope(token):
+            limiter.acquire("extract", 1, "normal")
+        raise AssertionError("acquire 未被取消")
+    except Cancelled:
+        pass
+    limiter.release("extract", "normal")
+    limiter.acquire("extract", 2, "normal")
+    limiter.release("extract", "normal")
+
+    # 服务端接受连接但永不响应：取消应立即打断阻塞中的读
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+    t0 = time.monotonic()
+    try:
+        with httpx.Client(transport=cancellable_transport(), timeout=30) as client, cancel_scope(token):
+            client.get(f"http://127.0.0.1:{port}/")
+        raise AssertionError("请求未被取消")
+    except Cancelled:
+        assert time.monotonic() - t0 < 5
+    finally:
+        server.close()
+
+
+def test_cancellable_client_keeps_env_proxies(monkeypatch):
+    from src.llm.openai_client import cancellable_client, is_cancellable
+
+    monkeypatch.setenv("HTTPS_PROXY", "http://127.0.0.1:3128")
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    monkeypatch.delenv("no_proxy", raising=False)
+    with cancellable_client(timeout=5) as client:
+        # 代理环境变量照常生效，默认与代理传输层都能被取消
+        assert client._mounts
+        assert is_cancellable(client._transport)
+        assert all(is_cancellable(t) for t in client._mounts.values() if t is not None)
+
+
+def test_extract_cost_model_lpt_and_eta(tmp_path):
+    from src.extractors.cost_model import ExtractCostModel, MakespanTracker, lpt_makespan, lpt_order
+
+    model = ExtractCostModel(tmp_path / "cost.json")
+    for chars in (10_000, 40_000, 80_000, 20_000):
+        model.observe(chars, 5 + chars / 1000, key="s")
+    assert abs(model.predict(60_000, key="s") - 65) < 1
+    model.save()
+    assert abs(ExtractCostModel(tmp_path / "cost.json").predict(60_000, key="other") - 65) < 1
+
+    costs = {"a": 10.0, "b": 50.0, "c": 20.0, "d": 50.0}
+    assert lpt_order(costs) == ["b", "d", "c", "a"]
+    assert lpt_makespan([10, 50, 20, 50], 2) == 70
+    assert lpt_makespan([10], 2, busy=[30, 5]) == 30
+    # 在途多于 worker 数：最长的在途论文不被丢掉，多出的压到最空的位上
+    assert lpt_makespan([], 2, busy=[5, 40, 10, 30]) == 45
+    assert lpt_makespan([10], 1, busy=[30, 5]) == 45
+
+    tracker = MakespanTracker(2)
+    tracker.calibrate(10, 20)
+    assert 1.2 < tracker.ratio < 1.4
+    assert tracker.eta([10], [(10, 0)]) == 10 * tracker.ratio
+
+
 def test_multi_agent_flat_extract_merges_candidates():
     source = "Material is Ti6Al4V. Wear rate was 1.2 mm3/Nm."
     schema = GeneratedSchema(domain="d", description="x", fields=[
@@ -268,6 +794,215 @@ def test_multi_agent_flat_extract_reviews_merged_records():
     assert res.metadata["evidence_verified"] == 2
 
 
+def test_multi_agent_adaptive_policy_escalates_on_signals():
+    source = "Material is Ti6Al4V. Lubricant was water."
+    schema = GeneratedSchema(domain="d", description="x", fields=[
+        SchemaField(name="material", type="string"),
+        SchemaField(name="lubricant", type="enum", enum_values=["water", "oil"]),
+    ])
+
+    def _run(lubricant):
+        a = FakeLLM({"flat_extract": {"records": [{
+            "material": {"value": "Ti6Al4V", "evidence": "Material is Ti6Al4V"},
+            "lubricant": {"value": lubricant, "evidence": "Lubricant was water"},
+        }]}})
+        b = FakeLLM({"flat_extract": {"records": [{
+            "material": {"value": "Ti6Al4V", "evidence": "Material is Ti6Al4V"},
+            "lubricant": {"value": "water", "evidence": "Lubricant was water"},
+        }]}})
+        merger = FakeLLM({"flat_merge": {"records": [{
+            "material": {"value": "Ti6Al4V", "evidence": "Material is Ti6Al4V"},
+            "lubricant": {"value": "water", "evidence": "Lubricant was water"},
+        }]}})
+        mode = MultiAgentFlatMode({"extractor_a": a, "extractor_b": b}, merger, schema, agent_policy="adaptive")
+        return mode.extract("p1", source), b, merger
+
+    # 简单论文：一个 extractor 即可，省下第二个 extractor 与 merger
+    res, b, merger = _run("water")
+    assert res.success and res.metadata["merge_used"] is False
+    assert not b.calls and not merger.calls
+    assert res.metadata["agent_policy"] == {"policy": "adaptive", "escalated": False, "reasons": [],
+                                            "extractors_run": 1, "calls_saved": 2}
+
+    # 枚举越界：补跑其余 extractor 并合并
+    res, b, merger = _run("seawater")
+    assert res.metadata["merge_used"] is True and b.calls and merger.calls
+    assert res.metadata["agent_policy"]["reasons"] == ["enum_violation"]
+    assert res.metadata["agent_policy"]["calls_saved"] == 0
+    assert res.records[0]["lubricant"]["value"] == "water"
+
+
+
+def test_reviewer_system_prompt_matches_context_mode(monkeypatch):
+    import settings
+    from src.schema import prompts as P
+
+    class Capture(FakeLLM):
+        def call(self, messages, call_id="unknown", **kwargs):
+            self.system = messages[0].content
+            return super().call(messages, call_id=call_id, **kwargs)
+
+    filler = "".join(f"Paragraph {i} describes unrelated sample preparation steps in detail.\n\n" for i in range(300))
+    source = filler + "Material is Ti6Al4V. Wear rate was 1.2 mm3/Nm.\n\n" + filler
+    schema = GeneratedSchema(domain="d", description="x", fields=[SchemaField(name="material", type="string")])
+    records = [{"material": {"value": "Ti6Al4V", "evidence": "Material is Ti6Al4V"}}]
+    for mode_name, expected in (("evidence", P.EXTRACT_REVIEWER_SYSTEM_EXCERPTS), ("full", P.EXTRACT_REVIEWER_SYSTEM)):
+        monkeypatch.setattr(settings, "EXTRACT_REVIEW_CONTEXT", mode_name, raising=False)
+        reviewer = Capture({"flat_review": {"records": records, "review": {"passed": True}}})
+        mode = MultiAgentFlatMode({"extractor_a": FakeLLM({})}, FakeLLM({}), schema, reviewer_client=reviewer)
+        res = mode._review_records("p1", source, records)
+        assert res.metadata["review_context"]["mode"] == mode_name
+        assert reviewer.system == expected
+    # 摘录模式明确告知：摘录外缺失不是置 null 的理由
+    assert "……" in P.EXTRACT_REVIEWER_SYSTEM_EXCERPTS and "不是置 null" in P.EXTRACT_REVIEWER_SYSTEM_EXCERPTS
+
+def test_review_context_keeps_evidence_windows_and_cited_tables():
+    from src.prompts.modes.review_context import build_review_context
+
+    filler = "\n\n".join(f"Paragraph {i} discusses unrelated background material at length." for i in range(300))
+    table = "Table 1. Wear results\n\n| Sample | Wear rate |\n|---|---|\n| A | 1.2 |\n| B | 3.4 |\n"
+    text = (filler + "\n\nThe \\mathrm{Ti6Al4V} alloy was tested (see Table 1).\n\n"
+            + filler + "\n\n" + table + "\n" + filler)
+    records = [{
+        "material": {"value": "Ti6Al4V", "evidence": "The Ti6Al4V alloy was tested"},
+        "wear_rate": {"value": 1.2, "evidence": "| A | 1.2 |"},
+    }]
+    ctx = build_review_context(text, records, max_tokens=4000)
+    assert ctx.mode == "evidence" and ctx.located == 2
+    assert "alloy was tested" in ctx.text and "| B | 3.4 |" in ctx.text and "Table 1. Wear results" in ctx.text
+    assert "Paragraph 150 " not in ctx.text
+    report = ctx.report()
+    assert report["context_tokens"] < report["full_tokens"] / 10
+
+    # 定位不到的证据：回退全文
+    records[0]["material"]["evidence"] = "completely invented sentence not in the paper"
+    ctx = build_review_context(text, records, full_text="minimized")
+    assert ctx.mode == "full" and ctx.text == "minimized" and ctx.report()["fallback"] == "unlocated_evidence"
+
+
+def test_merger_compact_encoding_lists_only_disputes():
+    from src.prompts.modes.compact import decode_merged, encode_candidates
+
+    schema = GeneratedSchema(domain="d", description="x", fields=[
+        SchemaField(name="material", type="string"),
+        SchemaField(name="wear_rate", type="number"),
+        SchemaField(name="load", type="number"),
+    ])
+    null = {"value": None, "evidence": None}
+    candidates = [
+        {"role": "extractor_a", "metadata": {"usage": {"prompt_tokens": 1}}, "records": [
+            {"material": {"value": "Ti6Al4V", "evidence": "Ti6Al4V disc"},
+             "wear_rate": {"value": 1.2, "evidence": "rate 1.2"}, "load": null},
+            {"material": {"value": "CoCr", "evidence": "CoCr disc"}, "wear_rate": null, "load": null},
+        ]},
+        {"role": "extractor_b", "metadata": {}, "records": [
+            {"material": {"value": "CoCr", "evidence": "CoCr disc"}, "wear_rate": null,
+             "load": {"value": 10, "evidence": "10 N"}},
+            {"material": {"value": " ti6al4v", "evidence": "Ti6Al4V disc"},
+             "wear_rate": {"value": 1.3, "evidence": "rate 1.3"}, "load": null},
+        ]},
+    ]
+    enc = encode_candidates(candidates, schema)
+    assert enc["extractors"] == {"A": "extractor_a", "B": "extractor_b"}
+    assert enc["quotes"] == ["Ti6Al4V disc", "rate 1.2", "rate 1.3", "CoCr disc", "10 N"]
+    ti, cocr = enc["groups"]
+    assert ti == {"by": "AB", "same": {"f1": ["Ti6Al4V", 0]}, "diff": {"f2": {"A": [1.2, 1], "B": [1.3, 2]}}}
+    assert cocr == {"by": "AB", "same": {"f1": ["CoCr", 3], "f3": [10, 4]}}
+    assert "metadata" not in json.dumps(enc) and "null" not in json.dumps(enc)
+
+    merged = decode_merged({"records": [{"f1": ["Ti6Al4V", 0], "f2": [1.2, 1]}]}, schema, enc["quotes"])
+    assert merged == [{"material": {"value": "Ti6Al4V", "evidence": "Ti6Al4V disc"},
+                       "wear_rate": {"value": 1.2, "evidence": "rate 1.2"},
+                       "load": {"value": None, "evidence": None}}]
+
+
+def test_candidate_dedupe_settles_agreeing_records_before_merge():
+    from src.prompts.modes.dedupe import dedupe_candidates, record_hash
+
+    def cell(v, ev="x", ok=True):
+        return {"value": v, "evidence": ev, "evidence_verified": ok}
+
+    ti = {"material": cell("Ti6Al4V"), "wear": cell(1.2)}
+    assert record_hash(ti) == record_hash({"material": cell(" ti6al4v ", "y"), "wear": cell("1.20")})
+    a = {"role": "a", "records": [ti, dict(ti), {"material": cell("CoCr"), "wear": cell(3.0)}]}
+    b = {"role": "b", "records": [{"material": cell("TI6AL4V", ok=False), "wear": cell(1.2)},
+                                  {"material": cell("CoCr"), "wear": cell(3.5)}]}
+    dd = dedupe_candidates([a, b])
+    assert len(dd.settled) == 1 and dd.settled[0]["material"]["evidence_verified"] is True
+    assert [len(c["records"]) for c in dd.candidates] == [1, 1]
+    rep = dd.report()
+    assert rep["records_in"] == 5 and rep["exact_duplicates"] == 2 and rep["sent_to_merger"] == 2
+    assert rep["rate"] == 0.4 and rep["merge_skipped"] is False
+
+    # 近似重复（一方少填字段）：跨 extractor 定稿为字段并集，全部定稿时跳过 merger
+    source = "Material is Ti6Al4V. Wear rate was 1.2 mm3/Nm."
+    schema = GeneratedSchema(domain="d", description="x", fields=[
+        SchemaField(name="material", type="string"),
+        SchemaField(name="wear_rate", type="number"),
+    ])
+    ea = FakeLLM({"flat_extract": {"records": [{
+        "material": {"value": "Ti6Al4V", "evidence": "Material is Ti6Al4V"},
+        "wear_rate": {"value": 1.2, "evidence": "Wear rate was 1.2 mm3/Nm"},
+    }]}})
+    eb = FakeLLM({"flat_extract": {"records": [{
+        "material": {"value": "Ti6Al4V", "evidence": "Material is Ti6Al4V"},
+    }]}})
+    merger = FakeLLM({})
+    mode = MultiAgentFlatMode({"a": ea, "b": eb}, merger, schema, agent_policy="fixed")
+    res = mode.extract("p1", source)
+    assert res.success and res.metadata["merge_used"] is False and not merger.calls
+    assert res.records[0]["wear_rate"]["value"] == 1.2
+    assert res.metadata["dedupe"]["near_duplicates"] == 1 and res.metadata["dedupe"]["merge_skipped"] is True
+
+
+def test_near_duplicate_papers_found_via_minhash_lsh(tmp_path):
+    from src.database.near_dup import NearDupIndex, shingle_hashes, minhash, similarity
+
+    words = [f"w{i % 97}x{i % 13}" for i in range(600)]
+    base = " ".join(words)
+    preprint = base + " preprint version submitted to arxiv"
+    other = " ".join(f"z{i % 89}y{i % 7}" for i in range(600))
+    sig = lambda t: minhash(shingle_hashes(t))
+    assert similarity(sig(base), sig(preprint)) > 0.9
+    assert similarity(sig(base), sig(other)) < 0.1
+
+    idx = NearDupIndex(tmp_path / "pdf_state.db")
+    assert idx.index_text("journal", base) is None
+    assert idx.index_text("unrelated", other) is None
+    dup = idx.index_text("preprint", preprint)
+    assert dup["paper_id"] == "journal" and dup["similarity"] >= 0.8
+    # 学位论文章节：只占较长文本的一部分，Jaccard 低但包含度高
+    chapter = idx.index_text("chapter", " ".join(words[:400]))
+    assert chapter and chapter["containment"] >= 0.9
+    assert {s["paper_id"] for s in idx.siblings("journal")} >= {"preprint"}
+    assert idx.duplicate_of(["preprint", "unrelated"]) == {"preprint": "journal"}
+    assert idx.has("unrelated") and not idx.has("missing")
+    # 仅包含度高的章节只标出、不作为复用来源
+    assert chapter["similarity"] < 0.8 and idx.siblings("chapter", min_similarity=0.8) == []
+    assert [s["paper_id"] for s in idx.siblings("preprint", min_similarity=0.8)] == ["journal"]
+    matches = {d["paper_id"]: d["match"] for g in idx.groups() for d in g["duplicates"]}
+    assert matches["preprint"] == "near_duplicate" and matches["chapter"] == "containment"
+
+
+def test_reused_sibling_records_are_reverified_against_target_text():
+    from src.prompts.modes.flat_mode import reverify_records
+    target = "The UHMWPE liner showed a wear rate of 5.2 mm3/Nm. Friction coefficient was 0.08."
+    records = [
+        {"material": {"value": "UHMWPE", "evidence": "The UHMWPE liner", "evidence_verified": True},
+         "wear_rate": {"value": 5.2, "evidence": "wear rate of 5.2 mm3/Nm", "evidence_verified": True},
+         "cof": {"value": None, "evidence": None}},
+        # 只在兄弟论文（学位论文）里出现的记录
+        {"material": {"value": "PEEK", "evidence": "The PEEK liner showed", "evidence_verified": True},
+         "wear_rate": {"value": 3.1, "evidence": "wear rate of 3.1 mm3/Nm", "evidence_verified": True}},
+        {"material": {"value": "UHMWPE", "evidence": None}},
+    ]
+    kept, dropped, verified = reverify_records(records, target)
+    assert dropped == 2 and verified == 2
+    assert kept == [{"material": {"value": "UHMWPE", "evidence": "The UHMWPE liner", "evidence_verified": True},
+                     "wear_rate": {"value": 5.2, "evidence": "wear rate of 5.2 mm3/Nm", "evidence_verified": True},
+                     "cof": {"value": None, "evidence": None}}]
+
+
 if __name__ == "__main__":
     import pytest
     sys.exit(pytest.main([__file__, "-q"]))
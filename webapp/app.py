@@ -66,6 +66,18 @@ class ExtractReq(BaseModel):
     paper_ids: Optional[List[str]] = None
     all_parsed: bool = False
     collection: Optional[str] = None
+    priority: Optional[str] = None   # interactive/normal/bulk；空=按论文数推断
+    reuse_duplicates: Optional[bool] = None   # 近似重复论文复用兄弟结果（重新核验 evidence）；空=按 NEAR_DUP_REUSE
+
+
+class IngestReq(BaseModel):
+    slug: str
+    filenames: Optional[List[str]] = None
+    all_unparsed: bool = False
+    force_reparse: bool = False
+    collection: Optional[str] = None
+    priority: Optional[str] = None
+    reuse_duplicates: Optional[bool] = None
 
 
 class UploadSchemaReq(BaseModel):
@@ -151,6 +163,21 @@ def api_parsed_by_collection(collection: Optional[str] = None):
     return {"papers": services.parsed_papers(collection)}
 
 
+@app.get("/api/parsed/duplicates")
+def api_parsed_duplicates():
+    return {"groups": services.near_duplicate_groups()}
+
+
+@app.get("/api/parsed/{paper_id}/files/{name:path}")
+def api_parsed_file(paper_id: str, name: str, collection: Optional[str] = None):
+    try:
+        return FileResponse(services.parsed_file(paper_id, name, collection))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(404, f"文件不存在: {e}")
+
+
 # ---------------- Schema 设计 ----------------
 @app.post("/api/schema/design")
 def api_design(req: DesignReq):
@@ -235,11 +262,39 @@ def api_extract(req: ExtractReq):
         raise HTTPException(400, "未选择任何论文")
     fp = _fingerprint("extract", {"collection": req.collection, "slug": req.slug, "paper_ids": sorted(paper_ids)})
     job = JOBS.submit("extract", f"提取 {len(paper_ids)} 篇（{req.slug}）",
-                      lambda h: services.run_extract_job(h, req.slug, paper_ids, req.collection),
+                      lambda h: services.run_extract_job(h, req.slug, paper_ids, req.collection,
+                                                         lane=req.priority,
+                                                         reuse_duplicates=req.reuse_duplicates),
                       fingerprint=fp)
     return {"job_id": job.id, "count": len(paper_ids)}
 
 
+# ---------------- 一体化导入（解析 → 提取流水线） ----------------
+@app.post("/api/ingest")
+def api_ingest(req: IngestReq):
+    if services.parse_in_progress():
+        raise HTTPException(409, "已有解析任务在运行，请等待其完成")
+    names = list(req.filenames or [])
+    if req.all_unparsed:
+        overview = services.pdf_overview(req.collection)
+        names += [it["filename"] for it in overview["items"] if it["category"] == "unparsed"]
+    names = sorted(set(names))
+    if not names:
+        raise HTTPException(400, "未选择任何 PDF")
+    try:
+        services.get_schema(req.slug, req.collection)
+    except FileNotFoundError as e:
+        raise HTTPException(404, str(e))
+    fp = _fingerprint("ingest", {"collection": req.collection, "slug": req.slug, "filenames": names,
+                                 "force_reparse": req.force_reparse})
+    job = JOBS.submit("ingest", f"导入 {len(names)} 个 PDF（{req.slug}）",
+                      lambda h: services.run_ingest_job(h, names, req.slug, collection=req.collection,
+                                                        force_reparse=req.force_reparse, lane=req.priority,
+                                                        reuse_duplicates=req.reuse_duplicates),
+                      fingerprint=fp)
+    return {"job_id": job.id, "count": len(names)}
+
+
 # ---------------- 数据查看 ----------------
 @app.get("/api/data")
 def api_data(slug: Optional[str] = None, collection: Optional[str] = None, offset: int = 0, limit: int = 100):
@@ -273,7 +328,8 @@ def api_data_export(slug: Optional[str] = None, collection: Optional[str] = None
 # ---------------- 任务 ----------------
 @app.get("/api/jobs")
 def api_jobs():
-    return {"jobs": JOBS.list(), "active": [j.to_dict() for j in JOBS.active()]}
+    return {"jobs": JOBS.list(), "active": [j.to_dict() for j in JOBS.active()],
+            "executor": services.executor_status()}
 
 
 @app.get("/api/jobs/{job_id}")
@@ -289,6 +345,11 @@ def api_job_cancel(job_id: str):
     return {"cancelled": JOBS.cancel(job_id)}
 
 
+@app.get("/api/llm/slots")
+def api_llm_slots():
+    return services.llm_slots_status()
+
+
 # ---------------- 设置 ----------------
 @app.get("/api/settings")
 def api_get_settings():
@@ -13,6 +13,8 @@ from collections import deque
 from datetime import datetime
 from typing import Any, Callable, Dict, List, Optional
 
+from src.cancel import CancelToken, Cancelled, cancel_scope
+
 
 class JobHandle:
     """传给任务函数，用于上报进度/日志/检查取消。"""
@@ -36,10 +38,54 @@ class JobHandle:
         with self._job._lock:
             self._job.meta.update(kwargs)
 
+    def update_stage(self, stage: str, **kwargs) -> None:
+        """多阶段任务：合并 meta["stages"][stage]；带 done/total 时总进度取各阶段之和。"""
+        with self._job._lock:
+            stages = self._job.meta.setdefault("stages", {})
+            stages.setdefault(stage, {}).update(kwargs)
+            if "done" in kwargs or "total" in kwargs:
+                self._job.done = sum(int(s.get("done") or 0) for s in stages.values())
+                self._job.total = sum(int(s.get("total") or 0) for s in stages.values())
+            self._job.updated_at = datetime.now().isoformat(timespec="seconds")
+
     @property
     def cancelled(self) -> bool:
         return self._job.cancel_requested
 
+    @property
+    def cancel_token(self) -> CancelToken:
+        """任务的取消令牌：任务函数在其上下文内运行，在途 LLM/HTTP 请求与退避等待随取消中止。"""
+        return self._job.cancel_token
+
+
+class StageHandle:
+    """多阶段任务中某一阶段的 JobHandle 视图：日志带阶段前缀，进度与 meta 记在 meta["stages"][stage]。
+
+    阶段函数（如 run_extract_job）照常调用 log/set_progress/set_meta，不必知道自己在流水线里。
+    """
+
+    def __init__(self, parent: JobHandle, stage: str, label: Optional[str] = None):
+        self._parent = parent
+        self.stage = stage
+        self.label = label or stage
+
+    def log(self, message: str) -> None:
+        self._parent.log(f"[{self.label}] {message}")
+
+    def set_progress(self, done: int, total: int) -> None:
+        self._parent.update_stage(self.stage, done=done, total=total)
+
+    def set_meta(self, **kwargs) -> None:
+        self._parent.update_stage(self.stage, **kwargs)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._parent.cancelled
+
+    @property
+    def cancel_token(self) -> CancelToken:
+        return self._parent.cancel_token
+
 
 class Job:
     def __init__(self, job_type: str, title: str, fingerprint: str = ""):
@@ -55,6 +101,7 @@ class Job:
         self.meta: Dict[str, Any] = {}
         self.error: Optional[str] = None
         self.cancel_requested = False
+        self.cancel_token = CancelToken()
         self.created_at = datetime.now().isoformat(timespec="seconds")
         self.updated_at = self.created_at
         self._lock = threading.Lock()
@@ -115,7 +162,8 @@ class JobManager:
                 job.updated_at = datetime.now().isoformat(timespec="seconds")
             handle.log(f"任务开始: {title}")
             try:
-                result = fn(handle)
+                with cancel_scope(job.cancel_token):
+                    result = fn(handle)
                 with job._lock:
                     if job.cancel_requested:
                         job.status = "cancelled"
@@ -125,6 +173,11 @@ class JobManager:
                             job.result = result
                     job.updated_at = datetime.now().isoformat(timespec="seconds")
                 handle.log(f"任务结束: {job.status}")
+            except Cancelled:
+                with job._lock:
+                    job.status = "cancelled"
+                    job.updated_at = datetime.now().isoformat(timespec="seconds")
+                handle.log("任务结束: cancelled")
             except Exception as e:  # noqa: BLE001
                 with job._lock:
                     job.status = "failed"
@@ -145,6 +198,7 @@ class JobManager:
         job = self._jobs.get(job_id)
         if job and job.status in ("queued", "running"):
             job.cancel_requested = True
+            job.cancel_token.cancel()
             return True
         return False
 
@@ -3,6 +3,7 @@ Web 后端业务逻辑：把解析 / 设计schema / 提取 / 数据查看封装
 """
 from __future__ import annotations
 
+import contextvars
 import json
 import os
 import random
@@ -15,15 +16,28 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import settings
+from src.database.near_dup import NearDupIndex, near_dup_reuse, near_dup_threshold
 from src.database.catalog import (
     PaperCatalog, PARSE_PARSED, PARSE_FAILED,
     configure_connection,
 )
+from src.pdfs.mineru_archive import extract_member
 from src.pdfs.pdf_processor import PDFProcessor
+from src.pdfs.parse_pipeline import PaperFeed, ParsePipeline, ParseProgress
 from src.schema import SchemaDiscovery, SchemaStore, GeneratedSchema, slugify, validate_schema
-from src.schema.sampling import list_parsed_papers, load_paper_text
+from src.schema.sampling import (
+    list_parsed_papers, load_paper_minimized, load_paper_structure, load_paper_text,
+)
 from src.extractors import ExtractionService
-from webapp.jobs import JobHandle
+from src.prompts.modes.flat_mode import reverify_records
+from src.cancel import Cancelled, cancel_scope
+from src.cancel import sleep as cancellable_sleep
+from src.executor import TaskGroup, executor_stats
+from src.extractors.cost_model import MakespanTracker, get_cost_model, lpt_order
+from src.llm.host_slots import host_slots_status
+from src.llm.limiter import lane_for_batch, limiter_stats, llm_context, next_paper_seq
+from src.llm.tokens import output_stats
+from webapp.jobs import JobHandle, StageHandle
 
 def _safe_collection(collection: Optional[str]) -> str:
     return settings.safe_collection_name(collection or getattr(settings, "DEFAULT_COLLECTION", ""))
@@ -380,7 +394,7 @@ def _register_pdfs(filenames: List[str], force_reparse: bool = False,
     默认跳过已成功解析(downloaded)的 PDF，避免重复消耗 MinerU 额度；
     force_reparse=True 时才会重置它们重新解析。失败(failed)的总是允许重试。
     """
-    import hashlib
+    from src.pdfs.file_hash import hash_files
     proc = PDFProcessor()
     paths: List[Path] = []
     skipped_large: List[str] = []
@@ -390,7 +404,17 @@ def _register_pdfs(filenames: List[str], force_reparse: bool = False,
     conn = _connect_state_db(proc.db_path)
     cur = conn.cursor()
     try:
-        for name in filenames:
+        # 已登记状态一次批量查出，不再逐文件 SELECT
+        status_of: Dict[str, Optional[str]] = {}
+        names = list(dict.fromkeys(filenames))
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            status_of.update(cur.execute(
+                f"SELECT filename, status FROM pdf_files WHERE filename IN ({', '.join('?' for _ in chunk)})",
+                chunk,
+            ).fetchall())
+        selected: List[tuple] = []
+        for name in names:
             p = _pdf_path(name)
             if not p.exists():
                 continue
@@ -399,32 +423,32 @@ def _register_pdfs(filenames: List[str], force_reparse: bool = False,
                 continue
             if p.stem in parsed_stems and not force_reparse:
                 continue  # 磁盘已有解析结果，跳过（真相来源，省额度）
-            row = cur.execute(
-                "SELECT status FROM pdf_files WHERE filename = ?", (name,)
-            ).fetchone()
-            status = row[0] if row else None
+            status = status_of.get(name)
             if status == "downloaded" and not force_reparse:
                 continue  # 已解析，跳过（省额度）
             if status == "uploaded" and not force_reparse:
                 continue  # 正在处理中，避免重复上传
-            paths.append(p)
-            md5 = hashlib.md5()
-            with open(p, "rb") as fh:
-                for chunk in iter(lambda: fh.read(8192), b""):
-                    md5.update(chunk)
-            h = md5.hexdigest()
-            if row is None:
-                cur.execute(
-                    "INSERT OR IGNORE INTO pdf_files (filename, file_hash, file_size, status) "
-                    "VALUES (?, ?, ?, 'pending')",
-                    (name, h, p.stat().st_size),
-                )
+            selected.append((name, p))
+        # 新登记的文件只取缓存里的 hash；未命中的先记空串（待补），由上传时边读边算补齐（每个文件只读一遍）；
+        # 上传失败/取消留下的空串行由 PDFProcessor.scan_new_pdfs 按文件名识别并补齐 hash
+        hashes = hash_files([p for name, p in selected if name not in status_of], proc.db_path, compute=False)
+        inserts, resets = [], []
+        for name, p in selected:
+            if name in status_of:
+                resets.append((name,))
             else:
-                cur.execute(
-                    "UPDATE pdf_files SET status='pending', batch_id=NULL, updated_at=CURRENT_TIMESTAMP "
-                    "WHERE filename = ?",
-                    (name,),
-                )
+                inserts.append((name, hashes.get(p, ""), p.stat().st_size))
+            paths.append(p)
+        cur.executemany(
+            "INSERT OR IGNORE INTO pdf_files (filename, file_hash, file_size, status) "
+            "VALUES (?, ?, ?, 'pending')",
+            inserts,
+        )
+        cur.executemany(
+            "UPDATE pdf_files SET status='pending', batch_id=NULL, updated_at=CURRENT_TIMESTAMP "
+            "WHERE filename = ?",
+            resets,
+        )
         conn.commit()
     finally:
         conn.close()
@@ -438,7 +462,13 @@ def run_parse_job(handle: JobHandle, filenames: List[str], force_reparse: bool =
     if not _PARSE_LOCK.acquire(blocking=False):
         raise RuntimeError("已有解析任务在运行，请等待其完成后再试")
     try:
-        return _run_parse_job_locked(handle, filenames, force_reparse, collection, poll_interval, max_wait_min)
+        # 取消令牌经 contextvars 传到上传退避、轮询等待与下载线程（TaskGroup 继承上下文）
+        with cancel_scope(getattr(handle, "cancel_token", None)):
+            return _run_parse_job_locked(handle, filenames, force_reparse, collection, poll_interval, max_wait_min)
+    except Cancelled:
+        # 取消打断了上传退避 / 轮询等待 / 下载：已上传的批次仍在 MinerU 解析，可稍后重新提交下载
+        handle.log("解析任务已取消")
+        return {"cancelled": True}
     finally:
         _PARSE_LOCK.release()
 
@@ -456,8 +486,14 @@ def _run_parse_job_locked(handle: JobHandle, filenames: List[str], force_reparse
         return {"skipped": True, "downloaded": 0, "failed": 0, "too_large": len(skipped_large)}
     handle.log(f"待解析 {len(paths)} 个 PDF")
     handle.set_progress(0, len(paths))
+    batch_ids = _upload_batches(handle, proc, paths)
+    if batch_ids is None:
+        return {"cancelled": True}
+    return _poll_and_download(handle, proc, batch_ids, collection, poll_interval, max_wait_min)
+
 
-    # 分批上传（单批受 50 文件/分钟速率上限约束）
+def _upload_batches(handle: JobHandle, proc: PDFProcessor, paths: List[Path]) -> Optional[List[str]]:
+    """分批上传（单批受 MinerU 文件/分钟速率上限约束）；返回批次 ID 列表，任务取消时返回 None。"""
     rate = proc.upload_rate_per_min
     batches = proc.build_upload_batches(paths, max_files=rate)
     handle.log(f"划分为 {len(batches)} 个上传批次（限速 {rate} 文件/分钟）")
@@ -473,7 +509,7 @@ def _run_parse_job_locked(handle: JobHandle, filenames: List[str], force_reparse
     window: "deque[tuple[float, int]]" = deque()
     for i, bp in enumerate(batches):
         if handle.cancelled:
-            return {"cancelled": True}
+            return None
         n = len(bp)
         now = time.time()
         while window and now - window[0][0] >= 60:
@@ -483,7 +519,7 @@ def _run_parse_job_locked(handle: JobHandle, filenames: List[str], force_reparse
             wait = 60 - (now - window[0][0]) + 1
             if wait > 0:
                 handle.log(f"⏳ 限速：等待 {wait:.0f}s 后上传批次 {i+1}")
-                time.sleep(wait)
+                cancellable_sleep(wait)
             window.clear()
         bid = proc.upload_batch(bp, base_index + i)
         window.append((time.time(), n))
@@ -494,67 +530,42 @@ def _run_parse_job_locked(handle: JobHandle, filenames: List[str], force_reparse
             handle.log(f"批次 {i+1}/{len(batches)} 上传失败")
     if not batch_ids:
         raise RuntimeError("所有批次上传失败")
-
-    # 轮询直到全部批次终态（done+failed==total）
-    handle.log("开始轮询 MinerU 解析进度 ...")
-    deadline = time.time() + max_wait_min * 60
-    failed_files: List[str] = []
-    timed_out = True
-    while time.time() < deadline:
-        if handle.cancelled:
-            return {"cancelled": True, "batch_ids": batch_ids}
-        total = done = failed = processing = 0
-        failed_files = []
-        all_terminal = True
-        for bid in batch_ids:
-            st = proc.check_batch_status(bid)
-            if not st:
-                all_terminal = False  # 查询失败按未完成处理
-                continue
-            total += st["total"]; done += st["done"]
-            failed += st["failed"]; processing += st["processing"]
-            if st["done"] + st["failed"] < st["total"]:
-                all_terminal = False
-            for it in st.get("results", []):
-                if it.get("state") == "failed":
-                    failed_files.append(it.get("file_name", ""))
-        handle.set_progress(done + failed, max(total, 1))
-        handle.set_meta(done=done, failed=failed, processing=processing, total=total)
-        handle.log(f"解析进度: 完成 {done} / 失败 {failed} / 处理中 {processing} / 共 {total}")
-        if all_terminal and total > 0:
-            timed_out = False
-            break
-        time.sleep(poll_interval)
-    if timed_out:
+    return batch_ids
+
+
+def _poll_and_download(handle: JobHandle, proc: PDFProcessor, batch_ids: List[str], collection: str,
+                       poll_interval: int, max_wait_min: int,
+                       feed: Optional[PaperFeed] = None) -> Dict[str, Any]:
+    """feed 不为空时每篇落盘即送入提取阶段，积压满时暂停新的下载。"""
+    # 流水线：并发轮询全部批次，文件一完成就下载落盘（不等最慢的批次），轮询间隔随进展自适应
+    handle.log("开始轮询 MinerU 解析进度（完成即下载）...")
+    last = {"line": ""}
+
+    def _progress(p: ParseProgress) -> None:
+        handle.set_progress(p.downloaded + p.download_failed + p.failed, max(p.total, 1))
+        handle.set_meta(done=p.done, failed=p.failed, processing=p.processing, total=p.total,
+                        downloaded=p.downloaded, first_parsed_s=p.first_parsed_s)
+        line = (f"解析进度: 完成 {p.done} / 失败 {p.failed} / 处理中 {p.processing} / 共 {p.total}"
+                f"，已落盘 {p.downloaded}")
+        if line != last["line"]:
+            last["line"] = line
+            handle.log(line)
+
+    pipeline = ParsePipeline(proc, _parsed_root(collection), poll_interval=poll_interval,
+                             max_wait_min=max_wait_min, download_workers=4, log=handle.log,
+                             on_progress=_progress, cancelled=lambda: handle.cancelled,
+                             on_parsed=feed.put if feed is not None else None,
+                             backpressure=feed.saturated if feed is not None else None)
+    prog = pipeline.run(batch_ids)
+    if handle.cancelled:
+        return {"cancelled": True, "batch_ids": batch_ids}
+    if prog.timed_out:
         handle.log("⚠️ 轮询超时，仅下载已完成部分；未完成的 PDF 仍为处理中，可稍后再次提交解析")
-
-    # 标记 MinerU 端解析失败的文件（可在前端重新解析）
-    failed_files = [f for f in failed_files if f]
-    if failed_files:
-        conn = _connect_state_db(proc.db_path)
-        try:
-            conn.executemany(
-                "UPDATE pdf_files SET status='failed', updated_at=CURRENT_TIMESTAMP WHERE filename=?",
-                [(f,) for f in failed_files],
-            )
-            conn.commit()
-        finally:
-            conn.close()
-        handle.log(f"标记 {len(failed_files)} 个 MinerU 解析失败文件")
-
-    # 下载落盘
-    handle.log("解析完成，开始下载结果 ...")
-    total_ok = total_fail = 0
-    for bid in batch_ids:
-        if handle.cancelled:
-            break
-        res = proc.download_batch_parallel(bid, _parsed_root(collection), max_workers=4)
-        total_ok += res.get("success_count", 0)
-        total_fail += res.get("failed_count", 0)
-        handle.log(f"批次 {bid} 下载: 成功 {res.get('success_count',0)} 失败 {res.get('failed_count',0)}")
-
-    handle.set_progress(total_ok + total_fail, total_ok + total_fail or 1)
-    return {"batch_ids": batch_ids, "downloaded": total_ok, "failed": total_fail}
+    if prog.failed_files:
+        handle.log(f"标记 {len(prog.failed_files)} 个 MinerU 解析失败文件")
+    handle.log(f"下载: 成功 {prog.downloaded} 失败 {prog.download_failed}（轮询 {prog.polls} 次）")
+    return {"batch_ids": batch_ids, "downloaded": prog.downloaded, "failed": prog.download_failed,
+            "parse_failed": prog.failed, "timed_out": prog.timed_out, "first_parsed_s": prog.first_parsed_s}
 
 
 # ----------------------------------------------------------------------
@@ -585,6 +596,24 @@ def parsed_papers(collection: Optional[str] = None) -> List[Dict[str, Any]]:
     return out
 
 
+def near_duplicate_groups() -> List[Dict[str, Any]]:
+    """近似重复论文分组（原件 -> 副本及其估计 Jaccard）。"""
+    return NearDupIndex().groups()
+
+
+def parsed_file(paper_id: str, name: str, collection: Optional[str] = None) -> Path:
+    """已解析论文目录下的文件；图片等尚未解出的条目此时从 mineru_output.zip 中解出。"""
+    if paper_id in {"", ".", ".."} or Path(paper_id).name != paper_id:
+        raise ValueError(f"非法的 paper_id: {paper_id}")
+    paper_dir = _parsed_root(collection) / paper_id
+    row = PaperCatalog().get(paper_id)
+    if row and row.get("parsed_dir") and Path(row["parsed_dir"]).is_dir():
+        paper_dir = Path(row["parsed_dir"])
+    if not paper_dir.is_dir():
+        raise FileNotFoundError(f"论文不存在: {paper_id}")
+    return extract_member(paper_dir, name)
+
+
 # ----------------------------------------------------------------------
 # Schema 设计
 # ----------------------------------------------------------------------
@@ -617,8 +646,10 @@ def run_design_job(handle: JobHandle, domain: str, description: str,
         sample_size=k, target_min=min_fields, target_max=max_fields,
         collection=_safe_collection(collection),
     )
-    handle.set_meta(stage="多agent设计中")
-    schema = disc.discover(pool)
+    handle.set_meta(stage="多agent设计中", lane="interactive")
+    # 设计 schema 时用户在页面上等结果：走 interactive 通道，不排在批量提取之后
+    with llm_context(lane="interactive"):
+        schema = disc.discover(pool)
     collection = _safe_collection(collection)
     store = SchemaStore(collection=collection)
     path = store.save(schema)
@@ -789,21 +820,101 @@ def _extract_concurrency() -> int:
     return max(1, min(32, n))
 
 
+def _extract_max_wip() -> int:
+    """同时在途（已准入、未完成）的论文数上限。
+
+    EXTRACT_MAX_WIP=0 时按 LLM 并发与每篇扇出推算：ceil(LLM_MAX_INFLIGHT / extractor 数) + 1，
+    多出的一篇让 merge/review 阶段也能填满槽位；不超过 EXTRACT_CONCURRENCY（线程数）。
+    """
+    try:
+        n = int(getattr(settings, "EXTRACT_MAX_WIP", 0) or 0)
+        if n <= 0:
+            inflight = max(1, int(getattr(settings, "LLM_MAX_INFLIGHT", 8)))
+            fanout = max(1, len(getattr(settings, "EXTRACTOR_ROLES", None) or [1]))
+            n = -(-inflight // fanout) + 1
+    except (TypeError, ValueError):
+        n = _extract_concurrency()
+    return max(1, min(_extract_concurrency(), n))
+
+
+def _catalog_char_counts(cat: PaperCatalog, papers: List[str]) -> Dict[str, int]:
+    """论文字符数（目录登记值）；缺失的按已知中位数估计，排程时不必读正文。"""
+    known: Dict[str, int] = {}
+    try:
+        for r in cat.list_papers(parse_status=PARSE_PARSED):
+            if r.get("char_count"):
+                known[r["paper_id"]] = int(r["char_count"])
+    except Exception:  # noqa: BLE001
+        pass
+    values = sorted(known[p] for p in papers if p in known)
+    fallback = values[len(values) // 2] if values else 0
+    return {p: known.get(p, fallback) for p in papers}
+
+
+def _fmt_duration(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    if seconds < 60:
+        return f"{seconds} 秒"
+    if seconds < 3600:
+        return f"{seconds // 60} 分 {seconds % 60} 秒"
+    return f"{seconds // 3600} 小时 {seconds % 3600 // 60} 分"
+
+
 def run_extract_job(handle: JobHandle, slug: str,
                     paper_ids: Optional[List[str]] = None,
-                    collection: Optional[str] = None) -> Dict[str, Any]:
+                    collection: Optional[str] = None,
+                    lane: Optional[str] = None,
+                    reuse_duplicates: Optional[bool] = None,
+                    feed: Optional[PaperFeed] = None) -> Dict[str, Any]:
+    """lane: LLM 优先级通道 interactive/normal/bulk；不传时按论文数推断（少量=interactive，大批=bulk）。
+    reuse_duplicates: 近似重复论文（预印本/期刊版）复用 Jaccard ≥ 阈值的兄弟论文同一 schema 的成功结果，
+    复用前对照本篇原文重新核验 evidence；不传时按 NEAR_DUP_REUSE（默认关闭）。
+    feed: 流式来源（run_ingest_job）：paper_ids 先按 LPT 准入，之后按到达顺序准入 feed 送来的论文，
+    直到 feed 关闭且取空。"""
     collection = _safe_collection(collection)
     store = SchemaStore(collection=collection)
     schema = store.load(slug)
-    papers = paper_ids or [p["paper_id"] for p in parsed_papers(collection)]
-    if not papers:
-        raise RuntimeError("没有论文可提取")
+    if feed is not None:
+        papers = list(paper_ids or [])
+    else:
+        papers = paper_ids or [p["paper_id"] for p in parsed_papers(collection)]
+        if not papers:
+            raise RuntimeError("没有论文可提取")
     _extracted_root(collection).mkdir(parents=True, exist_ok=True)
     cat = PaperCatalog()
-    total = len(papers)
-    workers = min(_extract_concurrency(), total)
+    initial = len(papers)
+
+    def _total() -> int:
+        if feed is None:
+            return initial
+        return initial + (feed.delivered if feed.closed else max(feed.expected, feed.delivered))
+
+    total = _total()
+    workers = max(1, min(_extract_max_wip(), total))
+    lane = lane_for_batch(total, lane)
     handle.set_progress(0, total)
-    handle.log(f"并行提取启动：{total} 篇，并发 {workers}（schema={slug}）")
+    handle.set_meta(lane=lane)
+    handle.log(f"并行提取启动：{total} 篇，在途上限 {workers}，通道 {lane}（schema={slug}）")
+
+    # LPT：按预测耗时（目录中的字符数 × 历史每字符耗时）降序准入，长论文先开跑，避免尾部单线程拖尾
+    cost_model = get_cost_model()
+    chars = _catalog_char_counts(cat, papers)
+    predicted = {pid: cost_model.predict(chars[pid], key=slug) for pid in papers}
+    papers = lpt_order(predicted)
+    reuse = near_dup_reuse() if reuse_duplicates is None else bool(reuse_duplicates)
+    dup_index = NearDupIndex() if reuse else None
+    if dup_index is not None:
+        # 原件也在本批时把副本排到最后：原件先提取完，副本即可直接复用
+        dup_of = dup_index.duplicate_of(papers)
+        in_batch = set(papers)
+        papers = ([p for p in papers if dup_of.get(p) not in in_batch]
+                  + [p for p in papers if dup_of.get(p) in in_batch])
+    tracker = MakespanTracker(workers)
+    makespan = tracker.eta(predicted.values(), [])
+    handle.set_meta(eta_s=int(makespan))
+    cm = cost_model.stats(slug)
+    handle.log(f"按预测耗时降序排程，预计用时约 {_fmt_duration(makespan)}"
+               f"（耗时模型 {cm['samples']} 样本：{cm['overhead_s']}s + {cm['sec_per_kchar']}s/千字符）")
 
     # 每个工作线程独立一个 ExtractionService（各自的 LLM 客户端 + 统计），
     # 避免共享可变状态竞争；schema 只读，可安全共享。
@@ -818,7 +929,38 @@ def run_extract_job(handle: JobHandle, slug: str,
 
     cat_lock = threading.Lock()      # SQLite 写串行化（upsert 每次新开连接）
     stat_lock = threading.Lock()
-    counter = {"done": 0, "ok": 0, "failed": 0, "skipped": 0, "records": 0}
+    counter = {"done": 0, "ok": 0, "failed": 0, "skipped": 0, "records": 0, "cancelled": 0, "reused": 0,
+               "calls_saved": 0, "escalated": 0, "review_tokens_full": 0, "review_tokens_sent": 0,
+               "merge_papers": 0, "merge_tokens_sent": 0}
+
+    def _reuse_sibling(pid: str, content: str, structure, out_file: Path) -> Optional[Dict[str, Any]]:
+        """复用兄弟论文的结果：只认 Jaccard ≥ 阈值（仅包含度高的章节/整篇不复用），
+        记录逐条对照本篇原文重新核验，丢弃过半或全部丢弃时返回 None 走正常提取。"""
+        if not dup_index.has(pid):
+            dup_index.index_text(pid, content, structure)
+        for sib in dup_index.siblings(pid, min_similarity=near_dup_threshold()):
+            sib_file = _extracted_root(collection, slug) / f"{sib['paper_id']}.json"
+            try:
+                d = json.loads(sib_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if d.get("schema_slug") != slug or d.get("success") is not True:
+                continue
+            records = d.get("records") or []
+            kept, dropped, verified = reverify_records(records, content)
+            if not kept or dropped * 2 > len(records):
+                handle.log(f"  {pid}: 兄弟论文 {sib['paper_id']} 的 {dropped}/{len(records)} 条记录在本篇核验不过，照常提取")
+                continue
+            meta = {k: v for k, v in (d.get("metadata") or {}).items() if k not in ("candidates", "review")}
+            meta.update(evidence_verified=verified, evidence_unverified=0, reused_from={
+                "paper_id": sib["paper_id"], "similarity": sib["similarity"], "dropped_records": dropped})
+            d.update(paper_id=pid, records=kept, count=len(kept), metadata=meta)
+            _atomic_write_text(out_file, json.dumps(d, ensure_ascii=False, indent=2))
+            with cat_lock:
+                cat.mark_extracted(pid, extract_json=str(out_file), extract_count=len(kept))
+            return {"status": "reused", "pid": pid, "count": len(kept),
+                    "sibling": sib["paper_id"], "similarity": sib["similarity"]}
+        return None
 
     def _work(pid: str) -> Dict[str, Any]:
         if handle.cancelled:
@@ -843,7 +985,23 @@ def run_extract_job(handle: JobHandle, slug: str,
         if not lock.acquire(blocking=False):
             return {"status": "skip", "pid": pid, "error": "同一 schema/paper 正在提取"}
         try:
-            out = _service().extract(paper_id=pid, content=content)
+            structure = load_paper_structure(pid, collection=collection, text=content)
+            if dup_index is not None:
+                reused = _reuse_sibling(pid, content, structure, out_file)
+                if reused is not None:
+                    return reused
+            svc = _service()
+            minimized = (load_paper_minimized(pid, collection=collection, text=content, structure=structure)
+                         if svc.minimize else None)
+            t0 = time.monotonic()
+            out = svc.extract(paper_id=pid, content=content, structure=structure, minimized=minimized,
+                              cancel=getattr(handle, "cancel_token", None))
+            elapsed = time.monotonic() - t0
+            if out.cancelled:
+                # 任务取消中止了在途调用：不落盘、不记失败，下次提取照常处理该论文
+                return {"status": "cancelled", "pid": pid}
+            if out.success:
+                cost_model.observe(len(content), elapsed, key=slug)
             d = out.to_dict()
             d["schema_slug"] = slug
             _atomic_write_text(out_file, json.dumps(d, ensure_ascii=False, indent=2))
@@ -854,52 +1012,243 @@ def run_extract_job(handle: JobHandle, slug: str,
                     cat.mark_extract_failed(pid, error=out.error or "提取失败")
         finally:
             lock.release()
-        return {"status": "ok" if out.success else "fail", "pid": pid,
+        return {"status": "ok" if out.success else "fail", "pid": pid, "elapsed": elapsed,
                 "count": out.count, "error": out.error, "meta": out.metadata or {}}
 
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    cancelled = False
-    with ThreadPoolExecutor(max_workers=workers) as ex:
-        futures = {ex.submit(_work, pid): pid for pid in papers}
-        for fut in as_completed(futures):
-            pid = futures[fut]
-            try:
-                res = fut.result()
-            except Exception as e:  # noqa: BLE001
-                res = {"status": "fail", "pid": pid, "error": str(e), "count": 0, "meta": {}}
-            with stat_lock:
-                counter["done"] += 1
-                st = res["status"]
-                if st == "ok":
-                    counter["ok"] += 1
-                    counter["records"] += res.get("count", 0)
-                elif st == "fail":
-                    counter["failed"] += 1
-                elif st == "skip":
-                    counter["skipped"] += 1
-                elif st == "cancelled":
-                    cancelled = True
-                done = counter["done"]
-            handle.set_progress(done, total)
-            handle.set_meta(ok=counter["ok"], records=counter["records"],
-                            failed=counter["failed"], skipped=counter["skipped"])
-            if res["status"] == "ok":
-                m = res["meta"]
-                handle.log(f"✅ [{done}/{total}] {pid}: {res['count']} 条, 证据 {m.get('evidence_verified',0)}/{m.get('evidence_total',0)}")
-            elif res["status"] == "fail":
-                handle.log(f"❌ [{done}/{total}] {pid}: {res.get('error')}")
-            elif res["status"] == "skip":
-                reason = res.get("error") or "无正文"
-                handle.log(f"⏭ [{done}/{total}] 跳过（{reason}）: {pid}")
+    def _report(fut, pid: str) -> None:
+        try:
+            res = fut.result()
+        except Exception as e:  # noqa: BLE001
+            res = {"status": "fail", "pid": pid, "error": str(e), "count": 0, "meta": {}}
+        if res.get("elapsed"):
+            # 用真实 LLM 耗时校准本次任务的 ETA（跳过/取消的论文不参与）
+            tracker.calibrate(predicted.get(pid, 0.0), res["elapsed"])
+        with stat_lock:
+            counter["done"] += 1
+            st = res["status"]
+            if st == "ok":
+                counter["ok"] += 1
+                counter["records"] += res.get("count", 0)
+            elif st == "fail":
+                counter["failed"] += 1
+            elif st == "skip":
+                counter["skipped"] += 1
+            elif st == "cancelled":
+                counter["cancelled"] += 1
+            elif st == "reused":
+                counter["reused"] += 1
+                counter["records"] += res.get("count", 0)
+            policy = (res.get("meta") or {}).get("agent_policy") or {}
+            counter["calls_saved"] += int(policy.get("calls_saved") or 0)
+            counter["escalated"] += 1 if policy.get("escalated") else 0
+            review_ctx = (res.get("meta") or {}).get("review_context") or {}
+            counter["review_tokens_full"] += int(review_ctx.get("full_tokens") or 0)
+            counter["review_tokens_sent"] += int(review_ctx.get("context_tokens") or 0)
+            merge_prompt = (res.get("meta") or {}).get("merge_prompt") or {}
+            counter["merge_papers"] += 1 if merge_prompt else 0
+            counter["merge_tokens_sent"] += int(merge_prompt.get("prompt_tokens") or 0)
+            done = counter["done"]
+        total = _total()
+        handle.set_progress(done, total)
+        handle.set_meta(ok=counter["ok"], records=counter["records"],
+                        failed=counter["failed"], skipped=counter["skipped"], reused=counter["reused"],
+                        calls_saved=counter["calls_saved"], escalated=counter["escalated"],
+                        review_tokens_full=counter["review_tokens_full"],
+                        review_tokens_sent=counter["review_tokens_sent"],
+                        merge_papers=counter["merge_papers"],
+                        merge_tokens_sent=counter["merge_tokens_sent"])
+        if res["status"] == "ok":
+            m = res["meta"]
+            mini = m.get("minimize") or {}
+            saved = f", 精简 -{mini['saved_ratio']:.0%}" if mini.get("saved_chars") else ""
+            rc = m.get("review_context") or {}
+            if rc.get("mode") == "evidence":
+                saved += f", 审阅 {rc['full_tokens']}→{rc['context_tokens']} tok"
+            handle.log(f"✅ [{done}/{total}] {pid}: {res['count']} 条, 证据 {m.get('evidence_verified',0)}/{m.get('evidence_total',0)}{saved}")
+        elif res["status"] == "fail":
+            handle.log(f"❌ [{done}/{total}] {pid}: {res.get('error')}")
+        elif res["status"] == "skip":
+            reason = res.get("error") or "无正文"
+            handle.log(f"⏭ [{done}/{total}] 跳过（{reason}）: {pid}")
+        elif res["status"] == "reused":
+            handle.log(f"♻️ [{done}/{total}] {pid}: 与 {res['sibling']} 近似重复（Jaccard≈{res['similarity']}），"
+                       f"复用其结果 {res['count']} 条")
+
+    def _admitted(pid: str, seq: int) -> Dict[str, Any]:
+        # 该论文的所有 LLM 调用带上通道与准入序号：限流器按通道加权公平、通道内先开始的论文优先
+        with llm_context(paper=pid, seq=seq, lane=lane):
+            return _work(pid)
+
+    # 准入与线程数解耦：最多 workers 篇在途，完成一篇再准入下一篇（按需读取正文，内存有界）；
+    # 线程取自进程级共享 papers 池，多个提取任务同时运行时线程总数仍有上限
+    queue = iter(papers)
+    admitted: set = set()
+
+    def _next_paper() -> Optional[str]:
+        pid = next(queue, None)
+        while pid is None and feed is not None:
+            pid = feed.get_nowait()
+            if pid is None:
+                return None
+            if pid in admitted:
+                pid = None       # 已在本任务中准入过（如选中的已解析论文又被重新解析）
+                continue
+            row = cat.get(pid) or {}
+            predicted[pid] = cost_model.predict(int(row.get("char_count") or 0), key=slug)
+        return pid
+
+    with TaskGroup("papers") as group:
+        inflight: Dict[Any, str] = {}
+
+        def _admit() -> None:
+            while len(inflight) < workers and not handle.cancelled:
+                pid = _next_paper()
+                if pid is None:
+                    return
+                admitted.add(pid)
+                inflight[group.submit(_admitted, pid, next_paper_seq())] = pid
+                started[pid] = time.monotonic()
+                pending.discard(pid)
+
+        def _streaming() -> bool:
+            return feed is not None and not feed.drained and not handle.cancelled
+
+        started: Dict[str, float] = {}
+        pending = set(papers)
+        _admit()
+        while inflight or _streaming():
+            if not inflight:
+                feed.wait(1.0)     # 等解析阶段送来下一篇
+                _admit()
+                continue
+            # 流式时限时等待，以便在途未满时及时准入新到的论文
+            for fut in group.wait_first(list(inflight), timeout=1.0 if feed is not None else None):
+                _report(fut, inflight.pop(fut))
+            _admit()
+            now = time.monotonic()
+            eta = tracker.eta([predicted[p] for p in pending],
+                              [(predicted[p], now - started[p]) for p in inflight.values()])
+            handle.set_meta(wip=len(inflight), llm=limiter_stats(), eta_s=int(eta),
+                            eta_ratio=round(tracker.ratio, 2))
+    cost_model.save()
+    # 本 schema 各输出格式学到的每记录输出 token（EWMA），随任务 meta 留存
+    per_record = {k.split(":", 1)[1]: v for k, v in output_stats().items() if k.startswith(f"{slug}:")}
+    if per_record:
+        handle.set_meta(output_per_record=per_record)
 
     result = {"slug": slug, "ok": counter["ok"], "failed": counter["failed"],
-              "skipped": counter["skipped"], "total": total, "records": counter["records"]}
-    if cancelled or handle.cancelled:
+              "skipped": counter["skipped"], "reused": counter["reused"], "total": _total(),
+              "records": counter["records"],
+              "calls_saved": counter["calls_saved"], "escalated": counter["escalated"],
+              "review_tokens_full": counter["review_tokens_full"], "review_tokens_sent": counter["review_tokens_sent"],
+              "merge_papers": counter["merge_papers"], "merge_tokens_sent": counter["merge_tokens_sent"],
+              "output_per_record": per_record}
+    if counter["cancelled"] or handle.cancelled:
         result["cancelled"] = True
     handle.log(f"提取完成：成功 {counter['ok']}，失败 {counter['failed']}，跳过 {counter['skipped']}，共 {counter['records']} 条记录")
+    if counter["calls_saved"] or counter["escalated"]:
+        handle.log(f"extractor 扇出：{counter['escalated']} 篇升级为多路，省下 {counter['calls_saved']} 次 LLM 调用")
+    if counter["review_tokens_full"]:
+        handle.log(f"审阅输入：全文 {counter['review_tokens_full']} tok → 实发 {counter['review_tokens_sent']} tok")
+    if counter["merge_papers"]:
+        handle.log(f"合并输入：{counter['merge_papers']} 篇共 {counter['merge_tokens_sent']} tok"
+                   f"（平均 {counter['merge_tokens_sent'] // counter['merge_papers']} tok/篇）")
     return result
 
 
+# ----------------------------------------------------------------------
+# 一体化导入：解析 → 提取流水线
+# ----------------------------------------------------------------------
+def run_ingest_job(handle: JobHandle, filenames: List[str], slug: str,
+                   collection: Optional[str] = None, force_reparse: bool = False,
+                   lane: Optional[str] = None, reuse_duplicates: Optional[bool] = None,
+                   poll_interval: int = 30, max_wait_min: int = 240) -> Dict[str, Any]:
+    """解析与提取交叠进行：每篇 full.md 校验通过即进入提取阶段，总耗时趋近 max(解析, 提取) 而非两者之和。
+
+    选中但已解析的 PDF 直接进入提取；两阶段的进度/日志分别记在 meta["stages"] 的 parse / extract 下。
+    提取积压达到在途上限时解析阶段暂停新的下载（背压）。
+    """
+    collection = _safe_collection(collection)
+    SchemaStore(collection=collection).load(slug)   # schema 不存在时在上传前就失败
+    if not _PARSE_LOCK.acquire(blocking=False):
+        raise RuntimeError("已有解析任务在运行，请等待其完成后再试")
+    try:
+        with cancel_scope(getattr(handle, "cancel_token", None)):
+            return _run_ingest_job_locked(handle, filenames, slug, collection, force_reparse, lane,
+                                          reuse_duplicates, poll_interval, max_wait_min)
+    except Cancelled:
+        handle.log("导入任务已取消")
+        return {"cancelled": True}
+    finally:
+        _PARSE_LOCK.release()
+
+
+def _run_ingest_job_locked(handle: JobHandle, filenames: List[str], slug: str, collection: str,
+                           force_reparse: bool, lane: Optional[str], reuse_duplicates: Optional[bool],
+                           poll_interval: int, max_wait_min: int) -> Dict[str, Any]:
+    proc = PDFProcessor()
+    parse_h = StageHandle(handle, "parse", "解析")
+    extract_h = StageHandle(handle, "extract", "提取")
+    parsed_stems = _parsed_stems(collection)
+    ready = [] if force_reparse else list(dict.fromkeys(
+        _pdf_path(n).stem for n in filenames if _pdf_path(n).stem in parsed_stems))
+    paths, skipped_large = _register_pdfs(filenames, force_reparse=force_reparse, collection=collection)
+    if skipped_large:
+        parse_h.log(f"⚠️ 跳过 {len(skipped_large)} 个超过 {settings.MAX_PDF_SIZE_MB}MB 的 PDF（不予上传）")
+    if not paths and not ready:
+        handle.log("所选 PDF 均在处理中或超过体积上限，没有可解析或提取的论文")
+        return {"skipped": True, "too_large": len(skipped_large)}
+    handle.log(f"导入：待解析 {len(paths)} 篇，已解析直接提取 {len(ready)} 篇（schema={slug}）")
+    parse_h.set_progress(0, len(paths))
+
+    feed = PaperFeed(maxsize=_extract_max_wip(), expected=len(paths))
+    box: Dict[str, Any] = {}
+
+    def _extract_stage() -> None:
+        try:
+            box["result"] = run_extract_job(extract_h, slug, ready, collection, lane=lane,
+                                            reuse_duplicates=reuse_duplicates, feed=feed)
+        except BaseException as e:  # noqa: BLE001
+            box["error"] = e
+            feed.unblock()
+
+    # 提取阶段在独立线程里跑（它自己会向共享 papers 池提交论文；放进池里会被同池嵌套规则串行化），
+    # 携带当前上下文（取消令牌）
+    ctx = contextvars.copy_context()
+    worker = threading.Thread(target=ctx.run, args=(_extract_stage,), name="sped-ingest-extract", daemon=True)
+    worker.start()
+    parse_result: Dict[str, Any] = {"downloaded": 0, "failed": 0}
+    try:
+        if paths:
+            batch_ids = _upload_batches(parse_h, proc, paths)
+            if batch_ids is not None:
+                parse_result = _poll_and_download(parse_h, proc, batch_ids, collection, poll_interval,
+                                                  max_wait_min, feed=feed)
+    finally:
+        feed.close()
+        worker.join()
+    if "error" in box:
+        raise box["error"]
+    extract_result = box.get("result") or {}
+    result = {"parse": parse_result, "extract": extract_result}
+    if handle.cancelled or parse_result.get("cancelled") or extract_result.get("cancelled"):
+        result["cancelled"] = True
+    handle.log(f"导入完成：解析落盘 {parse_result.get('downloaded', 0)} 篇，"
+               f"提取成功 {extract_result.get('ok', 0)} 篇，共 {extract_result.get('records', 0)} 条记录")
+    return result
+
+
+def executor_status() -> Dict[str, Any]:
+    """进程级共享线程池（papers/agents/io）的线程数、排队深度与利用率。"""
+    return executor_stats()
+
+
+def llm_slots_status() -> Dict[str, Any]:
+    """LLM 槽位占用：host=本机所有 SPED 进程的租约/排队（跨进程），local=本进程优先队列；
+    output_per_record=本进程学到的每记录输出 token（"schema:格式" -> EWMA）。"""
+    return {"host": host_slots_status(), "local": limiter_stats(), "output_per_record": output_stats()}
+
+
 # ----------------------------------------------------------------------
 # 数据查看（含证据与来源）
 # ----------------------------------------------------------------------